@@ -0,0 +1,112 @@
+"""
+In-process stand-ins for the mailbox server and transit relay, so that two
+FileTransferProtocols in one process can talk to each other over loopback.
+"""
+
+from collections import deque
+from contextlib import contextmanager
+import hashlib
+import itertools
+from unittest import mock
+
+from wormhole_ui.protocol import Relays
+
+
+class LoopbackMailbox:
+    """
+    Pairs up wormholes by code, and passes messages between them on the
+    reactor. Replaces wormhole.create, taking the same arguments.
+    """
+
+    def __init__(self, reactor, latency_seconds=0):
+        self._reactor = reactor
+        self._latency_seconds = latency_seconds
+        self._waiting = {}
+        self._nameplates = itertools.count(1)
+
+    def create(self, appid, relay_url, reactor, delegate, versions=None, **kwds):
+        return LoopbackWormhole(self, delegate, versions or {})
+
+    def allocate_code(self):
+        return f"{next(self._nameplates)}-loopback-benchmark"
+
+    def claim(self, wormhole, code):
+        peer = self._waiting.pop(code, None)
+        if peer is None:
+            self._waiting[code] = wormhole
+        else:
+            key = hashlib.sha256(code.encode("utf-8")).digest()
+            wormhole.connect(peer, key)
+            peer.connect(wormhole, key)
+
+    def release(self, wormhole, code):
+        if self._waiting.get(code) is wormhole:
+            del self._waiting[code]
+
+    def call_soon(self, f, *args):
+        self._reactor.callLater(0, f, *args)
+
+    def call_after_latency(self, f, *args):
+        self._reactor.callLater(self._latency_seconds, f, *args)
+
+
+class LoopbackWormhole:
+    def __init__(self, mailbox, delegate, versions):
+        self._mailbox = mailbox
+        self._delegate = delegate
+        self._versions = versions
+        self._code = None
+        self._key = None
+        self._peer = None
+        self._inbox = deque()
+        self._is_closed = False
+
+    def allocate_code(self):
+        self.set_code(self._mailbox.allocate_code())
+
+    def set_code(self, code):
+        self._code = code
+        self._mailbox.call_soon(self._delegate.wormhole_got_code, code)
+        self._mailbox.claim(self, code)
+
+    def connect(self, peer, key):
+        self._peer = peer
+        self._key = key
+        self._mailbox.call_soon(self._delegate.wormhole_got_versions, peer._versions)
+
+    def send_message(self, data):
+        assert self._peer is not None
+        self._peer._deliver(data)
+
+    def _deliver(self, data):
+        # Messages are queued so that they arrive in the order they were sent
+        self._inbox.append(data)
+        self._mailbox.call_after_latency(self._deliver_next)
+
+    def _deliver_next(self):
+        if self._inbox and not self._is_closed:
+            self._delegate.wormhole_got_message(self._inbox.popleft())
+
+    def derive_key(self, purpose, length):
+        return hashlib.sha256(self._key + purpose.encode("utf-8")).digest()[:length]
+
+    def close(self):
+        if self._is_closed:
+            return
+        self._is_closed = True
+        self._mailbox.release(self, self._code)
+        self._mailbox.call_soon(self._delegate.wormhole_closed, "happy")
+
+
+@contextmanager
+def loopback_relays(reactor, latency_seconds=0):
+    """
+    Replaces the mailbox server with a LoopbackMailbox, and returns Relays
+    without a transit relay (so peers only connect directly). Each message
+    through the mailbox takes latency_seconds to arrive.
+    """
+    mailbox = LoopbackMailbox(reactor, latency_seconds)
+    with mock.patch(
+        "wormhole_ui.protocol.file_transfer_protocol.wormhole.create", mailbox.create
+    ):
+        yield Relays(mailbox_url="ws://loopback/v1", transit_relay=None)
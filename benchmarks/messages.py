@@ -0,0 +1,243 @@
+"""
+Measures text message round trip times between two Sessions in one process,
+over loopback, both while idle and while a large file is being sent.
+
+    python -m benchmarks.messages
+    python -m benchmarks.messages --mailbox-latency 50 --no-transit-messages
+
+Each message is sent once the previous one has been acknowledged, in both
+directions: from the file's sender to its receiver, and back. A burst sends
+all the messages at once, as when pasting many lines, timing each message's
+ack from the start of the burst. Large messages are sent one after another
+too, and are streamed over the transit connection if the peers support it.
+Mailbox latency delays each message through the mailbox server, as a distant
+server would.
+"""
+
+import argparse
+import json
+from pathlib import Path
+import statistics
+import tempfile
+import time
+
+from twisted.internet import defer, task
+
+from wormhole_ui.protocol import Session, accept_into
+from wormhole_ui.protocol.capabilities import (
+    FEATURES,
+    TRANSIT_MESSAGES,
+    Capabilities,
+)
+from .loopback import loopback_relays
+from .transfer import THINK_SECONDS, make_files, parse_size
+
+DEFAULT_COUNT = 50
+DEFAULT_FILE_SIZE = "1G"
+DEFAULT_LARGE_SIZE = "1M"
+LARGE_COUNT = 5
+
+
+@defer.inlineCallbacks
+def measure_round_trips(reactor, sender, receiver, count, size=None):
+    """
+    Sends count messages one after another, returning their round trips.
+    If size is given, each message is padded to that many bytes.
+    """
+    round_trips = []
+    for index in range(count):
+        message = f"Message {index}"
+        if size is not None:
+            message = message.ljust(size, "x")
+        start_time = time.perf_counter()
+        sent = sender.send_message(message)
+        yield receiver.receive_message()
+        yield sent
+        round_trips.append(time.perf_counter() - start_time)
+    return round_trips
+
+
+@defer.inlineCallbacks
+def measure_burst(reactor, sender, receiver, count):
+    """Sends count messages at once, returning the time until each is acked"""
+    start_time = time.perf_counter()
+    round_trips = []
+
+    def on_acked(_):
+        round_trips.append(time.perf_counter() - start_time)
+
+    sent = [
+        sender.send_message(f"Message {index}").addCallback(on_acked)
+        for index in range(count)
+    ]
+    for _ in range(count):
+        yield receiver.receive_message()
+    yield defer.gatherResults(sent)
+    return round_trips
+
+
+@defer.inlineCallbacks
+def run(
+    reactor,
+    count=DEFAULT_COUNT,
+    file_size=parse_size(DEFAULT_FILE_SIZE),
+    mailbox_latency_seconds=0,
+    transit_messages=True,
+    large_size=parse_size(DEFAULT_LARGE_SIZE),
+):
+    features = [f for f in FEATURES if transit_messages or f != TRANSIT_MESSAGES]
+    results = []
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        source_path = Path(temp_dir) / "source"
+        dest_path = Path(temp_dir) / "dest"
+        source_path.mkdir()
+        dest_path.mkdir()
+        file_paths = make_files(source_path, file_size, 1)
+
+        with loopback_relays(reactor, mailbox_latency_seconds) as relays:
+            sender = Session(reactor, relays, Capabilities(features))
+            receiver = Session(reactor, relays, Capabilities(features))
+            code = yield sender.open()
+            receiver.open(code)
+            yield sender.when_connected()
+            yield receiver.when_connected()
+            # Give the transit connection time to be made
+            yield task.deferLater(reactor, THINK_SECONDS, lambda: None)
+
+        for direction, a, b in [
+            ("forward", sender, receiver),
+            ("back", receiver, sender),
+        ]:
+            round_trips = yield measure_round_trips(reactor, a, b, count)
+            results.append(_summarise("idle", direction, round_trips))
+        round_trips = yield measure_burst(reactor, sender, receiver, count)
+        results.append(_summarise("idle burst", "forward", round_trips))
+        round_trips = yield measure_round_trips(
+            reactor, sender, receiver, LARGE_COUNT, large_size
+        )
+        results.append(_summarise("idle large", "forward", round_trips))
+
+        (handle,) = sender.send_files(file_paths)
+        received = yield receiver.receive(accept_into(str(dest_path)))
+        yield _when_streaming(received)
+        for direction, a, b in [
+            ("forward", sender, receiver),
+            ("back", receiver, sender),
+        ]:
+            round_trips = yield measure_round_trips(reactor, a, b, count)
+            results.append(_summarise("during transfer", direction, round_trips))
+        if handle.is_finished:
+            print("Warning: the file finished sending before all messages were sent")
+        yield handle.when_complete()
+        yield received.when_complete()
+
+        yield sender.close()
+        yield receiver.close()
+
+    return results
+
+
+def _when_streaming(handle):
+    """Returns a Deferred that fires once the file's data starts arriving"""
+    deferred = defer.Deferred()
+
+    def on_progress(transferred_bytes, total_bytes):
+        if transferred_bytes > 0 and not deferred.called:
+            deferred.callback(None)
+
+    handle.progress.connect(on_progress)
+    return deferred
+
+
+def _summarise(condition, direction, round_trips):
+    round_trips = sorted(round_trips)
+    return {
+        "condition": condition,
+        "direction": direction,
+        "count": len(round_trips),
+        "median_ms": statistics.median(round_trips) * 1000,
+        "p95_ms": round_trips[int(len(round_trips) * 0.95) - 1] * 1000,
+        "max_ms": round_trips[-1] * 1000,
+    }
+
+
+def print_result(result):
+    print(
+        f"{result['condition']:<16}{result['direction']:<9}"
+        f"{result['median_ms']:>10.1f}{result['p95_ms']:>10.1f}"
+        f"{result['max_ms']:>10.1f}",
+        flush=True,
+    )
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks.messages", description=__doc__.split("\n\n")[0]
+    )
+    parser.add_argument(
+        "--count",
+        type=int,
+        default=DEFAULT_COUNT,
+        help="messages sent each way, for each condition",
+    )
+    parser.add_argument(
+        "--file-size",
+        type=parse_size,
+        default=parse_size(DEFAULT_FILE_SIZE),
+        help="size of the file sent alongside the messages, eg. 100M",
+    )
+    parser.add_argument(
+        "--large-size",
+        type=parse_size,
+        default=parse_size(DEFAULT_LARGE_SIZE),
+        help="size of the large messages, eg. 1M",
+    )
+    parser.add_argument(
+        "--mailbox-latency",
+        type=float,
+        default=0,
+        metavar="MS",
+        help="one-way latency of the mailbox server, in milliseconds",
+    )
+    parser.add_argument(
+        "--no-transit-messages",
+        action="store_true",
+        help="send messages through the mailbox, even once there's a connection",
+    )
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    def _run(reactor):
+        deferred = run(
+            reactor,
+            args.count,
+            args.file_size,
+            args.mailbox_latency / 1000,
+            not args.no_transit_messages,
+            args.large_size,
+        )
+        deferred.addCallback(_print_results, args.json)
+        return deferred
+
+    task.react(_run)
+
+
+def _print_results(results, as_json):
+    if not as_json:
+        print(
+            f"{'condition':<16}{'to':<9}{'median ms':>10}{'p95 ms':>10}{'max ms':>10}"
+        )
+    for result in results:
+        if as_json:
+            print(json.dumps(result), flush=True)
+        else:
+            print_result(result)
+
+
+if __name__ == "__main__":
+    main()
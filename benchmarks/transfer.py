@@ -0,0 +1,314 @@
+"""
+Measures file transfer throughput between two FileTransferProtocols in one
+process, over loopback.
+
+    python -m benchmarks.transfer                  # quick run
+    python -m benchmarks.transfer --full           # up to 10GiB / 100k files
+    python -m benchmarks.transfer --sizes 1M,1G --counts 1,100
+    python -m benchmarks.transfer --mailbox-latency 50 --no-warm-start
+
+Each case runs in a fresh process, so peak RSS is measured per case. CPU time
+covers both the sender and the receiver, including the reactor thread pool.
+Reactor stall is how late a 10ms timer on the reactor thread fired, in total
+and at worst. In the GUI the reactor runs on the Qt thread, so it's time the UI
+was unresponsive.
+
+Time to first byte is from sending the files to the receiver getting the first
+of their data. Files are sent a short while after the wormhole connects, as if
+a user had dropped them in. Mailbox latency delays each message through the
+mailbox server, to show how many round trips the handshake takes.
+"""
+
+import argparse
+import json
+import os
+from pathlib import Path
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from twisted.internet import defer, task
+
+from wormhole_ui.protocol import Session, accept_into
+from wormhole_ui.protocol.capabilities import FEATURES, WARM_START, Capabilities
+from .loopback import loopback_relays
+
+STALL_INTERVAL_SECONDS = 0.01
+THINK_SECONDS = 0.5
+WRITE_CHUNK_BYTES = 1024 * 1024
+
+UNITS = {"": 1, "K": 1024, "M": 1024 * 1024, "G": 1024 * 1024 * 1024}
+
+# Sizes are swept with a single file, and counts with small files
+QUICK_SIZES = ["1K", "1M", "100M"]
+QUICK_COUNTS = [100, 1000]
+FULL_SIZES = ["1K", "1M", "100M", "1G", "10G"]
+FULL_COUNTS = [100, 1000, 10000, 100000]
+SMALL_FILE_SIZE = "1K"
+
+
+class StallMonitor:
+    """Measures how late a short timer fires on the reactor thread"""
+
+    def __init__(self, reactor, interval=STALL_INTERVAL_SECONDS):
+        self._reactor = reactor
+        self._interval = interval
+        self._loop = task.LoopingCall(self._tick)
+        self._loop.clock = reactor
+        self._last_tick = None
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+
+    def start(self):
+        self._last_tick = self._reactor.seconds()
+        self._loop.start(self._interval, now=False)
+
+    def stop(self):
+        if self._loop.running:
+            self._loop.stop()
+
+    def _tick(self):
+        now = self._reactor.seconds()
+        stall = max(0.0, now - self._last_tick - self._interval)
+        self._last_tick = now
+
+        self.total_seconds += stall
+        self.max_seconds = max(self.max_seconds, stall)
+
+
+def make_files(path, size, count, data="random"):
+    paths = []
+    for index in range(count):
+        file_path = path / f"file{index:06d}.bin"
+        with open(file_path, "wb") as f:
+            remaining = size
+            while remaining > 0:
+                chunk_bytes = min(remaining, WRITE_CHUNK_BYTES)
+                f.write(_make_data(chunk_bytes, data))
+                remaining -= chunk_bytes
+        paths.append(file_path)
+    return paths
+
+
+def _make_data(length, data):
+    if data == "random":
+        return os.urandom(length)
+    line = b"The quick brown fox jumps over the lazy dog.\n"
+    return (line * (length // len(line) + 1))[:length]
+
+
+@defer.inlineCallbacks
+def run_case(
+    reactor, size, count, data="random", mailbox_latency_seconds=0, warm_start=True
+):
+    """Sends count files of size bytes from one Session to another"""
+    features = [f for f in FEATURES if warm_start or f != WARM_START]
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        source_path = Path(temp_dir) / "source"
+        dest_path = Path(temp_dir) / "dest"
+        source_path.mkdir()
+        dest_path.mkdir()
+        file_paths = make_files(source_path, size, count, data)
+
+        with loopback_relays(reactor, mailbox_latency_seconds) as relays:
+            sender = Session(reactor, relays, Capabilities(features))
+            receiver = Session(reactor, relays, Capabilities(features))
+            code = yield sender.open()
+            receiver.open(code)
+            yield sender.when_connected()
+            yield receiver.when_connected()
+            yield task.deferLater(reactor, THINK_SECONDS, lambda: None)
+
+        first_byte_times = []
+
+        def on_progress(id, transferred_bytes, total_bytes):
+            if transferred_bytes > 0 and not first_byte_times:
+                first_byte_times.append(time.perf_counter())
+
+        receiver.signals.file_transfer_progress.connect(on_progress)
+
+        monitor = StallMonitor(reactor)
+        monitor.start()
+        start_cpu = _cpu_seconds()
+        start_time = time.perf_counter()
+
+        handles = sender.send_files(file_paths)
+        received = []
+        while sum(h.total_bytes for h in received) < size * count:
+            handle = yield receiver.receive(accept_into(str(dest_path)))
+            yield handle.when_complete()
+            received.append(handle)
+        for handle in handles:
+            yield handle.when_complete()
+
+        elapsed_seconds = time.perf_counter() - start_time
+        cpu_seconds = _cpu_seconds() - start_cpu
+        monitor.stop()
+
+        yield sender.close()
+        yield receiver.close()
+
+    megabytes = size * count / 1e6
+    return {
+        "size": size,
+        "count": count,
+        "seconds": elapsed_seconds,
+        "ttfb_seconds": first_byte_times[0] - start_time,
+        "mb_per_second": megabytes / elapsed_seconds,
+        "cpu_seconds_per_mb": cpu_seconds / megabytes,
+        "peak_rss_mb": _peak_rss_bytes() / 1e6,
+        "stall_seconds": monitor.total_seconds,
+        "max_stall_seconds": monitor.max_seconds,
+    }
+
+
+def _cpu_seconds():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def _peak_rss_bytes():
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, MacOS reports bytes
+    return peak_rss if sys.platform == "darwin" else peak_rss * 1024
+
+
+def parse_size(size):
+    size = size.strip().upper().rstrip("IB")
+    unit = size[-1] if size[-1] in UNITS else ""
+    return int(size[: len(size) - len(unit)]) * UNITS[unit]
+
+
+def format_size(size):
+    for unit in ["G", "M", "K"]:
+        if size >= UNITS[unit] and size % UNITS[unit] == 0:
+            return f"{size // UNITS[unit]}{unit}iB"
+    return f"{size}B"
+
+
+def cases(args):
+    if args.sizes or args.counts:
+        sizes = args.sizes or [parse_size(SMALL_FILE_SIZE)]
+        counts = args.counts or [1]
+        return [(size, count) for size in sizes for count in counts]
+
+    sizes = FULL_SIZES if args.full else QUICK_SIZES
+    counts = FULL_COUNTS if args.full else QUICK_COUNTS
+    small_file_size = parse_size(SMALL_FILE_SIZE)
+    return [(parse_size(size), 1) for size in sizes] + [
+        (small_file_size, count) for count in counts
+    ]
+
+
+def run_in_subprocess(size, count, args):
+    command = [
+        sys.executable,
+        "-m",
+        "benchmarks.transfer",
+        "--case",
+        str(size),
+        str(count),
+        "--data",
+        args.data,
+        "--mailbox-latency",
+        str(args.mailbox_latency),
+    ]
+    if args.no_warm_start:
+        command.append("--no-warm-start")
+    output = subprocess.check_output(command)
+    return json.loads(output.decode("utf-8").splitlines()[-1])
+
+
+def print_result(result):
+    print(
+        f"{format_size(result['size']):>8} x{result['count']:<7}"
+        f"{result['seconds']:>10.3f}"
+        f"{result['ttfb_seconds'] * 1000:>10.1f}"
+        f"{result['mb_per_second']:>10.1f}"
+        f"{result['cpu_seconds_per_mb'] * 1000:>12.2f}"
+        f"{result['peak_rss_mb']:>10.0f}"
+        f"{result['stall_seconds']:>10.2f}"
+        f"{result['max_stall_seconds'] * 1000:>12.1f}",
+        flush=True,
+    )
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks.transfer", description=__doc__.split("\n\n")[0]
+    )
+    parser.add_argument(
+        "--full", action="store_true", help="include the largest sizes and counts"
+    )
+    parser.add_argument(
+        "--sizes",
+        type=lambda sizes: [parse_size(size) for size in sizes.split(",")],
+        help="comma-separated file sizes, eg. 1K,10M,1G",
+    )
+    parser.add_argument(
+        "--counts",
+        type=lambda counts: [int(count) for count in counts.split(",")],
+        help="comma-separated file counts",
+    )
+    parser.add_argument(
+        "--data",
+        choices=["random", "text"],
+        default="random",
+        help="file contents (text is compressible)",
+    )
+    parser.add_argument(
+        "--mailbox-latency",
+        type=float,
+        default=0,
+        metavar="MS",
+        help="one-way latency of the mailbox server, in milliseconds",
+    )
+    parser.add_argument(
+        "--no-warm-start",
+        action="store_true",
+        help="only start the transit handshake once files are sent",
+    )
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    parser.add_argument("--case", nargs=2, type=int, help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    if args.case:
+        size, count = args.case
+
+        def _run(reactor):
+            deferred = run_case(
+                reactor,
+                size,
+                count,
+                args.data,
+                args.mailbox_latency / 1000,
+                not args.no_warm_start,
+            )
+            deferred.addCallback(lambda result: print(json.dumps(result)))
+            return deferred
+
+        task.react(_run)
+
+    if not args.json:
+        print(
+            f"{'size':>8} {'count':<7}{'seconds':>10}{'TTFB ms':>10}{'MB/s':>10}"
+            f"{'CPU ms/MB':>12}"
+            f"{'RSS MB':>10}{'stall s':>10}{'max ms':>12}"
+        )
+    for size, count in cases(args):
+        result = run_in_subprocess(size, count, args)
+        if args.json:
+            print(json.dumps(result), flush=True)
+        else:
+            print_result(result)
+
+
+if __name__ == "__main__":
+    main()
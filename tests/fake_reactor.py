@@ -0,0 +1,36 @@
+from twisted.internet.task import Clock
+from twisted.python.failure import Failure
+
+
+class FakeReactor(Clock):
+    """Clock that queues thread pool calls until run_threads() is called"""
+
+    def __init__(self):
+        super().__init__()
+        self.thread_calls = []
+
+    def callInThread(self, f, *args):
+        self.thread_calls.append((f, args))
+
+    def callFromThread(self, f, *args):
+        f(*args)
+
+    def getThreadPool(self):
+        # Only callInThreadWithCallback is needed, as used by deferToThreadPool
+        return self
+
+    def callInThreadWithCallback(self, on_result, f, *args):
+        def run():
+            try:
+                result = f(*args)
+            except BaseException:
+                on_result(False, Failure())
+            else:
+                on_result(True, result)
+
+        self.callInThread(run)
+
+    def run_threads(self):
+        while self.thread_calls:
+            f, args = self.thread_calls.pop(0)
+            f(*args)
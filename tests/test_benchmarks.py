@@ -0,0 +1,94 @@
+from hamcrest import assert_that, close_to, contains_exactly, is_
+import pytest
+from twisted.internet.task import Clock
+
+from benchmarks.loopback import LoopbackMailbox
+from benchmarks.transfer import StallMonitor, format_size, parse_size
+
+
+class TestSizes:
+    @pytest.mark.parametrize(
+        "size,expected",
+        [("100", 100), ("1K", 1024), ("1KiB", 1024), ("10m", 10 * 1024 * 1024)],
+    )
+    def test_parses_sizes(self, size, expected):
+        assert_that(parse_size(size), is_(expected))
+
+    def test_formats_sizes(self):
+        assert_that(format_size(10 * 1024 * 1024 * 1024), is_("10GiB"))
+        assert_that(format_size(1500), is_("1500B"))
+
+
+class TestStallMonitor:
+    def test_measures_late_ticks(self):
+        clock = Clock()
+        monitor = StallMonitor(clock, interval=0.01)
+        monitor.start()
+
+        clock.advance(0.01)
+        clock.advance(0.05)
+
+        assert_that(monitor.total_seconds, close_to(0.04, 1e-6))
+        assert_that(monitor.max_seconds, close_to(0.04, 1e-6))
+        monitor.stop()
+
+
+class TestLoopbackMailbox:
+    @pytest.fixture(autouse=True)
+    def setup(self, mocker):
+        self.clock = Clock()
+        self.mailbox = LoopbackMailbox(self.clock)
+        self.delegate1 = mocker.Mock()
+        self.delegate2 = mocker.Mock()
+        self.wormhole1 = self.mailbox.create(
+            None, None, self.clock, self.delegate1, versions={"v": 1}
+        )
+        self.wormhole2 = self.mailbox.create(
+            None, None, self.clock, self.delegate2, versions={"v": 2}
+        )
+
+    def connect(self):
+        self.wormhole1.allocate_code()
+        self.clock.advance(0)
+        code = self.delegate1.wormhole_got_code.call_args[0][0]
+        self.wormhole2.set_code(code)
+        self.clock.advance(0)
+
+    def test_exchanges_versions(self):
+        self.connect()
+
+        self.delegate1.wormhole_got_versions.assert_called_once_with({"v": 2})
+        self.delegate2.wormhole_got_versions.assert_called_once_with({"v": 1})
+
+    def test_delivers_messages_in_order(self):
+        self.connect()
+
+        self.wormhole1.send_message(b"1")
+        self.wormhole1.send_message(b"2")
+        self.clock.advance(0)
+
+        assert_that(
+            self.delegate2.wormhole_got_message.call_args_list,
+            contains_exactly(((b"1",),), ((b"2",),)),
+        )
+
+    def test_delays_messages_by_latency(self, mocker):
+        self.mailbox = LoopbackMailbox(self.clock, latency_seconds=0.05)
+        self.wormhole1 = self.mailbox.create(None, None, self.clock, self.delegate1)
+        self.wormhole2 = self.mailbox.create(None, None, self.clock, self.delegate2)
+        self.connect()
+
+        self.wormhole1.send_message(b"1")
+        self.clock.advance(0.04)
+        self.delegate2.wormhole_got_message.assert_not_called()
+        self.clock.advance(0.01)
+
+        self.delegate2.wormhole_got_message.assert_called_once_with(b"1")
+
+    def test_derives_the_same_key(self):
+        self.connect()
+
+        assert_that(
+            self.wormhole1.derive_key("purpose", 32),
+            is_(self.wormhole2.derive_key("purpose", 32)),
+        )
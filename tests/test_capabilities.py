@@ -0,0 +1,150 @@
+from hamcrest import assert_that, is_
+import pytest
+
+from wormhole_ui.protocol.capabilities import Capabilities
+
+
+class TestBase:
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        self.capabilities = Capabilities(side="ours")
+
+    def peer(self, **v0):
+        self.capabilities.set_peer_versions({"v0": v0})
+
+
+class TestVersions(TestBase):
+    def test_advertises_all_extensions(self):
+        assert_that(
+            self.capabilities.versions(),
+            is_(
+                {
+                    "v0": {
+                        "mode": "connect",
+                        "features": [
+                            "batch",
+                            "large_messages",
+                            "pack",
+                            "reconnect",
+                            "resume",
+                            "shared_transit",
+                            "transit_messages",
+                            "warm_start",
+                            "zlib",
+                        ],
+                        "hashes": ["blake2b", "sha256"],
+                        "record_bytes": 256 * 1024,
+                        "side": "ours",
+                    }
+                }
+            ),
+        )
+
+
+class TestSupports(TestBase):
+    def test_nothing_supported_before_versions_received(self):
+        assert_that(self.capabilities.supports_connect_mode(), is_(False))
+        assert_that(self.capabilities.supports("batch"), is_(False))
+
+    def test_nothing_supported_by_wormhole_cli(self):
+        self.capabilities.set_peer_versions({})
+
+        assert_that(self.capabilities.supports_connect_mode(), is_(False))
+        assert_that(self.capabilities.supports("batch"), is_(False))
+
+    def test_connect_mode(self):
+        self.peer(mode="connect")
+
+        assert_that(self.capabilities.supports_connect_mode(), is_(True))
+
+    def test_features_supported_by_both_peers(self):
+        self.peer(features=["batch", "zlib", "future"])
+
+        assert_that(self.capabilities.supports("batch"), is_(True))
+        assert_that(self.capabilities.supports("zlib"), is_(True))
+        assert_that(self.capabilities.supports("pack"), is_(False))
+        assert_that(self.capabilities.supports("future"), is_(False))
+
+    def test_features_we_disable_arent_supported(self):
+        capabilities = Capabilities(features=["batch"])
+        capabilities.set_peer_versions({"v0": {"features": ["batch", "zlib"]}})
+
+        assert_that(capabilities.supports("zlib"), is_(False))
+
+    def test_malformed_versions_are_ignored(self):
+        self.capabilities.set_peer_versions({"v0": {"features": "batch"}})
+
+        assert_that(self.capabilities.supports("batch"), is_(False))
+
+
+class TestHashAlgorithm(TestBase):
+    def test_defaults_to_sha256(self):
+        assert_that(self.capabilities.hash_algorithm, is_("sha256"))
+
+    def test_uses_common_algorithm(self):
+        self.peer(hashes=["blake2b"])
+
+        assert_that(self.capabilities.hash_algorithm, is_("blake2b"))
+
+    def test_prefers_blake2b(self):
+        self.peer(hashes=["sha256", "blake2b"])
+
+        assert_that(self.capabilities.hash_algorithm, is_("blake2b"))
+
+    def test_preference_order_doesnt_depend_on_peer(self):
+        peer = Capabilities(hash_algorithms=["sha256", "blake2b"], side="theirs")
+        peer.set_peer_versions(self.capabilities.versions())
+        self.capabilities.set_peer_versions(peer.versions())
+
+        assert_that(peer.hash_algorithm, is_(self.capabilities.hash_algorithm))
+
+    def test_uses_sha256_if_peer_lacks_blake2b(self):
+        self.peer(hashes=["sha256"])
+
+        assert_that(self.capabilities.hash_algorithm, is_("sha256"))
+
+    def test_falls_back_to_sha256(self):
+        self.peer(hashes=["md5"])
+
+        assert_that(self.capabilities.hash_algorithm, is_("sha256"))
+
+
+class TestRecordBytes(TestBase):
+    def test_defaults_to_64k(self):
+        assert_that(self.capabilities.record_bytes, is_(64 * 1024))
+
+    def test_uses_smaller_of_both_limits(self):
+        self.peer(record_bytes=128 * 1024)
+        assert_that(self.capabilities.record_bytes, is_(128 * 1024))
+
+        self.peer(record_bytes=1024 * 1024)
+        assert_that(self.capabilities.record_bytes, is_(256 * 1024))
+
+    def test_invalid_limit_is_ignored(self):
+        self.peer(record_bytes=-1)
+
+        assert_that(self.capabilities.record_bytes, is_(64 * 1024))
+
+
+class TestSharedTransit(TestBase):
+    def test_supported_with_distinct_sides(self):
+        self.peer(features=["shared_transit"], side="theirs")
+
+        assert_that(self.capabilities.supports_shared_transit(), is_(True))
+
+    def test_not_supported_without_peer_side(self):
+        self.peer(features=["shared_transit"])
+
+        assert_that(self.capabilities.supports_shared_transit(), is_(False))
+
+    def test_not_supported_with_the_same_side(self):
+        self.peer(features=["shared_transit"], side="ours")
+
+        assert_that(self.capabilities.supports_shared_transit(), is_(False))
+
+    def test_greater_side_leads(self):
+        self.peer(side="abc")
+        assert_that(self.capabilities.is_transit_leader, is_(True))
+
+        self.peer(side="xyz")
+        assert_that(self.capabilities.is_transit_leader, is_(False))
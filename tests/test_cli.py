@@ -0,0 +1,295 @@
+import io
+import json
+from pathlib import Path
+import subprocess
+import sys
+
+from hamcrest import assert_that, contains_exactly, has_entries, is_, none
+import pytest
+
+from wormhole_ui.cli import Transfer, get_relays, parse_args
+from wormhole_ui.errors import SendFileError
+from wormhole_ui.protocol import Relays
+
+
+class TestBase:
+    @pytest.fixture(autouse=True)
+    def setup(self, mocker):
+        self.protocol_class = mocker.patch(
+            "wormhole_ui.protocol.session.FileTransferProtocol"
+        )
+        self.protocol = self.protocol_class()
+        self.output = io.StringIO()
+        self.transfer = Transfer(mocker.Mock(), self.output)
+        self.signals = self.transfer.session.signals
+
+        self.status = None
+
+    def on_finished(self, status):
+        self.status = status
+
+    def connect(self):
+        self.signals.code_received.emit("42-is-a-code")
+        self.signals.wormhole_open.emit()
+
+    def events(self):
+        return [json.loads(line) for line in self.output.getvalue().splitlines()]
+
+
+class TestSend(TestBase):
+    def test_opens_wormhole_with_code(self):
+        self.transfer.send(["file.txt"], "42-is-a-code")
+
+        self.protocol.open.assert_called_once_with("42-is-a-code")
+
+    def test_reports_allocated_code(self):
+        self.transfer.send(["file.txt"])
+
+        self.signals.code_received.emit("42-is-a-code")
+
+        assert_that(
+            self.events(),
+            contains_exactly(has_entries(event="code", code="42-is-a-code")),
+        )
+
+    def test_sends_files_once_wormhole_is_open(self):
+        self.transfer.send(["file1.txt", "file2.txt"])
+        self.protocol.send_files.assert_not_called()
+
+        self.signals.wormhole_open.emit()
+
+        self.protocol.send_files.assert_called_once_with(
+            [
+                (0, str(Path("file1.txt").resolve())),
+                (1, str(Path("file2.txt").resolve())),
+            ]
+        )
+
+    def test_reports_progress(self):
+        self.transfer.send(["file.txt"])
+
+        self.signals.file_transfer_progress.emit(0, 100, 200)
+
+        assert_that(
+            self.events(),
+            contains_exactly(
+                has_entries(
+                    event="progress", id=0, transferred_bytes=100, total_bytes=200
+                )
+            ),
+        )
+
+    def test_shuts_down_once_all_files_are_sent(self):
+        self.transfer.send(["file1.txt", "file2.txt"])
+        self.connect()
+
+        self.signals.file_transfer_complete.emit(0, "file1.txt")
+        self.protocol.shutdown.assert_not_called()
+        self.signals.file_transfer_complete.emit(1, "file2.txt")
+
+        self.protocol.shutdown.assert_called_once()
+
+    def test_succeeds_once_wormhole_is_shut_down(self):
+        self.transfer.send(["file.txt"]).addCallback(self.on_finished)
+        self.connect()
+
+        self.signals.file_transfer_complete.emit(0, "file.txt")
+        self.signals.wormhole_shutdown.emit()
+
+        assert_that(self.status, is_(0))
+        assert_that(self.events()[-1], has_entries(event="closed", ok=True))
+
+    def test_sends_stdin_after_files(self, mocker):
+        stdin = io.BytesIO(b"data")
+        transfer = Transfer(mocker.Mock(), self.output, stdin=stdin)
+        transfer.session.send_stream = mocker.Mock()
+
+        transfer.send(["file.txt", "-"], stdin_name="dump.sql")
+
+        transfer.session.send_stream.assert_called_once_with(stdin, "dump.sql", None)
+
+    def test_sends_stdin_of_known_size_without_buffering(self, mocker):
+        stdin = io.BytesIO(b"data")
+        transfer = Transfer(mocker.Mock(), self.output, stdin=stdin)
+        transfer.session.send_stream = mocker.Mock()
+
+        transfer.send(["-"], stdin_name="dump.sql", stdin_size=4)
+
+        transfer.session.send_stream.assert_called_once_with(stdin, "dump.sql", 4)
+
+    def test_fails_if_wormhole_closes_before_all_files_are_sent(self):
+        self.transfer.send(["file1.txt", "file2.txt"]).addCallback(self.on_finished)
+
+        self.signals.file_transfer_complete.emit(0, "file1.txt")
+        self.signals.wormhole_closed.emit()
+
+        assert_that(self.status, is_(1))
+        assert_that(self.events()[-1], has_entries(event="closed", ok=False))
+
+
+class TestReceive(TestBase):
+    def test_opens_wormhole_with_code(self, tmp_path):
+        self.transfer.receive(tmp_path, "42-is-a-code")
+
+        self.protocol.open.assert_called_once_with("42-is-a-code")
+
+    def test_accepts_offered_files(self, tmp_path):
+        self.transfer.receive(tmp_path)
+        self.connect()
+
+        self.signals.file_receive_pending.emit("file1.txt", 100)
+        self.signals.file_transfer_complete.emit(0, "file1.txt")
+        self.signals.file_receive_pending.emit("file2.txt", 200)
+
+        assert_that(
+            self.protocol.receive_file.call_args_list,
+            contains_exactly(((0, str(tmp_path)),), ((1, str(tmp_path)),)),
+        )
+        assert_that(
+            [e for e in self.events() if e["event"] == "receive_pending"],
+            contains_exactly(
+                has_entries(id=0, filename="file1.txt", size=100),
+                has_entries(id=1, filename="file2.txt", size=200),
+            ),
+        )
+
+    def test_accepts_offered_files_into_stream(self):
+        stream = io.BytesIO()
+        self.transfer.receive(stream)
+        self.connect()
+
+        self.signals.file_receive_pending.emit("file.txt", 100)
+
+        self.protocol.receive_file.assert_called_once_with(0, stream)
+
+    def test_reports_messages(self, tmp_path):
+        self.transfer.receive(tmp_path)
+
+        self.signals.message_received.emit("hello")
+
+        assert_that(
+            self.events(),
+            contains_exactly(has_entries(event="message", message="hello")),
+        )
+
+    def test_succeeds_once_wormhole_is_closed(self, tmp_path):
+        self.transfer.receive(tmp_path).addCallback(self.on_finished)
+        self.connect()
+
+        self.signals.file_receive_pending.emit("file.txt", 100)
+        self.signals.file_transfer_complete.emit(0, "file.txt")
+        self.signals.wormhole_closed.emit()
+
+        assert_that(self.status, is_(0))
+        self.protocol.shutdown.assert_not_called()
+
+
+class TestErrors(TestBase):
+    def test_closes_wormhole_on_error(self):
+        self.transfer.send(["file.txt"])
+
+        self.signals.error.emit(SendFileError("Oops"), None)
+
+        self.protocol.close.assert_called_once()
+        assert_that(
+            self.events(),
+            contains_exactly(has_entries(event="error", error="SendFileError: Oops")),
+        )
+
+    def test_fails_once_wormhole_is_closed(self):
+        self.transfer.send(["file.txt"]).addCallback(self.on_finished)
+
+        self.signals.error.emit(SendFileError("Oops"), None)
+        self.signals.file_transfer_complete.emit(0, "file.txt")
+        self.signals.wormhole_closed.emit()
+
+        assert_that(self.status, is_(1))
+
+    def test_reports_exceptions_from_the_protocol(self):
+        self.protocol.send_files.side_effect = SendFileError("Oops")
+        self.transfer.send(["file.txt"])
+
+        self.signals.wormhole_open.emit()
+
+        assert_that(self.events()[-1], has_entries(event="error"))
+        self.protocol.close.assert_called_once()
+
+
+class TestParseArgs:
+    def test_parses_send(self, tmp_path):
+        args = parse_args(["send", "-c", "42-is-a-code", str(tmp_path)])
+
+        assert_that(args.command, is_("send"))
+        assert_that(args.paths, contains_exactly(str(tmp_path)))
+        assert_that(args.code, is_("42-is-a-code"))
+
+    def test_parses_receive(self, tmp_path):
+        args = parse_args(["receive", "42-is-a-code", "-o", str(tmp_path)])
+
+        assert_that(args.command, is_("receive"))
+        assert_that(args.code, is_("42-is-a-code"))
+        assert_that(args.output_dir, is_(tmp_path))
+
+    def test_parses_stdin_and_stdout(self):
+        send_args = parse_args(["send", "--name", "dump.sql", "--size", "42", "-"])
+        receive_args = parse_args(["receive", "-o", "-"])
+
+        assert_that(send_args.paths, contains_exactly("-"))
+        assert_that(send_args.name, is_("dump.sql"))
+        assert_that(send_args.size, is_(42))
+        assert_that(str(receive_args.output_dir), is_("-"))
+
+    def test_parses_relays(self, tmp_path):
+        args = parse_args(
+            [
+                "--mailbox-url",
+                "ws://localhost:4000/v1",
+                "--transit-relay",
+                "none",
+                "send",
+                str(tmp_path),
+            ]
+        )
+
+        relays = get_relays(args)
+
+        assert_that(relays.mailbox_url, is_("ws://localhost:4000/v1"))
+        assert_that(relays.transit_relay, is_(none()))
+
+    def test_parses_alternative_transit_relays(self, tmp_path):
+        args = parse_args(
+            [
+                "--transit-relay",
+                "tcp:relay1:4001",
+                "--transit-relay",
+                "tcp:relay2:4001",
+                "send",
+                str(tmp_path),
+            ]
+        )
+
+        relays = get_relays(args)
+
+        assert_that(
+            relays.transit_relays,
+            contains_exactly("tcp:relay1:4001", "tcp:relay2:4001"),
+        )
+
+    def test_defaults_to_public_relays(self, tmp_path):
+        relays = get_relays(parse_args(["send", str(tmp_path)]))
+
+        assert_that(relays.transit_relay, is_(Relays().transit_relay))
+
+    def test_rejects_missing_files(self, tmp_path):
+        with pytest.raises(SystemExit):
+            parse_args(["send", str(tmp_path / "missing.txt")])
+
+
+def test_doesnt_import_qt():
+    script = (
+        "import sys, wormhole_ui.cli; print(any('PySide2' in m for m in sys.modules))"
+    )
+
+    output = subprocess.check_output([sys.executable, "-c", script])
+
+    assert_that(output.strip(), is_(b"False"))
@@ -0,0 +1,121 @@
+import os
+import zlib
+
+from hamcrest import assert_that, calling, instance_of, is_, raises
+import pytest
+
+from wormhole_ui.errors import ReceiveFileError
+from wormhole_ui.protocol.transit.compression import (
+    Compressor,
+    DecompressingConsumer,
+    compress_record,
+    decompress_record,
+    is_compressible,
+    is_compressible_record,
+    sample_entropy,
+)
+
+
+class TestSampleEntropy:
+    def test_repeated_byte_has_no_entropy(self):
+        assert_that(sample_entropy(b"a" * 100), is_(0.0))
+
+    def test_uniform_bytes_have_full_entropy(self):
+        assert_that(sample_entropy(bytes(range(256))), is_(8.0))
+
+
+class TestIsCompressible:
+    def test_text_is_compressible(self, tmp_path):
+        path = tmp_path / "file.txt"
+        path.write_bytes(b"hello world\n" * 10000)
+
+        assert_that(is_compressible(str(path)), is_(True))
+
+    def test_random_data_is_not_compressible(self, tmp_path):
+        path = tmp_path / "file.bin"
+        path.write_bytes(os.urandom(100_000))
+
+        assert_that(is_compressible(str(path)), is_(False))
+
+    def test_empty_remainder_is_not_compressible(self, tmp_path):
+        path = tmp_path / "file.txt"
+        path.write_bytes(b"hello")
+
+        assert_that(is_compressible(str(path), offset=5), is_(False))
+
+
+class TestIsCompressibleRecord:
+    def test_text_is_compressible(self):
+        assert_that(is_compressible_record(b"hello world\n" * 10000), is_(True))
+
+    def test_random_data_is_not_compressible(self):
+        assert_that(is_compressible_record(os.urandom(100_000)), is_(False))
+
+
+class TestCompressRecord:
+    def test_round_trip(self):
+        record = compress_record(b"hello" * 100)
+
+        assert_that(decompress_record(record, 500), is_(b"hello" * 100))
+
+    def test_raises_error_if_too_large(self):
+        record = compress_record(b"hello" * 100)
+
+        assert_that(
+            calling(decompress_record).with_args(record, 499),
+            raises(ReceiveFileError),
+        )
+
+
+class TestDecompressingConsumer:
+    @pytest.fixture(autouse=True)
+    def setup(self, mocker):
+        self.pipe = mocker.Mock()
+        self.pipe.connectConsumer.return_value = None
+        self.write_callback = mocker.Mock()
+
+    def compressed(self, data):
+        compressor = Compressor()
+        return compressor.encode(data) + compressor.flush()
+
+    def test_writes_decompressed_data(self):
+        consumer = DecompressingConsumer(10, self.write_callback)
+        results = []
+        consumer.receive(self.pipe).addCallback(results.append)
+
+        data = self.compressed(b"0123456789")
+        consumer.write(data[:4])
+        consumer.write(data[4:])
+
+        written = b"".join(c[0][0] for c in self.write_callback.call_args_list)
+        assert_that(written, is_(b"0123456789"))
+        assert_that(results, is_([10]))
+        self.pipe.disconnectConsumer.assert_called_once()
+
+    def test_errbacks_if_too_much_data(self):
+        consumer = DecompressingConsumer(5, self.write_callback)
+        failures = []
+        consumer.receive(self.pipe).addErrback(failures.append)
+
+        consumer.write(self.compressed(b"0123456789"))
+
+        assert_that(failures[0].value, instance_of(ReceiveFileError))
+        self.pipe.disconnectConsumer.assert_called_once()
+
+    def test_errbacks_if_data_follows_stream(self):
+        consumer = DecompressingConsumer(20, self.write_callback)
+        failures = []
+        consumer.receive(self.pipe).addErrback(failures.append)
+
+        consumer.write(self.compressed(b"0123456789") + b"extra")
+
+        assert_that(failures[0].value, instance_of(ReceiveFileError))
+
+    def test_errbacks_if_stream_invalid(self):
+        consumer = DecompressingConsumer(10, self.write_callback)
+        failures = []
+        consumer.receive(self.pipe).addErrback(failures.append)
+
+        consumer.write(b"not compressed")
+
+        assert_that(failures[0].value, instance_of(zlib.error))
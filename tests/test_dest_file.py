@@ -1,7 +1,15 @@
+import io
+import zipfile
+
 from hamcrest import assert_that, calling, is_, raises
 
-from wormhole_ui.errors import RespondError
-from wormhole_ui.protocol.transit.dest_file import DestFile
+from wormhole_ui.errors import ReceiveFileError, RespondError
+from wormhole_ui.protocol.transit.dest_file import (
+    DestBatch,
+    DestDirectory,
+    DestFile,
+    DestStream,
+)
 
 
 class TestDestFile:
@@ -103,3 +111,232 @@ class TestDestFile:
         assert_that((tmp_path / "file.txt.part").exists(), is_(False))
 
         dest_file.cleanup()
+
+
+class TestResume:
+    def test_existing_part_file_is_not_reused_by_default(self, tmp_path):
+        tmp_path = tmp_path.resolve()
+        (tmp_path / "file.txt.part").write_bytes(b"0123")
+        dest_file = DestFile("file.txt", 10)
+
+        dest_file.open(13, tmp_path)
+
+        assert_that(dest_file.resume_offset, is_(0))
+        assert_that(dest_file.temp_path, is_(tmp_path / "file.txt.1.part"))
+
+    def test_existing_part_file_is_resumed(self, tmp_path):
+        tmp_path = tmp_path.resolve()
+        (tmp_path / "file.txt.part").write_bytes(b"0123")
+        dest_file = DestFile("file.txt", 10)
+
+        dest_file.open(13, tmp_path, resume=True)
+        dest_file.file_object.write(b"456789")
+        dest_file.finalise()
+
+        assert_that(dest_file.resume_offset, is_(4))
+        assert_that(dest_file.transfer_bytes, is_(6))
+        assert_that((tmp_path / "file.txt").read_bytes(), is_(b"0123456789"))
+
+    def test_oversized_part_file_is_not_resumed(self, tmp_path):
+        tmp_path = tmp_path.resolve()
+        (tmp_path / "file.txt.part").write_bytes(b"0123")
+        dest_file = DestFile("file.txt", 3)
+
+        dest_file.open(13, tmp_path, resume=True)
+
+        assert_that(dest_file.resume_offset, is_(0))
+        assert_that(dest_file.temp_path, is_(tmp_path / "file.txt.1.part"))
+
+    def test_seek_discards_the_rest_of_the_part_file(self, tmp_path):
+        tmp_path = tmp_path.resolve()
+        (tmp_path / "file.txt.part").write_bytes(b"0123")
+        dest_file = DestFile("file.txt", 10)
+        dest_file.open(13, tmp_path, resume=True)
+
+        dest_file.seek(0)
+        dest_file.cleanup()
+
+        assert_that(dest_file.transfer_bytes, is_(10))
+        assert_that((tmp_path / "file.txt.part").exists(), is_(False))
+
+    def test_cleanup_keeps_partial_file(self, tmp_path):
+        tmp_path = tmp_path.resolve()
+        dest_file = DestFile("file.txt", 10)
+        dest_file.open(13, tmp_path, resume=True)
+        dest_file.file_object.write(b"0123")
+
+        dest_file.cleanup()
+
+        assert_that((tmp_path / "file.txt.part").read_bytes(), is_(b"0123"))
+
+
+class TestDestStream:
+    def test_attributes_are_set(self):
+        stream = io.BytesIO()
+        dest_stream = DestStream(DestFile("file.txt", 42), stream)
+        dest_stream.open(13)
+
+        assert_that(dest_stream.id, is_(13))
+        assert_that(dest_stream.name, is_("file.txt"))
+        assert_that(dest_stream.final_bytes, is_(42))
+        assert_that(dest_stream.file_object, is_(stream))
+
+    def test_only_single_files_can_be_received(self):
+        dest_batch = DestBatch([{"filename": "one", "filesize": 1}])
+
+        assert_that(
+            calling(DestStream).with_args(dest_batch, io.BytesIO()),
+            raises(RespondError),
+        )
+
+    def test_cant_resume(self):
+        dest_stream = DestStream(DestFile("file.txt", 42), io.BytesIO())
+
+        assert_that(calling(dest_stream.seek).with_args(10), raises(ReceiveFileError))
+
+    def test_finalise_leaves_the_stream_open(self):
+        stream = io.BytesIO()
+        dest_stream = DestStream(DestFile("file.txt", 42), stream)
+        dest_stream.open(13)
+
+        dest_stream.finalise()
+
+        assert_that(stream.closed, is_(False))
+
+
+class TestDestBatch:
+    FILES = [
+        {"filename": "one.txt", "filesize": 1},
+        {"filename": "two.txt", "filesize": 2},
+    ]
+
+    def test_attributes_are_set(self):
+        dest_batch = DestBatch(self.FILES)
+
+        assert_that(dest_batch.name, is_("2 files"))
+        assert_that(dest_batch.final_bytes, is_(3))
+        assert_that(dest_batch.transfer_bytes, is_(3))
+
+    def test_files_are_opened_one_at_a_time(self, tmp_path):
+        dest_batch = DestBatch(self.FILES)
+        dest_batch.open(13, str(tmp_path))
+
+        first = dest_batch.open_next()
+
+        assert_that(first.id, is_(13))
+        assert_that((tmp_path / "one.txt.part").exists())
+        assert_that((tmp_path / "two.txt.part").exists(), is_(False))
+        assert_that(dest_batch.has_next(), is_(True))
+
+    def test_next_packed_files_are_the_run_of_packed_files(self):
+        dest_batch = DestBatch(
+            [
+                {"filename": "one", "filesize": 1, "packed": True},
+                {"filename": "two", "filesize": 1, "packed": True},
+                {"filename": "big", "filesize": 1},
+                {"filename": "three", "filesize": 1, "packed": True},
+            ]
+        )
+
+        assert_that(dest_batch.next_is_packed(), is_(True))
+        packed = dest_batch.next_packed_files()
+        assert_that([f.name for f in packed], is_(["one", "two"]))
+
+        dest_batch.skip(2)
+        assert_that(dest_batch.next_is_packed(), is_(False))
+        assert_that(dest_batch.next_packed_files(), is_([]))
+
+    def test_open_raises_error_if_insufficient_disk_space(self, tmp_path):
+        dest_batch = DestBatch([{"filename": "big", "filesize": 1_000_000_000_000_000}])
+
+        assert_that(
+            calling(dest_batch.open).with_args(13, str(tmp_path)),
+            raises(RespondError),
+        )
+
+    def test_checks_disk_space_in_dest_path(self, mocker, tmp_path):
+        statvfs = mocker.patch(
+            "wormhole_ui.protocol.transit.dest_file.os.statvfs",
+            return_value=mocker.Mock(f_frsize=4096, f_bfree=1_000_000),
+        )
+        dest_batch = DestBatch(self.FILES)
+
+        dest_batch.open(13, str(tmp_path))
+
+        statvfs.assert_called_once_with(tmp_path.resolve())
+
+    def test_cleanup_deletes_the_current_temp_file(self, tmp_path):
+        dest_batch = DestBatch(self.FILES)
+        dest_batch.open(13, str(tmp_path))
+        dest_batch.open_next().finalise()
+        dest_batch.open_next()
+
+        dest_batch.cleanup()
+
+        assert_that((tmp_path / "one.txt").exists())
+        assert_that((tmp_path / "two.txt.part").exists(), is_(False))
+
+
+class TestDestDirectory:
+    def zip_bytes(self, files):
+        data = io.BytesIO()
+        with zipfile.ZipFile(data, "w") as zip_file:
+            for name, contents in files.items():
+                zip_file.writestr(name, contents)
+        return data.getvalue()
+
+    def test_attributes_are_set(self):
+        dest_directory = DestDirectory("path/to/dir", 142, 42, 2)
+
+        assert_that(dest_directory.name, is_("dir"))
+        assert_that(dest_directory.final_bytes, is_(142))
+        assert_that(dest_directory.transfer_bytes, is_(142))
+
+    def test_invalid_name_raises_error(self):
+        assert_that(
+            calling(DestDirectory).with_args("..", 142, 42, 2), raises(RespondError)
+        )
+
+    def test_files_are_extracted_into_place(self, tmp_path):
+        data = self.zip_bytes({"one.txt": b"one", "sub/two.txt": b"two"})
+        dest_directory = DestDirectory("dir", len(data), 6, 2)
+        dest_directory.open(13, str(tmp_path))
+
+        dest_directory.file_object.write(data)
+        assert_that((tmp_path / "dir").exists(), is_(False))
+        dest_directory.finalise()
+        dest_directory.cleanup()
+
+        assert_that((tmp_path / "dir" / "one.txt").read_bytes(), is_(b"one"))
+        assert_that((tmp_path / "dir" / "sub" / "two.txt").read_bytes(), is_(b"two"))
+        assert_that(list(tmp_path.iterdir()), is_([tmp_path / "dir"]))
+
+    def test_existing_directory_isnt_overwritten(self, tmp_path):
+        (tmp_path / "dir").mkdir()
+        data = self.zip_bytes({"one.txt": b"one"})
+        dest_directory = DestDirectory("dir", len(data), 3, 1)
+        dest_directory.open(13, str(tmp_path))
+        dest_directory.file_object.write(data)
+
+        dest_directory.finalise()
+
+        assert_that(dest_directory.name, is_("dir.1"))
+        assert_that((tmp_path / "dir.1" / "one.txt").exists())
+
+    def test_incomplete_directory_raises_error(self, tmp_path):
+        data = self.zip_bytes({"one.txt": b"one"})
+        dest_directory = DestDirectory("dir", len(data), 3, 1)
+        dest_directory.open(13, str(tmp_path))
+        dest_directory.file_object.write(data[:40])
+
+        assert_that(calling(dest_directory.finalise), raises(ReceiveFileError))
+
+    def test_cleanup_removes_partial_directory(self, tmp_path):
+        data = self.zip_bytes({"one.txt": b"one"})
+        dest_directory = DestDirectory("dir", len(data), 3, 1)
+        dest_directory.open(13, str(tmp_path))
+        dest_directory.file_object.write(data[:40])
+
+        dest_directory.cleanup()
+
+        assert_that(list(tmp_path.iterdir()), is_([]))
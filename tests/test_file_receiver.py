@@ -0,0 +1,45 @@
+from hamcrest import assert_that, instance_of
+import pytest
+from twisted.internet import defer
+
+from tests.fake_reactor import FakeReactor
+
+from wormhole_ui.errors import ReceiveFileError
+from wormhole_ui.protocol.transit.file_receiver import FileReceiver
+
+
+class TestReceive:
+    @pytest.fixture(autouse=True)
+    def setup(self, mocker):
+        self.writer = mocker.patch(
+            "wormhole_ui.protocol.transit.file_receiver.ThreadedWriter"
+        )()
+        self.pipe = mocker.Mock()
+        transit = mocker.Mock()
+        transit.connect.return_value = defer.succeed(self.pipe)
+        self.file_receiver = FileReceiver(FakeReactor(), transit)
+        self.file_receiver.open()
+        self.dest_file = mocker.Mock(transfer_bytes=42)
+
+    def receive(self, mocker):
+        failures = []
+        self.file_receiver.receive(self.dest_file, mocker.Mock()).addErrback(
+            failures.append
+        )
+        return failures
+
+    def test_flush_error_is_reported(self, mocker):
+        self.pipe.writeToFile.return_value = defer.succeed(42)
+        self.writer.flush.return_value = defer.fail(OSError("Disk full"))
+
+        failures = self.receive(mocker)
+
+        assert_that(failures[0].value, instance_of(OSError))
+
+    def test_transfer_error_isnt_replaced_by_flush_error(self, mocker):
+        self.pipe.writeToFile.return_value = defer.fail(ReceiveFileError("Oops"))
+        self.writer.flush.return_value = defer.fail(OSError("Disk full"))
+
+        failures = self.receive(mocker)
+
+        assert_that(failures[0].value, instance_of(ReceiveFileError))
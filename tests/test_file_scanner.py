@@ -0,0 +1,71 @@
+from pathlib import Path
+
+from hamcrest import assert_that, is_
+import pytest
+
+from tests.fake_reactor import FakeReactor
+
+from wormhole_ui.widgets.file_scanner import FileScanner
+
+
+@pytest.fixture
+def test_file_path():
+    return Path(__file__).parent / "test_files" / "file.txt"
+
+
+class TestFileScanner:
+    @pytest.fixture(autouse=True)
+    def setup(self, mocker):
+        self.reactor = FakeReactor()
+        self.scanner = FileScanner(self.reactor)
+        self.scanned = mocker.Mock()
+        self.scanner.scanned.connect(self.scanned)
+
+    def scan(self, files):
+        self.scanner.scan(files)
+        self.reactor.run_threads()
+
+    def test_emits_resolved_path_and_size(self, test_file_path):
+        relative_path = test_file_path.parent / ".." / "test_files" / "file.txt"
+
+        self.scan([(13, str(relative_path))])
+
+        self.scanned.assert_called_once_with(
+            [
+                (
+                    13,
+                    str(test_file_path.resolve()),
+                    test_file_path.stat().st_size,
+                    False,
+                )
+            ]
+        )
+
+    def test_emits_none_for_missing_file(self, tmp_path):
+        self.scan([(13, str(tmp_path / "missing.txt"))])
+
+        self.scanned.assert_called_once_with([(13, None, None, False)])
+
+    def test_emits_resolved_directory(self, tmp_path):
+        self.scan([(13, str(tmp_path))])
+
+        self.scanned.assert_called_once_with(
+            [(13, str(tmp_path.resolve()), None, True)]
+        )
+
+    def test_scans_on_thread_pool(self, tmp_path):
+        self.scanner.scan([(13, str(tmp_path))])
+        self.scanned.assert_not_called()
+
+        self.reactor.run_threads()
+
+        self.scanned.assert_called_once()
+
+    def test_scans_in_batches(self, test_file_path):
+        files = [(id, str(test_file_path)) for id in range(1000)]
+
+        self.scan(files)
+
+        batches = [call[0][0] for call in self.scanned.call_args_list]
+        assert_that([len(batch) for batch in batches], is_([256, 256, 256, 232]))
+        assert_that([result[0] for result in sum(batches, [])], is_(list(range(1000))))
@@ -1,5 +1,6 @@
 from hamcrest import assert_that, is_, starts_with
 import pytest
+from twisted.internet import defer
 
 from wormhole_ui.errors import (
     MessageError,
@@ -11,6 +12,8 @@ from wormhole_ui.errors import (
     SendTextError,
 )
 from wormhole_ui.protocol.file_transfer_protocol import FileTransferProtocol
+from wormhole_ui.protocol.relays import Relays
+from wormhole_ui.protocol.signals import HeadlessSignals
 
 
 class TestBase:
@@ -20,11 +23,13 @@ class TestBase:
         self.wormhole = wormhole.create()
         self.wormhole_create = wormhole.create
 
-        self.transit = mocker.patch(
+        self.transit_class = mocker.patch(
             "wormhole_ui.protocol.file_transfer_protocol.TransitProtocolPair"
-        )()
+        )
+        self.transit = self.transit_class()
 
         self.reactor = mocker.Mock()
+        self.reactor.seconds.return_value = 0
         self.signals = mocker.Mock()
 
     def connect(self, signal):
@@ -41,8 +46,38 @@ class TestOpen(TestBase):
             relay_url="ws://relay.magic-wormhole.io:4000/v1",
             reactor=self.reactor,
             delegate=mocker.ANY,
-            versions={"v0": {"mode": "connect"}},
+            versions={
+                "v0": {
+                    "mode": "connect",
+                    "features": [
+                        "batch",
+                        "large_messages",
+                        "pack",
+                        "reconnect",
+                        "resume",
+                        "shared_transit",
+                        "transit_messages",
+                        "warm_start",
+                        "zlib",
+                    ],
+                    "hashes": ["blake2b", "sha256"],
+                    "record_bytes": 262144,
+                    "side": mocker.ANY,
+                }
+            },
+        )
+
+    def test_uses_configured_relays(self, mocker):
+        relays = Relays("ws://localhost:4000/v1", "tcp:localhost:4001")
+        ftp = FileTransferProtocol(self.reactor, self.signals, relays)
+        ftp.open(None)
+
+        assert_that(
+            self.wormhole_create.call_args[1]["relay_url"],
+            is_("ws://localhost:4000/v1"),
         )
+        relay_selector = self.transit_class.call_args[0][4]
+        assert_that(relay_selector.current, is_("tcp:localhost:4001"))
 
     def test_can_allocate_a_code(self):
         ftp = FileTransferProtocol(self.reactor, self.signals)
@@ -59,6 +94,30 @@ class TestOpen(TestBase):
         self.wormhole.set_code.assert_called_with("42-is-a-code")
 
 
+class TestWarmStart(TestBase):
+    def test_starts_transit_handshake_when_wormhole_opens(self):
+        ftp = FileTransferProtocol(self.reactor, self.signals)
+        wormhole_open = self.connect(self.signals.wormhole_open)
+        versions_received = self.connect(self.signals.versions_received)
+
+        ftp.open(None)
+        versions_received({"v0": {"features": ["warm_start"]}})
+        wormhole_open()
+
+        self.transit.warm_start.assert_called_once()
+
+    def test_waits_for_a_file_unless_peer_supports_warm_start(self):
+        ftp = FileTransferProtocol(self.reactor, self.signals)
+        wormhole_open = self.connect(self.signals.wormhole_open)
+        versions_received = self.connect(self.signals.versions_received)
+
+        ftp.open(None)
+        versions_received({"v0": {}})
+        wormhole_open()
+
+        self.transit.warm_start.assert_not_called()
+
+
 class TestClose(TestBase):
     def test_can_close_the_wormhole_and_transit(self):
         ftp = FileTransferProtocol(self.reactor, self.signals)
@@ -85,6 +144,16 @@ class TestClose(TestBase):
 
         self.signals.wormhole_closed.emit.assert_called()
 
+    def test_can_close_before_opening(self, mocker):
+        signals = HeadlessSignals()
+        slot = mocker.Mock()
+        signals.wormhole_closed.connect(slot)
+        ftp = FileTransferProtocol(self.reactor, signals)
+
+        ftp.close()
+
+        slot.assert_called_once()
+
 
 class TestShutdown(TestBase):
     def test_can_close_the_wormhole_and_transit(self):
@@ -164,8 +233,59 @@ class TestSendMessage(TestBase):
         ftp = FileTransferProtocol(self.reactor, self.signals)
 
         ftp.open(None)
-        ftp.send_message("hello world")
+        ftp.send_message(7, "hello world")
+
+        self.wormhole.send_message.assert_called_with(
+            b'{"offer": {"message": "hello world"}}'
+        )
+
+    def test_sends_over_transit_once_connected_if_supported(self, mocker):
+        ftp = FileTransferProtocol(self.reactor, self.signals)
+        versions_received = self.connect(self.signals.versions_received)
+        channel = mocker.Mock()
+        channel.receive_record.return_value = defer.Deferred()
+
+        ftp.open(None)
+        versions_received({"v0": {"features": ["transit_messages"]}})
+        ftp._transit_delegate.transit_connected(channel, mocker.Mock())
+        ftp.send_message(7, "hello world")
+
+        channel.send_record.assert_called_once_with(
+            b'{"message": "hello world", "seq": 0}'
+        )
+        self.wormhole.send_message.assert_not_called()
+
+    def test_large_message_starts_transit(self):
+        ftp = FileTransferProtocol(self.reactor, self.signals)
+        versions_received = self.connect(self.signals.versions_received)
+
+        ftp.open(None)
+        versions_received(
+            {
+                "v0": {
+                    "features": [
+                        "large_messages",
+                        "shared_transit",
+                        "transit_messages",
+                    ],
+                    "side": "theirs",
+                }
+            }
+        )
+        ftp.send_message(7, "x" * 1024 * 1024)
 
+        self.transit.warm_start.assert_called_once()
+        self.wormhole.send_message.assert_not_called()
+
+    def test_sends_through_mailbox_if_transit_messages_not_supported(self, mocker):
+        ftp = FileTransferProtocol(self.reactor, self.signals)
+        channel = mocker.Mock()
+
+        ftp.open(None)
+        ftp._transit_delegate.transit_connected(channel, mocker.Mock())
+        ftp.send_message(7, "hello world")
+
+        channel.send_record.assert_not_called()
         self.wormhole.send_message.assert_called_with(
             b'{"offer": {"message": "hello world"}}'
         )
@@ -180,6 +300,25 @@ class TestSendFile(TestBase):
 
         self.transit.send_file.assert_called_with(42, "test_file")
 
+    def test_send_files_calls_transit(self):
+        ftp = FileTransferProtocol(self.reactor, self.signals)
+
+        ftp.open(None)
+        ftp.send_files([(42, "one"), (43, "two")])
+
+        self.transit.send_files.assert_called_with([(42, "one"), (43, "two")])
+
+    def test_transit_uses_peer_capabilities(self):
+        ftp = FileTransferProtocol(self.reactor, self.signals)
+        versions_received = self.connect(self.signals.versions_received)
+
+        ftp.open(None)
+        versions_received({"v0": {"mode": "connect", "features": ["batch"]}})
+
+        capabilities = self.transit_class.call_args[0][3]
+        assert_that(capabilities.supports("batch"), is_(True))
+        assert_that(capabilities.supports("pack"), is_(False))
+
     def test_is_sending_file_calls_transit(self, mocker):
         ftp = FileTransferProtocol(self.reactor, self.signals)
 
@@ -198,6 +337,14 @@ class TestReceiveFile(TestBase):
 
         self.transit.receive_file.assert_called_with(42, "path/to/file")
 
+    def test_can_receive_into_stream_calls_transit(self):
+        ftp = FileTransferProtocol(self.reactor, self.signals)
+
+        ftp.open(None)
+        self.transit.can_receive_into_stream.return_value = False
+
+        assert_that(ftp.can_receive_into_stream(), is_(False))
+
     def test_is_receiving_file_calls_transit(self, mocker):
         ftp = FileTransferProtocol(self.reactor, self.signals)
 
@@ -356,27 +503,43 @@ class TestHandleMessage(TestBase):
         ftp = FileTransferProtocol(self.reactor, self.signals)
 
         ftp.open(None)
+        ftp.send_message(7, "hello world")
         ftp._wormhole_delegate.wormhole_got_message(
             b'{"answer": {"message_ack": "ok"}}'
         )
 
-        self.signals.message_sent.emit.assert_called_with(True)
+        self.signals.message_sent.emit.assert_called_with(7, True)
         self.signals.error.emit.assert_not_called()
 
     def test_message_ack_with_error_emits_message_sent_and_error(self):
         ftp = FileTransferProtocol(self.reactor, self.signals)
 
         ftp.open(None)
+        ftp.send_message(7, "hello world")
         ftp._wormhole_delegate.wormhole_got_message(
             b'{"answer": {"message_ack": "error"}}'
         )
 
-        self.signals.message_sent.emit.assert_called_with(False)
+        self.signals.message_sent.emit.assert_called_with(7, False)
         self.signals.error.emit.assert_called_once()
         args = self.signals.error.emit.call_args[0]
         assert_that(args[0], is_(SendTextError))
         assert_that(args[1], starts_with("Traceback"))
 
+    def test_message_acks_are_matched_by_number(self):
+        ftp = FileTransferProtocol(self.reactor, self.signals)
+        versions_received = self.connect(self.signals.versions_received)
+
+        ftp.open(None)
+        versions_received({"v0": {"features": ["transit_messages"]}})
+        ftp.send_message(7, "first")
+        ftp.send_message(8, "second")
+        ftp._wormhole_delegate.wormhole_got_message(
+            b'{"answer": {"message_ack": "ok", "seq": 1}}'
+        )
+
+        self.signals.message_sent.emit.assert_called_once_with(8, True)
+
     def test_wormhole_closed_after_receiving_message_ack_if_connect_mode_not_supported(
         self,
     ):
@@ -409,9 +572,21 @@ class TestHandleMessage(TestBase):
         ftp.open(None)
         ftp._wormhole_delegate.wormhole_got_message(b'{"answer": {"file_ack": "ok"}}')
 
-        self.transit.handle_file_ack.assert_called_once()
+        self.transit.handle_file_ack.assert_called_once_with(None)
         self.signals.error.emit.assert_not_called()
 
+    def test_file_ack_with_resume_passes_it_to_transit(self):
+        ftp = FileTransferProtocol(self.reactor, self.signals)
+
+        ftp.open(None)
+        ftp._wormhole_delegate.wormhole_got_message(
+            b'{"answer": {"file_ack": "ok", "resume": {"offset": 4, "sha256": "ab"}}}'
+        )
+
+        self.transit.handle_file_ack.assert_called_once_with(
+            {"offset": 4, "sha256": "ab"}
+        )
+
     def test_file_ack_with_error_emits_error(self):
         ftp = FileTransferProtocol(self.reactor, self.signals)
 
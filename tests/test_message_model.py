@@ -0,0 +1,160 @@
+from hamcrest import assert_that, is_
+import pytest
+from PySide2.QtCore import Qt
+
+from wormhole_ui.widgets.message_model import (
+    ICON_COLUMN,
+    ICON_ROLE,
+    PROGRESS_ROLE,
+    TEXT_COLUMN,
+    MessageModel,
+    ReceiveFile,
+    ReceiveItem,
+    SendFile,
+    SendMessage,
+)
+
+
+class TestBase:
+    @pytest.fixture(autouse=True)
+    def setup(self, mocker):
+        self.model = MessageModel()
+        self.data_changed = mocker.Mock()
+        self.model.dataChanged.connect(self.data_changed)
+
+    def text(self, id):
+        return self.model.index(id, TEXT_COLUMN).data(Qt.DisplayRole)
+
+    def progress(self, id):
+        return self.model.index(id, ICON_COLUMN).data(PROGRESS_ROLE)
+
+    def icon(self, id):
+        return self.model.index(id, ICON_COLUMN).data(ICON_ROLE)
+
+
+class TestAppend(TestBase):
+    def test_returns_row_as_id(self):
+        assert_that(self.model.append(ReceiveItem("one")), is_(0))
+        assert_that(self.model.append(ReceiveItem("two")), is_(1))
+        assert_that(self.model.rowCount(), is_(2))
+
+    def test_message_has_text_and_no_progress(self):
+        id = self.model.append(ReceiveItem("message"))
+
+        assert_that(self.text(id), is_("message"))
+        assert_that(self.progress(id), is_(None))
+        assert_that(self.icon(id), is_(None))
+
+    def test_file_is_queued_with_no_progress(self):
+        id = self.model.append(SendFile("file.txt"))
+
+        assert_that(self.text(id), is_("Queued: file.txt..."))
+        assert_that(self.progress(id), is_(0))
+
+    def test_append_many_returns_ids(self):
+        self.model.append(ReceiveItem("message"))
+
+        ids = self.model.append_many([SendFile("one.txt"), SendFile("two.txt")])
+
+        assert_that(list(ids), is_([1, 2]))
+        assert_that(self.text(2), is_("Queued: two.txt..."))
+
+    def test_append_many_inserts_rows_in_one_update(self, mocker):
+        rows_inserted = mocker.Mock()
+        self.model.rowsInserted.connect(rows_inserted)
+
+        self.model.append_many([SendFile(f"file{i}.txt") for i in range(100_000)])
+
+        rows_inserted.assert_called_once_with(mocker.ANY, 0, 99_999)
+
+    def test_scales_to_100k_rows(self):
+        for i in range(100_000):
+            self.model.append(SendFile(f"file{i}.txt"))
+        self.model.transfer_started(99_999)
+        self.model.transfer_progress(99_999, 50)
+
+        assert_that(self.model.rowCount(), is_(100_000))
+        assert_that(self.text(99_999), is_("Sending: file99999.txt..."))
+        assert_that(self.progress(99_999), is_(50))
+
+
+class TestTransfer(TestBase):
+    def test_started_updates_text(self):
+        id = self.model.append(ReceiveFile("file.txt"))
+
+        self.model.transfer_started(id)
+
+        assert_that(self.text(id), is_("Receiving: file.txt..."))
+        self.data_changed.assert_called_once()
+
+    def test_progress_updates_progress(self):
+        id = self.model.append(SendFile("file.txt"))
+
+        self.model.transfer_progress(id, 42)
+
+        assert_that(self.progress(id), is_(42))
+        self.data_changed.assert_called_once()
+
+    def test_unchanged_progress_is_not_signalled(self):
+        id = self.model.append(SendFile("file.txt"))
+
+        self.model.transfer_progress(id, 42)
+        self.model.transfer_progress(id, 42)
+
+        self.data_changed.assert_called_once()
+
+    def test_complete_shows_check_icon(self):
+        id = self.model.append(SendFile("file.txt"))
+        self.model.transfer_started(id)
+
+        self.model.transfer_complete(id, "file.1.txt")
+
+        assert_that(self.text(id), is_("Sent: file.1.txt"))
+        assert_that(self.icon(id), is_("check.svg"))
+
+    def test_failed_only_changes_transfers_in_progress(self):
+        queued_id = self.model.append(SendFile("queued.txt"))
+        sending_id = self.model.append(SendFile("sending.txt"))
+        self.model.transfer_started(sending_id)
+
+        self.model.transfers_failed()
+
+        assert_that(self.text(queued_id), is_("Queued: queued.txt..."))
+        assert_that(self.text(sending_id), is_("Failed to send sending.txt"))
+        assert_that(self.icon(sending_id), is_("times.svg"))
+
+
+class TestSendMessage(TestBase):
+    def test_pending_until_sent(self):
+        id = self.model.append(SendMessage("hello"))
+        self.model.transfer_started(id)
+        assert_that(self.text(id), is_("Sending: hello"))
+
+        self.model.message_sent(id)
+
+        assert_that(self.text(id), is_("Sent: hello"))
+        assert_that(self.icon(id), is_(None))
+
+    def test_messages_can_be_sent_out_of_order(self):
+        first_id = self.model.append(SendMessage("first"))
+        second_id = self.model.append(SendMessage("second"))
+        self.model.transfer_started(first_id)
+        self.model.transfer_started(second_id)
+
+        self.model.message_sent(second_id)
+
+        assert_that(self.text(first_id), is_("Sending: first"))
+        assert_that(self.text(second_id), is_("Sent: second"))
+
+    def test_unsent_messages_fail_with_transfers(self):
+        sent_id = self.model.append(SendMessage("sent"))
+        pending_id = self.model.append(SendMessage("pending"))
+        self.model.transfer_started(sent_id)
+        self.model.transfer_started(pending_id)
+        self.model.message_sent(sent_id)
+
+        self.model.transfers_failed()
+
+        assert_that(self.text(sent_id), is_("Sent: sent"))
+        assert_that(self.text(pending_id), is_("Failed to send: pending"))
+        assert_that(self.icon(pending_id), is_("times.svg"))
@@ -0,0 +1,287 @@
+import json
+
+from hamcrest import assert_that, contains_exactly, instance_of, is_
+import pytest
+from twisted.internet import defer, error
+
+from wormhole_ui.protocol.capabilities import Capabilities
+from wormhole_ui.errors import MessageError
+from wormhole_ui.protocol.messenger import (
+    LARGE_MESSAGE_BYTES,
+    MAILBOX,
+    MAX_MESSAGE_BYTES,
+    TRANSIT,
+    Messenger,
+)
+
+
+class FakeChannel:
+    """Message channel that records what's sent, and is read by the Messenger"""
+
+    def __init__(self):
+        self.sent = []
+        self.reads = []
+
+    def send_record(self, record):
+        self.sent.append(json.loads(record.decode("utf-8")))
+
+    def receive_record(self):
+        deferred = defer.Deferred()
+        self.reads.append(deferred)
+        return deferred
+
+    def receive(self, data):
+        self.reads.pop(0).callback(json.dumps(data).encode("utf-8"))
+
+    def lose_connection(self):
+        self.reads.pop(0).errback(error.ConnectionClosed())
+
+
+class TestBase:
+    @pytest.fixture(autouse=True)
+    def setup(self, mocker):
+        self.reactor = mocker.Mock()
+        self.reactor.seconds.return_value = 0
+        self.signals = mocker.Mock()
+        self.capabilities = Capabilities()
+        self.capabilities.set_peer_versions({"v0": {"features": ["transit_messages"]}})
+        self.send_data = mocker.Mock()
+        self.channel = FakeChannel()
+        self.messenger = Messenger(
+            self.reactor, self.signals, self.capabilities, self.send_data
+        )
+
+
+class TestMailbox(TestBase):
+    def test_sends_numbered_messages(self):
+        self.messenger.send(10, "hello")
+        self.messenger.send(11, "world")
+
+        assert_that(
+            self.send_data.call_args_list,
+            contains_exactly(
+                (({"offer": {"message": "hello", "seq": 0}},),),
+                (({"offer": {"message": "world", "seq": 1}},),),
+            ),
+        )
+
+    def test_doesnt_number_messages_if_peer_doesnt_support_it(self):
+        self.capabilities.set_peer_versions({})
+
+        self.messenger.send(10, "hello")
+
+        self.send_data.assert_called_once_with({"offer": {"message": "hello"}})
+
+    def test_acks_with_the_messages_number(self):
+        self.messenger.handle_offer({"message": "hello", "seq": 3})
+
+        self.send_data.assert_called_once_with(
+            {"answer": {"message_ack": "ok", "seq": 3}}
+        )
+        self.signals.message_received.emit.assert_called_once_with("hello")
+
+    def test_records_round_trip(self):
+        self.messenger.send(10, "hello")
+        self.reactor.seconds.return_value = 0.25
+
+        is_ok = self.messenger.handle_ack({"message_ack": "ok", "seq": 0})
+
+        assert_that(is_ok, is_(True))
+        assert_that(list(self.messenger.round_trips[MAILBOX]), contains_exactly(0.25))
+        self.signals.message_sent.emit.assert_called_once_with(10, True)
+
+    def test_acks_can_arrive_out_of_order(self):
+        self.messenger.send(10, "hello")
+        self.messenger.send(11, "world")
+
+        self.messenger.handle_ack({"message_ack": "ok", "seq": 1})
+        self.messenger.handle_ack({"message_ack": "error", "seq": 0})
+
+        assert_that(
+            self.signals.message_sent.emit.call_args_list,
+            contains_exactly(((11, True),), ((10, False),)),
+        )
+
+    def test_acks_without_numbers_are_for_the_oldest_message(self):
+        self.capabilities.set_peer_versions({})
+        self.messenger.send(10, "hello")
+        self.messenger.send(11, "world")
+
+        self.messenger.handle_ack({"message_ack": "ok"})
+
+        self.signals.message_sent.emit.assert_called_once_with(10, True)
+
+    def test_ignores_acks_for_unknown_messages(self):
+        is_ok = self.messenger.handle_ack({"message_ack": "ok", "seq": 3})
+
+        assert_that(is_ok, is_(True))
+        self.signals.message_sent.emit.assert_not_called()
+
+
+class TestTransit(TestBase):
+    @pytest.fixture(autouse=True)
+    def use_channel(self, setup, mocker):
+        self.messenger.use_channel(self.channel, mocker.Mock())
+
+    def test_sends_over_the_channel(self):
+        self.messenger.send(10, "hello")
+
+        assert_that(self.channel.sent, contains_exactly({"message": "hello", "seq": 0}))
+        self.send_data.assert_not_called()
+        assert_that(self.messenger.route, is_(TRANSIT))
+
+    def test_acks_messages_from_the_channel(self):
+        self.channel.receive({"message": "hello", "seq": 5})
+
+        assert_that(
+            self.channel.sent, contains_exactly({"message_ack": "ok", "seq": 5})
+        )
+        self.signals.message_received.emit.assert_called_once_with("hello")
+
+    def test_records_round_trip_of_acks_from_the_channel(self):
+        self.messenger.send(10, "hello")
+        self.reactor.seconds.return_value = 0.002
+
+        self.channel.receive({"message_ack": "ok", "seq": 0})
+
+        assert_that(list(self.messenger.round_trips[TRANSIT]), contains_exactly(0.002))
+        self.signals.message_sent.emit.assert_called_once_with(10, True)
+
+    def test_ignores_messages_received_both_ways(self):
+        self.channel.receive({"message": "hello", "seq": 0})
+        self.messenger.handle_offer({"message": "hello", "seq": 0})
+
+        self.signals.message_received.emit.assert_called_once_with("hello")
+
+    def test_resends_unacked_messages_through_mailbox_if_connection_lost(self):
+        self.messenger.send(10, "hello")
+        self.messenger.send(11, "world")
+        self.channel.receive({"message_ack": "ok", "seq": 0})
+
+        self.channel.lose_connection()
+
+        self.send_data.assert_called_once_with(
+            {"offer": {"message": "world", "seq": 1}}
+        )
+        assert_that(self.messenger.route, is_(MAILBOX))
+
+    def test_doesnt_resend_once_closed(self):
+        self.messenger.send(10, "hello")
+        self.messenger.close()
+
+        self.channel.lose_connection()
+
+        self.send_data.assert_not_called()
+
+
+class TestLargeMessages(TestBase):
+    @pytest.fixture(autouse=True)
+    def large_messages(self, setup, mocker):
+        self.capabilities = Capabilities(side="ours")
+        self.capabilities.set_peer_versions(
+            {
+                "v0": {
+                    "features": [
+                        "large_messages",
+                        "shared_transit",
+                        "transit_messages",
+                    ],
+                    "side": "theirs",
+                }
+            }
+        )
+        self.messenger = Messenger(
+            self.reactor, self.signals, self.capabilities, self.send_data
+        )
+        self.file_sender = mocker.patch(
+            "wormhole_ui.protocol.messenger.FileSender"
+        ).return_value
+        self.file_sender.open.return_value = defer.succeed(None)
+        self.file_sender.send.return_value = defer.succeed("hash")
+        self.text_channel = mocker.Mock()
+        self.large_message = "x" * (LARGE_MESSAGE_BYTES + 1)
+
+    def test_waits_for_transit(self):
+        self.messenger.send(10, self.large_message)
+
+        self.send_data.assert_not_called()
+        assert_that(self.messenger.is_waiting_for_transit, is_(True))
+
+    def test_streams_over_transit_once_connected(self):
+        self.messenger.send(10, self.large_message)
+
+        self.messenger.use_channel(self.channel, self.text_channel)
+
+        assert_that(
+            self.channel.sent,
+            contains_exactly(
+                {"message_stream": {"seq": 0, "size": LARGE_MESSAGE_BYTES + 1}}
+            ),
+        )
+        source_text = self.file_sender.send.call_args[0][0]
+        assert_that(source_text.final_bytes, is_(LARGE_MESSAGE_BYTES + 1))
+        assert_that(self.messenger.is_waiting_for_transit, is_(False))
+
+    def test_small_messages_dont_wait(self):
+        self.messenger.send(10, "hello")
+
+        self.send_data.assert_called_once_with(
+            {"offer": {"message": "hello", "seq": 0}}
+        )
+
+    def test_goes_through_mailbox_if_peer_doesnt_support_it(self):
+        self.capabilities.set_peer_versions(
+            {"v0": {"features": ["transit_messages"], "side": "theirs"}}
+        )
+
+        self.messenger.send(10, self.large_message)
+
+        self.send_data.assert_called_once_with(
+            {"offer": {"message": self.large_message, "seq": 0}}
+        )
+
+    def test_fails_if_too_large(self):
+        self.messenger.use_channel(self.channel, self.text_channel)
+
+        self.messenger.send(10, "x" * (MAX_MESSAGE_BYTES + 1))
+
+        self.signals.message_sent.emit.assert_called_once_with(10, False)
+        self.file_sender.send.assert_not_called()
+
+    def test_receives_streamed_messages(self):
+        def write_to_file(f, expected):
+            f.write(self.large_message.encode("utf-8"))
+            return defer.succeed(expected)
+
+        self.text_channel.writeToFile.side_effect = write_to_file
+        self.messenger.use_channel(self.channel, self.text_channel)
+
+        self.channel.receive(
+            {"message_stream": {"seq": 3, "size": LARGE_MESSAGE_BYTES + 1}}
+        )
+
+        self.signals.message_received.emit.assert_called_once_with(self.large_message)
+        assert_that(
+            self.channel.sent, contains_exactly({"message_ack": "ok", "seq": 3})
+        )
+
+    def test_refuses_to_receive_too_large_messages(self):
+        self.messenger.use_channel(self.channel, self.text_channel)
+
+        self.channel.receive(
+            {"message_stream": {"seq": 3, "size": MAX_MESSAGE_BYTES + 1}}
+        )
+
+        self.text_channel.writeToFile.assert_not_called()
+        assert_that(self.signals.error.emit.call_args[0][0], instance_of(MessageError))
+
+    def test_resends_through_mailbox_if_connection_lost(self):
+        self.file_sender.send.return_value = defer.Deferred()
+        self.messenger.use_channel(self.channel, self.text_channel)
+        self.messenger.send(10, self.large_message)
+
+        self.channel.lose_connection()
+
+        self.send_data.assert_called_once_with(
+            {"offer": {"message": self.large_message, "seq": 0}}
+        )
@@ -0,0 +1,211 @@
+from hamcrest import assert_that, contains_exactly, empty, instance_of, is_
+import pytest
+from twisted.internet import defer, error
+
+from wormhole_ui.protocol.transit.multiplexer import (
+    CREDIT_BYTES,
+    CREDIT_TAG,
+    SEND_TAG,
+    WINDOW_BYTES,
+    Multiplexer,
+)
+
+
+class FakePipe:
+    """Transit Connection that records what's sent, for a Multiplexer to use"""
+
+    def __init__(self):
+        self.sent = []
+        self.consumer = None
+        self.producer = None
+        self.is_paused = False
+        self.is_closed = False
+        self.lost = defer.Deferred()
+
+    def connectConsumer(self, consumer, expected=None):
+        self.consumer = consumer
+        return self.lost
+
+    def registerProducer(self, producer, streaming):
+        self.producer = producer
+
+    def send_record(self, record):
+        self.sent.append(record)
+
+    def describe(self):
+        return "->tcp:peer:1234"
+
+    def pauseProducing(self):
+        self.is_paused = True
+
+    def resumeProducing(self):
+        self.is_paused = False
+
+    def close(self):
+        self.is_closed = True
+
+
+class TestBase:
+    @pytest.fixture(autouse=True)
+    def setup(self, mocker):
+        self.pipe = FakePipe()
+        self.multiplexer = Multiplexer()
+        self.send_channel = self.multiplexer.send_channel
+        self.receive_channel = self.multiplexer.receive_channel
+
+
+class TestConnect(TestBase):
+    def test_channels_connect_once_attached(self):
+        connected = self.send_channel.connect()
+        assert_that(connected.called, is_(False))
+
+        self.multiplexer.attach(self.pipe)
+
+        assert_that(connected.result, is_(self.send_channel))
+
+    def test_channels_fail_to_connect_once_closed(self):
+        connected = self.send_channel.connect()
+
+        self.multiplexer.close()
+
+        failures = []
+        connected.addErrback(failures.append)
+        assert_that(failures[0].value, instance_of(error.ConnectionClosed))
+
+
+class TestRecords(TestBase):
+    @pytest.fixture(autouse=True)
+    def attach(self, setup):
+        self.multiplexer.attach(self.pipe)
+
+    def test_records_are_tagged_with_their_channel(self):
+        self.send_channel.send_record(b"data")
+        self.receive_channel.write(b"ack")
+        self.multiplexer.message_channel.send_record(b"hello")
+
+        assert_that(self.pipe.sent, contains_exactly(b"sdata", b"rack", b"mhello"))
+
+    def test_peers_send_records_go_to_our_receive_channel(self):
+        received = self.receive_channel.receive_record()
+        acked = self.send_channel.receive_record()
+
+        self.pipe.consumer.write(b"sdata")
+        self.pipe.consumer.write(b"rack")
+
+        assert_that(received.result, is_(b"data"))
+        assert_that(acked.result, is_(b"ack"))
+
+    def test_records_are_written_to_consumer(self, mocker):
+        consumer = mocker.Mock()
+        done = self.receive_channel.connectConsumer(consumer, expected=6)
+
+        self.pipe.consumer.write(b"sabc")
+        self.pipe.consumer.write(b"rack")
+        self.pipe.consumer.write(b"sdef")
+
+        assert_that(
+            consumer.write.call_args_list, contains_exactly(((b"abc",),), ((b"def",),))
+        )
+        assert_that(done.result, is_(6))
+        assert_that(self.send_channel.receive_record().result, is_(b"ack"))
+
+    def test_records_are_queued_until_read(self):
+        self.pipe.consumer.write(b"sdata")
+
+        assert_that(self.receive_channel.receive_record().result, is_(b"data"))
+
+    def test_reads_fail_when_connection_lost(self):
+        received = self.receive_channel.receive_record()
+        failures = []
+        received.addErrback(failures.append)
+
+        self.pipe.lost.errback(error.ConnectionLost())
+
+        assert_that(failures[0].value, instance_of(error.ConnectionClosed))
+
+    def test_closing_a_channel_closes_the_connection(self):
+        self.send_channel.close()
+
+        assert_that(self.pipe.is_closed, is_(True))
+
+
+class TestFlowControl(TestBase):
+    @pytest.fixture(autouse=True)
+    def attach(self, setup):
+        self.multiplexer.attach(self.pipe)
+
+    def test_outbound_pause_pauses_both_producers(self, mocker):
+        send_producer = mocker.Mock()
+        receive_producer = mocker.Mock()
+        self.send_channel.registerProducer(send_producer, True)
+        self.receive_channel.registerProducer(receive_producer, True)
+
+        self.pipe.producer.pauseProducing()
+
+        send_producer.pauseProducing.assert_called_once()
+        receive_producer.pauseProducing.assert_called_once()
+
+    def test_producer_registered_while_paused_is_paused(self, mocker):
+        producer = mocker.Mock()
+        self.pipe.producer.pauseProducing()
+
+        self.send_channel.registerProducer(producer, True)
+
+        producer.pauseProducing.assert_called_once()
+
+    def test_send_producer_pauses_once_window_is_full(self, mocker):
+        producer = mocker.Mock()
+        self.send_channel.registerProducer(producer, True)
+
+        self.send_channel.send_record(b"x" * (WINDOW_BYTES - 1))
+        producer.pauseProducing.assert_not_called()
+        self.send_channel.send_record(b"x")
+
+        producer.pauseProducing.assert_called_once()
+
+    def test_send_producer_resumes_once_credited(self, mocker):
+        producer = mocker.Mock()
+        self.send_channel.registerProducer(producer, True)
+        self.send_channel.send_record(b"x" * WINDOW_BYTES)
+
+        self.pipe.consumer.write(CREDIT_TAG + str(CREDIT_BYTES).encode())
+
+        producer.resumeProducing.assert_called_once()
+
+    def test_window_does_not_limit_other_channels(self, mocker):
+        producer = mocker.Mock()
+        self.receive_channel.registerProducer(producer, True)
+
+        self.send_channel.send_record(b"x" * WINDOW_BYTES)
+
+        producer.pauseProducing.assert_not_called()
+
+    def test_received_file_data_is_credited(self):
+        self.pipe.consumer.write(SEND_TAG + b"x" * (CREDIT_BYTES - 1))
+        assert_that(self.pipe.sent, is_(empty()))
+
+        self.pipe.consumer.write(SEND_TAG + b"x")
+
+        assert_that(
+            self.pipe.sent, contains_exactly(CREDIT_TAG + str(CREDIT_BYTES).encode())
+        )
+
+    def test_credit_is_held_back_while_paused(self):
+        self.receive_channel.pauseProducing()
+        self.pipe.consumer.write(SEND_TAG + b"x" * CREDIT_BYTES)
+        assert_that(self.pipe.sent, is_(empty()))
+
+        self.receive_channel.resumeProducing()
+
+        assert_that(
+            self.pipe.sent, contains_exactly(CREDIT_TAG + str(CREDIT_BYTES).encode())
+        )
+
+    def test_messages_are_read_while_paused(self):
+        self.receive_channel.pauseProducing()
+        received = self.multiplexer.message_channel.receive_record()
+
+        self.pipe.consumer.write(b"mhello")
+
+        assert_that(received.result, is_(b"hello"))
+        assert_that(self.pipe.is_paused, is_(False))
@@ -0,0 +1,126 @@
+import hashlib
+
+from hamcrest import assert_that, calling, is_, raises
+import pytest
+
+from wormhole_ui.errors import ReceiveFileError, SendFileError
+from wormhole_ui.protocol.transit.dest_file import DestFile
+from wormhole_ui.protocol.transit.packed_files import (
+    PACKED_RECORD_MAX_BYTES,
+    group_packed_files,
+    pack,
+    unpack,
+)
+from wormhole_ui.protocol.transit.source_file import SourceFile
+
+
+@pytest.fixture
+def source_files(tmp_path):
+    source_files = []
+    for id, contents in enumerate([b"one", b"", b"three"]):
+        path = tmp_path / f"file{id}.txt"
+        path.write_bytes(contents)
+        source_file = SourceFile(id, str(path))
+        source_file.stat()
+        source_file.packed = True
+        source_files.append(source_file)
+    return source_files
+
+
+class TestGroupPackedFiles:
+    def make_file(self, mocker, size, packed=True):
+        return mocker.Mock(final_bytes=size, packed=packed)
+
+    def test_consecutive_packed_files_are_grouped(self, mocker):
+        files = [self.make_file(mocker, 10) for _ in range(3)]
+
+        assert_that(list(group_packed_files(files)), is_([files]))
+
+    def test_unpacked_files_are_sent_alone(self, mocker):
+        small1 = self.make_file(mocker, 10)
+        large = self.make_file(mocker, 10, packed=False)
+        small2 = self.make_file(mocker, 10)
+
+        groups = list(group_packed_files([small1, large, small2]))
+
+        assert_that(groups, is_([[small1], [large], [small2]]))
+
+    def test_groups_are_limited_in_size(self, mocker):
+        files = [self.make_file(mocker, PACKED_RECORD_MAX_BYTES // 2) for _ in range(3)]
+
+        groups = list(group_packed_files(files))
+
+        assert_that(groups, is_([files[:2], files[2:]]))
+
+
+class TestPackUnpack:
+    def test_files_are_unpacked_to_disk(self, source_files, tmp_path):
+        dest_path = tmp_path / "dest"
+        dest_path.mkdir()
+        dest_files = [DestFile(f.name, f.final_bytes) for f in source_files]
+
+        record, _ = pack(source_files)
+
+        result = unpack(record, dest_files, str(dest_path), 13)
+
+        assert_that(result, is_((3, 8, hashlib.sha256(b"onethree").digest())))
+        assert_that((dest_path / "file0.txt").read_bytes(), is_(b"one"))
+        assert_that((dest_path / "file1.txt").read_bytes(), is_(b""))
+        assert_that((dest_path / "file2.txt").read_bytes(), is_(b"three"))
+
+    def test_unpacks_only_the_files_in_the_record(self, source_files, tmp_path):
+        dest_files = [DestFile(f.name, f.final_bytes) for f in source_files]
+
+        record, _ = pack(source_files[:1])
+
+        result = unpack(record, dest_files, str(tmp_path), 13)
+
+        assert_that(result[:2], is_((1, 3)))
+
+    def test_digests_match(self, source_files, tmp_path):
+        dest_files = [DestFile(f.name, f.final_bytes) for f in source_files]
+
+        record, digest = pack(source_files, hashlib.blake2b)
+        result = unpack(record, dest_files, str(tmp_path), 13, hashlib.blake2b)
+
+        assert_that(digest, is_(hashlib.blake2b(b"onethree").digest()))
+        assert_that(result[2], is_(digest))
+
+    def test_pack_raises_error_if_file_changed(self, source_files):
+        source_files[0].full_path.write_bytes(b"changed")
+
+        assert_that(calling(pack).with_args(source_files), raises(SendFileError))
+
+    def test_unpack_raises_error_if_file_unexpected(self, source_files, tmp_path):
+        dest_files = [DestFile("other.txt", 3)]
+
+        assert_that(
+            calling(unpack).with_args(
+                pack(source_files[:1])[0], dest_files, str(tmp_path), 13
+            ),
+            raises(ReceiveFileError),
+        )
+
+    def test_unpack_raises_error_if_file_corrupt(self, source_files, tmp_path):
+        record = pack(source_files[:1])[0].replace(b"one", b"two")
+        dest_files = [DestFile("file0.txt", 3)]
+        dest_path = tmp_path / "dest"
+        dest_path.mkdir()
+
+        assert_that(
+            calling(unpack).with_args(record, dest_files, str(dest_path), 13),
+            raises(ReceiveFileError),
+        )
+        assert_that(list(dest_path.iterdir()), is_([]))
+
+    @pytest.mark.parametrize("length", [2, 10, 30])
+    def test_unpack_raises_error_if_record_truncated(
+        self, source_files, tmp_path, length
+    ):
+        record, _ = pack(source_files[:1])
+        dest_files = [DestFile("file0.txt", 3)]
+
+        assert_that(
+            calling(unpack).with_args(record[:length], dest_files, str(tmp_path), 13),
+            raises(ReceiveFileError),
+        )
@@ -0,0 +1,84 @@
+from hamcrest import assert_that, is_
+import pytest
+from twisted.internet.task import Clock
+
+from wormhole_ui.protocol.transit.progress import Progress
+
+
+class TestProgress:
+    @pytest.fixture(autouse=True)
+    def setup(self, mocker):
+        self.reactor = Clock()
+        self.delegate = mocker.Mock()
+
+    def reported(self):
+        return [call[0] for call in self.delegate.transit_progress.call_args_list]
+
+    def test_first_update_is_reported(self):
+        progress = Progress(self.reactor, self.delegate, 13, 100)
+
+        progress.update(10)
+
+        assert_that(self.reported(), is_([(13, 10, 100)]))
+
+    def test_updates_are_coalesced(self):
+        progress = Progress(self.reactor, self.delegate, 13, 100, rate_hz=10)
+
+        progress.update(10)
+        progress.update(10)
+        progress.update(10)
+
+        assert_that(self.reported(), is_([(13, 10, 100)]))
+
+    def test_coalesced_updates_are_reported_after_interval(self):
+        progress = Progress(self.reactor, self.delegate, 13, 100, rate_hz=10)
+
+        progress.update(10)
+        progress.update(10)
+        progress.update(10)
+        self.reactor.advance(0.1)
+
+        assert_that(self.reported(), is_([(13, 10, 100), (13, 30, 100)]))
+
+    def test_final_update_is_reported_immediately(self):
+        progress = Progress(self.reactor, self.delegate, 13, 100)
+
+        progress.update(10)
+        progress.update(90)
+
+        assert_that(self.reported(), is_([(13, 10, 100), (13, 100, 100)]))
+        assert_that(self.reactor.getDelayedCalls(), is_([]))
+
+    def test_update_rate_is_limited(self):
+        progress = Progress(self.reactor, self.delegate, 13, 10_000, rate_hz=10)
+
+        for _ in range(1000):
+            progress.update(1)
+            self.reactor.advance(0.001)
+
+        assert_that(len(self.reported()), is_(11))
+
+    def test_stop_cancels_coalesced_update(self):
+        progress = Progress(self.reactor, self.delegate, 13, 100, rate_hz=10)
+
+        progress.update(10)
+        progress.update(10)
+        progress.stop()
+        self.reactor.advance(0.1)
+
+        assert_that(self.reported(), is_([(13, 10, 100)]))
+        assert_that(self.reactor.getDelayedCalls(), is_([]))
+
+    def test_petabyte_totals_are_reported_exactly(self):
+        petabyte = 1_000_000_000_000_000
+        progress = Progress(self.reactor, self.delegate, 13, 3 * petabyte)
+
+        progress.update(2 * petabyte + 1)
+        progress.update(petabyte - 1)
+
+        assert_that(
+            self.reported(),
+            is_(
+                [(13, 2 * petabyte + 1, 3 * petabyte), (13, 3 * petabyte, 3 * petabyte)]
+            ),
+        )
@@ -0,0 +1,162 @@
+import io
+import zlib
+
+from hamcrest import assert_that, instance_of, is_
+import pytest
+
+from tests.fake_reactor import FakeReactor
+from wormhole_ui.protocol.transit.compression import Compressor
+from wormhole_ui.protocol.transit.read_ahead_producer import ReadAheadProducer
+
+
+class ShortReader:
+    """Returns no more than max_read bytes at a time, like a pipe"""
+
+    def __init__(self, file_object, max_read):
+        self._file_object = file_object
+        self._max_read = max_read
+
+    def read(self, size):
+        return self._file_object.read(min(size, self._max_read))
+
+
+class TestBase:
+    @pytest.fixture(autouse=True)
+    def setup(self, mocker):
+        self.reactor = FakeReactor()
+        self.file_object = io.BytesIO(b"0123456789")
+        self.consumer = mocker.Mock()
+
+    def written(self):
+        return [call[0][0] for call in self.consumer.write.call_args_list]
+
+
+class TestBeginFileTransfer(TestBase):
+    def test_registers_as_streaming_producer(self):
+        producer = ReadAheadProducer(self.reactor, self.file_object)
+
+        producer.beginFileTransfer(self.consumer)
+
+        self.consumer.registerProducer.assert_called_once_with(producer, True)
+
+    def test_writes_chunks_to_consumer(self):
+        producer = ReadAheadProducer(self.reactor, self.file_object, chunk_size=4)
+        results = []
+
+        producer.beginFileTransfer(self.consumer).addCallback(results.append)
+        self.reactor.run_threads()
+
+        assert_that(self.written(), is_([b"0123", b"4567", b"89"]))
+        assert_that(results, is_([None]))
+        self.consumer.unregisterProducer.assert_called_once()
+
+    def test_stops_at_length(self):
+        producer = ReadAheadProducer(
+            self.reactor, self.file_object, chunk_size=4, length=6
+        )
+        results = []
+
+        producer.beginFileTransfer(self.consumer).addCallback(results.append)
+        self.reactor.run_threads()
+
+        assert_that(self.written(), is_([b"0123", b"45"]))
+        assert_that(results, is_([None]))
+
+    def test_short_reads_dont_stop_early(self):
+        file_object = ShortReader(self.file_object, max_read=2)
+        producer = ReadAheadProducer(self.reactor, file_object, chunk_size=4, length=6)
+        results = []
+
+        producer.beginFileTransfer(self.consumer).addCallback(results.append)
+        self.reactor.run_threads()
+
+        assert_that(self.written(), is_([b"01", b"23", b"45"]))
+        assert_that(results, is_([None]))
+
+    def test_encodes_chunks(self):
+        producer = ReadAheadProducer(
+            self.reactor, self.file_object, chunk_size=4, encoder=Compressor()
+        )
+        observed = []
+
+        producer.beginFileTransfer(
+            self.consumer, transform=lambda d: observed.append(d) or d
+        )
+        self.reactor.run_threads()
+
+        assert_that(observed, is_([b"0123", b"4567", b"89"]))
+        assert_that(zlib.decompress(b"".join(self.written())), is_(b"0123456789"))
+
+    def test_reads_on_thread_pool(self):
+        producer = ReadAheadProducer(self.reactor, self.file_object)
+
+        producer.beginFileTransfer(self.consumer)
+
+        assert_that(self.file_object.tell(), is_(0))
+        self.reactor.run_threads()
+        assert_that(self.file_object.tell(), is_(10))
+
+    def test_applies_transform(self):
+        producer = ReadAheadProducer(self.reactor, self.file_object, chunk_size=5)
+
+        producer.beginFileTransfer(self.consumer, transform=lambda d: d[::-1])
+        self.reactor.run_threads()
+
+        assert_that(self.written(), is_([b"43210", b"98765"]))
+
+    def test_read_ahead_is_limited(self):
+        producer = ReadAheadProducer(
+            self.reactor, self.file_object, chunk_size=2, read_ahead_bytes=4
+        )
+        producer.pauseProducing()
+
+        producer.beginFileTransfer(self.consumer)
+        self.reactor.run_threads()
+
+        assert_that(self.file_object.tell(), is_(4))
+
+    def test_errbacks_on_read_error(self, mocker):
+        file_object = mocker.Mock()
+        file_object.read.side_effect = OSError("Read failed")
+        producer = ReadAheadProducer(self.reactor, file_object)
+        failures = []
+
+        producer.beginFileTransfer(self.consumer).addErrback(failures.append)
+        self.reactor.run_threads()
+
+        assert_that(failures[0].value, instance_of(OSError))
+
+
+class TestFlowControl(TestBase):
+    def test_pause_stops_writes(self):
+        producer = ReadAheadProducer(self.reactor, self.file_object, chunk_size=4)
+
+        producer.beginFileTransfer(self.consumer)
+        producer.pauseProducing()
+        self.reactor.run_threads()
+
+        self.consumer.write.assert_not_called()
+
+    def test_resume_restarts_writes(self):
+        producer = ReadAheadProducer(self.reactor, self.file_object, chunk_size=4)
+        results = []
+
+        producer.beginFileTransfer(self.consumer).addCallback(results.append)
+        producer.pauseProducing()
+        self.reactor.run_threads()
+        producer.resumeProducing()
+        self.reactor.run_threads()
+
+        assert_that(self.written(), is_([b"0123", b"4567", b"89"]))
+        assert_that(results, is_([None]))
+
+    def test_stop_errbacks(self):
+        producer = ReadAheadProducer(self.reactor, self.file_object, chunk_size=4)
+        failures = []
+
+        producer.beginFileTransfer(self.consumer).addErrback(failures.append)
+        producer.stopProducing()
+        self.reactor.run_threads()
+
+        self.consumer.write.assert_not_called()
+        assert_that(str(failures[0].value), is_("Consumer asked us to stop producing"))
@@ -0,0 +1,110 @@
+from hamcrest import assert_that, is_, none
+import pytest
+from twisted.internet import defer
+from twisted.internet.task import Clock
+
+from wormhole_ui.protocol.transit.relay_selector import (
+    MIN_MEASURED_BYTES,
+    RelaySelector,
+)
+
+RELAY1 = "tcp:relay1.example.com:4001"
+RELAY2 = "tcp:relay2.example.com:4001"
+
+
+class TestProbe:
+    @pytest.fixture(autouse=True)
+    def setup(self, mocker):
+        self.clock = Clock()
+        self.connections = {}
+        mocker.patch(
+            "wormhole_ui.protocol.transit.relay_selector.endpoints.clientFromString",
+            side_effect=lambda reactor, relay: relay,
+        )
+        mocker.patch(
+            "wormhole_ui.protocol.transit.relay_selector.endpoints.connectProtocol",
+            side_effect=self.connect,
+        )
+
+    def connect(self, endpoint, protocol):
+        self.connections[endpoint] = defer.Deferred()
+        return self.connections[endpoint]
+
+    def test_defaults_to_the_first_relay(self):
+        selector = RelaySelector(self.clock, [RELAY1, RELAY2])
+
+        assert_that(selector.current, is_(RELAY1))
+
+    def test_has_no_relay_without_candidates(self):
+        selector = RelaySelector(self.clock, [None])
+
+        assert_that(selector.current, is_(none()))
+
+    def test_chooses_the_fastest_relay(self, mocker):
+        selector = RelaySelector(self.clock, [RELAY1, RELAY2])
+        results = []
+        selector.probe().addCallback(results.append)
+
+        self.clock.advance(0.1)
+        self.connections[RELAY2].callback(mocker.Mock())
+        self.clock.advance(0.1)
+        self.connections[RELAY1].callback(mocker.Mock())
+
+        assert_that(results, is_([RELAY2]))
+        assert_that(selector.current, is_(RELAY2))
+
+    def test_skips_unreachable_relays(self, mocker):
+        selector = RelaySelector(self.clock, [RELAY1, RELAY2])
+        selector.probe()
+
+        self.connections[RELAY2].callback(mocker.Mock())
+        self.clock.advance(2)
+
+        assert_that(selector.current, is_(RELAY2))
+
+    def test_doesnt_probe_a_single_relay(self):
+        selector = RelaySelector(self.clock, [RELAY1])
+
+        selector.probe()
+
+        assert_that(self.connections, is_({}))
+        assert_that(selector.is_probing, is_(False))
+
+
+class TestReportTransfer:
+    def make_selector(self):
+        return RelaySelector(Clock(), [RELAY1, RELAY2], min_bytes_per_second=1000)
+
+    def test_fails_over_from_a_slow_relay(self):
+        selector = self.make_selector()
+
+        changed = selector.report_transfer(
+            f"->relay:{RELAY1}", MIN_MEASURED_BYTES, MIN_MEASURED_BYTES / 100
+        )
+
+        assert_that(changed, is_(True))
+        assert_that(selector.current, is_(RELAY2))
+
+    def test_keeps_a_fast_relay(self):
+        selector = self.make_selector()
+
+        changed = selector.report_transfer(f"->relay:{RELAY1}", MIN_MEASURED_BYTES, 1)
+
+        assert_that(changed, is_(False))
+        assert_that(selector.current, is_(RELAY1))
+
+    def test_ignores_direct_connections(self):
+        selector = self.make_selector()
+
+        selector.report_transfer(
+            "->tcp:192.168.1.2:4321", MIN_MEASURED_BYTES, MIN_MEASURED_BYTES
+        )
+
+        assert_that(selector.current, is_(RELAY1))
+
+    def test_ignores_small_transfers(self):
+        selector = self.make_selector()
+
+        selector.report_transfer(f"->relay:{RELAY1}", 1, 1000)
+
+        assert_that(selector.current, is_(RELAY1))
@@ -0,0 +1,83 @@
+import socket
+
+from hamcrest import assert_that, is_
+import pytest
+import pytest_twisted
+from twisted.internet import error
+from twisted.internet.endpoints import clientFromString, connectProtocol
+from twisted.internet.protocol import Protocol
+
+from wormhole_ui.protocol.relays import LocalRelay, Relays
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def test_defaults_to_public_relays():
+    relays = Relays()
+
+    assert_that(relays.mailbox_url, is_("ws://relay.magic-wormhole.io:4000/v1"))
+    assert_that(relays.transit_relay, is_("tcp:transit.magic-wormhole.io:4001"))
+
+
+class TestLocalRelay:
+    def test_advertises_host_and_ports(self):
+        local_relay = LocalRelay(None, "10.0.0.1", mailbox_port=5000, transit_port=5001)
+
+        relays = local_relay.relays
+
+        assert_that(relays.mailbox_url, is_("ws://10.0.0.1:5000/v1"))
+        assert_that(relays.transit_relay, is_("tcp:10.0.0.1:5001"))
+
+    def test_defaults_to_a_network_address(self, mocker):
+        mocker.patch(
+            "wormhole_ui.protocol.relays.find_addresses",
+            return_value=["127.0.0.1", "192.168.1.2"],
+        )
+
+        local_relay = LocalRelay(None)
+
+        assert_that(local_relay.relays.mailbox_url, is_("ws://192.168.1.2:4000/v1"))
+
+    def test_falls_back_to_loopback(self, mocker):
+        mocker.patch(
+            "wormhole_ui.protocol.relays.find_addresses", return_value=["127.0.0.1"]
+        )
+
+        local_relay = LocalRelay(None)
+
+        assert_that(local_relay.relays.transit_relay, is_("tcp:127.0.0.1:4001"))
+
+    @pytest_twisted.inlineCallbacks
+    def test_starts_and_stops(self):
+        pytest.importorskip("wormhole_mailbox_server")
+        pytest.importorskip("wormhole_transit_relay")
+        from twisted.internet import reactor
+
+        local_relay = LocalRelay(
+            reactor,
+            "127.0.0.1",
+            mailbox_port=free_port(),
+            transit_port=free_port(),
+            interface="127.0.0.1",
+        )
+        relays = local_relay.start()
+        try:
+            for endpoint in [
+                relays.transit_relay,
+                relays.mailbox_url.replace("ws://", "tcp:").replace("/v1", ""),
+            ]:
+                protocol = yield connectProtocol(
+                    clientFromString(reactor, endpoint), Protocol()
+                )
+                protocol.transport.loseConnection()
+        finally:
+            yield local_relay.stop()
+
+        with pytest.raises(error.ConnectionRefusedError):
+            yield connectProtocol(
+                clientFromString(reactor, relays.transit_relay), Protocol()
+            )
@@ -0,0 +1,411 @@
+import io
+from pathlib import Path
+
+from hamcrest import assert_that, contains_exactly, instance_of, is_, none
+import pytest
+
+from tests.fake_reactor import FakeReactor
+
+from wormhole_ui.errors import ClosedError, RefusedError, SendFileError, SendTextError
+from wormhole_ui.protocol.session import (
+    Outcome,
+    Session,
+    accept_into,
+    accept_to_stream,
+)
+
+
+class Results:
+    def __init__(self, deferred):
+        self.value = None
+        self.failure = None
+        self.is_called = False
+        deferred.addCallbacks(self._on_success, self._on_failure)
+
+    def _on_success(self, value):
+        self.is_called = True
+        self.value = value
+
+    def _on_failure(self, failure):
+        self.is_called = True
+        self.failure = failure
+
+
+class TestOutcome:
+    def test_fires_waiters_when_set(self):
+        outcome = Outcome()
+        results = Results(outcome.wait())
+
+        outcome.succeed(42)
+
+        assert_that(results.value, is_(42))
+
+    def test_fires_later_waiters_immediately(self):
+        outcome = Outcome()
+        outcome.fail(ClosedError())
+
+        results = Results(outcome.wait())
+
+        assert_that(results.failure.value, instance_of(ClosedError))
+
+    def test_ignores_later_results(self):
+        outcome = Outcome()
+        outcome.succeed(1)
+        outcome.succeed(2)
+
+        assert_that(Results(outcome.wait()).value, is_(1))
+
+
+class TestBase:
+    @pytest.fixture(autouse=True)
+    def setup(self, mocker):
+        self.protocol_class = mocker.patch(
+            "wormhole_ui.protocol.session.FileTransferProtocol"
+        )
+        self.protocol = self.protocol_class()
+        self.reactor = mocker.Mock()
+        self.reactor.callLater.side_effect = lambda delay, f, *args: f(*args)
+        self.session = Session(self.reactor)
+        self.signals = self.session.signals
+
+    def connect(self, code="42-is-a-code"):
+        results = Results(self.session.open())
+        self.signals.code_received.emit(code)
+        self.signals.wormhole_open.emit()
+        return results
+
+
+class TestOpen(TestBase):
+    def test_opens_protocol_with_code(self):
+        self.session.open("42-is-a-code")
+
+        self.protocol.open.assert_called_once_with("42-is-a-code")
+
+    def test_fires_with_code(self):
+        results = Results(self.session.open())
+
+        self.signals.code_received.emit("42-is-a-code")
+
+        assert_that(results.value, is_("42-is-a-code"))
+
+    def test_when_connected_fires_once_wormhole_is_open(self):
+        results = Results(self.session.when_connected())
+        self.session.open()
+        assert_that(results.is_called, is_(False))
+
+        self.signals.wormhole_open.emit()
+
+        assert_that(results.is_called, is_(True))
+        assert_that(results.failure, is_(none()))
+
+    def test_fails_if_wormhole_closes_first(self):
+        results = Results(self.session.when_connected())
+        self.session.open()
+
+        self.signals.wormhole_closed.emit()
+
+        assert_that(results.failure.value, instance_of(ClosedError))
+
+
+class TestSendFiles(TestBase):
+    def test_sends_files_once_connected(self):
+        self.session.send_files(["file1.txt", "file2.txt"])
+        self.protocol.send_files.assert_not_called()
+
+        self.connect()
+
+        self.protocol.send_files.assert_called_once_with(
+            [
+                (0, str(Path("file1.txt").resolve())),
+                (1, str(Path("file2.txt").resolve())),
+            ]
+        )
+
+    def test_returns_a_handle_per_file(self):
+        handles = self.session.send_files(["file1.txt", "file2.txt"])
+
+        assert_that([h.id for h in handles], contains_exactly(0, 1))
+        assert_that(
+            [h.name for h in handles], contains_exactly("file1.txt", "file2.txt")
+        )
+
+    def test_handles_complete_with_filename(self):
+        self.connect()
+        handle = self.session.send_files(["file.txt"])[0]
+        results = Results(handle.when_complete())
+
+        self.signals.file_transfer_complete.emit(handle.id, "file.txt")
+
+        assert_that(results.value, is_("file.txt"))
+        assert_that(handle.is_finished, is_(True))
+
+    def test_handles_report_progress(self, mocker):
+        self.connect()
+        handle = self.session.send_files(["file.txt"])[0]
+        slot = mocker.Mock()
+        handle.progress.connect(slot)
+
+        self.signals.file_transfer_progress.emit(handle.id, 100, 200)
+
+        slot.assert_called_once_with(100, 200)
+        assert_that(handle.transferred_bytes, is_(100))
+        assert_that(handle.total_bytes, is_(200))
+
+    def test_queues_files_until_previous_ones_are_sent(self):
+        self.connect()
+        first = self.session.send_files(["file1.txt"])
+        self.session.send_files(["file2.txt"])
+        self.protocol.send_files.assert_called_once()
+
+        self.signals.file_transfer_complete.emit(first[0].id, "file1.txt")
+
+        self.protocol.send_files.assert_called_with(
+            [(1, str(Path("file2.txt").resolve()))]
+        )
+
+    def test_fails_handles_on_error(self):
+        self.connect()
+        handle = self.session.send_files(["file.txt"])[0]
+        results = Results(handle.when_complete())
+
+        self.signals.error.emit(SendFileError("Oops"), None)
+
+        assert_that(results.failure.value, instance_of(SendFileError))
+        assert_that(self.session.error, instance_of(SendFileError))
+        self.protocol.close.assert_called_once()
+
+    def test_fails_handles_if_wormhole_closes(self):
+        self.connect()
+        handle = self.session.send_files(["file.txt"])[0]
+        results = Results(handle.when_complete())
+
+        self.signals.wormhole_closed.emit()
+
+        assert_that(results.failure.value, instance_of(ClosedError))
+
+    def test_fails_handles_immediately_if_already_closed(self):
+        self.signals.wormhole_closed.emit()
+
+        handle = self.session.send_files(["file.txt"])[0]
+
+        assert_that(
+            Results(handle.when_complete()).failure.value, instance_of(ClosedError)
+        )
+
+
+class TestSendStream(TestBase):
+    @pytest.fixture(autouse=True)
+    def setup_threads(self, setup):
+        self.thread_pool = FakeReactor()
+        self.reactor.getThreadPool.return_value = self.thread_pool
+        self.reactor.callFromThread.side_effect = lambda f, *args: f(*args)
+
+    def test_sends_stream_once_connected(self):
+        stream = io.BytesIO(b"data")
+        handle = self.session.send_stream(stream, "stream.bin", 4)
+        self.protocol.send_files.assert_not_called()
+
+        self.connect()
+
+        ((id, source_stream),) = self.protocol.send_files.call_args[0][0]
+        assert_that(id, is_(handle.id))
+        assert_that(source_stream.name, is_("stream.bin"))
+        assert_that(source_stream.file_object, is_(stream))
+        assert_that(handle.total_bytes, is_(4))
+
+    def test_stream_of_unknown_size_is_read_first(self):
+        self.connect()
+
+        handle = self.session.send_stream(io.BytesIO(b"data"), "stream.bin")
+        self.thread_pool.run_threads()
+
+        ((_, source_stream),) = self.protocol.send_files.call_args[0][0]
+        assert_that(source_stream.final_bytes, is_(4))
+        assert_that(source_stream.file_object.read(), is_(b"data"))
+        assert_that(handle.total_bytes, is_(4))
+
+    def test_fails_handle_if_stream_cant_be_read(self, mocker):
+        self.connect()
+        stream = mocker.Mock()
+        stream.read.side_effect = OSError("Broken pipe")
+
+        handle = self.session.send_stream(stream, "stream.bin")
+        self.thread_pool.run_threads()
+
+        results = Results(handle.when_complete())
+        assert_that(results.failure.value, instance_of(OSError))
+        self.protocol.send_files.assert_not_called()
+
+
+class TestReceive(TestBase):
+    def test_accepts_offer_with_policy(self, tmp_path):
+        self.connect()
+        results = Results(self.session.receive(accept_into(tmp_path)))
+
+        self.signals.file_receive_pending.emit("file.txt", 100)
+
+        handle = results.value
+        assert_that(handle.name, is_("file.txt"))
+        assert_that(handle.total_bytes, is_(100))
+        self.protocol.receive_file.assert_called_once_with(handle.id, str(tmp_path))
+
+    def test_accepts_offer_into_stream(self):
+        self.connect()
+        stream = io.BytesIO()
+        results = Results(self.session.receive(accept_to_stream(stream)))
+
+        self.signals.file_receive_pending.emit("file.txt", 100)
+
+        self.protocol.receive_file.assert_called_once_with(results.value.id, stream)
+
+    def test_answers_offers_received_before_waiting(self, tmp_path):
+        self.connect()
+        self.signals.file_receive_pending.emit("file.txt", 100)
+
+        results = Results(self.session.receive(accept_into(tmp_path)))
+
+        assert_that(results.value.name, is_("file.txt"))
+        self.protocol.receive_file.assert_called_once()
+
+    def test_policy_is_given_offer_details(self, mocker, tmp_path):
+        self.connect()
+        policy = mocker.Mock(return_value=tmp_path)
+        self.session.receive(policy)
+
+        self.signals.file_receive_pending.emit("file.txt", 100)
+
+        policy.assert_called_once_with("file.txt", 100)
+
+    def test_refuses_offer_if_policy_returns_none(self, mocker):
+        self.connect()
+        respond_error = mocker.Mock()
+        self.signals.respond_error.connect(respond_error)
+        results = Results(self.session.receive(lambda filename, size: None))
+
+        self.signals.file_receive_pending.emit("file.txt", 100)
+
+        assert_that(results.value, is_(none()))
+        assert_that(respond_error.call_args[0][0], instance_of(RefusedError))
+        self.protocol.receive_file.assert_not_called()
+
+    def test_refuses_batch_offered_to_stream(self, mocker):
+        self.connect()
+        self.protocol.can_receive_into_stream.return_value = False
+        respond_error = mocker.Mock()
+        self.signals.respond_error.connect(respond_error)
+        results = Results(self.session.receive(accept_to_stream(io.BytesIO())))
+
+        self.signals.file_receive_pending.emit("3 files", 100)
+
+        assert_that(results.value, is_(none()))
+        assert_that(respond_error.call_args[0][0], instance_of(RefusedError))
+        self.protocol.receive_file.assert_not_called()
+        assert_that(self.session.error, is_(none()))
+        assert_that(Results(self.session.send_message("hi")).failure, is_(none()))
+
+    def test_fires_with_none_once_wormhole_closes(self, tmp_path):
+        self.connect()
+        results = Results(self.session.receive(accept_into(tmp_path)))
+
+        self.signals.wormhole_closed.emit()
+
+        assert_that(results.failure, is_(none()))
+        assert_that(results.value, is_(none()))
+
+    def test_fails_on_error(self, tmp_path):
+        self.connect()
+        results = Results(self.session.receive(accept_into(tmp_path)))
+
+        self.signals.error.emit(SendFileError("Oops"), None)
+
+        assert_that(results.failure.value, instance_of(SendFileError))
+
+
+class TestMessages(TestBase):
+    def test_sends_message_once_connected(self):
+        self.session.send_message("hello")
+        self.protocol.send_message.assert_not_called()
+
+        self.connect()
+
+        self.protocol.send_message.assert_called_once_with(0, "hello")
+
+    def test_fires_once_message_is_acked(self):
+        self.connect()
+        results = Results(self.session.send_message("hello"))
+        assert_that(results.is_called, is_(False))
+
+        self.signals.message_sent.emit(0, True)
+
+        assert_that(results.is_called, is_(True))
+        assert_that(results.failure, is_(none()))
+
+    def test_fails_if_message_is_refused(self):
+        self.connect()
+        results = Results(self.session.send_message("hello"))
+
+        self.signals.message_sent.emit(0, False)
+
+        assert_that(results.failure.value, instance_of(SendTextError))
+
+    def test_messages_are_sent_without_waiting_for_acks(self):
+        self.connect()
+        first = Results(self.session.send_message("first"))
+        second = Results(self.session.send_message("second"))
+
+        self.signals.message_sent.emit(1, True)
+
+        assert_that(self.protocol.send_message.call_count, is_(2))
+        assert_that(first.is_called, is_(False))
+        assert_that(second.is_called, is_(True))
+
+    def test_receives_messages_in_order(self):
+        self.connect()
+        self.signals.message_received.emit("hello")
+        self.signals.message_received.emit("world")
+
+        first = Results(self.session.receive_message())
+        second = Results(self.session.receive_message())
+
+        assert_that(first.value, is_("hello"))
+        assert_that(second.value, is_("world"))
+
+    def test_receive_fires_with_none_if_wormhole_closes(self):
+        self.connect()
+        results = Results(self.session.receive_message())
+
+        self.signals.wormhole_closed.emit()
+
+        assert_that(results.value, is_(none()))
+        assert_that(results.failure, is_(none()))
+
+
+class TestClose(TestBase):
+    def test_fires_once_wormhole_is_closed(self):
+        self.connect()
+        results = Results(self.session.close())
+        self.protocol.close.assert_called_once()
+
+        assert_that(results.is_called, is_(False))
+        self.signals.wormhole_closed.emit()
+
+        assert_that(results.is_called, is_(True))
+        assert_that(results.failure, is_(none()))
+
+    def test_shutdown_fires_once_wormhole_is_shut_down(self):
+        self.connect()
+        results = Results(self.session.shutdown())
+        self.protocol.shutdown.assert_called_once()
+
+        self.signals.wormhole_shutdown.emit()
+
+        assert_that(results.is_called, is_(True))
+        assert_that(results.failure, is_(none()))
+
+    def test_doesnt_close_twice_after_an_error(self):
+        self.connect()
+        self.signals.error.emit(SendFileError("Oops"), None)
+
+        self.session.close()
+
+        self.protocol.close.assert_called_once()
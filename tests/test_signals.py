@@ -0,0 +1,59 @@
+import pytest
+
+from wormhole_ui.protocol.signals import HeadlessSignals
+
+PETABYTE = 1_000_000_000_000_000
+
+
+class TestHeadlessSignals:
+    @pytest.fixture(autouse=True)
+    def setup(self, mocker):
+        self.signals = HeadlessSignals()
+        self.slot = mocker.Mock()
+
+    def test_emit_calls_connected_slots(self):
+        self.signals.file_receive_pending.connect(self.slot)
+
+        self.signals.file_receive_pending.emit("disk.img", 3 * PETABYTE + 1)
+
+        self.slot.assert_called_once_with("disk.img", 3 * PETABYTE + 1)
+
+    def test_slots_are_called_in_order_connected(self):
+        calls = []
+        self.signals.wormhole_open.connect(lambda: calls.append(1))
+        self.signals.wormhole_open.connect(lambda: calls.append(2))
+
+        self.signals.wormhole_open.emit()
+
+        assert calls == [1, 2]
+
+    def test_disconnected_slots_are_not_called(self):
+        self.signals.wormhole_closed.connect(self.slot)
+        self.signals.wormhole_closed.disconnect(self.slot)
+
+        self.signals.wormhole_closed.emit()
+
+        self.slot.assert_not_called()
+
+    def test_slot_can_disconnect_itself_while_emitting(self):
+        def disconnect():
+            self.signals.wormhole_closed.disconnect(disconnect)
+
+        self.signals.wormhole_closed.connect(disconnect)
+        self.signals.wormhole_closed.connect(self.slot)
+
+        self.signals.wormhole_closed.emit()
+        self.signals.wormhole_closed.emit()
+
+        assert self.slot.call_count == 2
+
+    def test_disconnecting_unconnected_slot_raises(self):
+        with pytest.raises(RuntimeError):
+            self.signals.error.disconnect(self.slot)
+
+    def test_signals_are_not_shared_between_instances(self):
+        self.signals.message_received.connect(self.slot)
+
+        HeadlessSignals().message_received.emit("hello")
+
+        self.slot.assert_not_called()
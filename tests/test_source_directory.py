@@ -0,0 +1,42 @@
+from hamcrest import assert_that, calling, is_, raises
+import pytest
+
+from wormhole_ui.errors import SendFileError
+from wormhole_ui.protocol.transit.source_directory import SourceDirectory
+
+
+@pytest.fixture
+def dir_path(tmp_path):
+    dir_path = tmp_path / "dir"
+    dir_path.mkdir()
+    (dir_path / "one.txt").write_bytes(b"one")
+    (dir_path / "two.txt").write_bytes(b"two")
+    return dir_path
+
+
+class TestSourceDirectory:
+    def test_stat_gets_zip_size(self, dir_path):
+        source_directory = SourceDirectory(13, dir_path)
+
+        source_directory.stat()
+
+        assert_that(source_directory.name, is_("dir"))
+        assert_that(source_directory.num_files, is_(2))
+        assert_that(source_directory.num_bytes, is_(6))
+        assert_that(source_directory.final_bytes > 6, is_(True))
+        assert_that(source_directory.file_object, is_(None))
+
+    def test_open_creates_zip_stream(self, dir_path):
+        source_directory = SourceDirectory(13, dir_path)
+
+        source_directory.open()
+
+        data = source_directory.file_object.read()
+        assert_that(len(data), is_(source_directory.final_bytes))
+        assert_that(source_directory.transfer_bytes, is_(len(data)))
+
+    def test_cant_resume(self, dir_path):
+        source_directory = SourceDirectory(13, dir_path)
+        source_directory.open()
+
+        assert_that(calling(source_directory.seek).with_args(4), raises(SendFileError))
@@ -18,6 +18,12 @@ class TestSourceFile:
         assert_that(source_file.id, is_(13))
         assert_that(source_file.name, is_("file.txt"))
 
+    def test_size_can_be_given(self, test_file_path):
+        source_file = SourceFile(13, test_file_path, 42)
+
+        assert_that(source_file.final_bytes, is_(42))
+        assert_that(source_file.transfer_bytes, is_(42))
+
     def test_open_creates_file_object(self, test_file_path):
         source_file = SourceFile(13, test_file_path)
 
@@ -32,3 +38,30 @@ class TestSourceFile:
 
         assert_that(source_file.transfer_bytes, is_(32))
         assert_that(source_file.final_bytes, is_(32))
+
+    def test_stat_gets_file_size_without_opening(self, test_file_path):
+        source_file = SourceFile(13, test_file_path)
+
+        source_file.stat()
+
+        assert_that(source_file.transfer_bytes, is_(32))
+        assert_that(source_file.file_object, is_(None))
+
+    def test_close_closes_the_file(self, test_file_path):
+        source_file = SourceFile(13, test_file_path)
+        source_file.open()
+        file_object = source_file.file_object
+
+        source_file.close()
+
+        assert_that(file_object.closed, is_(True))
+        assert_that(source_file.file_object, is_(None))
+
+    def test_seek_skips_start_of_file(self, test_file_path):
+        source_file = SourceFile(13, test_file_path)
+        source_file.open()
+
+        source_file.seek(30)
+
+        assert_that(source_file.file_object.tell(), is_(30))
+        assert_that(source_file.transfer_bytes, is_(2))
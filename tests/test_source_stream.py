@@ -0,0 +1,58 @@
+import io
+
+from hamcrest import assert_that, calling, is_, none, raises
+
+from wormhole_ui.errors import SendFileError
+from wormhole_ui.protocol.transit.source_stream import (
+    SourceStream,
+    read_stream,
+)
+
+
+class TestSourceStream:
+    def test_attributes_are_set(self):
+        stream = io.BytesIO(b"data")
+        source_stream = SourceStream(13, "stream.bin", stream, 4)
+
+        assert_that(source_stream.id, is_(13))
+        assert_that(source_stream.name, is_("stream.bin"))
+        assert_that(source_stream.full_path, is_(none()))
+        assert_that(source_stream.final_bytes, is_(4))
+        assert_that(source_stream.file_object, is_(stream))
+
+    def test_cant_resume(self):
+        source_stream = SourceStream(13, "stream.bin", io.BytesIO(b"data"), 4)
+
+        assert_that(calling(source_stream.seek).with_args(2), raises(SendFileError))
+
+    def test_close_leaves_the_stream_open(self):
+        stream = io.BytesIO(b"data")
+        source_stream = SourceStream(13, "stream.bin", stream, 4)
+
+        source_stream.close()
+
+        assert_that(stream.closed, is_(False))
+
+
+class TestReadStream:
+    def test_reads_stream_into_memory(self):
+        source_stream = read_stream(13, "stream.bin", io.BytesIO(b"data"))
+
+        assert_that(source_stream.final_bytes, is_(4))
+        assert_that(source_stream.file_object.read(), is_(b"data"))
+
+    def test_reads_generator_into_memory(self):
+        chunks = (chunk for chunk in [b"da", b"ta"])
+
+        source_stream = read_stream(13, "stream.bin", chunks)
+
+        assert_that(source_stream.final_bytes, is_(4))
+        assert_that(source_stream.file_object.read(), is_(b"data"))
+
+    def test_raises_error_if_stream_is_too_large(self, mocker):
+        mocker.patch("wormhole_ui.protocol.transit.source_stream.MAX_STREAM_BYTES", 3)
+
+        assert_that(
+            calling(read_stream).with_args(13, "stream.bin", io.BytesIO(b"data")),
+            raises(SendFileError),
+        )
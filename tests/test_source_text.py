@@ -0,0 +1,17 @@
+from hamcrest import assert_that, is_
+
+from wormhole_ui.protocol.transit.source_text import SourceText
+
+
+class TestSourceText:
+    def test_size_is_encoded_size(self):
+        source_text = SourceText(13, "café")
+
+        assert_that(source_text.id, is_(13))
+        assert_that(source_text.final_bytes, is_(5))
+        assert_that(source_text.transfer_bytes, is_(5))
+
+    def test_reads_encoded_text(self):
+        source_text = SourceText(13, "café")
+
+        assert_that(source_text.file_object.read(), is_("café".encode("utf-8")))
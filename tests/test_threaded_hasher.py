@@ -0,0 +1,127 @@
+import hashlib
+import queue
+import threading
+
+from hamcrest import assert_that, instance_of, is_
+import pytest
+
+from tests.fake_reactor import FakeReactor
+
+from wormhole_ui.protocol.transit.threaded_hasher import (
+    ThreadedHasher,
+    get_hash_factory,
+    hash_file_prefix,
+)
+
+
+@pytest.fixture
+def reactor(mocker):
+    reactor = mocker.Mock()
+    reactor.callInThread.side_effect = lambda f, *args: f(*args)
+    reactor.callFromThread.side_effect = lambda f, *args: f(*args)
+    return reactor
+
+
+@pytest.fixture
+def threaded_reactor(mocker):
+    """Runs pool calls on real threads, and queues calls back to the reactor"""
+    reactor = mocker.Mock()
+    reactor.calls = queue.Queue()
+    reactor.callInThread.side_effect = lambda f, *args: threading.Thread(
+        target=f, args=args
+    ).start()
+    reactor.callFromThread.side_effect = lambda f, *args: reactor.calls.put((f, args))
+    return reactor
+
+
+class TestThreadedHasher:
+    def test_digest_matches_sequential_hash(self, reactor):
+        hasher = ThreadedHasher(reactor)
+        results = []
+
+        hasher.update(b"hello ")
+        hasher.update(b"world")
+        hasher.digest().addCallback(results.append)
+
+        assert_that(results, is_([hashlib.sha256(b"hello world").digest()]))
+
+    def test_digest_of_no_data(self, reactor):
+        hasher = ThreadedHasher(reactor)
+        results = []
+
+        hasher.digest().addCallback(results.append)
+
+        assert_that(results, is_([hashlib.sha256().digest()]))
+
+    def test_hash_factory_can_be_changed(self, reactor):
+        hasher = ThreadedHasher(reactor, hashlib.blake2b)
+        results = []
+
+        hasher.update(b"data")
+        hasher.digest().addCallback(results.append)
+
+        assert_that(results, is_([hashlib.blake2b(b"data").digest()]))
+
+    def test_hashes_on_worker_thread(self, threaded_reactor):
+        hasher = ThreadedHasher(threaded_reactor)
+        chunks = [bytes([i]) * 100_000 for i in range(50)]
+        done = threading.Event()
+        results = []
+
+        for chunk in chunks:
+            hasher.update(chunk)
+        hasher.digest().addCallback(results.append).addCallback(lambda _: done.set())
+        while not done.is_set():
+            f, args = threaded_reactor.calls.get(timeout=10)
+            f(*args)
+
+        assert_that(results, is_([hashlib.sha256(b"".join(chunks)).digest()]))
+
+    def test_pauses_producer_until_hashing_catches_up(self, mocker):
+        reactor = FakeReactor()
+        producer = mocker.Mock()
+        hasher = ThreadedHasher(reactor, producer=producer, max_pending_bytes=10)
+
+        hasher.update(b"x" * 6)
+        producer.pauseProducing.assert_not_called()
+        hasher.update(b"x" * 6)
+        producer.pauseProducing.assert_called_once()
+
+        reactor.run_threads()
+
+        producer.resumeProducing.assert_called_once()
+
+    def test_digest_errbacks_if_hashing_fails(self, reactor, mocker):
+        hash_object = mocker.Mock()
+        hash_object.update.side_effect = ValueError("Oops")
+        hasher = ThreadedHasher(reactor, lambda: hash_object)
+        failures = []
+
+        hasher.update(b"data")
+        hasher.digest().addErrback(failures.append)
+
+        assert_that(failures[0].value, instance_of(ValueError))
+
+
+class TestHashFilePrefix:
+    def test_hashes_start_of_file(self, tmp_path):
+        path = tmp_path / "file"
+        path.write_bytes(b"0123456789")
+
+        hasher = hash_file_prefix(path, 4)
+
+        assert_that(hasher.digest(), is_(hashlib.sha256(b"0123").digest()))
+
+    def test_returns_none_if_file_too_short(self, tmp_path):
+        path = tmp_path / "file"
+        path.write_bytes(b"0123")
+
+        assert_that(hash_file_prefix(path, 5), is_(None))
+
+    def test_uses_hash_factory(self, tmp_path):
+        path = tmp_path / "file"
+        path.write_bytes(b"0123456789")
+
+        hasher = hash_file_prefix(path, 4, get_hash_factory("blake2b"))
+
+        assert_that(hasher.digest(), is_(hashlib.blake2b(b"0123").digest()))
@@ -0,0 +1,112 @@
+import io
+
+from hamcrest import assert_that, instance_of, is_
+import pytest
+
+from tests.fake_reactor import FakeReactor
+from wormhole_ui.protocol.transit.threaded_writer import ThreadedWriter
+
+
+class TestBase:
+    @pytest.fixture(autouse=True)
+    def setup(self, mocker):
+        self.reactor = FakeReactor()
+        self.file_object = io.BytesIO()
+        self.producer = mocker.Mock()
+
+
+class TestWrite(TestBase):
+    def test_writes_are_coalesced(self, mocker):
+        file_object = mocker.Mock()
+        writer = ThreadedWriter(
+            self.reactor, file_object, self.producer, coalesce_bytes=8
+        )
+
+        writer.write(b"1234")
+        writer.write(b"5678")
+        writer.write(b"9")
+        writer.flush()
+        self.reactor.run_threads()
+
+        assert_that(
+            file_object.write.call_args_list,
+            is_([mocker.call(b"12345678"), mocker.call(b"9")]),
+        )
+
+    def test_writes_happen_on_thread_pool(self):
+        writer = ThreadedWriter(
+            self.reactor, self.file_object, self.producer, coalesce_bytes=1
+        )
+
+        writer.write(b"data")
+
+        assert_that(self.file_object.getvalue(), is_(b""))
+        self.reactor.run_threads()
+        assert_that(self.file_object.getvalue(), is_(b"data"))
+
+
+class TestFlush(TestBase):
+    def test_fires_once_data_is_written(self):
+        writer = ThreadedWriter(self.reactor, self.file_object, self.producer)
+        results = []
+
+        writer.write(b"data")
+        writer.flush().addCallback(results.append)
+
+        assert_that(results, is_([]))
+        self.reactor.run_threads()
+        assert_that(results, is_([None]))
+        assert_that(self.file_object.getvalue(), is_(b"data"))
+
+    def test_fires_immediately_if_nothing_written(self):
+        writer = ThreadedWriter(self.reactor, self.file_object, self.producer)
+        results = []
+
+        writer.flush().addCallback(results.append)
+
+        assert_that(results, is_([None]))
+
+    def test_errbacks_if_write_fails(self, mocker):
+        file_object = mocker.Mock()
+        file_object.write.side_effect = OSError("Disk full")
+        writer = ThreadedWriter(self.reactor, file_object, self.producer)
+        failures = []
+
+        writer.write(b"data")
+        writer.flush().addErrback(failures.append)
+        self.reactor.run_threads()
+
+        assert_that(failures[0].value, instance_of(OSError))
+
+
+class TestFlowControl(TestBase):
+    def test_pauses_producer_when_queue_is_full(self):
+        writer = ThreadedWriter(
+            self.reactor,
+            self.file_object,
+            self.producer,
+            coalesce_bytes=1,
+            max_queued_bytes=8,
+        )
+
+        writer.write(b"1234")
+        self.producer.pauseProducing.assert_not_called()
+        writer.write(b"5678")
+
+        self.producer.pauseProducing.assert_called_once()
+
+    def test_resumes_producer_and_records_stall_time(self):
+        writer = ThreadedWriter(
+            self.reactor,
+            self.file_object,
+            self.producer,
+            coalesce_bytes=1,
+            max_queued_bytes=8,
+        )
+
+        writer.write(b"12345678")
+        self.reactor.advance(1.5)
+        self.reactor.run_threads()
+
+        self.producer.resumeProducing.assert_called_once()
+        assert_that(writer.stall_seconds, is_(1.5))
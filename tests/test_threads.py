@@ -0,0 +1,58 @@
+from hamcrest import assert_that, is_
+
+from tests.fake_reactor import FakeReactor
+from wormhole_ui.protocol.transit.threads import SharedProducer, run_in_thread
+
+
+class TestRunInThread:
+    def test_returns_result(self):
+        reactor = FakeReactor()
+        results = []
+
+        run_in_thread(reactor, lambda x: x * 2, 21).addCallback(results.append)
+        assert_that(results, is_([]))
+        reactor.run_threads()
+
+        assert_that(results, is_([42]))
+
+    def test_errbacks_on_exception(self):
+        reactor = FakeReactor()
+        failures = []
+
+        run_in_thread(reactor, lambda: 1 / 0).addErrback(failures.append)
+        reactor.run_threads()
+
+        assert_that(failures[0].value, is_(ZeroDivisionError))
+
+
+class TestSharedProducer:
+    def test_pauses_producer_once(self, mocker):
+        producer = mocker.Mock()
+        shared = SharedProducer(producer)
+
+        shared.share().pauseProducing()
+        shared.share().pauseProducing()
+
+        producer.pauseProducing.assert_called_once()
+
+    def test_resumes_once_every_share_has_resumed(self, mocker):
+        producer = mocker.Mock()
+        shared = SharedProducer(producer)
+        writer, hasher = shared.share(), shared.share()
+        writer.pauseProducing()
+        hasher.pauseProducing()
+
+        writer.resumeProducing()
+        producer.resumeProducing.assert_not_called()
+        hasher.resumeProducing()
+
+        producer.resumeProducing.assert_called_once()
+
+    def test_ignores_resume_without_pause(self, mocker):
+        producer = mocker.Mock()
+        shared = SharedProducer(producer)
+        shared.share().pauseProducing()
+
+        shared.share().resumeProducing()
+
+        producer.resumeProducing.assert_not_called()
@@ -1,6 +1,15 @@
-from hamcrest import assert_that, is_
+import io
+
+from hamcrest import assert_that, contains_exactly, instance_of, is_
 import pytest
 
+from tests.fake_reactor import FakeReactor
+
+from wormhole_ui.errors import SendFileError
+from wormhole_ui.protocol.capabilities import Capabilities
+from wormhole_ui.protocol.transit.dest_file import DestFile, DestStream
+from wormhole_ui.protocol.transit.relay_selector import RelaySelector
+from wormhole_ui.protocol.transit.source_stream import SourceStream
 from wormhole_ui.protocol.transit.transit_protocol_pair import TransitProtocolPair
 
 
@@ -16,110 +25,333 @@ class TestBase:
         self.source_file = mocker.patch(
             "wormhole_ui.protocol.transit.transit_protocol_pair.SourceFile"
         )()
+        self.source_directory = mocker.patch(
+            "wormhole_ui.protocol.transit.transit_protocol_pair.SourceDirectory"
+        )()
+        self.shared = mocker.patch(
+            "wormhole_ui.protocol.transit.transit_protocol_pair.TransitProtocolShared"
+        )()
+        self.shared.is_transit_sent = False
+        self.shared.is_handshake_complete = False
+        self.reactor = FakeReactor()
 
 
 class TestSendFile(TestBase):
     def test_sends_transit(self):
-        transit = TransitProtocolPair(None, None, None)
+        transit = TransitProtocolPair(self.reactor, None, None)
 
         transit.send_file(13, "test_file")
+        self.reactor.run_threads()
 
         self.sender.send_transit.assert_called_once()
 
     def test_skips_transit_handshake_if_already_complete(self):
-        transit = TransitProtocolPair(None, None, None)
+        transit = TransitProtocolPair(self.reactor, None, None)
         transit.send_file(13, "test_file")
-        transit.handle_transit("transit")
+        self.reactor.run_threads()
+        transit.handle_transit({})
         transit.handle_file_ack()
         on_send_finished = self.sender.send_file.call_args[0][1]
         on_send_finished()
 
         transit.send_file(13, "test_file")
+        self.reactor.run_threads()
 
         self.sender.send_transit.assert_called_once()
         assert_that(self.sender.send_offer.call_count, is_(2))
         self.sender.send_offer.assert_called_with(self.source_file)
 
     def test_opens_source_file(self):
-        transit = TransitProtocolPair(None, None, None)
+        transit = TransitProtocolPair(self.reactor, None, None)
 
         transit.send_file(13, "test_file")
+        self.reactor.run_threads()
 
         self.source_file.open.assert_called_once()
 
 
+class TestSendFiles(TestBase):
+    def make_transit(self, *features):
+        capabilities = Capabilities()
+        capabilities.set_peer_versions({"v0": {"features": list(features)}})
+        return TransitProtocolPair(self.reactor, None, None, capabilities)
+
+    def test_batch_is_offered_together(self, mocker):
+        transit = self.make_transit("batch")
+
+        transit.send_files([(13, "one"), (14, "two")])
+        self.reactor.run_threads()
+        transit.handle_transit({})
+
+        self.sender.send_batch_offer.assert_called_once_with(
+            [self.source_file, self.source_file]
+        )
+        self.sender.send_offer.assert_not_called()
+        assert_that(self.source_file.stat.call_count, is_(2))
+        self.source_file.open.assert_not_called()
+
+    def test_scanned_files_are_not_stated(self, mocker):
+        source_file_class = mocker.patch(
+            "wormhole_ui.protocol.transit.transit_protocol_pair.SourceFile"
+        )
+        transit = self.make_transit("batch")
+
+        transit.send_files([(13, "one", 10, False), (14, "two", 20, False)])
+
+        assert_that(
+            source_file_class.call_args_list,
+            contains_exactly(((13, "one", 10),), ((14, "two", 20),)),
+        )
+        source_file_class().stat.assert_not_called()
+
+    def test_files_are_scanned_on_thread_pool(self, mocker, tmp_path):
+        source_file_class = mocker.patch(
+            "wormhole_ui.protocol.transit.transit_protocol_pair.SourceFile"
+        )
+        (tmp_path / "one").write_bytes(b"0123456789")
+        transit = self.make_transit("batch")
+
+        transit.send_files([(13, str(tmp_path / "one")), (14, str(tmp_path))])
+        source_file_class.assert_not_called()
+        self.reactor.run_threads()
+        transit.handle_transit({})
+
+        source_file_class.assert_called_once_with(13, str(tmp_path / "one"), 10)
+        self.sender.send_offer.assert_called_once_with(source_file_class())
+
+    def test_closing_while_scanning_sends_nothing(self):
+        transit = self.make_transit("batch")
+        transit.send_files([(13, "one"), (14, "two")])
+
+        transit.close()
+        self.reactor.run_threads()
+
+        self.sender.send_transit.assert_not_called()
+        assert_that(transit.is_sending_file, is_(False))
+
+    def test_scanned_directory_is_offered_on_its_own(self):
+        transit = self.make_transit("batch")
+
+        transit.send_files([(13, "one", 10, False), (14, "dir", None, True)])
+        transit.handle_transit({})
+        transit.handle_file_ack()
+        on_send_finished = self.sender.send_file.call_args[0][1]
+        on_send_finished()
+        self.reactor.run_threads()
+
+        self.sender.send_offer.assert_called_with(self.source_directory)
+
+    def test_batch_is_sent_on_file_ack(self, mocker):
+        transit = self.make_transit("batch")
+        transit.send_files([(13, "one"), (14, "two")])
+        self.reactor.run_threads()
+        transit.handle_transit({})
+
+        transit.handle_file_ack()
+
+        self.sender.send_batch.assert_called_once_with(
+            [self.source_file, self.source_file], mocker.ANY
+        )
+
+    def test_files_are_offered_one_at_a_time_without_batch(self):
+        transit = self.make_transit()
+        transit.send_files([(13, "one"), (14, "two")])
+        self.reactor.run_threads()
+        transit.handle_transit({})
+        self.sender.send_offer.assert_called_once_with(self.source_file)
+
+        transit.handle_file_ack()
+        on_send_finished = self.sender.send_file.call_args[0][1]
+        on_send_finished()
+
+        assert_that(self.sender.send_offer.call_count, is_(2))
+        assert_that(transit.is_sending_file, is_(True))
+
+        transit.handle_file_ack()
+        on_send_finished = self.sender.send_file.call_args[0][1]
+        on_send_finished()
+
+        assert_that(transit.is_sending_file, is_(False))
+
+    def test_single_file_batch_is_sent_as_a_file(self):
+        transit = self.make_transit("batch")
+
+        transit.send_files([(13, "one")])
+        self.reactor.run_threads()
+        transit.handle_transit({})
+
+        self.sender.send_offer.assert_called_once_with(self.source_file)
+
+    def test_small_files_are_packed(self, mocker):
+        self.source_file.final_bytes = 64 * 1024
+        transit = self.make_transit("batch", "pack")
+
+        transit.send_files([(13, "one"), (14, "two")])
+        self.reactor.run_threads()
+
+        assert_that(self.source_file.packed, is_(True))
+
+    def test_large_files_are_not_packed(self, mocker):
+        self.source_file.final_bytes = 64 * 1024 + 1
+        transit = self.make_transit("batch", "pack")
+
+        transit.send_files([(13, "one"), (14, "two")])
+        self.reactor.run_threads()
+
+        assert_that(self.source_file.packed, is_(False))
+
+    def test_directory_is_offered_on_its_own(self, tmp_path):
+        transit = self.make_transit()
+
+        transit.send_files([(13, str(tmp_path))])
+        self.reactor.run_threads()
+        transit.handle_transit({})
+        self.reactor.run_threads()
+
+        self.source_directory.open.assert_called_once()
+        self.sender.send_offer.assert_called_once_with(self.source_directory)
+
+    def test_directory_is_walked_on_thread_pool(self, tmp_path):
+        transit = self.make_transit()
+        transit.send_files([(13, str(tmp_path), None, True)])
+        transit.handle_transit({})
+        self.source_directory.open.assert_not_called()
+        self.sender.send_offer.assert_not_called()
+
+        self.reactor.run_threads()
+
+        self.source_directory.open.assert_called_once()
+        self.sender.send_offer.assert_called_once_with(self.source_directory)
+
+    def test_directory_walk_error_is_reported(self, mocker, tmp_path):
+        delegate = mocker.Mock()
+        transit = self.make_transit()
+        transit._delegate = delegate
+        self.source_directory.open.side_effect = SendFileError("Oops")
+        transit.send_files([(13, str(tmp_path))])
+        transit.handle_transit({})
+
+        self.reactor.run_threads()
+
+        self.sender.send_offer.assert_not_called()
+        assert_that(
+            delegate.transit_error.call_args[1]["exception"],
+            instance_of(SendFileError),
+        )
+        assert_that(transit.is_sending_file, is_(False))
+
+    def test_directories_are_offered_after_batch(self, tmp_path):
+        transit = self.make_transit("batch")
+        transit.send_files([(13, "one"), (14, str(tmp_path)), (15, "two")])
+        self.reactor.run_threads()
+        transit.handle_transit({})
+        self.sender.send_batch_offer.assert_called_once_with(
+            [self.source_file, self.source_file]
+        )
+
+        transit.handle_file_ack()
+        on_send_finished = self.sender.send_batch.call_args[0][1]
+        on_send_finished()
+        self.reactor.run_threads()
+
+        self.sender.send_offer.assert_called_once_with(self.source_directory)
+
+    def test_stream_is_offered_after_batch(self):
+        source_stream = SourceStream(14, "stream.bin", io.BytesIO(b"data"), 4)
+        transit = self.make_transit("batch")
+        transit.send_files([(13, "one"), (14, source_stream), (15, "two")])
+        self.reactor.run_threads()
+        transit.handle_transit({})
+        self.sender.send_batch_offer.assert_called_once_with(
+            [self.source_file, self.source_file]
+        )
+
+        transit.handle_file_ack()
+        on_send_finished = self.sender.send_batch.call_args[0][1]
+        on_send_finished()
+
+        self.sender.send_offer.assert_called_once_with(source_stream)
+
+
 class TestHandleTransit(TestBase):
     def test_handles_transit_when_sending(self):
-        transit = TransitProtocolPair(None, None, None)
+        transit = TransitProtocolPair(self.reactor, None, None)
         transit.send_file(13, "test_file")
+        self.reactor.run_threads()
 
-        transit.handle_transit("transit")
+        transit.handle_transit({})
 
-        self.sender.handle_transit.assert_called_once_with("transit")
+        self.sender.handle_transit.assert_called_once_with({})
 
     def test_only_handles_transit_the_first_time_when_sending(self):
-        transit = TransitProtocolPair(None, None, None)
+        transit = TransitProtocolPair(self.reactor, None, None)
         transit.send_file(13, "test_file")
-        transit.handle_transit("transit")
+        self.reactor.run_threads()
+        transit.handle_transit({})
         transit.handle_file_ack()
         on_send_finished = self.sender.send_file.call_args[0][1]
         on_send_finished()
 
         transit.send_file(13, "test_file")
-        transit.handle_transit("transit")
+        self.reactor.run_threads()
+        transit.handle_transit({})
 
-        self.sender.handle_transit.assert_called_once_with("transit")
+        self.sender.handle_transit.assert_called_once_with({})
 
     def test_sends_offer_when_sending(self):
-        transit = TransitProtocolPair(None, None, None)
+        transit = TransitProtocolPair(self.reactor, None, None)
         transit.send_file(13, "test_file")
+        self.reactor.run_threads()
 
-        transit.handle_transit("transit")
+        transit.handle_transit({})
 
         self.sender.send_offer.assert_called_once_with(self.source_file)
 
     def test_handles_transit_when_receiving(self):
-        transit = TransitProtocolPair(None, None, None)
+        transit = TransitProtocolPair(self.reactor, None, None)
 
-        transit.handle_transit("transit")
+        transit.handle_transit({})
 
-        self.receiver.handle_transit.assert_called_once_with("transit")
+        self.receiver.handle_transit.assert_called_once_with({})
 
     def test_only_handles_transit_the_first_time_when_receiving(self):
-        transit = TransitProtocolPair(None, None, None)
-        transit.handle_transit("transit")
+        transit = TransitProtocolPair(self.reactor, None, None)
+        transit.handle_transit({})
         transit.handle_offer("offer")
         transit.receive_file(13, "test_file")
         on_receive_finished = self.receiver.receive_file.call_args[0][1]
         on_receive_finished()
 
-        transit.handle_transit("transit")
+        transit.handle_transit({})
 
-        self.receiver.handle_transit.assert_called_once_with("transit")
+        self.receiver.handle_transit.assert_called_once_with({})
 
     def test_sends_transit_when_receiving(self):
-        transit = TransitProtocolPair(None, None, None)
+        transit = TransitProtocolPair(self.reactor, None, None)
 
-        transit.handle_transit("transit")
+        transit.handle_transit({})
 
         self.receiver.send_transit.assert_called_once()
 
 
 class TestHandleFileAck(TestBase):
     def test_sends_file(self, mocker):
-        transit = TransitProtocolPair(None, None, None)
+        transit = TransitProtocolPair(self.reactor, None, None)
         transit.send_file(13, "test_file")
-        transit.handle_transit("transit")
+        self.reactor.run_threads()
+        transit.handle_transit({})
 
         transit.handle_file_ack()
 
-        self.sender.send_file.assert_called_once_with(self.source_file, mocker.ANY)
+        self.sender.send_file.assert_called_once_with(
+            self.source_file, mocker.ANY, None
+        )
 
 
 class TestHandleOffer(TestBase):
     def test_handles_offer(self):
-        transit = TransitProtocolPair(None, None, None)
-        transit.handle_transit("transit")
+        transit = TransitProtocolPair(self.reactor, None, None)
+        transit.handle_transit({})
 
         transit.handle_offer("offer")
 
@@ -128,43 +360,71 @@ class TestHandleOffer(TestBase):
     def test_returns_dest_file(self, mocker):
         dest_file = mocker.Mock()
         self.receiver.handle_offer.return_value = dest_file
-        transit = TransitProtocolPair(None, None, None)
-        transit.handle_transit("transit")
+        transit = TransitProtocolPair(self.reactor, None, None)
+        transit.handle_transit({})
 
         result = transit.handle_offer("offer")
 
         assert_that(result, is_(dest_file))
 
+    def test_only_single_files_can_be_received_into_stream(self, mocker):
+        transit = TransitProtocolPair(self.reactor, None, None)
+        transit.handle_transit({})
+
+        self.receiver.handle_offer.return_value = DestFile("file.txt", 42)
+        transit.handle_offer("offer")
+        assert_that(transit.can_receive_into_stream(), is_(True))
+
+        self.receiver.handle_offer.return_value = mocker.Mock(is_directory=True)
+        transit.handle_offer("offer")
+        assert_that(transit.can_receive_into_stream(), is_(False))
+
 
 class TestReceiveFile(TestBase):
     def test_file_is_received(self, mocker):
         dest_file = mocker.Mock()
         self.receiver.handle_offer.return_value = dest_file
-        transit = TransitProtocolPair(None, None, None)
-        transit.handle_transit("transit")
+        transit = TransitProtocolPair(self.reactor, None, None)
+        transit.handle_transit({})
         transit.handle_offer("offer")
 
         transit.receive_file(13, "test_file")
 
         self.receiver.receive_file.assert_called_once_with(dest_file, mocker.ANY)
 
+    def test_file_is_received_into_stream(self, mocker):
+        self.receiver.handle_offer.return_value = DestFile("file.txt", 42)
+        transit = TransitProtocolPair(self.reactor, None, None)
+        transit.handle_transit({})
+        transit.handle_offer("offer")
+        stream = io.BytesIO()
+
+        transit.receive_file(13, stream)
+
+        dest_stream = self.receiver.receive_file.call_args[0][0]
+        assert_that(dest_stream, instance_of(DestStream))
+        assert_that(dest_stream.id, is_(13))
+        assert_that(dest_stream.file_object, is_(stream))
+
 
 class TestIsSendingFile(TestBase):
     def test_is_false_before_sending(self):
-        transit = TransitProtocolPair(None, None, None)
+        transit = TransitProtocolPair(self.reactor, None, None)
 
         assert_that(transit.is_sending_file, is_(False))
 
     def test_is_true_while_sending(self):
-        transit = TransitProtocolPair(None, None, None)
+        transit = TransitProtocolPair(self.reactor, None, None)
         transit.send_file(13, "test_file")
+        self.reactor.run_threads()
 
         assert_that(transit.is_sending_file, is_(True))
 
     def test_is_false_after_sending(self):
-        transit = TransitProtocolPair(None, None, None)
+        transit = TransitProtocolPair(self.reactor, None, None)
         transit.send_file(13, "test_file")
-        transit.handle_transit("transit")
+        self.reactor.run_threads()
+        transit.handle_transit({})
         transit.handle_file_ack()
         assert_that(transit.is_sending_file, is_(True))
 
@@ -176,21 +436,21 @@ class TestIsSendingFile(TestBase):
 
 class TestIsReceivingFile(TestBase):
     def test_is_false_before_receiving(self):
-        transit = TransitProtocolPair(None, None, None)
+        transit = TransitProtocolPair(self.reactor, None, None)
 
         assert_that(transit.is_receiving_file, is_(False))
 
     def test_is_true_while_receiving(self):
-        transit = TransitProtocolPair(None, None, None)
-        transit.handle_transit("transit")
+        transit = TransitProtocolPair(self.reactor, None, None)
+        transit.handle_transit({})
         transit.handle_offer("offer")
         transit.receive_file(13, "test_file")
 
         assert_that(transit.is_receiving_file, is_(True))
 
     def test_is_false_after_receiving(self):
-        transit = TransitProtocolPair(None, None, None)
-        transit.handle_transit("transit")
+        transit = TransitProtocolPair(self.reactor, None, None)
+        transit.handle_transit({})
         transit.handle_offer("offer")
         transit.receive_file(13, "test_file")
 
@@ -198,3 +458,155 @@ class TestIsReceivingFile(TestBase):
         on_receive_finished()
 
         assert_that(transit.is_receiving_file, is_(False))
+
+
+class TestWarmStart(TestBase):
+    def make_transit(self):
+        capabilities = Capabilities()
+        capabilities.set_peer_versions({"v0": {"features": ["warm_start"]}})
+        return TransitProtocolPair(self.reactor, None, None, capabilities)
+
+    def test_sends_transit_before_sending_a_file(self):
+        transit = self.make_transit()
+
+        transit.warm_start()
+
+        self.sender.send_transit.assert_called_once()
+        self.sender.send_offer.assert_not_called()
+
+    def test_offers_file_straight_away_once_handshake_complete(self):
+        transit = self.make_transit()
+        transit.warm_start()
+        transit.handle_transit({"direction": "receive"})
+
+        transit.send_file(13, "test_file")
+        self.reactor.run_threads()
+
+        self.sender.send_transit.assert_called_once()
+        self.sender.send_offer.assert_called_once_with(self.source_file)
+
+    def test_offers_file_once_handshake_completes(self):
+        transit = self.make_transit()
+        transit.warm_start()
+        transit.send_file(13, "test_file")
+        self.reactor.run_threads()
+        self.sender.send_offer.assert_not_called()
+
+        transit.handle_transit({"direction": "receive"})
+
+        self.sender.send_transit.assert_called_once()
+        self.sender.send_offer.assert_called_once_with(self.source_file)
+
+    def test_routes_peers_warm_start_to_receiver(self):
+        transit = self.make_transit()
+        transit.warm_start()
+
+        transit.handle_transit({"direction": "send"})
+
+        self.receiver.handle_transit.assert_called_once_with({"direction": "send"})
+        self.receiver.send_transit.assert_called_once()
+        self.sender.handle_transit.assert_not_called()
+
+
+class TestSharedTransit(TestBase):
+    def make_transit(self):
+        capabilities = Capabilities(side="ours")
+        capabilities.set_peer_versions(
+            {"v0": {"features": ["shared_transit", "warm_start"], "side": "theirs"}}
+        )
+        return TransitProtocolPair(self.reactor, None, None, capabilities)
+
+    def test_warm_start_sends_shared_transit(self):
+        transit = self.make_transit()
+
+        transit.warm_start()
+
+        self.shared.send_transit.assert_called_once()
+        self.sender.send_transit.assert_not_called()
+
+    def test_sender_and_receiver_share_the_connection(self):
+        transit = self.make_transit()
+
+        transit.warm_start()
+
+        self.sender.share_connection.assert_called_once_with(self.shared.send_channel)
+        self.receiver.share_connection.assert_called_once_with(
+            self.shared.receive_channel
+        )
+
+    def test_offers_file_without_waiting_for_peer(self):
+        transit = self.make_transit()
+
+        transit.send_file(13, "test_file")
+        self.reactor.run_threads()
+
+        self.shared.send_transit.assert_called_once()
+        self.sender.send_offer.assert_called_once_with(self.source_file)
+
+    def test_handles_peers_shared_transit(self):
+        transit = self.make_transit()
+
+        transit.handle_transit({"direction": "shared"})
+
+        self.shared.send_transit.assert_called_once()
+        self.shared.handle_transit.assert_called_once_with({"direction": "shared"})
+        self.sender.handle_transit.assert_not_called()
+        self.receiver.handle_transit.assert_not_called()
+
+    def test_closes_shared_connection(self):
+        transit = self.make_transit()
+        transit.warm_start()
+
+        transit.close()
+
+        self.shared.close.assert_called_once()
+
+
+class TestReconnect(TestBase):
+    def make_transit(self, *features):
+        capabilities = Capabilities()
+        capabilities.set_peer_versions({"v0": {"features": list(features)}})
+        self.relay_selector = RelaySelector(None, ["tcp:relay1:4001"])
+        self.sender.transit_relay = "tcp:relay1:4001"
+        return TransitProtocolPair(
+            self.reactor, None, None, capabilities, self.relay_selector
+        )
+
+    def send_file(self, transit):
+        transit.send_file(13, "test_file")
+        self.reactor.run_threads()
+        transit.handle_transit({})
+        transit.handle_file_ack()
+        on_send_finished = self.sender.send_file.call_args[0][1]
+        on_send_finished()
+
+    def test_reconnects_once_the_relay_changes(self):
+        transit = self.make_transit("reconnect")
+        self.send_file(transit)
+        self.sender.reconnect.assert_not_called()
+
+        self.relay_selector.current = "tcp:relay2:4001"
+        self.send_file(transit)
+
+        self.sender.reconnect.assert_called_once()
+        transit.send_file(13, "test_file")
+        self.reactor.run_threads()
+        assert_that(self.sender.send_transit.call_count, is_(2))
+
+    def test_doesnt_reconnect_unless_supported(self):
+        transit = self.make_transit()
+        self.send_file(transit)
+
+        self.relay_selector.current = "tcp:relay2:4001"
+        self.send_file(transit)
+
+        self.sender.reconnect.assert_not_called()
+
+    def test_receiver_reconnects_when_asked(self):
+        transit = self.make_transit("reconnect")
+        transit.handle_transit({})
+
+        transit.handle_transit({"reconnect": True})
+
+        self.receiver.reconnect.assert_called_once()
+        assert_that(self.receiver.handle_transit.call_count, is_(2))
@@ -1,8 +1,14 @@
+import hashlib
+import json
+
 from hamcrest import assert_that, is_, starts_with, calling, raises
 import pytest
 from twisted.internet import defer
 
+from tests.fake_reactor import FakeReactor
 from wormhole_ui.errors import RespondError
+from wormhole_ui.protocol.capabilities import Capabilities
+from wormhole_ui.protocol.transit.dest_file import DestBatch
 from wormhole_ui.protocol.transit.transit_protocol_receiver import (
     TransitProtocolReceiver,
 )
@@ -78,6 +84,57 @@ class TestHandleOffer(TestBase):
         assert_that(result.name, is_("test_file"))
         assert_that(result.final_bytes, is_(42))
 
+    def test_batch_offer_is_parsed(self, mocker):
+        transit_receiver = TransitProtocolReceiver(None, self.wormhole, None)
+        result = transit_receiver.handle_offer(
+            {
+                "batch": {
+                    "files": [
+                        {"filename": "file1", "filesize": 42},
+                        {"filename": "file2", "filesize": 8},
+                    ]
+                }
+            }
+        )
+
+        assert_that(result.name, is_("2 files"))
+        assert_that(result.final_bytes, is_(50))
+
+    def test_directory_offer_is_parsed(self, mocker):
+        transit_receiver = TransitProtocolReceiver(None, self.wormhole, None)
+        result = transit_receiver.handle_offer(
+            {
+                "directory": {
+                    "mode": "zipfile/deflated",
+                    "dirname": "test_dir",
+                    "zipsize": 142,
+                    "numbytes": 42,
+                    "numfiles": 2,
+                }
+            }
+        )
+
+        assert_that(result.name, is_("test_dir"))
+        assert_that(result.final_bytes, is_(142))
+        assert_that(result.num_bytes, is_(42))
+
+    def test_unknown_directory_mode_raises_exception(self, mocker):
+        transit_receiver = TransitProtocolReceiver(None, self.wormhole, None)
+        offer = {
+            "directory": {
+                "mode": "tarball",
+                "dirname": "test_dir",
+                "zipsize": 142,
+                "numbytes": 42,
+                "numfiles": 2,
+            }
+        }
+
+        assert_that(
+            calling(transit_receiver.handle_offer).with_args(offer),
+            raises(RespondError),
+        )
+
     def test_invalid_offer_raises_exception(self, mocker):
         transit_receiver = TransitProtocolReceiver(None, self.wormhole, None)
 
@@ -89,7 +146,7 @@ class TestHandleOffer(TestBase):
 
 class TestReceiveFile(TestBase):
     def test_receives_file_and_calls_transit_complete(self, mocker):
-        dest_file = mocker.Mock(id=13)
+        dest_file = mocker.Mock(id=13, resume_offset=0)
         dest_file.name = "test_file"
         self.file_receiver.open.return_value = defer.Deferred()
         self.file_receiver.receive.return_value = defer.Deferred()
@@ -104,7 +161,9 @@ class TestReceiveFile(TestBase):
         self.file_receiver.send_ack.return_value.callback(None)
 
         self.file_receiver.open.assert_called_once()
-        self.file_receiver.receive.assert_called_once_with(dest_file, mocker.ANY)
+        self.file_receiver.receive.assert_called_once_with(
+            dest_file, mocker.ANY, None, compressed=False
+        )
         self.file_receiver.send_ack.assert_called_once_with("1234")
         dest_file.finalise.assert_called_once()
         self.delegate.transit_complete.assert_called_once_with(13, "test_file")
@@ -115,7 +174,9 @@ class TestReceiveFile(TestBase):
         receive_finished_handler = mocker.Mock()
 
         transit_receiver = TransitProtocolReceiver(None, self.wormhole, self.delegate)
-        transit_receiver.receive_file(mocker.Mock(), receive_finished_handler)
+        transit_receiver.receive_file(
+            mocker.Mock(resume_offset=0), receive_finished_handler
+        )
 
         self.file_receiver.open.return_value.errback(Exception("Error"))
 
@@ -124,3 +185,141 @@ class TestReceiveFile(TestBase):
         assert_that(kwargs["exception"], is_(Exception))
         assert_that(kwargs["traceback"], starts_with("Traceback"))
         receive_finished_handler.assert_called_once()
+
+    def test_receives_batch_and_calls_transit_complete_once(self, mocker):
+        dest_batch = DestBatch(
+            [{"filename": "file1", "filesize": 1}, {"filename": "file2", "filesize": 2}]
+        )
+        dest_batch.id = 13
+        dest_batch.dest_files = [mocker.Mock(), mocker.Mock()]
+        self.file_receiver.open.return_value = defer.succeed(None)
+        self.file_receiver.receive.side_effect = ["1234", "5678"]
+        receive_finished_handler = mocker.Mock()
+
+        transit_receiver = TransitProtocolReceiver(None, self.wormhole, self.delegate)
+        transit_receiver.receive_file(dest_batch, receive_finished_handler)
+
+        assert_that(
+            self.file_receiver.receive.call_args_list,
+            is_(
+                [
+                    mocker.call(f, mocker.ANY, compressed=False)
+                    for f in dest_batch.dest_files
+                ]
+            ),
+        )
+        assert_that(
+            self.file_receiver.send_ack.call_args_list,
+            is_([mocker.call("1234"), mocker.call("5678")]),
+        )
+        for dest_file in dest_batch.dest_files:
+            dest_file.finalise.assert_called_once()
+        self.delegate.transit_complete.assert_called_once_with(13, "2 files")
+        receive_finished_handler.assert_called_once()
+
+    def test_receives_packed_files_in_batch(self, mocker):
+        dest_batch = DestBatch(
+            [
+                {"filename": "file1", "filesize": 1, "packed": True},
+                {"filename": "file2", "filesize": 2, "packed": True},
+            ]
+        )
+        self.file_receiver.open.return_value = defer.succeed(None)
+        self.file_receiver.receive_packed.side_effect = lambda batch, *_: batch.skip(2)
+
+        transit_receiver = TransitProtocolReceiver(None, self.wormhole, self.delegate)
+        transit_receiver.receive_file(dest_batch, mocker.Mock())
+
+        self.file_receiver.receive_packed.assert_called_once_with(
+            dest_batch, mocker.ANY, False
+        )
+        self.file_receiver.receive.assert_not_called()
+        self.delegate.transit_complete.assert_called_once()
+
+
+class TestResume(TestBase):
+    @pytest.fixture(autouse=True)
+    def setup_resume(self, mocker, tmp_path):
+        self.reactor = FakeReactor()
+        temp_path = tmp_path / "file.part"
+        temp_path.write_bytes(b"0123")
+        self.dest_file = mocker.Mock(
+            id=13, final_bytes=10, resume_offset=4, temp_path=temp_path
+        )
+        self.file_receiver.open.return_value = defer.succeed(None)
+        self.file_receiver.receive_header.return_value = defer.Deferred()
+        self.file_receiver.receive.return_value = defer.succeed(b"hash")
+
+    def sent_answer(self):
+        message = self.wormhole.send_message.call_args[0][0]
+        return json.loads(message)["answer"]
+
+    def test_ack_offers_to_resume(self, mocker):
+        transit_receiver = TransitProtocolReceiver(
+            self.reactor, self.wormhole, self.delegate
+        )
+        transit_receiver.receive_file(self.dest_file, mocker.Mock())
+        self.reactor.run_threads()
+
+        assert_that(
+            self.sent_answer(),
+            is_(
+                {
+                    "file_ack": "ok",
+                    "resume": {
+                        "offset": 4,
+                        "sha256": hashlib.sha256(b"0123").hexdigest(),
+                    },
+                }
+            ),
+        )
+
+    def test_receives_rest_of_file(self, mocker):
+        transit_receiver = TransitProtocolReceiver(
+            self.reactor, self.wormhole, self.delegate
+        )
+        transit_receiver.receive_file(self.dest_file, mocker.Mock())
+        self.reactor.run_threads()
+        self.file_receiver.receive_header.return_value.callback({"offset": 4})
+
+        self.dest_file.seek.assert_called_once_with(4)
+        prefix_hash = self.file_receiver.receive.call_args[0][2]
+        assert_that(prefix_hash.digest(), is_(hashlib.sha256(b"0123").digest()))
+        self.delegate.transit_complete.assert_called_once()
+
+    def test_restarts_if_sender_doesnt_resume(self, mocker):
+        transit_receiver = TransitProtocolReceiver(
+            self.reactor, self.wormhole, self.delegate
+        )
+        transit_receiver.receive_file(self.dest_file, mocker.Mock())
+        self.reactor.run_threads()
+        self.file_receiver.receive_header.return_value.callback({"offset": 0})
+
+        self.dest_file.seek.assert_called_once_with(0)
+        self.file_receiver.receive.assert_called_once_with(
+            self.dest_file, mocker.ANY, None, compressed=False
+        )
+
+
+class TestCompression(TestBase):
+    def test_receives_compressed_file(self, mocker):
+        dest_file = mocker.Mock(
+            id=13, final_bytes=10, resume_offset=0, is_directory=False
+        )
+        self.file_receiver.open.return_value = defer.succeed(None)
+        self.file_receiver.receive_header.return_value = defer.succeed(
+            {"compression": "zlib"}
+        )
+        self.file_receiver.receive.return_value = defer.succeed(b"hash")
+        capabilities = Capabilities()
+        capabilities.set_peer_versions({"v0": {"features": ["zlib"]}})
+        transit_receiver = TransitProtocolReceiver(
+            mocker.Mock(), self.wormhole, self.delegate, capabilities
+        )
+
+        transit_receiver.receive_file(dest_file, mocker.Mock())
+
+        self.file_receiver.receive.assert_called_once_with(
+            dest_file, mocker.ANY, None, compressed=True
+        )
+        self.delegate.transit_complete.assert_called_once()
@@ -1,17 +1,27 @@
 from hamcrest import assert_that, is_, starts_with
+import hashlib
+import json
+import os
+
 import pytest
 from twisted.internet import defer
+from wormhole.cli import cmd_receive
+
+from tests.fake_reactor import FakeReactor
 
 from wormhole_ui.errors import SendFileError
+from wormhole_ui.protocol.capabilities import Capabilities
+from wormhole_ui.protocol.transit.relay_selector import RelaySelector
 from wormhole_ui.protocol.transit.transit_protocol_sender import TransitProtocolSender
 
 
 class TestBase:
     @pytest.fixture(autouse=True)
     def setup(self, mocker):
-        self.transit = mocker.patch(
+        self.transit_class = mocker.patch(
             "wormhole_ui.protocol.transit.transit_protocol_sender.TransitSender"
-        )()
+        )
+        self.transit = self.transit_class()
         self.file_sender = mocker.patch(
             "wormhole_ui.protocol.transit.transit_protocol_sender.FileSender"
         )()
@@ -20,6 +30,15 @@ class TestBase:
 
 
 class TestSendTransit(TestBase):
+    def test_uses_configured_transit_relay(self):
+        relay_selector = RelaySelector(None, ["tcp:localhost:4001"])
+
+        TransitProtocolSender(None, self.wormhole, None, relay_selector=relay_selector)
+
+        self.transit_class.assert_called_with(
+            transit_relay="tcp:localhost:4001", reactor=None
+        )
+
     def test_sends_transit(self, mocker):
         self.transit.get_connection_abilities.return_value = "abilities"
         self.transit.get_connection_hints.return_value = defer.Deferred()
@@ -32,11 +51,53 @@ class TestSendTransit(TestBase):
             b'{"transit": {"abilities-v1": "abilities", "hints-v1": "hints"}}',
         )
 
+    def test_says_which_direction_if_warm_start_supported(self, mocker):
+        self.transit.get_connection_abilities.return_value = []
+        self.transit.get_connection_hints.return_value = []
+        capabilities = Capabilities()
+        capabilities.set_peer_versions({"v0": {"features": ["warm_start"]}})
+        transit_sender = TransitProtocolSender(None, self.wormhole, None, capabilities)
+
+        transit_sender.send_transit()
+
+        message = json.loads(self.wormhole.send_message.call_args[0][0])
+        assert_that(message["transit"]["direction"], is_("send"))
+
+    def test_advertises_the_relay_chosen_by_probing(self, mocker):
+        relay_selector = mocker.Mock(current="tcp:relay1:4001")
+        relay_selector.wait_for_probe.return_value = defer.Deferred()
+        transit_sender = TransitProtocolSender(
+            None, self.wormhole, self.delegate, relay_selector=relay_selector
+        )
+        transit_sender.send_transit()
+
+        relay_selector.current = "tcp:relay2:4001"
+        relay_selector.wait_for_probe.return_value.callback(None)
+
+        self.transit_class.assert_called_with(
+            transit_relay="tcp:relay2:4001", reactor=None
+        )
+        assert_that(transit_sender.transit_relay, is_("tcp:relay2:4001"))
+
+    def test_asks_peer_to_reconnect(self, mocker):
+        self.transit.get_connection_abilities.return_value = []
+        self.transit.get_connection_hints.return_value = []
+        transit_sender = TransitProtocolSender(None, self.wormhole, None)
+
+        transit_sender.reconnect()
+        transit_sender.send_transit()
+
+        message = json.loads(self.wormhole.send_message.call_args[0][0])
+        assert_that(message["transit"]["reconnect"], is_(True))
+        self.file_sender.close.assert_called_once()
+
     def test_emits_transit_error_on_exception(self, mocker):
         self.transit.get_connection_abilities.return_value = "abilities"
         self.transit.get_connection_hints.return_value = defer.Deferred()
 
-        transit_sender = TransitProtocolSender(None, self.wormhole, self.delegate)
+        transit_sender = TransitProtocolSender(
+            FakeReactor(), self.wormhole, self.delegate
+        )
         transit_sender.send_transit()
         self.transit.get_connection_hints.return_value.errback(Exception("Error"))
 
@@ -68,7 +129,7 @@ class TestHandleTransit(TestBase):
 
 class TestSendOffer(TestBase):
     def test_offer_is_sent(self, mocker):
-        source_file = mocker.Mock(final_bytes=42)
+        source_file = mocker.Mock(final_bytes=42, is_directory=False)
         source_file.name = "test_file"
 
         transit_sender = TransitProtocolSender(None, self.wormhole, None)
@@ -78,17 +139,78 @@ class TestSendOffer(TestBase):
             b'{"offer": {"file": {"filename": "test_file", "filesize": 42}}}',
         )
 
+    def test_directory_offer_is_sent(self, mocker):
+        source_directory = mocker.Mock(
+            final_bytes=142, num_bytes=42, num_files=2, is_directory=True
+        )
+        source_directory.name = "test_dir"
+
+        transit_sender = TransitProtocolSender(None, self.wormhole, None)
+        transit_sender.send_offer(source_directory)
+
+        message = json.loads(self.wormhole.send_message.call_args[0][0])
+        assert_that(
+            message,
+            is_(
+                {
+                    "offer": {
+                        "directory": {
+                            "mode": "zipfile/deflated",
+                            "dirname": "test_dir",
+                            "zipsize": 142,
+                            "numbytes": 42,
+                            "numfiles": 2,
+                        }
+                    }
+                }
+            ),
+        )
+
+    def test_directory_offer_is_accepted_by_wormhole_cli(self, mocker, tmp_path):
+        source_directory = mocker.Mock(
+            final_bytes=142, num_bytes=42, num_files=2, is_directory=True
+        )
+        source_directory.name = "test_dir"
+        transit_sender = TransitProtocolSender(None, self.wormhole, None)
+        transit_sender.send_offer(source_directory)
+        message = json.loads(self.wormhole.send_message.call_args[0][0])
+
+        args = mocker.MagicMock(
+            relay_url="", output_file=None, cwd=str(tmp_path), accept_file=True
+        )
+        receiver = cmd_receive.Receiver(args)
+        receiver._handle_directory(message["offer"]).close()
+
+
+class TestSendBatchOffer(TestBase):
+    def test_batch_offer_is_sent(self, mocker):
+        source_file1 = mocker.Mock(final_bytes=42, packed=False)
+        source_file1.name = "file1"
+        source_file2 = mocker.Mock(final_bytes=0, packed=True)
+        source_file2.name = "file2"
+
+        transit_sender = TransitProtocolSender(None, self.wormhole, None)
+        transit_sender.send_batch_offer([source_file1, source_file2])
+
+        self.wormhole.send_message.assert_called_with(
+            b'{"offer": {"batch": {"files": ['
+            b'{"filename": "file1", "filesize": 42}, '
+            b'{"filename": "file2", "filesize": 0, "packed": true}]}}}',
+        )
+
 
 class TestHandleFileAck(TestBase):
     def test_sends_file_and_calls_transit_complete(self, mocker):
-        source_file = mocker.Mock(id=13, final_bytes=42)
+        source_file = mocker.Mock(id=13, final_bytes=42, transfer_bytes=42)
         source_file.name = "test_file"
         self.file_sender.open.return_value = defer.Deferred()
         self.file_sender.send.return_value = defer.Deferred()
         self.file_sender.wait_for_ack.return_value = defer.Deferred()
         send_finished_handler = mocker.Mock()
 
-        transit_sender = TransitProtocolSender(None, self.wormhole, self.delegate)
+        transit_sender = TransitProtocolSender(
+            FakeReactor(), self.wormhole, self.delegate
+        )
         transit_sender.send_file(source_file, send_finished_handler)
 
         self.file_sender.open.return_value.callback(None)
@@ -96,20 +218,24 @@ class TestHandleFileAck(TestBase):
         self.file_sender.wait_for_ack.return_value.callback("1234")
 
         self.file_sender.open.assert_called_once()
-        self.file_sender.send.assert_called_once_with(source_file, mocker.ANY)
+        self.file_sender.send.assert_called_once_with(
+            source_file, mocker.ANY, None, compress=False
+        )
         self.file_sender.wait_for_ack.assert_called_once()
         self.delegate.transit_complete.assert_called_once_with(13, "test_file")
         self.delegate.transit_error.assert_not_called()
         send_finished_handler.assert_called_once()
 
     def test_raises_error_on_hash_mismatch(self, mocker):
-        source_file = mocker.Mock(id=13, final_bytes=42)
+        source_file = mocker.Mock(id=13, final_bytes=42, transfer_bytes=42)
         source_file.name = "test_file"
         self.file_sender.send.return_value = "4321"
         self.file_sender.wait_for_ack.return_value = "1234"
         send_finished_handler = mocker.Mock()
 
-        transit_sender = TransitProtocolSender(None, self.wormhole, self.delegate)
+        transit_sender = TransitProtocolSender(
+            FakeReactor(), self.wormhole, self.delegate
+        )
         transit_sender.send_file(source_file, send_finished_handler)
 
         self.delegate.transit_complete.assert_not_called()
@@ -118,16 +244,269 @@ class TestHandleFileAck(TestBase):
         assert_that(kwargs["traceback"], starts_with("Traceback"))
         send_finished_handler.assert_called_once()
 
+    def test_cancels_pending_progress_on_error(self, mocker):
+        source_file = mocker.Mock(id=13, final_bytes=42, transfer_bytes=42)
+        source_file.name = "test_file"
+        self.file_sender.send.return_value = defer.Deferred()
+        reactor = FakeReactor()
+
+        transit_sender = TransitProtocolSender(reactor, self.wormhole, self.delegate)
+        transit_sender.send_file(source_file, mocker.Mock())
+        progress = self.file_sender.send.call_args[0][1]
+        progress.update(10)
+        progress.update(10)
+        self.file_sender.send.return_value.errback(SendFileError("Oops"))
+
+        assert_that(reactor.getDelayedCalls(), is_([]))
+
     def test_doesnt_raise_error_if_hash_missing(self, mocker):
-        source_file = mocker.Mock(id=13, final_bytes=42)
+        source_file = mocker.Mock(id=13, final_bytes=42, transfer_bytes=42)
         source_file.name = "test_file"
         self.file_sender.send.return_value = "4321"
         self.file_sender.wait_for_ack.return_value = None
         send_finished_handler = mocker.Mock()
 
-        transit_sender = TransitProtocolSender(None, self.wormhole, self.delegate)
+        transit_sender = TransitProtocolSender(
+            FakeReactor(), self.wormhole, self.delegate
+        )
         transit_sender.send_file(source_file, send_finished_handler)
 
         self.delegate.transit_complete.assert_called_once_with(13, "test_file")
         self.delegate.transit_error.assert_not_called()
         send_finished_handler.assert_called_once()
+
+
+class TestSendBatch(TestBase):
+    @pytest.fixture(autouse=True)
+    def setup_batch(self, mocker):
+        self.source_files = []
+        for id in range(3):
+            source_file = mocker.Mock(id=id, final_bytes=42, transfer_bytes=42)
+            source_file.packed = False
+            source_file.name = f"file{id}"
+            self.source_files.append(source_file)
+
+        self.file_sender.open.return_value = defer.succeed(None)
+        self.file_sender.send.side_effect = lambda f, p, **kwargs: defer.succeed(f.name)
+        self.acks = [defer.Deferred() for _ in self.source_files]
+        self.file_sender.wait_for_ack.side_effect = self.acks
+
+    def test_sends_all_files_before_waiting_for_acks(self, mocker):
+        transit_sender = TransitProtocolSender(
+            FakeReactor(), self.wormhole, self.delegate
+        )
+        transit_sender.send_batch(self.source_files, mocker.Mock())
+
+        assert_that(self.file_sender.send.call_count, is_(3))
+        assert_that(self.file_sender.wait_for_ack.call_count, is_(3))
+        self.delegate.transit_complete.assert_not_called()
+
+    def test_each_ack_completes_its_file(self, mocker):
+        send_finished_handler = mocker.Mock()
+        transit_sender = TransitProtocolSender(
+            FakeReactor(), self.wormhole, self.delegate
+        )
+        transit_sender.send_batch(self.source_files, send_finished_handler)
+
+        self.acks[0].callback("file0")
+        self.delegate.transit_complete.assert_called_once_with(0, "file0")
+        send_finished_handler.assert_not_called()
+
+        self.acks[1].callback("file1")
+        self.acks[2].callback("file2")
+        self.delegate.transit_complete.assert_called_with(2, "file2")
+        self.delegate.transit_error.assert_not_called()
+        send_finished_handler.assert_called_once()
+
+    def test_files_are_closed_after_sending(self, mocker):
+        transit_sender = TransitProtocolSender(
+            FakeReactor(), self.wormhole, self.delegate
+        )
+        transit_sender.send_batch(self.source_files, mocker.Mock())
+
+        for source_file in self.source_files:
+            source_file.open.assert_called_once()
+            source_file.close.assert_called_once()
+
+    def test_raises_error_on_hash_mismatch(self, mocker):
+        send_finished_handler = mocker.Mock()
+        transit_sender = TransitProtocolSender(
+            FakeReactor(), self.wormhole, self.delegate
+        )
+        transit_sender.send_batch(self.source_files, send_finished_handler)
+
+        self.acks[0].callback("file0")
+        self.acks[1].callback("bad")
+        self.acks[2].callback("file2")
+
+        kwargs = self.delegate.transit_error.call_args[1]
+        assert_that(kwargs["exception"], is_(SendFileError))
+        send_finished_handler.assert_called_once()
+
+    def test_raises_error_if_file_changed(self, mocker):
+        self.source_files[1].open.side_effect = lambda: setattr(
+            self.source_files[1], "transfer_bytes", 43
+        )
+        transit_sender = TransitProtocolSender(
+            FakeReactor(), self.wormhole, self.delegate
+        )
+        transit_sender.send_batch(self.source_files, mocker.Mock())
+
+        assert_that(self.file_sender.send.call_count, is_(1))
+        kwargs = self.delegate.transit_error.call_args[1]
+        assert_that(kwargs["exception"], is_(SendFileError))
+
+    def test_packed_files_are_sent_together(self, mocker):
+        for source_file in self.source_files:
+            source_file.packed = True
+        self.file_sender.send_packed.return_value = defer.succeed("1234")
+        transit_sender = TransitProtocolSender(
+            FakeReactor(), self.wormhole, self.delegate
+        )
+        transit_sender.send_batch(self.source_files, mocker.Mock())
+
+        self.file_sender.send_packed.assert_called_once_with(self.source_files, False)
+        self.file_sender.send.assert_not_called()
+        self.delegate.transit_complete.assert_not_called()
+
+        self.acks[0].callback("1234")
+
+        assert_that(self.delegate.transit_complete.call_count, is_(3))
+
+    @pytest.mark.parametrize("ack_hash", ["4321", None])
+    def test_raises_error_on_packed_hash_mismatch(self, mocker, ack_hash):
+        for source_file in self.source_files:
+            source_file.packed = True
+        self.file_sender.send_packed.return_value = defer.succeed("1234")
+        transit_sender = TransitProtocolSender(
+            FakeReactor(), self.wormhole, self.delegate
+        )
+        transit_sender.send_batch(self.source_files, mocker.Mock())
+
+        self.acks[0].callback(ack_hash)
+
+        self.delegate.transit_complete.assert_not_called()
+        kwargs = self.delegate.transit_error.call_args[1]
+        assert_that(kwargs["exception"], is_(SendFileError))
+
+
+class TestResume(TestBase):
+    @pytest.fixture(autouse=True)
+    def setup_resume(self, mocker, tmp_path):
+        self.reactor = FakeReactor()
+        full_path = tmp_path / "file"
+        full_path.write_bytes(b"0123456789")
+        self.source_file = mocker.Mock(
+            id=13, final_bytes=10, transfer_bytes=10, full_path=full_path
+        )
+        self.file_sender.open.return_value = defer.succeed(None)
+        self.file_sender.send.return_value = defer.succeed("hash")
+        self.file_sender.wait_for_ack.return_value = defer.succeed("hash")
+
+    def send_file(self, mocker, resume):
+        transit_sender = TransitProtocolSender(
+            self.reactor, self.wormhole, self.delegate
+        )
+        transit_sender.send_file(self.source_file, mocker.Mock(), resume)
+        self.reactor.run_threads()
+
+    def test_sends_rest_of_file_if_prefix_matches(self, mocker):
+        sha256 = hashlib.sha256(b"0123").hexdigest()
+
+        self.send_file(mocker, {"offset": 4, "sha256": sha256})
+
+        self.file_sender.send_header.assert_called_once_with({"offset": 4})
+        self.source_file.seek.assert_called_once_with(4)
+        prefix_hash = self.file_sender.send.call_args[0][2]
+        assert_that(prefix_hash.hexdigest(), is_(sha256))
+        self.delegate.transit_complete.assert_called_once()
+
+    def test_sends_whole_file_if_prefix_doesnt_match(self, mocker):
+        sha256 = hashlib.sha256(b"abcd").hexdigest()
+
+        self.send_file(mocker, {"offset": 4, "sha256": sha256})
+
+        self.file_sender.send_header.assert_called_once_with({"offset": 0})
+        self.source_file.seek.assert_called_once_with(0)
+        self.file_sender.send.assert_called_once_with(
+            self.source_file, mocker.ANY, None, compress=False
+        )
+
+    def test_sends_whole_file_if_offset_too_large(self, mocker):
+        self.send_file(mocker, {"offset": 11, "sha256": "ab"})
+
+        self.file_sender.send_header.assert_called_once_with({"offset": 0})
+
+    def test_sends_whole_stream(self, mocker):
+        self.source_file.full_path = None
+
+        self.send_file(mocker, {"offset": 4, "sha256": "ab"})
+
+        self.file_sender.send_header.assert_called_once_with({"offset": 0})
+
+
+class TestCompression(TestBase):
+    @pytest.fixture(autouse=True)
+    def setup_compression(self, mocker, tmp_path):
+        self.reactor = FakeReactor()
+        self.full_path = tmp_path / "file"
+        self.source_file = mocker.Mock(
+            id=13,
+            final_bytes=10,
+            transfer_bytes=10,
+            full_path=self.full_path,
+            is_directory=False,
+        )
+        self.file_sender.open.return_value = defer.succeed(None)
+        self.file_sender.send.return_value = defer.succeed("hash")
+        self.file_sender.wait_for_ack.return_value = defer.succeed("hash")
+
+    def send_file(self, mocker):
+        capabilities = Capabilities()
+        capabilities.set_peer_versions({"v0": {"features": ["zlib"]}})
+        transit_sender = TransitProtocolSender(
+            self.reactor, self.wormhole, self.delegate, capabilities
+        )
+        transit_sender.send_file(self.source_file, mocker.Mock())
+        self.reactor.run_threads()
+
+    def test_compresses_text(self, mocker):
+        self.full_path.write_bytes(b"hello world\n" * 1000)
+
+        self.send_file(mocker)
+
+        self.file_sender.send_header.assert_called_once_with({"compression": "zlib"})
+        self.file_sender.send.assert_called_once_with(
+            self.source_file, mocker.ANY, None, compress=True
+        )
+        self.delegate.transit_complete.assert_called_once()
+
+    def test_skips_compression_of_random_data(self, mocker):
+        self.full_path.write_bytes(os.urandom(100_000))
+
+        self.send_file(mocker)
+
+        self.file_sender.send_header.assert_called_once_with({"compression": None})
+        self.file_sender.send.assert_called_once_with(
+            self.source_file, mocker.ANY, None, compress=False
+        )
+
+    def test_doesnt_compress_directories(self, mocker):
+        self.source_file.is_directory = True
+
+        self.send_file(mocker)
+
+        self.file_sender.send_header.assert_not_called()
+        self.file_sender.send.assert_called_once_with(
+            self.source_file, mocker.ANY, None, compress=False
+        )
+
+    def test_doesnt_compress_streams(self, mocker):
+        self.source_file.full_path = None
+
+        self.send_file(mocker)
+
+        self.file_sender.send_header.assert_called_once_with({"compression": None})
+        self.file_sender.send.assert_called_once_with(
+            self.source_file, mocker.ANY, None, compress=False
+        )
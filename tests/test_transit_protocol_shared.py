@@ -0,0 +1,105 @@
+from hamcrest import assert_that, is_
+import pytest
+from twisted.internet import defer
+
+from wormhole_ui.protocol.capabilities import Capabilities
+from wormhole_ui.protocol.transit.transit_protocol_shared import (
+    TransitProtocolShared,
+)
+
+
+class TestBase:
+    @pytest.fixture(autouse=True)
+    def setup(self, mocker):
+        self.transit_sender_class = mocker.patch(
+            "wormhole_ui.protocol.transit.transit_protocol_shared.TransitSender"
+        )
+        self.transit_receiver_class = mocker.patch(
+            "wormhole_ui.protocol.transit.transit_protocol_shared.TransitReceiver"
+        )
+        self.wormhole = mocker.Mock()
+        self.delegate = mocker.Mock()
+
+    def make_shared(self, peer_side):
+        capabilities = Capabilities(side="m")
+        capabilities.set_peer_versions({"v0": {"side": peer_side}})
+        return TransitProtocolShared(None, self.wormhole, self.delegate, capabilities)
+
+
+class TestCreateTransit(TestBase):
+    def test_leader_is_transit_sender(self):
+        self.make_shared(peer_side="a")
+
+        self.transit_sender_class.assert_called_once()
+        self.transit_receiver_class.assert_not_called()
+
+    def test_follower_is_transit_receiver(self):
+        self.make_shared(peer_side="z")
+
+        self.transit_receiver_class.assert_called_once()
+        self.transit_sender_class.assert_not_called()
+
+
+class TestHandleTransit(TestBase):
+    def test_connects_once_hints_received(self, mocker):
+        transit = self.transit_sender_class()
+        transit.TRANSIT_KEY_LENGTH = 32
+        transit.connect.return_value = defer.Deferred()
+        shared = self.make_shared(peer_side="a")
+        connected = shared.send_channel.connect()
+
+        shared.handle_transit({"hints-v1": "hints"})
+        pipe = mocker.Mock()
+        transit.connect.return_value.callback(pipe)
+
+        transit.add_connection_hints.assert_called_once_with("hints")
+        assert_that(connected.result, is_(shared.send_channel))
+        pipe.registerProducer.assert_called_once()
+
+    def test_doesnt_report_error_when_closed(self):
+        transit = self.transit_sender_class()
+        transit.TRANSIT_KEY_LENGTH = 32
+        transit.connect.return_value = defer.Deferred()
+        shared = self.make_shared(peer_side="a")
+        shared.handle_transit({})
+
+        shared.close()
+
+        self.delegate.transit_error.assert_not_called()
+
+    def test_key_is_set_once_before_hints_are_sent(self):
+        transit = self.transit_sender_class()
+        transit.TRANSIT_KEY_LENGTH = 32
+        transit.connect.return_value = defer.Deferred()
+        shared = self.make_shared(peer_side="a")
+
+        shared.send_transit()
+        transit.set_transit_key.assert_called_once()
+        shared.handle_transit({})
+
+        transit.set_transit_key.assert_called_once()
+
+    def test_reports_message_channel_once_connected(self, mocker):
+        transit = self.transit_sender_class()
+        transit.TRANSIT_KEY_LENGTH = 32
+        transit.connect.return_value = defer.Deferred()
+        shared = self.make_shared(peer_side="a")
+
+        shared.handle_transit({})
+        transit.connect.return_value.callback(mocker.Mock())
+
+        self.delegate.transit_connected.assert_called_once_with(
+            shared._multiplexer.message_channel, shared._multiplexer.text_channel
+        )
+
+    def test_disables_nagle_once_connected(self, mocker):
+        transit = self.transit_sender_class()
+        transit.TRANSIT_KEY_LENGTH = 32
+        transit.connect.return_value = defer.Deferred()
+        shared = self.make_shared(peer_side="a")
+        pipe = mocker.Mock()
+
+        shared.handle_transit({})
+        transit.connect.return_value.callback(pipe)
+
+        pipe.transport.setTcpNoDelay.assert_called_once_with(True)
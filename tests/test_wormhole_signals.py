@@ -0,0 +1,26 @@
+import pytest
+
+from wormhole_ui.protocol.wormhole_protocol import WormholeSignals
+
+PETABYTE = 1_000_000_000_000_000
+
+
+class TestWormholeSignals:
+    @pytest.fixture(autouse=True)
+    def setup(self, mocker):
+        self.signals = WormholeSignals()
+        self.slot = mocker.Mock()
+
+    def test_file_receive_pending_supports_petabyte_files(self):
+        self.signals.file_receive_pending.connect(self.slot)
+
+        self.signals.file_receive_pending.emit("disk.img", 3 * PETABYTE + 1)
+
+        self.slot.assert_called_once_with("disk.img", 3 * PETABYTE + 1)
+
+    def test_file_transfer_progress_supports_petabyte_files(self):
+        self.signals.file_transfer_progress.connect(self.slot)
+
+        self.signals.file_transfer_progress.emit(13, 2 * PETABYTE + 1, 3 * PETABYTE)
+
+        self.slot.assert_called_once_with(13, 2 * PETABYTE + 1, 3 * PETABYTE)
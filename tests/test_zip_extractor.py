@@ -0,0 +1,138 @@
+import io
+import os
+import zipfile
+
+from hamcrest import assert_that, calling, is_, raises
+import pytest
+
+from wormhole_ui.errors import ReceiveFileError
+from wormhole_ui.protocol.transit.zip_extractor import ZipExtractor
+from wormhole_ui.protocol.transit.zip_stream import ZipStream
+
+FILES = {
+    "one.txt": b"one",
+    "empty.txt": b"",
+    "sub/two.bin": os.urandom(100_000),
+    "sub/three.txt": b"PK\x07\x08" * 1000,
+}
+
+
+def extract(data, dest_path, max_bytes=1_000_000, chunk_size=1000):
+    extractor = ZipExtractor(dest_path, max_bytes)
+    for start in range(0, len(data), chunk_size):
+        end = start + chunk_size
+        extractor.write(data[start:end])
+    return extractor.close()
+
+
+def zipfile_bytes(files, compression=zipfile.ZIP_DEFLATED):
+    data = io.BytesIO()
+    with zipfile.ZipFile(data, "w", compression) as zip_file:
+        for name, contents in files.items():
+            zip_file.writestr(name, contents)
+    return data.getvalue()
+
+
+class Unseekable(io.RawIOBase):
+    def __init__(self):
+        self.data = bytearray()
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.data += data
+        return len(data)
+
+
+def streamed_zip_bytes(files, compression=zipfile.ZIP_STORED):
+    """Zips without seeking, using data descriptors like the wormhole CLI"""
+    output = Unseekable()
+    with zipfile.ZipFile(output, "w", compression) as zip_file:
+        for name, contents in files.items():
+            with zip_file.open(name, "w") as entry:
+                entry.write(contents)
+    return bytes(output.data)
+
+
+def assert_extracted(dest_path, files):
+    for name, contents in files.items():
+        assert_that((dest_path / name).read_bytes(), is_(contents))
+
+
+class TestZipExtractor:
+    @pytest.mark.parametrize("compression", [zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED])
+    def test_extracts_zipfile(self, tmp_path, compression):
+        data = zipfile_bytes(FILES, compression)
+
+        assert_that(extract(data, tmp_path), is_(True))
+        assert_extracted(tmp_path, FILES)
+
+    @pytest.mark.parametrize("compression", [zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED])
+    def test_extracts_streamed_zip(self, tmp_path, compression):
+        data = streamed_zip_bytes(FILES, compression)
+
+        assert_that(extract(data, tmp_path), is_(True))
+        assert_extracted(tmp_path, FILES)
+
+    def test_extracts_zip_stream(self, tmp_path):
+        source_path = tmp_path / "source"
+        for name, contents in FILES.items():
+            (source_path / name).parent.mkdir(parents=True, exist_ok=True)
+            (source_path / name).write_bytes(contents)
+        (source_path / "script.sh").write_bytes(b"#!/bin/sh")
+        (source_path / "script.sh").chmod(0o755)
+        (source_path / "empty_dir").mkdir()
+        dest_path = tmp_path / "dest"
+        dest_path.mkdir()
+
+        extract(ZipStream(source_path).read(), dest_path)
+
+        assert_extracted(dest_path, FILES)
+        assert_that((dest_path / "empty_dir").is_dir(), is_(True))
+        assert_that((dest_path / "script.sh").stat().st_mode & 0o777, is_(0o755))
+
+    def test_incomplete_zip_isnt_complete(self, tmp_path):
+        data = zipfile_bytes(FILES)
+
+        assert_that(extract(data[:-100], tmp_path), is_(False))
+
+    def test_raises_error_if_larger_than_offered(self, tmp_path):
+        data = zipfile_bytes({"big.txt": b"0" * 10_000})
+
+        assert_that(
+            calling(extract).with_args(data, tmp_path, max_bytes=9_999),
+            raises(ReceiveFileError),
+        )
+
+    def test_raises_error_if_corrupt(self, tmp_path):
+        data = zipfile_bytes({"one.txt": b"contents"}, zipfile.ZIP_STORED)
+        data = data.replace(b"contents", b"corrupt!")
+
+        assert_that(
+            calling(extract).with_args(data, tmp_path), raises(ReceiveFileError)
+        )
+
+    def test_raises_error_if_not_a_zip(self, tmp_path):
+        assert_that(
+            calling(extract).with_args(b"not a zip file", tmp_path),
+            raises(ReceiveFileError),
+        )
+
+    @pytest.mark.parametrize("name", ["../evil.txt", "sub/../../evil.txt"])
+    def test_raises_error_on_path_traversal(self, tmp_path, name):
+        dest_path = tmp_path / "dest"
+        dest_path.mkdir()
+        data = zipfile_bytes({name: b"evil"})
+
+        assert_that(
+            calling(extract).with_args(data, dest_path), raises(ReceiveFileError)
+        )
+        assert_that((tmp_path / "evil.txt").exists(), is_(False))
+
+    def test_absolute_paths_are_made_relative(self, tmp_path):
+        data = streamed_zip_bytes({"/tmp/evil.txt": b"evil"})
+
+        extract(data, tmp_path)
+
+        assert_that((tmp_path / "tmp" / "evil.txt").read_bytes(), is_(b"evil"))
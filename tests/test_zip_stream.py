@@ -0,0 +1,88 @@
+import io
+import os
+import zipfile
+
+from hamcrest import assert_that, calling, is_, raises
+import pytest
+
+from wormhole_ui.errors import SendFileError
+from wormhole_ui.protocol.transit import zip_stream
+from wormhole_ui.protocol.transit.zip_stream import ZipStream
+
+
+@pytest.fixture
+def dir_path(tmp_path):
+    dir_path = tmp_path / "dir"
+    (dir_path / "sub").mkdir(parents=True)
+    (dir_path / "empty").mkdir()
+    (dir_path / "one.txt").write_bytes(b"one")
+    (dir_path / "sub" / "two.txt").write_bytes(b"two" * 100_000)
+    (dir_path / "sub" / "two.txt").chmod(0o640)
+    return dir_path
+
+
+def read_all(stream, size=70_000):
+    chunks = []
+    while True:
+        chunk = stream.read(size)
+        if not chunk:
+            return b"".join(chunks)
+        chunks.append(chunk)
+
+
+class TestZipStream:
+    def test_size_is_known_in_advance(self, dir_path):
+        stream = ZipStream(dir_path)
+
+        assert_that(len(read_all(stream)), is_(stream.size))
+        assert_that(stream.num_files, is_(2))
+        assert_that(stream.num_bytes, is_(300_003))
+
+    def test_stream_is_a_valid_zip(self, dir_path):
+        zip_file = zipfile.ZipFile(io.BytesIO(read_all(ZipStream(dir_path))))
+
+        assert_that(zip_file.testzip(), is_(None))
+        assert_that(zip_file.namelist(), is_(["one.txt", "empty/", "sub/two.txt"]))
+        assert_that(zip_file.read("sub/two.txt"), is_(b"two" * 100_000))
+
+    def test_permissions_are_stored(self, dir_path):
+        zip_file = zipfile.ZipFile(io.BytesIO(read_all(ZipStream(dir_path))))
+
+        info = zip_file.getinfo("sub/two.txt")
+        assert_that(info.external_attr >> 16, is_(0o100640))
+
+    def test_large_zips_use_zip64(self, dir_path, monkeypatch):
+        monkeypatch.setattr(zip_stream, "ZIP64_LIMIT", 100)
+        monkeypatch.setattr(zip_stream, "ZIP64_COUNT_LIMIT", 2)
+        stream = ZipStream(dir_path)
+
+        data = read_all(stream)
+
+        assert_that(len(data), is_(stream.size))
+        zip_file = zipfile.ZipFile(io.BytesIO(data))
+        assert_that(zip_file.testzip(), is_(None))
+        assert_that(zip_file.read("sub/two.txt"), is_(b"two" * 100_000))
+
+    def test_raises_error_if_file_changes(self, dir_path):
+        stream = ZipStream(dir_path)
+        (dir_path / "one.txt").write_bytes(b"changed")
+
+        assert_that(calling(read_all).with_args(stream), raises(SendFileError))
+
+    @pytest.mark.skipif(not hasattr(os, "mkfifo"), reason="Needs FIFOs")
+    def test_skips_fifos(self, dir_path):
+        os.mkfifo(dir_path / "sub" / "fifo")
+        stream = ZipStream(dir_path)
+
+        zip_file = zipfile.ZipFile(io.BytesIO(read_all(stream)))
+
+        assert_that(zip_file.namelist(), is_(["one.txt", "empty/", "sub/two.txt"]))
+        assert_that(stream.num_files, is_(2))
+
+    def test_skips_broken_symlinks(self, dir_path):
+        (dir_path / "broken").symlink_to(dir_path / "missing")
+        stream = ZipStream(dir_path)
+
+        zip_file = zipfile.ZipFile(io.BytesIO(read_all(stream)))
+
+        assert_that(zip_file.namelist(), is_(["one.txt", "empty/", "sub/two.txt"]))
@@ -0,0 +1,274 @@
+"""
+Headless front end, for scripting transfers on machines without a display.
+
+Runs the same protocol as the GUI on a plain Twisted reactor, and reports
+progress as a stream of JSON objects on stdout (one per line). Qt is never
+imported.
+
+A path of "-" sends stdin, and an output directory of "-" writes received
+files to stdout, in which case progress is reported on stderr instead.
+"""
+
+import argparse
+from functools import partial
+import json
+import logging
+from pathlib import Path
+import sys
+
+from twisted.internet import defer, task
+
+from .protocol import LocalRelay, Relays, Session, accept_into, accept_to_stream
+from .protocol.transit.source_stream import MAX_STREAM_BYTES
+from .util import get_download_path_or_cwd
+
+# Path that stands for stdin (when sending) or stdout (when receiving)
+STDIO_PATH = "-"
+DEFAULT_STDIN_NAME = "stdin"
+
+
+class Transfer:
+    """
+    Sends or receives files over a single wormhole, then shuts it down.
+    Progress is reported to the output as JSON events.
+    """
+
+    def __init__(self, reactor, output=sys.stdout, relays=None, stdin=None):
+        self.session = Session(reactor, relays)
+        self.session.signals.message_received.connect(self._on_message_received)
+        self._output = output
+        self._stdin = stdin
+        self._failed = False
+
+    @defer.inlineCallbacks
+    def send(
+        self, file_paths, code=None, stdin_name=DEFAULT_STDIN_NAME, stdin_size=None
+    ):
+        """
+        Sends the files once the peer connects, and stdin as stdin_name if
+        STDIO_PATH is one of them. Returns a Deferred that fires with the exit
+        status once the wormhole has closed.
+
+        Unless stdin_size is given, stdin is read into memory before it's sent.
+        """
+        paths = [p for p in file_paths if p != STDIO_PATH]
+        handles = self.session.send_files(paths) if paths else []
+        if len(paths) < len(file_paths):
+            handles.append(
+                self.session.send_stream(self._stdin, stdin_name, stdin_size)
+            )
+        for handle in handles:
+            self._report_progress(handle)
+
+        try:
+            yield self._open(code)
+            for handle in handles:
+                filename = yield handle.when_complete()
+                self._emit("complete", id=handle.id, filename=filename)
+        except Exception as exception:
+            self._emit_error(exception)
+            yield self.session.close()
+        else:
+            yield self.session.shutdown()
+
+        return self._on_closed()
+
+    @defer.inlineCallbacks
+    def receive(self, dest_path, code=None):
+        """
+        Accepts every file offered into dest_path (a directory, or a binary
+        stream to write them into), until the peer closes the wormhole.
+        Returns a Deferred that fires with the exit status.
+        """
+        if hasattr(dest_path, "write"):
+            policy = accept_to_stream(dest_path)
+        else:
+            policy = accept_into(str(dest_path))
+        try:
+            yield self._open(code)
+            while True:
+                handle = yield self.session.receive(policy)
+                if handle is None:
+                    break
+
+                self._emit(
+                    "receive_pending",
+                    id=handle.id,
+                    filename=handle.name,
+                    size=handle.total_bytes,
+                )
+                self._report_progress(handle)
+                filename = yield handle.when_complete()
+                self._emit("complete", id=handle.id, filename=filename)
+        except Exception as exception:
+            self._emit_error(exception)
+            yield self.session.close()
+
+        return self._on_closed()
+
+    @defer.inlineCallbacks
+    def _open(self, code):
+        code = yield self.session.open(code)
+        self._emit("code", code=code)
+        yield self.session.when_connected()
+        self._emit("open")
+
+    def _report_progress(self, handle):
+        handle.progress.connect(partial(self._on_progress, handle.id))
+
+    def _on_progress(self, id, transferred_bytes, total_bytes):
+        self._emit(
+            "progress",
+            id=id,
+            transferred_bytes=transferred_bytes,
+            total_bytes=total_bytes,
+        )
+
+    def _on_message_received(self, message):
+        self._emit("message", message=message)
+
+    def _on_closed(self):
+        is_ok = not self._failed
+        self._emit("closed", ok=is_ok)
+        return 0 if is_ok else 1
+
+    def _emit_error(self, exception):
+        self._failed = True
+        self._emit("error", error=f"{exception.__class__.__name__}: {exception}")
+
+    def _emit(self, event, **kwds):
+        self._output.write(json.dumps(dict(event=event, **kwds)) + "\n")
+        self._output.flush()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="wormhole-ui-cli",
+        description="Send or receive files over Magic Wormhole, without the GUI. "
+        "Progress is reported on stdout as JSON, one object per line (or on "
+        "stderr, when receiving to stdout).",
+    )
+    parser.add_argument(
+        "-v", "--verbose", action="count", default=0, help="log more to stderr"
+    )
+    default_relays = Relays()
+    parser.add_argument(
+        "--mailbox-url",
+        default=default_relays.mailbox_url,
+        help="mailbox server to rendezvous on (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--transit-relay",
+        action="append",
+        help="relay for peers that can't connect directly, or 'none'. Give more "
+        "than once to use whichever responds fastest "
+        f"(default: {default_relays.transit_relay})",
+    )
+    parser.add_argument(
+        "--local-relay",
+        action="store_true",
+        help="run a mailbox server and transit relay in this process, and use "
+        "them instead (peers must be configured to use them too)",
+    )
+    subparsers = parser.add_subparsers(dest="command")
+    subparsers.required = True
+
+    send_parser = subparsers.add_parser("send", help="send files or directories")
+    send_parser.add_argument(
+        "paths", nargs="+", metavar="PATH", help="file or directory, or - for stdin"
+    )
+    send_parser.add_argument("-c", "--code", help="wormhole code (default: allocate)")
+    send_parser.add_argument(
+        "--name",
+        default=DEFAULT_STDIN_NAME,
+        help="filename to send stdin as (default: %(default)s)",
+    )
+    send_parser.add_argument(
+        "--size",
+        type=int,
+        help="size of stdin in bytes, so that it's sent as it's read. Otherwise "
+        "it's read into memory first, which is limited to "
+        f"{MAX_STREAM_BYTES // (1024 * 1024)}MiB",
+    )
+
+    receive_parser = subparsers.add_parser("receive", help="receive files")
+    receive_parser.add_argument("code", nargs="?", help="wormhole code")
+    receive_parser.add_argument(
+        "-o",
+        "--output-dir",
+        type=Path,
+        default=None,
+        help="directory to save into, or - for stdout (default: Downloads)",
+    )
+
+    args = parser.parse_args(argv)
+    if args.command == "send":
+        if args.paths.count(STDIO_PATH) > 1:
+            parser.error(f"{STDIO_PATH} can only be given once")
+        if args.size is not None and args.size < 0:
+            parser.error("--size can't be negative")
+        for path in args.paths:
+            if path != STDIO_PATH and not Path(path).exists():
+                parser.error(f"{path} does not exist")
+    elif args.output_dir is not None and not _is_stdout(args):
+        if not args.output_dir.is_dir():
+            parser.error(f"{args.output_dir} is not a directory")
+    return args
+
+
+def _is_stdout(args):
+    return args.command == "receive" and str(args.output_dir) == STDIO_PATH
+
+
+def get_relays(args):
+    if args.transit_relay is None:
+        return Relays(mailbox_url=args.mailbox_url)
+
+    transit_relays = [
+        relay for relay in args.transit_relay if relay.lower() != "none"
+    ] or [None]
+    return Relays(
+        mailbox_url=args.mailbox_url,
+        transit_relay=transit_relays[0],
+        alternative_transit_relays=transit_relays[1:],
+    )
+
+
+def main(reactor, args):
+    if args.local_relay:
+        local_relay = LocalRelay(reactor)
+        relays = local_relay.start()
+        logging.warning(
+            f"Running local relays: --mailbox-url {relays.mailbox_url} "
+            f"--transit-relay {relays.transit_relay}"
+        )
+        reactor.addSystemEventTrigger("before", "shutdown", local_relay.stop)
+    else:
+        relays = get_relays(args)
+
+    if _is_stdout(args):
+        # stdout carries the files, so progress goes to stderr
+        transfer = Transfer(reactor, sys.stderr, relays)
+        finished = transfer.receive(sys.stdout.buffer, args.code)
+    elif args.command == "send":
+        transfer = Transfer(reactor, relays=relays, stdin=sys.stdin.buffer)
+        finished = transfer.send(args.paths, args.code, args.name, args.size)
+    else:
+        transfer = Transfer(reactor, relays=relays)
+        dest_path = args.output_dir or get_download_path_or_cwd()
+        finished = transfer.receive(dest_path, args.code)
+
+    @finished.addCallback
+    def exit_on_failure(status):
+        if status != 0:
+            raise SystemExit(status)
+
+    return finished
+
+
+def run(argv=None):
+    args = parse_args(argv)
+    levels = [logging.WARNING, logging.INFO, logging.DEBUG]
+    logging.basicConfig(level=levels[min(args.verbose, len(levels) - 1)])
+
+    task.react(main, [args])
@@ -55,3 +55,9 @@ class RefusedError(WormholeGuiError):
     """The file transfer was refused"""
 
     pass
+
+
+class ClosedError(WormholeGuiError):
+    """The wormhole closed before the transfer finished"""
+
+    pass
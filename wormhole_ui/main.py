@@ -2,7 +2,7 @@ import logging
 import sys
 
 from PySide2 import QtCore, QtGui
-from PySide2.QtWidgets import QApplication
+from PySide2.QtWidgets import QApplication, QMessageBox
 import qt5reactor
 import twisted.internet
 
@@ -28,7 +28,9 @@ QApplication([])
 qt5reactor.install()
 
 from .widgets.main_window import MainWindow  # noqa: E402
-from .protocol import WormholeProtocol  # noqa: E402
+from .protocol.relays import Relays  # noqa: E402
+from .protocol.wormhole_protocol import WormholeProtocol  # noqa: E402
+from .settings import get_relays, get_settings  # noqa: E402
 
 
 def run():
@@ -36,7 +38,23 @@ def run():
     QApplication.setWindowIcon(QtGui.QIcon(get_icon_path()))
 
     reactor = twisted.internet.reactor
-    wormhole = WormholeProtocol(reactor)
+    try:
+        relays, local_relay = get_relays(reactor, get_settings())
+    except ImportError as exception:
+        # The local relay's packages are an optional extra
+        QMessageBox.critical(
+            None,
+            "Local relay unavailable",
+            f"{exception}.\n\nThe public relays will be used instead.",
+        )
+        relays, local_relay = Relays(), None
+    if local_relay is not None:
+        logging.info(
+            f"Running local relays: {relays.mailbox_url} {relays.transit_relay}"
+        )
+        reactor.addSystemEventTrigger("before", "shutdown", local_relay.stop)
+
+    wormhole = WormholeProtocol(reactor, relays)
     main_window = MainWindow(wormhole)
     main_window.run()
 
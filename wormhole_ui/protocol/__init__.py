@@ -1,3 +1,15 @@
-from .wormhole_protocol import WormholeProtocol
+from .file_transfer_protocol import FileTransferProtocol
+from .relays import LocalRelay, Relays
+from .session import Session, TransferHandle, accept_into, accept_to_stream
+from .signals import HeadlessSignals
 
-__all__ = [WormholeProtocol]
+__all__ = [
+    FileTransferProtocol,
+    HeadlessSignals,
+    LocalRelay,
+    Relays,
+    Session,
+    TransferHandle,
+    accept_into,
+    accept_to_stream,
+]
@@ -0,0 +1,117 @@
+import os
+
+# Extensions to the file transfer protocol, only used if both peers support them
+BATCH = "batch"
+LARGE_MESSAGES = "large_messages"
+PACK = "pack"
+RECONNECT = "reconnect"
+RESUME = "resume"
+SHARED_TRANSIT = "shared_transit"
+TRANSIT_MESSAGES = "transit_messages"
+WARM_START = "warm_start"
+ZLIB = "zlib"
+FEATURES = [
+    BATCH,
+    LARGE_MESSAGES,
+    PACK,
+    RECONNECT,
+    RESUME,
+    SHARED_TRANSIT,
+    TRANSIT_MESSAGES,
+    WARM_START,
+    ZLIB,
+]
+
+# Algorithms for hashing transferred files, in order of preference. Both peers
+# pick the first one they have in common, so this order must never depend on
+# local settings. blake2b is faster on 64-bit CPUs, and sha256 is all the wormhole
+# CLI supports.
+HASH_ALGORITHMS = ["blake2b", "sha256"]
+DEFAULT_HASH_ALGORITHM = "sha256"
+
+# Size of the transit records that file data is sent in. Larger records are
+# only sent to peers that say they can take them.
+DEFAULT_RECORD_BYTES = 64 * 1024
+MAX_RECORD_BYTES = 256 * 1024
+
+
+class Capabilities:
+    """
+    Advertises our protocol extensions in the wormhole versions message, and
+    works out which of them the peer supports too.
+
+    Peers that don't advertise anything (such as the wormhole CLI) get the plain
+    file transfer protocol.
+
+    Each peer also advertises a random side, so that peers can agree which of
+    them leads when something has to be asymmetric.
+    """
+
+    def __init__(
+        self,
+        features=FEATURES,
+        hash_algorithms=HASH_ALGORITHMS,
+        max_record_bytes=MAX_RECORD_BYTES,
+        side=None,
+    ):
+        self._features = list(features)
+        self._hash_algorithms = list(hash_algorithms)
+        self._max_record_bytes = max_record_bytes
+        self._side = side or os.urandom(8).hex()
+        self._peer = {}
+
+    def versions(self):
+        return {
+            "v0": {
+                "mode": "connect",
+                "features": self._features,
+                "hashes": self._hash_algorithms,
+                "record_bytes": self._max_record_bytes,
+                "side": self._side,
+            }
+        }
+
+    def set_peer_versions(self, versions):
+        peer = versions.get("v0") if isinstance(versions, dict) else None
+        self._peer = peer if isinstance(peer, dict) else {}
+
+    def supports_connect_mode(self):
+        return self._peer.get("mode") == "connect"
+
+    def supports(self, feature):
+        return feature in self._features and feature in self._peer_list("features")
+
+    def supports_shared_transit(self):
+        # Without distinct sides, neither peer could lead the connection
+        peer_side = self._peer.get("side")
+        return (
+            self.supports(SHARED_TRANSIT)
+            and isinstance(peer_side, str)
+            and peer_side != self._side
+        )
+
+    @property
+    def is_transit_leader(self):
+        return self._side > str(self._peer.get("side", ""))
+
+    @property
+    def hash_algorithm(self):
+        peer_hash_algorithms = self._peer_list("hashes")
+        for hash_algorithm in HASH_ALGORITHMS:
+            if (
+                hash_algorithm in self._hash_algorithms
+                and hash_algorithm in peer_hash_algorithms
+            ):
+                return hash_algorithm
+        return DEFAULT_HASH_ALGORITHM
+
+    @property
+    def record_bytes(self):
+        peer_record_bytes = self._peer.get("record_bytes")
+        if not isinstance(peer_record_bytes, int) or peer_record_bytes <= 0:
+            return DEFAULT_RECORD_BYTES
+        return min(self._max_record_bytes, peer_record_bytes)
+
+    def _peer_list(self, key):
+        values = self._peer.get(key)
+        return values if isinstance(values, list) else []
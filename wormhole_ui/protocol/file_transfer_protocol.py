@@ -2,9 +2,7 @@ import json
 import logging
 import traceback
 
-from PySide2.QtCore import QObject, Slot
 import wormhole
-from wormhole.cli import public_relay
 from wormhole.errors import LonelyError
 
 from ..errors import (
@@ -15,22 +13,32 @@ from ..errors import (
     SendFileError,
     SendTextError,
 )
+from .capabilities import TRANSIT_MESSAGES, WARM_START, Capabilities
+from .messenger import Messenger
+from .relays import Relays
 from .timeout import Timeout
-from .transit import TransitProtocolPair
+from .transit import RelaySelector, TransitProtocolPair
 
 TIMEOUT_SECONDS = 2
 APPID = "lothar.com/wormhole/text-or-file-xfer"
 
 
-class FileTransferProtocol(QObject):
-    def __init__(self, reactor, signals):
+class FileTransferProtocol:
+    def __init__(self, reactor, signals, relays=None, capabilities=None):
+        if relays is None:
+            relays = Relays()
+        if capabilities is None:
+            capabilities = Capabilities()
         self._reactor = reactor
+        self._relays = relays
+        self._relay_selector = RelaySelector(reactor, relays.transit_relays)
         self._wormhole = None
         self._is_wormhole_connected = False
         self._transit = None
-        self._peer_versions = {}
+        self._capabilities = capabilities
         self._wormhole_delegate = WormholeDelegate(signals, self._handle_message)
-        self._transit_delegate = TransitDelegate(signals)
+        self._transit_delegate = TransitDelegate(signals, self._on_transit_connected)
+        self._messenger = None
         self._timeout = Timeout(reactor, TIMEOUT_SECONDS)
 
         self._signals = signals
@@ -46,15 +54,24 @@ class FileTransferProtocol(QObject):
 
         self._wormhole = wormhole.create(
             appid=APPID,
-            relay_url=public_relay.RENDEZVOUS_RELAY,
+            relay_url=self._relays.mailbox_url,
             reactor=self._reactor,
             delegate=self._wormhole_delegate,
-            versions={"v0": {"mode": "connect"}},
+            versions=self._capabilities.versions(),
         )
 
+        # Message numbers start again with each wormhole
+        self._messenger = Messenger(
+            self._reactor, self._signals, self._capabilities, self._send_data
+        )
         self._transit = TransitProtocolPair(
-            self._reactor, self._wormhole, self._transit_delegate
+            self._reactor,
+            self._wormhole,
+            self._transit_delegate,
+            self._capabilities,
+            self._relay_selector,
         )
+        self._relay_selector.probe()
 
         if code is None or code == "":
             self._wormhole.allocate_code()
@@ -66,6 +83,7 @@ class FileTransferProtocol(QObject):
         if self._wormhole is None:
             self._signals.wormhole_closed.emit()
         else:
+            self._messenger.close()
             self._transit.close()
             self._wormhole.close()
 
@@ -74,31 +92,34 @@ class FileTransferProtocol(QObject):
         if self._wormhole is None:
             self._signals.wormhole_shutdown.emit()
         else:
-            if self._is_wormhole_connected and self._peer_supports_connect_mode():
+            if (
+                self._is_wormhole_connected
+                and self._capabilities.supports_connect_mode()
+            ):
                 self._send_command("shutdown")
 
             self._wormhole_delegate.shutdown()
             self.close()
 
-    @Slot()
     def _on_wormhole_open(self):
         self._is_wormhole_connected = True
+        if self._capabilities.supports(WARM_START):
+            self._transit.warm_start()
 
-    @Slot()
     def _on_wormhole_closed(self):
+        # The wormhole may be closed before it's opened
+        if self._messenger is not None:
+            self._messenger.close()
         self._wormhole = None
         self._is_wormhole_connected = False
 
-    @Slot(dict)
     def _on_versions_received(self, versions):
-        self._peer_versions = versions
+        self._capabilities.set_peer_versions(versions)
 
-    @Slot(int, str)
     def _on_file_transfer_complete(self, id, filename):
-        if not self._peer_supports_connect_mode():
+        if not self._capabilities.supports_connect_mode():
             self.close()
 
-    @Slot(Exception, str)
     def _on_respond_error(self, exception, traceback):
         self._send_data({"error": str(exception)})
         if isinstance(exception, RefusedError):
@@ -106,13 +127,16 @@ class FileTransferProtocol(QObject):
         else:
             self._signals.error.emit(exception, traceback)
 
-    def _peer_supports_connect_mode(self):
-        if "v0" not in self._peer_versions:
-            return False
-        return self._peer_versions["v0"].get("mode") == "connect"
+    def send_message(self, id, message):
+        self._messenger.send(id, message)
+        if self._messenger.is_waiting_for_transit:
+            # Large messages are sent over the transit connection, so make sure
+            # there is one
+            self._transit.warm_start()
 
-    def send_message(self, message):
-        self._send_data({"offer": {"message": message}})
+    def _on_transit_connected(self, message_channel, text_channel):
+        if self._capabilities.supports(TRANSIT_MESSAGES):
+            self._messenger.use_channel(message_channel, text_channel)
 
     def _send_command(self, command):
         self._send_data({"command": command})
@@ -120,9 +144,15 @@ class FileTransferProtocol(QObject):
     def send_file(self, id, file_path):
         self._transit.send_file(id, file_path)
 
+    def send_files(self, files):
+        self._transit.send_files(files)
+
     def receive_file(self, id, dest_path):
         self._transit.receive_file(id, dest_path)
 
+    def can_receive_into_stream(self):
+        return self._transit.can_receive_into_stream()
+
     def is_sending_file(self):
         return self._transit.is_sending_file
 
@@ -156,18 +186,15 @@ class FileTransferProtocol(QObject):
                 self.close()
 
             elif key == "answer" and "message_ack" in contents:
-                result = contents["message_ack"]
-                is_ok = result == "ok"
-                self._signals.message_sent.emit(is_ok)
-                if not is_ok:
-                    raise SendTextError(result)
-                if not self._peer_supports_connect_mode():
+                if not self._messenger.handle_ack(contents):
+                    raise SendTextError(contents["message_ack"])
+                if not self._capabilities.supports_connect_mode():
                     self.close()
 
             elif key == "answer" and "file_ack" in contents:
                 result = contents["file_ack"]
                 if result == "ok":
-                    self._transit.handle_file_ack()
+                    self._transit.handle_file_ack(contents.get("resume"))
                 else:
                     raise SendFileError(result)
 
@@ -176,9 +203,8 @@ class FileTransferProtocol(QObject):
 
     def _handle_offer(self, offer):
         if "message" in offer:
-            self._send_data({"answer": {"message_ack": "ok"}})
-            self._signals.message_received.emit(offer["message"])
-            if not self._peer_supports_connect_mode():
+            self._messenger.handle_offer(offer)
+            if not self._capabilities.supports_connect_mode():
                 self.close()
         else:
             dest_file = self._transit.handle_offer(offer)
@@ -237,8 +263,13 @@ class WormholeDelegate:
 
 
 class TransitDelegate:
-    def __init__(self, signals):
+    def __init__(self, signals, connected_handler):
         self._signals = signals
+        self._connected_handler = connected_handler
+
+    def transit_connected(self, message_channel, text_channel):
+        logging.debug("transit_connected")
+        self._connected_handler(message_channel, text_channel)
 
     def transit_progress(self, id, transferred_bytes, total_bytes):
         self._signals.file_transfer_progress.emit(id, transferred_bytes, total_bytes)
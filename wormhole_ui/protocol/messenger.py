@@ -0,0 +1,276 @@
+from collections import OrderedDict, deque
+import io
+import json
+import logging
+
+from twisted.internet import defer
+
+from ..errors import MessageError
+from .capabilities import LARGE_MESSAGES, TRANSIT_MESSAGES, ZLIB
+from .transit.compression import COMPRESSION, DecompressingConsumer
+from .transit.file_sender import FileSender
+from .transit.source_text import SourceText
+
+# Routes that a message can take to the peer
+MAILBOX = "mailbox"
+TRANSIT = "transit"
+
+LATENCY_SAMPLES = 100
+
+# Messages larger than this are streamed over the transit connection, rather
+# than sent whole through the mailbox server. They're held in memory at both
+# ends, so there's a limit.
+LARGE_MESSAGE_BYTES = 64 * 1024
+MAX_MESSAGE_BYTES = 64 * 1024 * 1024
+
+
+class Messenger:
+    """
+    Sends text messages to the peer, through the mailbox server or, once
+    there's a transit connection, over that instead. The mailbox is used
+    until the connection is made, and again if it's lost (any messages still
+    waiting for an ack are resent through it).
+
+    Messages are sent straight away, without waiting for the previous one to
+    be acked, and message_sent is emitted with the id given to send(). If the
+    peer supports TRANSIT_MESSAGES, messages are numbered, so that acks can
+    be matched up in any order and a message that arrives both ways is only
+    shown once. Otherwise messages are acked in order.
+
+    If the peer supports LARGE_MESSAGES too, messages over LARGE_MESSAGE_BYTES
+    wait for the transit connection, and are streamed over it one at a time by
+    a FileSender.
+
+    The round trip time of each message is recorded for each route.
+    """
+
+    def __init__(self, reactor, signals, capabilities, send_data):
+        self._reactor = reactor
+        self._signals = signals
+        self._capabilities = capabilities
+        self._send_data = send_data
+
+        self._channel = None
+        self._text_channel = None
+        self._text_sender = None
+        self._stream_lock = defer.DeferredLock()
+        self._is_transit_lost = False
+        self._next_seq = 0
+        self._pending = OrderedDict()
+        self._waiting = deque()
+        self._received_seqs = set()
+        self._is_closed = False
+        self.round_trips = {
+            MAILBOX: deque(maxlen=LATENCY_SAMPLES),
+            TRANSIT: deque(maxlen=LATENCY_SAMPLES),
+        }
+
+    @property
+    def route(self):
+        """The route that the next message will take"""
+        return TRANSIT if self._channel is not None else MAILBOX
+
+    @property
+    def is_waiting_for_transit(self):
+        """Whether there are large messages waiting for a transit connection"""
+        return bool(self._waiting)
+
+    def send(self, id, message):
+        seq = self._next_seq
+        self._next_seq += 1
+        self._send(seq, id, message)
+
+    def _send(self, seq, id, message):
+        if self._is_large(message):
+            self._send_large(seq, id, message)
+            return
+
+        route = self.route
+        if route == TRANSIT:
+            self._channel.send_record(_encode({"message": message, "seq": seq}))
+        else:
+            offer = {"message": message}
+            if self._capabilities.supports(TRANSIT_MESSAGES):
+                offer["seq"] = seq
+            self._send_data({"offer": offer})
+        self._pending[seq] = (id, message, route, self._reactor.seconds())
+
+    def _is_large(self, message):
+        # Once the connection's lost, large messages go through the mailbox too
+        return (
+            len(message.encode("utf-8")) > LARGE_MESSAGE_BYTES
+            and not self._is_transit_lost
+            and self._capabilities.supports(LARGE_MESSAGES)
+            and self._capabilities.supports(TRANSIT_MESSAGES)
+            and self._capabilities.supports_shared_transit()
+        )
+
+    def _send_large(self, seq, id, message):
+        source_text = SourceText(id, message)
+        if source_text.final_bytes > MAX_MESSAGE_BYTES:
+            logging.warning(f"Message too large to send ({source_text.final_bytes}B)")
+            self._signals.message_sent.emit(id, False)
+            return
+
+        if self._channel is None:
+            self._waiting.append((seq, id, message))
+            return
+
+        self._pending[seq] = (id, message, TRANSIT, self._reactor.seconds())
+        streamed = self._stream_lock.run(self._stream, seq, source_text)
+        streamed.addErrback(self._on_stream_error)
+
+    @defer.inlineCallbacks
+    def _stream(self, seq, source_text):
+        channel = self._channel
+        if channel is None or seq not in self._pending:
+            # It's been resent through the mailbox
+            return
+
+        header = {"seq": seq, "size": source_text.final_bytes}
+        compress = self._capabilities.supports(ZLIB)
+        if compress:
+            header["compression"] = COMPRESSION
+
+        self._text_sender.chunk_size = self._capabilities.record_bytes
+        yield self._text_sender.open()
+        channel.send_record(_encode({"message_stream": header}))
+        try:
+            yield self._text_sender.send(source_text, None, compress=compress)
+        finally:
+            source_text.close()
+
+    def _on_stream_error(self, failure):
+        # Unacked messages are resent once the connection's lost
+        logging.warning(f"Failed to stream message: {failure.value!r}")
+
+    def handle_offer(self, offer):
+        """Acks a message that came through the mailbox"""
+        answer = {"message_ack": "ok"}
+        if "seq" in offer:
+            answer["seq"] = offer["seq"]
+        self._send_data({"answer": answer})
+        self._receive(offer["message"], offer.get("seq"))
+
+    def handle_ack(self, answer):
+        """Emits message_sent, returning whether the peer accepted the message"""
+        is_ok = answer["message_ack"] == "ok"
+        id = self._acked(answer.get("seq"))
+        if id is not None:
+            self._signals.message_sent.emit(id, is_ok)
+        return is_ok
+
+    def _receive(self, message, seq):
+        if seq is not None:
+            if seq in self._received_seqs:
+                logging.debug(f"Ignoring duplicate message {seq}")
+                return
+            self._received_seqs.add(seq)
+        self._signals.message_received.emit(message)
+
+    def _acked(self, seq):
+        if seq is None:
+            # Acks without a number are for the oldest message
+            entry = self._pending.popitem(last=False)[1] if self._pending else None
+        else:
+            entry = self._pending.pop(seq, None)
+        if entry is None:
+            logging.warning(f"Ignoring ack for unknown message {seq}")
+            return None
+
+        id, _, route, start_time = entry
+        round_trip = self._reactor.seconds() - start_time
+        self.round_trips[route].append(round_trip)
+        logging.debug(f"Message acked through the {route} in {round_trip * 1000:.0f}ms")
+        return id
+
+    def use_channel(self, channel, text_channel):
+        """
+        Sends messages over a transit connection's message channel from now on,
+        streaming large messages over its text channel.
+        """
+        self._channel = channel
+        self._text_channel = text_channel
+        self._text_sender = FileSender(self._reactor, text_channel)
+        self._read_channel(channel)
+
+        waiting, self._waiting = self._waiting, deque()
+        for seq, id, message in waiting:
+            self._send(seq, id, message)
+
+    @defer.inlineCallbacks
+    def _read_channel(self, channel):
+        while True:
+            try:
+                record = yield channel.receive_record()
+            except Exception:
+                break
+            self._handle_record(json.loads(record.decode("utf-8")))
+        self._on_channel_lost(channel)
+
+    def _handle_record(self, data):
+        if "message" in data:
+            self._send_ack(data["seq"])
+            self._receive(data["message"], data["seq"])
+        elif "message_stream" in data:
+            self._receive_stream(data["message_stream"])
+        elif "message_ack" in data:
+            self.handle_ack(data)
+        else:
+            logging.warning(f"Unexpected transit message: {data}")
+
+    def _send_ack(self, seq):
+        if self._channel is not None:
+            self._channel.send_record(_encode({"message_ack": "ok", "seq": seq}))
+
+    def _receive_stream(self, header):
+        """Receives a large message into memory, as it's streamed"""
+        size = header["size"]
+        if size > MAX_MESSAGE_BYTES:
+            self._signals.error.emit(
+                MessageError(f"Message too large to receive ({size}B)"), None
+            )
+            return
+
+        buffer = io.BytesIO()
+        if header.get("compression") == COMPRESSION:
+            consumer = DecompressingConsumer(size, buffer.write)
+            received = consumer.receive(self._text_channel)
+        else:
+            received = self._text_channel.writeToFile(buffer, size)
+        received.addCallback(self._on_stream_received, header["seq"], size, buffer)
+        received.addErrback(self._on_stream_error)
+
+    def _on_stream_received(self, received_bytes, seq, size, buffer):
+        if received_bytes != size:
+            raise MessageError("Connection dropped before full message received")
+
+        self._send_ack(seq)
+        self._receive(buffer.getvalue().decode("utf-8"), seq)
+
+    def _on_channel_lost(self, channel):
+        if self._channel is not channel:
+            return
+        self._channel = None
+        self._text_channel = None
+        self._is_transit_lost = True
+        if self._is_closed:
+            return
+
+        unacked = [
+            (seq, id, message)
+            for seq, (id, message, route, _) in self._pending.items()
+            if route == TRANSIT
+        ]
+        if unacked:
+            logging.info(f"Transit connection lost, resending {len(unacked)} messages")
+        for seq, id, message in unacked:
+            self._send(seq, id, message)
+
+    def close(self):
+        """Stops messages being resent once the wormhole's closing"""
+        self._is_closed = True
+
+
+def _encode(data):
+    return json.dumps(data).encode("utf-8")
@@ -0,0 +1,119 @@
+from twisted.internet import defer
+from wormhole.cli import public_relay
+from wormhole.ipaddrs import find_addresses
+
+LOCAL_MAILBOX_PORT = 4000
+LOCAL_TRANSIT_PORT = 4001
+
+
+class Relays:
+    """
+    Servers that a wormhole connects through: the mailbox server that peers
+    rendezvous on, and the transit relay that file data goes through if the
+    peers can't connect directly. A transit_relay of None means peers only
+    ever connect directly.
+
+    If alternative transit relays are given too, whichever responds fastest
+    is used (see RelaySelector).
+
+    Defaults to the public servers run by the magic-wormhole project.
+    """
+
+    def __init__(
+        self,
+        mailbox_url=public_relay.RENDEZVOUS_RELAY,
+        transit_relay=public_relay.TRANSIT_RELAY,
+        alternative_transit_relays=(),
+    ):
+        self.mailbox_url = mailbox_url
+        self.transit_relay = transit_relay
+        self.alternative_transit_relays = list(alternative_transit_relays)
+
+    @property
+    def transit_relays(self):
+        """All the candidate transit relays, in order of preference"""
+        relays = [self.transit_relay] + self.alternative_transit_relays
+        return [relay for relay in relays if relay]
+
+
+class LocalRelay:
+    """
+    Runs a mailbox server and transit relay in this process, so that peers on
+    the local network don't need the public servers. Peers on other machines
+    need to be configured with the same relays.
+
+    Needs the magic-wormhole-mailbox-server and magic-wormhole-transit-relay
+    packages (the local-relay extra), which are only imported when the relay is
+    started.
+    """
+
+    def __init__(
+        self,
+        reactor,
+        host=None,
+        mailbox_port=LOCAL_MAILBOX_PORT,
+        transit_port=LOCAL_TRANSIT_PORT,
+        interface="",
+    ):
+        self._reactor = reactor
+        self._host = host or _get_local_address()
+        self._mailbox_port = mailbox_port
+        self._transit_port = transit_port
+        self._interface = interface
+        self._services = []
+
+    @property
+    def relays(self):
+        """Relays for peers to connect through"""
+        return Relays(
+            mailbox_url=f"ws://{self._host}:{self._mailbox_port}/v1",
+            transit_relay=f"tcp:{self._host}:{self._transit_port}",
+        )
+
+    def start(self):
+        try:
+            from wormhole_mailbox_server import server_tap as mailbox_tap
+            from wormhole_transit_relay import server_tap as transit_tap
+        except ImportError as exception:
+            raise ImportError(
+                "Running a local relay needs magic-wormhole-mailbox-server "
+                "and magic-wormhole-transit-relay to be installed "
+                "(pip install wormhole-ui[local-relay])"
+            ) from exception
+
+        mailbox_options = mailbox_tap.Options()
+        mailbox_options.parseOptions(
+            [
+                f"--port={self._endpoint(self._mailbox_port)}",
+                "--channel-db=:memory:",
+            ]
+        )
+        transit_options = transit_tap.Options()
+        transit_options.parseOptions([f"--port={self._endpoint(self._transit_port)}"])
+
+        self._services = [
+            mailbox_tap.makeService(mailbox_options, reactor=self._reactor),
+            transit_tap.makeService(transit_options, reactor=self._reactor),
+        ]
+        for service in self._services:
+            service.startService()
+        return self.relays
+
+    def stop(self):
+        """Returns a Deferred that fires once the relays have stopped listening"""
+        services, self._services = self._services, []
+        return defer.gatherResults(
+            [defer.maybeDeferred(service.stopService) for service in services]
+        )
+
+    def _endpoint(self, port):
+        endpoint = f"tcp:{port}"
+        if self._interface:
+            endpoint += f":interface={self._interface}"
+        return endpoint
+
+
+def _get_local_address():
+    """Returns an address that other machines on the network can reach us on"""
+    addresses = [a for a in find_addresses() if a != "127.0.0.1"]
+    return addresses[0] if addresses else "127.0.0.1"
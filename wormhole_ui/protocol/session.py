@@ -0,0 +1,463 @@
+from collections import deque
+import logging
+from pathlib import Path
+import traceback
+
+from twisted.internet import defer
+from twisted.internet.defer import CancelledError
+
+from ..errors import ClosedError, RefusedError, RespondError, SendTextError
+from .file_transfer_protocol import FileTransferProtocol
+from .signals import HeadlessSignals, Signal
+from .transit.source_stream import SourceStream, read_stream
+from .transit.threads import run_in_thread
+
+
+class Outcome:
+    """
+    Result that can be waited on any number of times, before or after it's
+    known. Nothing is created until someone waits, so a failure that nobody
+    waits for isn't reported as unhandled.
+    """
+
+    def __init__(self):
+        self.is_set = False
+        self._result = None
+        self._is_failure = False
+        self._waiters = []
+
+    def wait(self):
+        deferred = defer.Deferred()
+        if self.is_set:
+            self._fire(deferred)
+        else:
+            self._waiters.append(deferred)
+        return deferred
+
+    def succeed(self, result):
+        self._set(result, False)
+
+    def fail(self, exception):
+        self._set(exception, True)
+
+    def _set(self, result, is_failure):
+        if self.is_set:
+            return
+        self.is_set = True
+        self._result = result
+        self._is_failure = is_failure
+
+        waiters, self._waiters = self._waiters, []
+        for deferred in waiters:
+            self._fire(deferred)
+
+    def _fire(self, deferred):
+        if self._is_failure:
+            deferred.errback(self._result)
+        else:
+            deferred.callback(self._result)
+
+
+class TransferHandle:
+    """
+    A file, batch or directory being sent or received. Awaiting the handle
+    (or the Deferred from when_complete) gives the name it was saved or sent as.
+    """
+
+    progress = Signal(int, int)
+
+    def __init__(self, id, name, total_bytes=None):
+        self.id = id
+        self.name = name
+        self.transferred_bytes = 0
+        self.total_bytes = total_bytes
+        self._outcome = Outcome()
+
+    @property
+    def is_finished(self):
+        return self._outcome.is_set
+
+    def when_complete(self):
+        return self._outcome.wait()
+
+    def __await__(self):
+        return self.when_complete().__await__()
+
+    def _set_progress(self, transferred_bytes, total_bytes):
+        self.transferred_bytes = transferred_bytes
+        self.total_bytes = total_bytes
+        self.progress.emit(transferred_bytes, total_bytes)
+
+    def _complete(self, filename):
+        self._outcome.succeed(filename)
+
+    def _fail(self, exception):
+        self._outcome.fail(exception)
+
+
+def accept_into(dest_path):
+    """Receive policy that accepts every offer into dest_path"""
+
+    def policy(filename, size):
+        return dest_path
+
+    return policy
+
+
+def accept_to_stream(stream):
+    """
+    Receive policy that writes every file offered into a binary stream, one
+    after another. Batches and directories are refused.
+    """
+
+    def policy(filename, size):
+        return stream
+
+    return policy
+
+
+class Session:
+    """
+    Deferred-based API for a single wormhole, for use without Qt. Several
+    sessions can run concurrently on the same reactor.
+
+        code = yield session.open()
+        yield session.when_connected()
+        for handle in session.send_files(paths):
+            yield handle.when_complete()
+
+    Any error closes the wormhole, failing every unfinished transfer. A session
+    can't be reopened once it's closed.
+    """
+
+    def __init__(self, reactor, relays=None, capabilities=None):
+        self.signals = HeadlessSignals()
+        self.error = None
+        self._reactor = reactor
+        self._protocol = FileTransferProtocol(
+            reactor, self.signals, relays, capabilities
+        )
+        self._code = Outcome()
+        self._connected = Outcome()
+        self._closed = Outcome()
+        self._is_closing = False
+
+        self._next_id = 0
+        self._handles = {}
+        self._send_queue = deque()
+        self._sending_ids = set()
+        self._pending_offer = None
+        self._receive_requests = deque()
+        self._message_queue = deque()
+        self._next_message_id = 0
+        self._message_acks = {}
+        self._received_messages = deque()
+        self._message_requests = deque()
+
+        s = self.signals
+        s.code_received.connect(self._on_code_received)
+        s.wormhole_open.connect(self._on_wormhole_open)
+        s.message_sent.connect(self._on_message_sent)
+        s.message_received.connect(self._on_message_received)
+        s.file_receive_pending.connect(self._on_file_receive_pending)
+        s.file_transfer_progress.connect(self._on_file_transfer_progress)
+        s.file_transfer_complete.connect(self._on_file_transfer_complete)
+        s.error.connect(self._on_error)
+        s.wormhole_closed.connect(self._on_wormhole_closed)
+        s.wormhole_shutdown.connect(self._on_wormhole_closed)
+
+    def open(self, code=None):
+        """
+        Opens the wormhole, with the given code or a newly allocated one.
+        Returns a Deferred that fires with the code.
+        """
+        self._capture_errors(self._protocol.open, code)
+        return self._code.wait()
+
+    def when_connected(self):
+        """Returns a Deferred that fires once the peer has connected"""
+        return self._connected.wait()
+
+    def when_closed(self):
+        """
+        Returns a Deferred that fires once the wormhole has closed, whether or
+        not there was an error.
+        """
+        return self._closed.wait()
+
+    def send_files(self, file_paths):
+        """
+        Queues the files (or directories) to be sent once the peer connects,
+        returning a TransferHandle for each. Files queued together are sent as
+        a batch, if the peer supports that.
+        """
+        files = []
+        handles = []
+        for file_path in file_paths:
+            file_path = Path(file_path).resolve()
+            handle = self._add_handle(file_path.name)
+            files.append((handle.id, str(file_path)))
+            handles.append(handle)
+
+        if self._closed.is_set:
+            self._fail_handles(handles)
+        else:
+            self._send_queue.append(files)
+            self._send_next_files()
+        return handles
+
+    def send_stream(self, stream, name, size=None):
+        """
+        Queues data from a binary stream (such as a pipe, stdin or a bytes
+        buffer) to be sent as a file called name, returning a TransferHandle.
+        Nothing is read from the filesystem.
+
+        If size isn't given, the stream is read into memory on a pool thread
+        first, and queued once it ends. An iterable of bytes (such as a
+        generator) can be given in place of a stream, and is read first too.
+        """
+        handle = self._add_handle(name, size)
+        if self._closed.is_set:
+            self._fail_handles([handle])
+        elif size is None or not hasattr(stream, "read"):
+            reading = run_in_thread(self._reactor, read_stream, handle.id, name, stream)
+            reading.addCallbacks(self._queue_stream, self._on_read_stream_error)
+        else:
+            self._queue_stream(SourceStream(handle.id, name, stream, size))
+        return handle
+
+    def _queue_stream(self, source_stream):
+        handle = self._handles.get(source_stream.id)
+        if handle is None:
+            # The wormhole closed while the stream was being read
+            return
+        handle.total_bytes = source_stream.final_bytes
+
+        self._send_queue.append([(source_stream.id, source_stream)])
+        self._send_next_files()
+
+    def _on_read_stream_error(self, failure):
+        self.signals.error.emit(failure.value, failure.getTraceback())
+
+    def receive(self, policy):
+        """
+        Waits for the next offer, and calls policy(filename, size) to decide
+        where to save it (a directory, or a binary stream to write a single file
+        into). Returns a Deferred that fires with its TransferHandle.
+
+        If the policy returns None, the offer is refused (which closes the
+        wormhole). Batches and directories are refused if the policy returns a
+        stream. The Deferred fires with None if the offer is refused, or if the
+        wormhole closes before anything is offered.
+        """
+        deferred = defer.Deferred()
+        if self._closed.is_set:
+            self._fail_request(deferred)
+        else:
+            self._receive_requests.append((policy, deferred))
+            self._answer_offer()
+        return deferred
+
+    def send_message(self, message):
+        """
+        Sends a text message once the peer connects. Returns a Deferred that
+        fires once the peer has acknowledged it. Messages don't wait for the
+        previous one to be acknowledged.
+        """
+        deferred = defer.Deferred()
+        if self._closed.is_set:
+            deferred.errback(self._closing_error())
+        else:
+            id = self._next_message_id
+            self._next_message_id += 1
+            self._message_acks[id] = deferred
+            self._message_queue.append((id, message))
+            self._send_next_messages()
+        return deferred
+
+    def receive_message(self):
+        """
+        Returns a Deferred that fires with the next text message, or with None
+        if the wormhole closes first.
+        """
+        deferred = defer.Deferred()
+        if self._received_messages:
+            deferred.callback(self._received_messages.popleft())
+        elif self._closed.is_set:
+            self._fail_request(deferred)
+        else:
+            self._message_requests.append(deferred)
+        return deferred
+
+    def close(self):
+        """Closes the wormhole, returning a Deferred that fires once it's closed"""
+        self._close(self._protocol.close)
+        return self._closed.wait()
+
+    def shutdown(self):
+        """Closes the wormhole and asks the peer to exit, if it's a wormhole-ui"""
+        self._close(self._protocol.shutdown)
+        return self._closed.wait()
+
+    def _close(self, command):
+        if self._is_closing or self._closed.is_set:
+            return
+        self._is_closing = True
+        self._capture_errors(command)
+
+    def _add_handle(self, name, total_bytes=None):
+        handle = TransferHandle(self._next_id, name, total_bytes)
+        self._next_id += 1
+        self._handles[handle.id] = handle
+        return handle
+
+    def _send_next_files(self):
+        if not self._connected.is_set or self._sending_ids or not self._send_queue:
+            return
+
+        files = self._send_queue.popleft()
+        self._sending_ids = {id for id, _ in files}
+        self._capture_errors(self._protocol.send_files, files)
+
+    def _send_next_messages(self):
+        if not self._connected.is_set:
+            return
+        while self._message_queue:
+            self._capture_errors(
+                self._protocol.send_message, *self._message_queue.popleft()
+            )
+
+    def _answer_offer(self):
+        if self._pending_offer is None or not self._receive_requests:
+            return
+
+        filename, size = self._pending_offer
+        self._pending_offer = None
+        policy, deferred = self._receive_requests.popleft()
+
+        try:
+            dest_path = policy(filename, size)
+        except Exception as exception:
+            self.signals.error.emit(exception, traceback.format_exc())
+            return
+
+        if hasattr(dest_path, "write") and not self._protocol.can_receive_into_stream():
+            logging.info(f"Can't receive {filename} into a stream, refusing it")
+            dest_path = None
+
+        if dest_path is None:
+            deferred.callback(None)
+            self.signals.respond_error.emit(
+                RefusedError("The file was refused by the user"), None
+            )
+            return
+
+        if not hasattr(dest_path, "write"):
+            dest_path = str(dest_path)
+        handle = self._add_handle(filename, size)
+        deferred.callback(handle)
+        self._capture_errors(self._protocol.receive_file, handle.id, dest_path)
+
+    def _on_code_received(self, code):
+        self._code.succeed(code)
+
+    def _on_wormhole_open(self):
+        self._connected.succeed(None)
+        self._send_next_messages()
+        self._send_next_files()
+
+    def _on_message_sent(self, id, is_ok):
+        deferred = self._message_acks.pop(id, None)
+        if deferred is None:
+            return
+        if is_ok:
+            deferred.callback(None)
+        else:
+            deferred.errback(SendTextError("The peer didn't accept the message"))
+
+    def _on_message_received(self, message):
+        if self._message_requests:
+            self._message_requests.popleft().callback(message)
+        else:
+            self._received_messages.append(message)
+
+    def _on_file_receive_pending(self, filename, size):
+        self._pending_offer = (filename, size)
+        self._answer_offer()
+
+    def _on_file_transfer_progress(self, id, transferred_bytes, total_bytes):
+        handle = self._handles.get(id)
+        if handle is not None:
+            handle._set_progress(transferred_bytes, total_bytes)
+
+    def _on_file_transfer_complete(self, id, filename):
+        handle = self._handles.pop(id, None)
+        if handle is not None:
+            handle._complete(filename)
+
+        self._sending_ids.discard(id)
+        # The transfer isn't finished until this signal has been handled, so
+        # check for the next files afterwards
+        self._reactor.callLater(0, self._send_next_files)
+
+    def _on_error(self, exception, traceback):
+        logging.error(f"Caught Exception: {repr(exception)}")
+        if traceback:
+            logging.error(f"Traceback: {traceback}")
+
+        if self.error is None:
+            self.error = exception
+        self._fail_all()
+        self._close(self._protocol.close)
+
+    def _on_wormhole_closed(self):
+        self._fail_all()
+        self._closed.succeed(None)
+
+    def _fail_all(self):
+        exception = self._closing_error()
+        self._code.fail(exception)
+        self._connected.fail(exception)
+
+        self._send_queue.clear()
+        self._sending_ids.clear()
+        self._fail_handles(list(self._handles.values()))
+
+        requests, self._receive_requests = self._receive_requests, deque()
+        for _, deferred in requests:
+            self._fail_request(deferred)
+
+        self._message_queue.clear()
+        acks, self._message_acks = self._message_acks, {}
+        for deferred in acks.values():
+            deferred.errback(exception)
+        message_requests, self._message_requests = self._message_requests, deque()
+        for deferred in message_requests:
+            self._fail_request(deferred)
+
+    def _fail_handles(self, handles):
+        exception = self._closing_error()
+        for handle in handles:
+            self._handles.pop(handle.id, None)
+            handle._fail(exception)
+
+    def _fail_request(self, deferred):
+        if self.error is None:
+            deferred.callback(None)
+        else:
+            deferred.errback(self.error)
+
+    def _closing_error(self):
+        if self.error is not None:
+            return self.error
+        return ClosedError("The wormhole closed before the transfer finished")
+
+    def _capture_errors(self, command, *args, **kwds):
+        try:
+            command(*args, **kwds)
+        except CancelledError:
+            pass
+        except RespondError as exception:
+            self.signals.respond_error.emit(exception.cause, traceback.format_exc())
+        except Exception as exception:
+            self.signals.error.emit(exception, traceback.format_exc())
@@ -0,0 +1,58 @@
+class Signal:
+    """
+    Pure-Python stand-in for Qt's Signal, so that the protocol can run without
+    a QApplication. Slots are called synchronously, in the order connected.
+    """
+
+    def __init__(self, *types):
+        self._types = types
+        self._name = None
+
+    def __set_name__(self, owner, name):
+        self._name = name
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+
+        bound_signal = instance.__dict__.get(self._name)
+        if bound_signal is None:
+            bound_signal = instance.__dict__[self._name] = BoundSignal()
+        return bound_signal
+
+
+class BoundSignal:
+    def __init__(self):
+        self._slots = []
+
+    def connect(self, slot):
+        self._slots.append(slot)
+
+    def disconnect(self, slot):
+        try:
+            self._slots.remove(slot)
+        except ValueError:
+            raise RuntimeError(f"Failed to disconnect signal from {slot}")
+
+    def emit(self, *args):
+        # Slots may disconnect themselves while the signal is being emitted
+        for slot in list(self._slots):
+            slot(*args)
+
+
+class HeadlessSignals:
+    """Same signals as WormholeSignals, without importing Qt"""
+
+    code_received = Signal(str)
+    versions_received = Signal(dict)
+    wormhole_open = Signal()
+    wormhole_closed = Signal()
+    wormhole_shutdown = Signal()
+    wormhole_shutdown_received = Signal()
+    message_sent = Signal(int, bool)
+    message_received = Signal(str)
+    file_receive_pending = Signal(str, int)
+    file_transfer_progress = Signal(int, int, int)
+    file_transfer_complete = Signal(int, str)
+    error = Signal(Exception, str)
+    respond_error = Signal(Exception, str)
@@ -1,3 +1,4 @@
+from .relay_selector import RelaySelector
 from .transit_protocol_pair import TransitProtocolPair
 
-__all__ = [TransitProtocolPair]
+__all__ = [RelaySelector, TransitProtocolPair]
@@ -0,0 +1,165 @@
+from collections import Counter
+import math
+import zlib
+
+from twisted.internet import defer
+
+from ...errors import ReceiveFileError
+
+COMPRESSION = "zlib"
+COMPRESSION_LEVEL = 3
+
+# Files are sampled at a few points, and only compressed if the samples have
+# low enough entropy. Compressed media (images, video, archives) is close to
+# 8 bits per byte, and isn't worth the CPU time.
+SAMPLE_BYTES = 16 * 1024
+SAMPLE_COUNT = 4
+MAX_ENTROPY_BITS = 7.5
+
+# More bytes than a stream can contain
+UNREACHABLE_BYTES = 1 << 63
+
+
+def sample_entropy(data):
+    """Returns the Shannon entropy of the data, in bits per byte"""
+    if not data:
+        return 0.0
+
+    total = len(data)
+    entropy = 0.0
+    for count in Counter(data).values():
+        p = count / total
+        entropy -= p * math.log2(p)
+    return entropy
+
+
+def is_compressible(file_path, offset=0):
+    """Samples the file from offset onwards. Blocks, so call it on a pool thread."""
+    with open(file_path, "rb") as file_object:
+        file_object.seek(0, 2)
+        length = file_object.tell() - offset
+        if length <= 0:
+            return False
+
+        samples = []
+        for position in _sample_positions(offset, length):
+            file_object.seek(position)
+            samples.append(file_object.read(SAMPLE_BYTES))
+
+    return sample_entropy(b"".join(samples)) <= MAX_ENTROPY_BITS
+
+
+def is_compressible_record(record):
+    """Samples the record in the same way as is_compressible"""
+    samples = []
+    for position in _sample_positions(0, len(record)):
+        end = position + SAMPLE_BYTES
+        samples.append(record[position:end])
+
+    return sample_entropy(b"".join(samples)) <= MAX_ENTROPY_BITS
+
+
+def _sample_positions(offset, length):
+    step = max(SAMPLE_BYTES, length // SAMPLE_COUNT)
+    return range(offset, offset + length, step)
+
+
+class Compressor:
+    """Encoder for ReadAheadProducer, run on its reading thread"""
+
+    def __init__(self, level=COMPRESSION_LEVEL):
+        self._compressor = zlib.compressobj(level)
+
+    def encode(self, data):
+        return self._compressor.compress(data)
+
+    def flush(self):
+        return self._compressor.flush()
+
+
+def compress_record(record):
+    return zlib.compress(record, COMPRESSION_LEVEL)
+
+
+def decompress_record(record, max_bytes):
+    decompressor = zlib.decompressobj()
+    data = decompressor.decompress(record, max_bytes)
+    if decompressor.unconsumed_tail or not decompressor.eof:
+        raise ReceiveFileError("Invalid compressed record")
+    return data
+
+
+class DecompressingConsumer:
+    """
+    Consumer for a transit Connection that decompresses a single zlib stream,
+    passing the original data to write_callback. The compressed length isn't
+    known in advance, so the stream is received until its end marker.
+    """
+
+    def __init__(self, expected_bytes, write_callback):
+        self._expected_bytes = expected_bytes
+        self._write_callback = write_callback
+        self._decompressor = zlib.decompressobj()
+        self._received_bytes = 0
+        self._pipe = None
+        self._is_connected = False
+        self._deferred = None
+
+    def receive(self, pipe):
+        """
+        Connects to the pipe, returning a Deferred that fires with the number of
+        (decompressed) bytes received.
+        """
+        self._pipe = pipe
+        self._deferred = defer.Deferred()
+
+        # Expecting an unreachable byte count means the pipe errbacks if the
+        # connection is lost. We disconnect ourselves at the end of the stream.
+        self._is_connected = True
+        lost = pipe.connectConsumer(self, expected=UNREACHABLE_BYTES)
+        if lost is not None:
+            lost.addErrback(self._on_connection_lost)
+        return self._deferred
+
+    def registerProducer(self, producer, streaming):
+        pass
+
+    def unregisterProducer(self):
+        pass
+
+    def write(self, data):
+        if self._deferred is None or self._deferred.called:
+            return
+
+        try:
+            # Limit the output, so that a malicious stream can't expand unchecked
+            remaining = self._expected_bytes - self._received_bytes
+            decompressed = self._decompressor.decompress(data, remaining + 1)
+            if (
+                self._decompressor.unconsumed_tail
+                or self._decompressor.unused_data
+                or len(decompressed) > remaining
+            ):
+                raise ReceiveFileError("Received more data than expected")
+        except Exception as exception:
+            self._disconnect()
+            self._deferred.errback(exception)
+            return
+
+        self._received_bytes += len(decompressed)
+        if decompressed:
+            self._write_callback(decompressed)
+
+        if self._decompressor.eof:
+            self._disconnect()
+            self._deferred.callback(self._received_bytes)
+
+    def _disconnect(self):
+        if self._is_connected:
+            self._is_connected = False
+            self._pipe.disconnectConsumer()
+
+    def _on_connection_lost(self, failure):
+        self._is_connected = False
+        if not self._deferred.called:
+            self._deferred.errback(failure)
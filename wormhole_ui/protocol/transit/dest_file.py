@@ -1,10 +1,14 @@
 import os
 from pathlib import Path
+import shutil
 
-from ...errors import DiskSpaceError, RespondError
+from ...errors import DiskSpaceError, OfferError, ReceiveFileError, RespondError
+from .zip_extractor import ZipExtractor
 
 
 class DestFile:
+    is_directory = False
+
     def __init__(self, filename, filesize):
         self.id = None
         # Path().name is intended to protect us against
@@ -14,39 +18,224 @@ class DestFile:
         self.final_bytes = filesize
         self.transfer_bytes = self.final_bytes
         self.file_object = None
-        self._temp_path = None
+        self.temp_path = None
+        self.resume_offset = 0
+        self._is_resumable = False
 
-    def open(self, id, dest_path):
+    def open(self, id, dest_path, resume=False):
+        """
+        Opens the .part file to receive into. If resume is set, an existing
+        .part file is reused, and resume_offset is set to its length.
+        """
         self.id = id
         self.full_path = Path(dest_path).resolve() / self.name
-        self._temp_path = _find_unique_path(
-            self.full_path.with_suffix(self.full_path.suffix + ".part")
-        )
+        part_path = self.full_path.with_suffix(self.full_path.suffix + ".part")
 
-        if not _has_disk_space(self.full_path, self.transfer_bytes):
+        self._is_resumable = resume
+        if resume and _is_resumable(part_path, self.final_bytes):
+            self.temp_path = part_path
+            self.resume_offset = part_path.stat().st_size
+        else:
+            self.temp_path = _find_unique_path(part_path)
+            self.resume_offset = 0
+        self.transfer_bytes = self.final_bytes - self.resume_offset
+
+        if not _has_disk_space(self.full_path.parent, self.transfer_bytes):
             raise RespondError(
                 DiskSpaceError(
                     f"Insufficient free disk space (need {self.transfer_bytes}B)"
                 )
             )
 
-        self.file_object = open(self._temp_path, "wb")
+        if self.resume_offset > 0:
+            self.file_object = open(self.temp_path, "r+b")
+            self.file_object.seek(self.resume_offset)
+        else:
+            self.file_object = open(self.temp_path, "wb")
+
+    def seek(self, offset):
+        """Continues the transfer from offset, discarding anything after it"""
+        self.file_object.seek(offset)
+        self.file_object.truncate()
+        self.resume_offset = offset
+        self.transfer_bytes = self.final_bytes - offset
 
     def finalise(self):
         self.file_object.close()
 
         self.full_path = _find_unique_path(self.full_path)
         self.name = self.full_path.name
-        return self._temp_path.rename(self.full_path)
+        return self.temp_path.rename(self.full_path)
 
     def cleanup(self):
         self.file_object.close()
         try:
-            self._temp_path.unlink()
+            # Keep partial files, so that the transfer can be resumed later
+            if self._is_resumable and self.temp_path.stat().st_size > 0:
+                return
+            self.temp_path.unlink()
         except Exception:
             pass
 
 
+class DestStream:
+    """
+    A file that's received into a binary stream (such as a pipe, stdout or a
+    bytes buffer) rather than saved. Has the same interface as DestFile.
+    Only single files can be received like this, and they're always received
+    from the start.
+    """
+
+    is_directory = False
+
+    def __init__(self, dest_file, stream):
+        if not isinstance(dest_file, DestFile):
+            raise RespondError(
+                OfferError(f"Can't receive {dest_file.name} into a stream")
+            )
+        self.id = None
+        self.name = dest_file.name
+        self.full_path = None
+        self.final_bytes = dest_file.final_bytes
+        self.transfer_bytes = self.final_bytes
+        self.file_object = stream
+        self.temp_path = None
+        self.resume_offset = 0
+
+    def open(self, id, dest_path=None, resume=False):
+        self.id = id
+
+    def seek(self, offset):
+        if offset != 0:
+            raise ReceiveFileError(f"Can't resume receiving {self.name}")
+
+    def finalise(self):
+        # The stream belongs to the caller, so it's flushed but left open
+        self.file_object.flush()
+
+    def cleanup(self):
+        pass
+
+
+class DestBatch:
+    """
+    A set of files offered together, which is accepted (or refused) once.
+    The files are opened one at a time as they're received.
+    """
+
+    def __init__(self, files):
+        self.id = None
+        self.dest_files = [DestFile(f["filename"], f["filesize"]) for f in files]
+        self.name = f"{len(self.dest_files)} files"
+        self.final_bytes = sum(f.final_bytes for f in self.dest_files)
+        self.transfer_bytes = self.final_bytes
+        self.dest_path = None
+        self._is_packed = [f.get("packed", False) for f in files]
+        self._next_index = 0
+        self._current_file = None
+
+    def open(self, id, dest_path, resume=False):
+        # Batches are always sent from the start
+        self.id = id
+        self.dest_path = dest_path
+
+        if not _has_disk_space(Path(dest_path).resolve(), self.transfer_bytes):
+            raise RespondError(
+                DiskSpaceError(
+                    f"Insufficient free disk space (need {self.transfer_bytes}B)"
+                )
+            )
+
+    def has_next(self):
+        return self._next_index < len(self.dest_files)
+
+    def next_is_packed(self):
+        return self._is_packed[self._next_index]
+
+    def open_next(self):
+        """Opens the next file, ready to be received"""
+        self._current_file = self.dest_files[self._next_index]
+        self._next_index += 1
+
+        self._current_file.open(self.id, self.dest_path)
+        return self._current_file
+
+    def next_packed_files(self):
+        """Returns the run of packed files that are due next, without opening them"""
+        start = end = self._next_index
+        while end < len(self.dest_files) and self._is_packed[end]:
+            end += 1
+        return self.dest_files[start:end]
+
+    def skip(self, count):
+        """Moves past files that have been received by unpacking them"""
+        self._current_file = None
+        self._next_index += count
+
+    def cleanup(self):
+        if self._current_file is not None:
+            self._current_file.cleanup()
+            self._current_file = None
+
+
+class DestDirectory:
+    """
+    A directory, received as a zip file that's extracted as it arrives.
+    Has the same interface as DestFile.
+    """
+
+    is_directory = True
+
+    def __init__(self, dirname, zipsize, numbytes, numfiles):
+        self.id = None
+        # As for DestFile, only the last part of the offered name is used
+        self.name = Path(dirname).name
+        if self.name in ("", ".", ".."):
+            raise RespondError(OfferError(f"Invalid directory name: {dirname}"))
+        self.full_path = None
+        self.final_bytes = zipsize
+        self.transfer_bytes = self.final_bytes
+        self.num_bytes = numbytes
+        self.num_files = numfiles
+        self.file_object = None
+        self.temp_path = None
+        self.resume_offset = 0
+
+    def open(self, id, dest_path, resume=False):
+        # Directories are always sent from the start
+        self.id = id
+        self.full_path = Path(dest_path).resolve() / self.name
+
+        # Files are extracted as they arrive, so no space is needed for the zip
+        if not _has_disk_space(self.full_path.parent, self.num_bytes):
+            raise RespondError(
+                DiskSpaceError(f"Insufficient free disk space (need {self.num_bytes}B)")
+            )
+
+        self.temp_path = _find_unique_path(
+            self.full_path.with_suffix(self.full_path.suffix + ".part")
+        )
+        self.temp_path.mkdir()
+        self.file_object = ZipExtractor(self.temp_path, self.num_bytes)
+
+    def seek(self, offset):
+        if offset != 0:
+            raise ReceiveFileError(f"Can't resume receiving directory {self.name}")
+
+    def finalise(self):
+        if not self.file_object.close():
+            raise ReceiveFileError(f"Directory {self.name} is incomplete")
+
+        self.full_path = _find_unique_path(self.full_path)
+        self.name = self.full_path.name
+        return self.temp_path.rename(self.full_path)
+
+    def cleanup(self):
+        self.file_object.close()
+        if self.temp_path.exists():
+            shutil.rmtree(self.temp_path, ignore_errors=True)
+
+
 def _find_unique_path(path):
     path_attempt = path
     count = 1
@@ -57,14 +246,21 @@ def _find_unique_path(path):
     return path_attempt
 
 
-def _has_disk_space(target, target_size):
+def _is_resumable(part_path, final_bytes):
+    try:
+        return part_path.is_file() and part_path.stat().st_size <= final_bytes
+    except OSError:
+        return False
+
+
+def _has_disk_space(dir_path, target_size):
     # f_bfree is the blocks available to a root user. It might be more
     # accurate to use f_bavail (blocks available to non-root user), but we
     # don't know which user is running us, and a lot of installations don't
     # bother with reserving extra space for root, so let's just stick to the
     # basic (larger) estimate.
     try:
-        s = os.statvfs(target.parent)
+        s = os.statvfs(dir_path)
         return s.f_frsize * s.f_bfree > target_size
     except AttributeError:
         return True
@@ -1,15 +1,23 @@
 from binascii import hexlify
-import hashlib
 import json
+import logging
 
 from twisted.internet import defer
 
 from ...errors import ReceiveFileError
+from ..capabilities import DEFAULT_HASH_ALGORITHM
+from .compression import COMPRESSION, DecompressingConsumer, decompress_record
+from .packed_files import HEADER_LENGTH, unpack
+from .threaded_hasher import ThreadedHasher, get_hash_factory
+from .threads import SharedProducer, run_in_thread
+from .threaded_writer import ThreadedWriter
 
 
 class FileReceiver:
-    def __init__(self, transit):
+    def __init__(self, reactor, transit, hash_algorithm=DEFAULT_HASH_ALGORITHM):
+        self._reactor = reactor
         self._transit = transit
+        self.hash_algorithm = hash_algorithm
         self._pipe = None
 
     @defer.inlineCallbacks
@@ -23,15 +31,47 @@ class FileReceiver:
             self._pipe = None
 
     @defer.inlineCallbacks
-    def receive(self, dest_file, progress):
-        hasher = hashlib.sha256()
-        received = yield self._pipe.writeToFile(
-            dest_file.file_object,
-            dest_file.transfer_bytes,
-            progress=progress.update,
-            hasher=hasher.update,
-        )
-        datahash = hasher.digest()
+    def receive(self, dest_file, progress, prefix_hash=None, compressed=False):
+        """
+        Receives the rest of the file, returning the digest of the whole file.
+        If the transfer is resuming, prefix_hash is the hash of the existing part.
+        If compressed is set, the data is received as a zlib stream.
+        """
+        # Both the disk and the hasher can hold back the connection
+        pauses = SharedProducer(self._pipe)
+        if prefix_hash is None:
+            hash_factory = get_hash_factory(self.hash_algorithm)
+        else:
+            hash_factory = prefix_hash.copy
+        hasher = ThreadedHasher(self._reactor, hash_factory, pauses.share())
+        writer = ThreadedWriter(self._reactor, dest_file.file_object, pauses.share())
+        try:
+            if compressed:
+                received = yield self._receive_compressed(
+                    dest_file, writer, progress, hasher
+                )
+            else:
+                received = yield self._pipe.writeToFile(
+                    writer,
+                    dest_file.transfer_bytes,
+                    progress=progress.update,
+                    hasher=hasher.update,
+                )
+        except Exception as exception:
+            # Don't let the file be closed until all queued writes are complete,
+            # but report why the transfer failed rather than any write error
+            try:
+                yield writer.flush()
+            except Exception:
+                logging.exception("Write failed after the transfer failed")
+            raise exception
+        yield writer.flush()
+        datahash = yield hasher.digest()
+
+        if writer.stall_seconds > 0:
+            logging.info(
+                f"Receive stalled on disk writes for {writer.stall_seconds:.2f}s"
+            )
 
         if received < dest_file.transfer_bytes:
             raise ReceiveFileError("Connection dropped before full file received")
@@ -39,10 +79,68 @@ class FileReceiver:
 
         return datahash
 
+    def _receive_compressed(self, dest_file, writer, progress, hasher):
+        def _write(data):
+            writer.write(data)
+            progress.update(len(data))
+            hasher.update(data)
+
+        consumer = DecompressingConsumer(dest_file.transfer_bytes, _write)
+        return consumer.receive(self._pipe)
+
+    @defer.inlineCallbacks
+    def receive_header(self):
+        """Waits for the sender to say how the following data is sent"""
+        record = yield self._pipe.receive_record()
+        header = json.loads(record.decode("utf-8"))
+
+        if header.get("compression") not in (None, COMPRESSION):
+            raise ReceiveFileError(f"Unsupported compression: {header}")
+        return header
+
     @defer.inlineCallbacks
-    def send_ack(self, datahash):
-        datahash_hex = hexlify(datahash).decode("ascii")
-        ack = {"ack": "ok", "sha256": datahash_hex}
+    def receive_packed(self, dest_batch, progress, compress=False):
+        """
+        Receives the next packed record, and acks it once it's unpacked.
+        If compression was negotiated, the record is preceded by a header.
+        """
+        header = {}
+        if compress:
+            header = yield self.receive_header()
+        record = yield self._pipe.receive_record()
+
+        dest_files = dest_batch.next_packed_files()
+        if header.get("compression") is not None:
+            record = yield run_in_thread(
+                self._reactor,
+                decompress_record,
+                record,
+                _max_packed_record_bytes(dest_files),
+            )
+        count, received_bytes, datahash = yield run_in_thread(
+            self._reactor,
+            unpack,
+            record,
+            dest_files,
+            dest_batch.dest_path,
+            dest_batch.id,
+            get_hash_factory(self.hash_algorithm),
+        )
+        dest_batch.skip(count)
+        progress.update(received_bytes)
+
+        yield self.send_ack(datahash)
+
+    @defer.inlineCallbacks
+    def send_ack(self, datahash=None):
+        ack = {"ack": "ok"}
+        if datahash is not None:
+            ack[self.hash_algorithm] = hexlify(datahash).decode("ascii")
         ack_bytes = json.dumps(ack).encode("utf-8")
 
         yield self._pipe.send_record(ack_bytes)
+
+
+def _max_packed_record_bytes(dest_files):
+    # Allows generously for the entry headers
+    return sum(HEADER_LENGTH.size + 4096 + f.final_bytes for f in dest_files)
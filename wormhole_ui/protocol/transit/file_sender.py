@@ -1,18 +1,35 @@
 from binascii import hexlify
-import hashlib
 import json
 import logging
 
-import twisted.internet
 from twisted.internet import defer
-import twisted.protocols
 
 from ...errors import SendFileError
+from ..capabilities import DEFAULT_HASH_ALGORITHM
+from .compression import (
+    COMPRESSION,
+    Compressor,
+    compress_record,
+    is_compressible_record,
+)
+from .packed_files import pack
+from .read_ahead_producer import DEFAULT_CHUNK_SIZE, ReadAheadProducer
+from .threaded_hasher import ThreadedHasher, get_hash_factory
+from .threads import SharedProducer, run_in_thread
 
 
 class FileSender:
-    def __init__(self, transit):
+    def __init__(
+        self,
+        reactor,
+        transit,
+        chunk_size=DEFAULT_CHUNK_SIZE,
+        hash_algorithm=DEFAULT_HASH_ALGORITHM,
+    ):
+        self._reactor = reactor
         self._transit = transit
+        self.chunk_size = chunk_size
+        self.hash_algorithm = hash_algorithm
         self._pipe = None
 
     @defer.inlineCallbacks
@@ -20,27 +37,75 @@ class FileSender:
         if self._pipe is None:
             self._pipe = yield self._transit.connect()
 
+    def describe(self):
+        """Describes the transit connection, if there is one"""
+        return self._pipe.describe() if self._pipe is not None else None
+
     def close(self):
         if self._pipe is not None:
             self._pipe.close()
             self._pipe = None
 
     @defer.inlineCallbacks
-    def send(self, source_file, progress):
+    def send(self, source_file, progress, prefix_hash=None, compress=False):
+        """
+        Sends the rest of the file, returning the hex digest of the whole file.
+        If the transfer is resuming, prefix_hash is the hash of the skipped part.
+        If compress is set, the data is sent as a zlib stream. progress may be
+        None, if nothing's watching.
+        """
         logging.info(f"Sending ({self._pipe.describe()})..")
-        sender = twisted.protocols.basic.FileSender()
-        hasher = hashlib.sha256()
+        sender = ReadAheadProducer(
+            self._reactor,
+            source_file.file_object,
+            self.chunk_size,
+            length=source_file.transfer_bytes,
+            encoder=Compressor() if compress else None,
+        )
+        # Both the connection and the hasher can hold back the file's data
+        pauses = SharedProducer(sender)
+        if prefix_hash is None:
+            hash_factory = get_hash_factory(self.hash_algorithm)
+        else:
+            hash_factory = prefix_hash.copy
+        hasher = ThreadedHasher(self._reactor, hash_factory, pauses.share())
 
         def _update(data):
             hasher.update(data)
-            progress.update(len(data))
+            if progress is not None:
+                progress.update(len(data))
             return data
 
-        if source_file.final_bytes > 0:
+        if source_file.transfer_bytes > 0:
             yield sender.beginFileTransfer(
-                source_file.file_object, self._pipe, transform=_update
+                self._pipe, transform=_update, registered_producer=pauses.share()
             )
-        return hexlify(hasher.digest()).decode("ascii")
+        datahash = yield hasher.digest()
+        return hexlify(datahash).decode("ascii")
+
+    def send_header(self, header):
+        """Tells the receiver how the following data is sent"""
+        self._pipe.send_record(json.dumps(header).encode("utf-8"))
+
+    @defer.inlineCallbacks
+    def send_packed(self, source_files, compress=False):
+        """
+        Sends small files together in a single record, returning the hex digest
+        of all their data. If compress is set, the record is preceded by a header
+        saying whether it's compressed.
+        """
+        record, datahash = yield run_in_thread(
+            self._reactor, pack, source_files, get_hash_factory(self.hash_algorithm)
+        )
+        if compress:
+            compressed = yield run_in_thread(self._reactor, _compress_packed, record)
+            if compressed is not None:
+                self.send_header({"compression": COMPRESSION})
+                record = compressed
+            else:
+                self.send_header({"compression": None})
+        self._pipe.send_record(record)
+        return hexlify(datahash).decode("ascii")
 
     @defer.inlineCallbacks
     def wait_for_ack(self):
@@ -51,4 +116,12 @@ class FileSender:
         if ok != "ok":
             raise SendFileError(f"Transfer failed: {ack}")
 
-        return ack.get("sha256", None)
+        return ack.get(self.hash_algorithm, None)
+
+
+def _compress_packed(record):
+    """Returns the compressed record, or None if it's not worth compressing"""
+    if not is_compressible_record(record):
+        return None
+    compressed = compress_record(record)
+    return compressed if len(compressed) < len(record) else None
@@ -0,0 +1,311 @@
+from collections import deque
+
+from twisted.internet import defer, error
+from twisted.internet.interfaces import IConsumer, IPushProducer
+from wormhole.transit import FileConsumer
+from zope.interface import implementer
+
+from .compression import UNREACHABLE_BYTES
+
+# Each record is tagged with the stream it belongs to, from the writer's side:
+# records for files the writer is sending (and their headers), or records for
+# files the writer is receiving (acks). The reader swaps them round. Text
+# messages (and their acks) go both ways on a stream of their own, as does the
+# data of large messages, and credit records let the peer send more file data.
+SEND_TAG = b"s"
+RECEIVE_TAG = b"r"
+MESSAGE_TAG = b"m"
+TEXT_TAG = b"t"
+CREDIT_TAG = b"c"
+
+# File data that can be sent before the receiver grants more credit. This
+# limits how much a message can be queued behind, at the cost of limiting
+# throughput to WINDOW_BYTES per round trip.
+WINDOW_BYTES = 4 * 1024 * 1024
+CREDIT_BYTES = WINDOW_BYTES // 4
+
+
+@implementer(IConsumer, IPushProducer)
+class Multiplexer:
+    """
+    Carries several streams of records over a single transit connection, so
+    that files can be sent in both directions at once, alongside text messages.
+    Each stream is accessed through a Channel, which behaves like a transit
+    connection of its own.
+
+    File data is flow controlled with credit, rather than by pausing the
+    connection. So the connection is always read, and messages never wait
+    behind more than WINDOW_BYTES of file data, even while the receiver is
+    waiting for the disk.
+    """
+
+    def __init__(self):
+        self._pipe = None
+        self._connected = []
+        self._paused_tags = set()
+        self._is_paused = False
+        self._is_closed = False
+        self._unacked_bytes = 0
+        self._uncredited_bytes = 0
+        self.send_channel = Channel(self, SEND_TAG)
+        self.receive_channel = Channel(self, RECEIVE_TAG)
+        self.message_channel = Channel(self, MESSAGE_TAG)
+        self.text_channel = Channel(self, TEXT_TAG)
+        self._channels = [
+            self.send_channel,
+            self.receive_channel,
+            self.message_channel,
+            self.text_channel,
+        ]
+
+    def attach(self, pipe):
+        """Starts carrying the channels over pipe, once it's connected"""
+        self._pipe = pipe
+        lost = pipe.connectConsumer(self, expected=UNREACHABLE_BYTES)
+        if lost is not None:
+            lost.addErrback(self._on_connection_lost)
+        pipe.registerProducer(self, True)
+
+        connected, self._connected = self._connected, []
+        for deferred in connected:
+            deferred.callback(None)
+
+    def wait_for_connection(self):
+        if self._pipe is not None:
+            return defer.succeed(None)
+        if self._is_closed:
+            return defer.fail(error.ConnectionClosed())
+
+        deferred = defer.Deferred()
+        self._connected.append(deferred)
+        return deferred
+
+    def describe(self):
+        return self._pipe.describe() if self._pipe is not None else None
+
+    def send_record(self, tag, record):
+        # Like a closed transit connection, records sent after closing are dropped
+        if self._pipe is None:
+            return
+
+        self._pipe.send_record(tag + record)
+        if tag == SEND_TAG:
+            self._unacked_bytes += len(record)
+            self._update_producers()
+
+    def close(self):
+        self._is_closed = True
+        connected, self._connected = self._connected, []
+        for deferred in connected:
+            deferred.errback(error.ConnectionClosed())
+
+        if self._pipe is not None:
+            self._pipe.close()
+            self._pipe = None
+        self._on_connection_lost(None)
+
+    @property
+    def is_connected(self):
+        return self._pipe is not None
+
+    def _on_connection_lost(self, failure):
+        for channel in self._channels:
+            channel._connection_lost()
+
+    # IConsumer methods, for records from the connection
+    def registerProducer(self, producer, streaming):
+        pass
+
+    def unregisterProducer(self):
+        pass
+
+    def write(self, record):
+        tag, record = record[:1], record[1:]
+        if tag == SEND_TAG:
+            self._uncredited_bytes += len(record)
+            self.receive_channel._record_received(record)
+            self._send_credit()
+        elif tag == RECEIVE_TAG:
+            self.send_channel._record_received(record)
+        elif tag == MESSAGE_TAG:
+            self.message_channel._record_received(record)
+        elif tag == TEXT_TAG:
+            self.text_channel._record_received(record)
+        elif tag == CREDIT_TAG:
+            self._unacked_bytes -= int(record)
+            self._update_producers()
+
+    def _send_credit(self):
+        # Credit is held back while the file's consumer is paused
+        if (
+            self._pipe is not None
+            and self._uncredited_bytes >= CREDIT_BYTES
+            and RECEIVE_TAG not in self._paused_tags
+        ):
+            self._pipe.send_record(CREDIT_TAG + str(self._uncredited_bytes).encode())
+            self._uncredited_bytes = 0
+
+    # IPushProducer methods, for records to the connection
+    def pauseProducing(self):
+        self._is_paused = True
+        self._update_producers()
+
+    def resumeProducing(self):
+        self._is_paused = False
+        self._update_producers()
+
+    def stopProducing(self):
+        for channel in self._channels:
+            channel._stop_producer()
+
+    def _update_producers(self):
+        for channel in self._channels:
+            is_window_full = (
+                channel is self.send_channel and self._unacked_bytes >= WINDOW_BYTES
+            )
+            channel._set_producer_paused(self._is_paused or is_window_full)
+
+    def _pause_inbound(self, tag):
+        self._paused_tags.add(tag)
+
+    def _resume_inbound(self, tag):
+        self._paused_tags.discard(tag)
+        self._send_credit()
+
+
+@implementer(IConsumer, IPushProducer)
+class Channel:
+    """
+    One stream of a Multiplexer. Has the same interface as a transit
+    Connection (as used by FileSender and FileReceiver), so it can be used in
+    place of one. It also stands in for the Transit, as connect() returns the
+    channel once the shared connection is made.
+    """
+
+    def __init__(self, multiplexer, tag):
+        self._multiplexer = multiplexer
+        self._tag = tag
+        self._producer = None
+        self._is_producer_paused = False
+        self._consumer = None
+        self._consumer_bytes_written = 0
+        self._consumer_bytes_expected = None
+        self._consumer_deferred = None
+        self._inbound_records = deque()
+        self._waiting_reads = deque()
+
+    @defer.inlineCallbacks
+    def connect(self):
+        yield self._multiplexer.wait_for_connection()
+        return self
+
+    def describe(self):
+        return self._multiplexer.describe()
+
+    def close(self):
+        # The connection is shared, so closing either channel closes both
+        self._multiplexer.close()
+
+    def send_record(self, record):
+        self._multiplexer.send_record(self._tag, record)
+
+    def receive_record(self):
+        deferred = defer.Deferred()
+        self._waiting_reads.append(deferred)
+        self._deliver_records()
+        return deferred
+
+    def _record_received(self, record):
+        if self._consumer is not None:
+            self._write_to_consumer(record)
+            return
+        self._inbound_records.append(record)
+        self._deliver_records()
+
+    def _deliver_records(self):
+        while self._inbound_records and self._waiting_reads:
+            self._waiting_reads.popleft().callback(self._inbound_records.popleft())
+
+    def _connection_lost(self):
+        while self._waiting_reads:
+            self._waiting_reads.popleft().errback(error.ConnectionClosed())
+        if self._consumer_deferred is not None:
+            deferred = self._consumer_deferred
+            self._consumer = None
+            self._consumer_deferred = None
+            deferred.errback(error.ConnectionClosed())
+
+    # IConsumer methods, for outbound flow control
+    def registerProducer(self, producer, streaming):
+        self._producer = producer
+        if self._is_producer_paused:
+            producer.pauseProducing()
+
+    def unregisterProducer(self):
+        self._producer = None
+
+    def write(self, data):
+        self.send_record(data)
+
+    def _set_producer_paused(self, is_paused):
+        if is_paused == self._is_producer_paused:
+            return
+        self._is_producer_paused = is_paused
+        if self._producer is not None:
+            if is_paused:
+                self._producer.pauseProducing()
+            else:
+                self._producer.resumeProducing()
+
+    def _stop_producer(self):
+        if self._producer is not None:
+            self._producer.stopProducing()
+
+    # IPushProducer methods, for inbound flow control
+    def pauseProducing(self):
+        self._multiplexer._pause_inbound(self._tag)
+
+    def resumeProducing(self):
+        self._multiplexer._resume_inbound(self._tag)
+
+    def stopProducing(self):
+        self.close()
+
+    # Helper methods, as in wormhole.transit.Connection
+    def connectConsumer(self, consumer, expected=None):
+        if self._consumer is not None:
+            raise RuntimeError(f"A consumer is already attached: {self._consumer!r}")
+
+        consumer.registerProducer(self, True)
+        self._consumer = consumer
+        self._consumer_bytes_written = 0
+        self._consumer_bytes_expected = expected
+        deferred = None
+        if expected is not None:
+            deferred = defer.Deferred()
+        self._consumer_deferred = deferred
+        if expected == 0:
+            self._write_to_consumer(b"")
+        while self._consumer is not None and self._inbound_records:
+            self._write_to_consumer(self._inbound_records.popleft())
+        return deferred
+
+    def _write_to_consumer(self, record):
+        self._consumer.write(record)
+        self._consumer_bytes_written += len(record)
+        if (
+            self._consumer_bytes_expected is not None
+            and self._consumer_bytes_written >= self._consumer_bytes_expected
+        ):
+            deferred = self._consumer_deferred
+            self.disconnectConsumer()
+            deferred.callback(self._consumer_bytes_written)
+
+    def disconnectConsumer(self):
+        self._consumer.unregisterProducer()
+        self._consumer = None
+        self._consumer_bytes_expected = None
+        self._consumer_deferred = None
+
+    def writeToFile(self, f, expected, progress=None, hasher=None):
+        return self.connectConsumer(FileConsumer(f, progress, hasher), expected)
@@ -0,0 +1,124 @@
+import hashlib
+import json
+from pathlib import Path
+import struct
+
+from ...errors import ReceiveFileError, SendFileError
+
+# Files up to this size are packed together when sent in a batch
+PACKED_FILE_MAX_BYTES = 64 * 1024
+# Packed files are grouped into transit records of up to this size
+PACKED_RECORD_MAX_BYTES = 1024 * 1024
+
+# A packed record holds several small files, each framed as:
+#   4 byte big-endian header length
+#   JSON header: {"filename": str, "filesize": int, "sha256": hex str}
+#   file data (filesize bytes)
+# The receiver splits the record back into files, checking each hash. Only one
+# ack is sent per record, with the receiver's digest of all the files' data (in
+# the negotiated hash algorithm) for the sender to check.
+HEADER_LENGTH = struct.Struct(">I")
+
+
+def group_packed_files(source_files):
+    """
+    Splits a batch into lists of files that are sent together. Consecutive
+    packed files are grouped up to PACKED_RECORD_MAX_BYTES, every other file is
+    sent on its own.
+    """
+    group = []
+    group_bytes = 0
+    for source_file in source_files:
+        if not source_file.packed:
+            if group:
+                yield group
+                group, group_bytes = [], 0
+            yield [source_file]
+            continue
+
+        if group and group_bytes + source_file.final_bytes > PACKED_RECORD_MAX_BYTES:
+            yield group
+            group, group_bytes = [], 0
+        group.append(source_file)
+        group_bytes += source_file.final_bytes
+
+    if group:
+        yield group
+
+
+def pack(source_files, hash_factory=hashlib.sha256):
+    """
+    Reads and frames the files, returning the record and the digest of all the
+    files' data. Called on a pool thread.
+    """
+    frames = []
+    hasher = hash_factory()
+    for source_file in source_files:
+        with open(source_file.full_path, "rb") as file_object:
+            data = file_object.read(source_file.final_bytes + 1)
+        if len(data) != source_file.final_bytes:
+            raise SendFileError(f"{source_file.name} changed while queued")
+
+        header = {
+            "filename": source_file.name,
+            "filesize": len(data),
+            "sha256": hashlib.sha256(data).hexdigest(),
+        }
+        header_bytes = json.dumps(header).encode("utf-8")
+        frames += [HEADER_LENGTH.pack(len(header_bytes)), header_bytes, data]
+        hasher.update(data)
+
+    return b"".join(frames), hasher.digest()
+
+
+def unpack(record, dest_files, dest_path, id, hash_factory=hashlib.sha256):
+    """
+    Splits the record into the given files, writing each one to disk.
+    Returns the number of files and bytes received, and the digest of all the
+    files' data. Called on a pool thread.
+    """
+    hasher = hash_factory()
+    count = 0
+    total_bytes = 0
+    offset = 0
+    while offset < len(record):
+        if count == len(dest_files):
+            raise ReceiveFileError("Packed record has more files than offered")
+        dest_file = dest_files[count]
+
+        try:
+            (header_length,) = HEADER_LENGTH.unpack_from(record, offset)
+            offset += HEADER_LENGTH.size
+            end = offset + header_length
+            header = json.loads(record[offset:end].decode("utf-8"))
+            offset = end
+
+            end = offset + header["filesize"]
+            data = record[offset:end]
+            offset = end
+        except (struct.error, ValueError, KeyError, TypeError):
+            raise ReceiveFileError("Packed record is truncated or malformed")
+
+        if (
+            Path(header["filename"]).name != dest_file.name
+            or len(data) != dest_file.final_bytes
+        ):
+            raise ReceiveFileError(f"Unexpected packed file: {header}")
+        if hashlib.sha256(data).hexdigest() != header["sha256"]:
+            raise ReceiveFileError(f"Packed file {dest_file.name} is corrupt")
+
+        dest_file.open(id, dest_path)
+        try:
+            dest_file.file_object.write(data)
+            dest_file.finalise()
+        except Exception:
+            dest_file.cleanup()
+            raise
+
+        hasher.update(data)
+        count += 1
+        total_bytes += len(data)
+
+    if count == 0:
+        raise ReceiveFileError("Packed record is empty")
+    return count, total_bytes, hasher.digest()
@@ -1,12 +1,51 @@
+PROGRESS_RATE_HZ = 10
+
+
 class Progress:
-    def __init__(self, delegate, id, total_bytes):
+    """
+    Reports transfer progress to the delegate, coalescing updates so that
+    it's called at most rate_hz times per second. The final update (once all
+    bytes are transferred) is always reported immediately.
+    """
+
+    def __init__(self, reactor, delegate, id, total_bytes, rate_hz=PROGRESS_RATE_HZ):
+        self._reactor = reactor
         self._delegate = delegate
         self._id = id
         self._total_bytes = total_bytes
         self._transferred_bytes = 0
+        self._interval = 1 / rate_hz
+        self._last_report_time = None
+        self._pending_report = None
 
     def update(self, increment_bytes):
         self._transferred_bytes += increment_bytes
+
+        if self._transferred_bytes >= self._total_bytes:
+            self._report()
+        elif self._pending_report is None:
+            now = self._reactor.seconds()
+            if (
+                self._last_report_time is None
+                or now - self._last_report_time >= self._interval
+            ):
+                self._report()
+            else:
+                delay = self._last_report_time + self._interval - now
+                self._pending_report = self._reactor.callLater(delay, self._report)
+
+    def stop(self):
+        """Cancels any coalesced update, once the transfer has ended"""
+        if self._pending_report is not None and self._pending_report.active():
+            self._pending_report.cancel()
+        self._pending_report = None
+
+    def _report(self):
+        if self._pending_report is not None and self._pending_report.active():
+            self._pending_report.cancel()
+        self._pending_report = None
+        self._last_report_time = self._reactor.seconds()
+
         self._delegate.transit_progress(
             self._id, self._transferred_bytes, self._total_bytes
         )
@@ -0,0 +1,176 @@
+from collections import deque
+import threading
+
+from twisted.internet import defer
+from twisted.internet.interfaces import IPushProducer
+from twisted.python.failure import Failure
+from zope.interface import implementer
+
+DEFAULT_CHUNK_SIZE = 64 * 1024
+READ_AHEAD_BYTES = 4 * 1024 * 1024
+
+
+@implementer(IPushProducer)
+class ReadAheadProducer:
+    """
+    Replacement for twisted.protocols.basic.FileSender that reads the file on the
+    reactor's thread pool, keeping up to READ_AHEAD_BYTES buffered ahead of the
+    consumer.
+
+    Each chunk is written to the consumer separately, so chunk_size sets the size
+    of the encrypted transit records. If length is given, no more than length
+    bytes are read, even if the file has grown since its size was sent.
+
+    If an encoder is given (with encode(data) and flush() methods), it's run on
+    the reading thread and its output is written instead of the file data. The
+    transform then only observes the original data.
+    """
+
+    def __init__(
+        self,
+        reactor,
+        file_object,
+        chunk_size=DEFAULT_CHUNK_SIZE,
+        read_ahead_bytes=READ_AHEAD_BYTES,
+        length=None,
+        encoder=None,
+    ):
+        self._reactor = reactor
+        self._file_object = file_object
+        self._chunk_size = chunk_size
+        self._max_buffered_chunks = max(1, read_ahead_bytes // chunk_size)
+        # Only accessed by the (single) reading thread
+        self._remaining = length
+        self._encoder = encoder
+
+        self._consumer = None
+        self._transform = None
+        self._deferred = None
+        self._chunks = deque()
+        self._is_paused = False
+
+        self._lock = threading.Lock()
+        self._buffered_chunks = 0
+        self._is_reading = False
+        self._is_stopped = False
+
+    def beginFileTransfer(self, consumer, transform=None, registered_producer=None):
+        """
+        Starts writing the file to the consumer. If registered_producer is
+        given (such as a share of a SharedProducer), it's registered with the
+        consumer in place of this one.
+        """
+        self._consumer = consumer
+        self._transform = transform
+        self._deferred = defer.Deferred()
+
+        self._consumer.registerProducer(registered_producer or self, True)
+        self._start_reading()
+        return self._deferred
+
+    def pauseProducing(self):
+        self._is_paused = True
+
+    def resumeProducing(self):
+        self._is_paused = False
+        self._deliver()
+
+    def stopProducing(self):
+        with self._lock:
+            self._is_stopped = True
+        self._chunks.clear()
+
+        if self._deferred is not None:
+            deferred, self._deferred = self._deferred, None
+            deferred.errback(Exception("Consumer asked us to stop producing"))
+
+    def _start_reading(self):
+        with self._lock:
+            if self._is_reading or self._is_stopped:
+                return
+            if self._buffered_chunks >= self._max_buffered_chunks:
+                return
+            self._is_reading = True
+
+        self._reactor.callInThread(self._read)
+
+    def _read(self):
+        while True:
+            with self._lock:
+                if self._is_stopped:
+                    self._is_reading = False
+                    return
+                if self._buffered_chunks >= self._max_buffered_chunks:
+                    self._is_reading = False
+                    return
+                self._buffered_chunks += 1
+
+            try:
+                data = self._file_object.read(self._next_read_size())
+                if self._remaining is not None:
+                    # Pipes and sockets can return less than was asked for
+                    self._remaining -= len(data)
+                encoded = self._encode(data)
+            except Exception:
+                self._reactor.callFromThread(self._on_error, Failure())
+                return
+
+            self._reactor.callFromThread(self._on_read, data, encoded)
+            if not data:
+                # Stay in the reading state, so that no more reads are started
+                return
+
+    def _next_read_size(self):
+        if self._remaining is None:
+            return self._chunk_size
+
+        return min(self._chunk_size, self._remaining)
+
+    def _encode(self, data):
+        if self._encoder is None:
+            return None
+        if not data:
+            return self._encoder.flush()
+        return self._encoder.encode(data)
+
+    def _on_read(self, data, encoded):
+        if self._deferred is None:
+            return
+        self._chunks.append((data, encoded))
+        self._deliver()
+
+    def _on_error(self, failure):
+        self._finish()
+        if self._deferred is not None:
+            deferred, self._deferred = self._deferred, None
+            deferred.errback(failure)
+
+    def _deliver(self):
+        while self._chunks and not self._is_paused and self._deferred is not None:
+            data, encoded = self._chunks.popleft()
+            with self._lock:
+                self._buffered_chunks -= 1
+
+            if not data:
+                if encoded:
+                    self._consumer.write(encoded)
+                self._finish()
+                deferred, self._deferred = self._deferred, None
+                deferred.callback(None)
+                return
+
+            if self._transform is not None:
+                data = self._transform(data)
+            if encoded is not None:
+                data = encoded
+            if data:
+                self._consumer.write(data)
+
+        self._start_reading()
+
+    def _finish(self):
+        with self._lock:
+            self._is_stopped = True
+        if self._consumer is not None:
+            self._consumer.unregisterProducer()
+            self._consumer = None
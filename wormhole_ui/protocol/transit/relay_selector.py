@@ -0,0 +1,150 @@
+import logging
+import re
+
+from twisted.internet import defer, endpoints
+from twisted.internet.protocol import Protocol
+
+PROBE_TIMEOUT_SECONDS = 2
+
+# Relayed transfers slower than this fail over to another relay. Transfers
+# smaller than MIN_MEASURED_BYTES are dominated by latency, so they're ignored.
+MIN_RELAY_BYTES_PER_SECOND = 1024 * 1024
+MIN_MEASURED_BYTES = 4 * 1024 * 1024
+
+RELAY_DESCRIPTION = re.compile(r"relay:tcp:(.+):(\d+)$")
+
+
+class RelaySelector:
+    """
+    Chooses which of the candidate transit relays to advertise. The candidates
+    are probed for their connection time, and the fastest to respond is used.
+    If a transfer through the current relay is too slow, the next best one is
+    used from then on.
+
+    The transit relay protocol has no way to measure bandwidth without a peer,
+    so bandwidth is only measured from real transfers.
+    """
+
+    def __init__(
+        self,
+        reactor,
+        transit_relays,
+        min_bytes_per_second=MIN_RELAY_BYTES_PER_SECOND,
+    ):
+        self._reactor = reactor
+        self._candidates = [relay for relay in transit_relays if relay]
+        self._min_bytes_per_second = min_bytes_per_second
+        self._rtts = {}
+        self._slow_relays = set()
+        self._probe_deferred = None
+        self.current = self._candidates[0] if self._candidates else None
+
+    def probe(self):
+        """
+        Measures how long each candidate takes to accept a connection, and
+        picks the fastest. There's nothing to choose between unless there's
+        more than one candidate.
+        """
+        if len(self._candidates) > 1 and not self.is_probing:
+            self._probe_deferred = self._probe()
+        return self.wait_for_probe()
+
+    @property
+    def is_probing(self):
+        return self._probe_deferred is not None and not self._probe_deferred.called
+
+    def wait_for_probe(self):
+        """Returns a Deferred that fires with the chosen relay once probing ends"""
+        if not self.is_probing:
+            return defer.succeed(self.current)
+
+        deferred = defer.Deferred()
+        self._probe_deferred.addBoth(lambda _: deferred.callback(self.current))
+        return deferred
+
+    @defer.inlineCallbacks
+    def _probe(self):
+        results = yield defer.DeferredList(
+            [self._measure_rtt(relay) for relay in self._candidates],
+            consumeErrors=True,
+        )
+        self._rtts = {}
+        for relay, (is_ok, rtt) in zip(self._candidates, results):
+            if is_ok:
+                self._rtts[relay] = rtt
+            else:
+                logging.info(f"Transit relay {relay} unreachable: {rtt.value!r}")
+
+        self._choose()
+
+    @defer.inlineCallbacks
+    def _measure_rtt(self, relay):
+        endpoint = endpoints.clientFromString(self._reactor, _strip_priority(relay))
+        start_time = self._reactor.seconds()
+
+        connecting = endpoints.connectProtocol(endpoint, Protocol())
+        timeout = self._reactor.callLater(PROBE_TIMEOUT_SECONDS, connecting.cancel)
+        try:
+            protocol = yield connecting
+        finally:
+            if timeout.active():
+                timeout.cancel()
+
+        rtt = self._reactor.seconds() - start_time
+        protocol.transport.loseConnection()
+        logging.info(f"Transit relay {relay} connected in {rtt * 1000:.0f}ms")
+        return rtt
+
+    def report_transfer(self, description, num_bytes, seconds):
+        """
+        Records the throughput of a transfer over the connection with the given
+        description. If it went through the current relay too slowly, fails over
+        to the next best one. Returns True if the relay changed.
+        """
+        if num_bytes < MIN_MEASURED_BYTES or seconds <= 0:
+            return False
+        relay = self._find_relay(description)
+        if relay is None:
+            return False
+
+        bytes_per_second = num_bytes / seconds
+        if bytes_per_second >= self._min_bytes_per_second:
+            return False
+
+        logging.info(
+            f"Transit relay {relay} is slow ({bytes_per_second / 1e6:.2f}MB/s)"
+        )
+        self._slow_relays.add(relay)
+        previous = self.current
+        self._choose()
+        return self.current != previous
+
+    def _find_relay(self, description):
+        match = RELAY_DESCRIPTION.search(description or "")
+        if match is None:
+            return None
+
+        for relay in self._candidates:
+            if _strip_priority(relay) == f"tcp:{match.group(1)}:{match.group(2)}":
+                return relay
+        return None
+
+    def _choose(self):
+        if not self._candidates:
+            return
+
+        def _rank(relay):
+            is_reachable = relay in self._rtts or not self._rtts
+            return (
+                relay in self._slow_relays,
+                not is_reachable,
+                self._rtts.get(relay, 0),
+                self._candidates.index(relay),
+            )
+
+        self.current = min(self._candidates, key=_rank)
+
+
+def _strip_priority(relay):
+    """Removes hint options (such as priority=) that aren't part of the address"""
+    return ":".join(relay.split(":")[:3])
@@ -2,16 +2,27 @@ from pathlib import Path
 
 
 class SourceFile:
-    def __init__(self, id, file_path):
-        file_path = Path(file_path).resolve()
-        assert file_path.exists()
+    is_directory = False
+
+    def __init__(self, id, file_path, size=None):
+        # The path is expected to be resolved already (off the GUI thread),
+        # so there's no filesystem access until the file is opened. The size
+        # can be given if it's known, so the file needn't be stat'ed either.
+        file_path = Path(file_path)
 
         self.id = id
         self.name = file_path.name
         self.full_path = file_path
-        self.final_bytes = None
-        self.transfer_bytes = None
+        self.final_bytes = size
+        self.transfer_bytes = size
         self.file_object = None
+        # Set for small files that are packed with others in a batch
+        self.packed = False
+
+    def stat(self):
+        """Gets the file size without opening the file"""
+        self.final_bytes = self.full_path.stat().st_size
+        self.transfer_bytes = self.final_bytes
 
     def open(self):
         self.file_object = open(self.full_path, "rb")
@@ -19,3 +30,13 @@ class SourceFile:
         self.final_bytes = self.file_object.tell()
         self.transfer_bytes = self.final_bytes
         self.file_object.seek(0, 0)
+
+    def seek(self, offset):
+        """Skips the start of the file, which the receiver already has"""
+        self.file_object.seek(offset)
+        self.transfer_bytes = self.final_bytes - offset
+
+    def close(self):
+        if self.file_object is not None:
+            self.file_object.close()
+            self.file_object = None
@@ -0,0 +1,76 @@
+import io
+
+from ...errors import SendFileError
+
+# Streams of unknown length are held in memory until they end, so there's a
+# limit. Larger streams have to be sent with their size.
+MAX_STREAM_BYTES = 256 * 1024 * 1024
+READ_BYTES = 1024 * 1024
+
+
+class SourceStream:
+    """
+    Data to send like a file, read from a binary stream (such as a pipe, stdin
+    or a bytes buffer) rather than from a path. Has the same interface as
+    SourceFile.
+
+    The size is sent in the offer, so it has to be known up front. Streams of
+    unknown length (up to MAX_STREAM_BYTES) can be read into memory first with
+    read_stream().
+
+    There's no path, so streams are sent on their own (not in a batch), can't
+    be resumed, and aren't sampled to see if they're worth compressing.
+    """
+
+    is_directory = False
+
+    def __init__(self, id, name, stream, size):
+        self.id = id
+        self.name = name
+        self.full_path = None
+        self.final_bytes = size
+        self.transfer_bytes = size
+        self.file_object = stream
+        self.packed = False
+
+    def stat(self):
+        pass
+
+    def open(self):
+        pass
+
+    def seek(self, offset):
+        """Streams can only be sent from where they are"""
+        if offset != 0:
+            raise SendFileError(f"Can't resume sending {self.name}")
+
+    def close(self):
+        # The stream belongs to the caller, so it's left open
+        pass
+
+
+def read_stream(id, name, stream):
+    """
+    Reads a stream (or an iterable of bytes, such as a generator) of unknown
+    length into memory, returning a SourceStream for it. Blocks until the
+    stream ends, so call it on a pool thread.
+
+    Raises SendFileError if the stream is larger than MAX_STREAM_BYTES.
+    """
+    if hasattr(stream, "read"):
+        chunks = iter(lambda: stream.read(READ_BYTES), b"")
+    else:
+        chunks = stream
+
+    buffer = io.BytesIO()
+    for chunk in chunks:
+        buffer.write(chunk)
+        if buffer.tell() > MAX_STREAM_BYTES:
+            raise SendFileError(
+                f"Can't send {name} without its size, "
+                f"as it's over {MAX_STREAM_BYTES // (1024 * 1024)}MiB"
+            )
+
+    size = buffer.tell()
+    buffer.seek(0)
+    return SourceStream(id, name, buffer, size)
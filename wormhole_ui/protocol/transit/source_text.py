@@ -0,0 +1,14 @@
+import io
+
+from .source_stream import SourceStream
+
+
+class SourceText(SourceStream):
+    """A text message to send like a file, from memory"""
+
+    def __init__(self, id, text):
+        data = text.encode("utf-8")
+        super().__init__(id, None, io.BytesIO(data), len(data))
+
+    def close(self):
+        self.file_object.close()
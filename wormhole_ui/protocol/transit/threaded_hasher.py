@@ -0,0 +1,155 @@
+from collections import deque
+import functools
+import hashlib
+import logging
+import threading
+
+from twisted.internet import defer
+from twisted.python.failure import Failure
+
+MAX_PENDING_BYTES = 16 * 1024 * 1024
+HASH_FILE_CHUNK_SIZE = 1024 * 1024
+
+
+class ThreadedHasher:
+    """
+    Hashes data on the reactor's thread pool, so that hashing large transfers
+    doesn't block the reactor (and the GUI that shares its thread).
+
+    Chunks are queued in order and drained by at most one pool thread at a time,
+    so the digest is identical to hashing the chunks sequentially. If hashing
+    falls behind and the queue fills up, the producer (if given) is paused
+    until the queue has drained by half.
+    """
+
+    def __init__(
+        self,
+        reactor,
+        hash_factory=hashlib.sha256,
+        producer=None,
+        max_pending_bytes=MAX_PENDING_BYTES,
+    ):
+        self._reactor = reactor
+        self._hasher = hash_factory()
+        self._producer = producer
+        self._max_pending_bytes = max_pending_bytes
+
+        self._lock = threading.Lock()
+        self._chunks = deque()
+        self._is_draining = False
+        self._hash_failed = False
+
+        # Only accessed by the reactor thread
+        self._pending_bytes = 0
+        self._is_paused = False
+        self._digest_deferred = None
+        self._error = None
+
+    def update(self, data):
+        if self._error is not None:
+            return
+
+        self._pending_bytes += len(data)
+        with self._lock:
+            self._chunks.append(data)
+            start_draining = not self._is_draining
+            self._is_draining = True
+
+        if start_draining:
+            self._reactor.callInThread(self._drain)
+
+        if (
+            self._producer is not None
+            and self._pending_bytes >= self._max_pending_bytes
+            and not self._is_paused
+        ):
+            self._is_paused = True
+            self._producer.pauseProducing()
+
+    def digest(self):
+        """
+        Returns a Deferred that fires with the digest, once all previously
+        queued chunks have been hashed, or errbacks if hashing failed.
+        """
+        assert self._digest_deferred is None
+        self._digest_deferred = defer.Deferred()
+        deferred = self._digest_deferred
+        self._check_digest()
+        return deferred
+
+    def _drain(self):
+        while True:
+            with self._lock:
+                if not self._chunks or self._hash_failed:
+                    self._chunks.clear()
+                    self._is_draining = False
+                    return
+                data = self._chunks.popleft()
+
+            try:
+                self._hasher.update(data)
+            except Exception:
+                with self._lock:
+                    self._hash_failed = True
+                    self._chunks.clear()
+                    self._is_draining = False
+                self._reactor.callFromThread(self._on_error, Failure())
+                return
+
+            self._reactor.callFromThread(self._on_hashed, len(data))
+
+    def _on_hashed(self, length):
+        if self._error is not None:
+            return
+        self._pending_bytes -= length
+
+        if self._is_paused and self._pending_bytes <= self._max_pending_bytes // 2:
+            self._resume()
+        self._check_digest()
+
+    def _on_error(self, failure):
+        logging.error(f"Hashing failed: {failure.value}")
+        self._error = failure
+        self._pending_bytes = 0
+
+        if self._is_paused:
+            self._resume()
+        self._check_digest()
+
+    def _resume(self):
+        self._is_paused = False
+        self._producer.resumeProducing()
+
+    def _check_digest(self):
+        if self._digest_deferred is None:
+            return
+        if self._pending_bytes > 0 and self._error is None:
+            return
+
+        deferred, self._digest_deferred = self._digest_deferred, None
+        if self._error is None:
+            # Every chunk has been hashed, so no pool thread is using the hasher
+            deferred.callback(self._hasher.digest())
+        else:
+            deferred.errback(self._error)
+
+
+def get_hash_factory(hash_algorithm):
+    """Returns a callable that creates hash objects for the named algorithm"""
+    return functools.partial(hashlib.new, hash_algorithm)
+
+
+def hash_file_prefix(file_path, length, hash_factory=hashlib.sha256):
+    """
+    Returns a hash object fed with the first length bytes of the file,
+    or None if the file is shorter than that. Blocks, so call it on a pool thread.
+    """
+    hasher = hash_factory()
+    with open(file_path, "rb") as file_object:
+        while length > 0:
+            data = file_object.read(min(length, HASH_FILE_CHUNK_SIZE))
+            if not data:
+                return None
+            hasher.update(data)
+            length -= len(data)
+    return hasher
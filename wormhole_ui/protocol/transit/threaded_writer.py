@@ -0,0 +1,147 @@
+from collections import deque
+import logging
+import threading
+
+from twisted.internet import defer
+from twisted.python.failure import Failure
+
+COALESCE_BYTES = 1024 * 1024
+MAX_QUEUED_BYTES = 32 * 1024 * 1024
+
+
+class ThreadedWriter:
+    """
+    File-like object that writes to disk on the reactor's thread pool, so that
+    slow disks don't block the network (or the GUI that shares the reactor thread).
+
+    Small writes are coalesced into large ones. If the disk falls behind and the
+    queue fills up, the producer is paused until the queue has drained by half.
+    """
+
+    def __init__(
+        self,
+        reactor,
+        file_object,
+        producer,
+        coalesce_bytes=COALESCE_BYTES,
+        max_queued_bytes=MAX_QUEUED_BYTES,
+    ):
+        self._reactor = reactor
+        self._file_object = file_object
+        self._producer = producer
+        self._coalesce_bytes = coalesce_bytes
+        self._max_queued_bytes = max_queued_bytes
+
+        self._buffer = []
+        self._buffer_bytes = 0
+        self._queued_bytes = 0
+        self._lock = threading.Lock()
+        self._chunks = deque()
+        self._is_draining = False
+        self._write_failed = False
+        self._flush_deferreds = []
+        self._error = None
+
+        self._is_paused = False
+        self._stall_started = None
+        self.stall_seconds = 0.0
+
+    def write(self, data):
+        if self._error is not None:
+            return
+
+        self._buffer.append(data)
+        self._buffer_bytes += len(data)
+        if self._buffer_bytes >= self._coalesce_bytes:
+            self._queue_buffer()
+
+    def flush(self):
+        """
+        Returns a Deferred that fires once everything written so far has reached
+        the file, or errbacks if a write failed.
+        """
+        self._queue_buffer()
+
+        deferred = defer.Deferred()
+        self._flush_deferreds.append(deferred)
+        self._check_flushed()
+        return deferred
+
+    def _queue_buffer(self):
+        if self._buffer_bytes == 0:
+            return
+
+        data = b"".join(self._buffer)
+        self._buffer = []
+        self._buffer_bytes = 0
+        self._queued_bytes += len(data)
+
+        with self._lock:
+            self._chunks.append(data)
+            start_draining = not self._is_draining
+            self._is_draining = True
+
+        if start_draining:
+            self._reactor.callInThread(self._drain)
+
+        if self._queued_bytes >= self._max_queued_bytes and not self._is_paused:
+            self._is_paused = True
+            self._stall_started = self._reactor.seconds()
+            self._producer.pauseProducing()
+
+    def _drain(self):
+        while True:
+            with self._lock:
+                if not self._chunks or self._write_failed:
+                    self._chunks.clear()
+                    self._is_draining = False
+                    return
+                data = self._chunks.popleft()
+
+            try:
+                self._file_object.write(data)
+            except Exception:
+                with self._lock:
+                    self._write_failed = True
+                    self._chunks.clear()
+                    self._is_draining = False
+                self._reactor.callFromThread(self._on_error, Failure())
+                return
+
+            self._reactor.callFromThread(self._on_written, len(data))
+
+    def _on_written(self, length):
+        if self._error is not None:
+            return
+        self._queued_bytes -= length
+
+        if self._is_paused and self._queued_bytes <= self._max_queued_bytes // 2:
+            self._resume()
+        self._check_flushed()
+
+    def _on_error(self, failure):
+        logging.error(f"Disk write failed: {failure.value}")
+        self._error = failure
+        self._queued_bytes = 0
+        self._buffer = []
+        self._buffer_bytes = 0
+
+        if self._is_paused:
+            self._resume()
+        self._check_flushed()
+
+    def _resume(self):
+        self._is_paused = False
+        self.stall_seconds += self._reactor.seconds() - self._stall_started
+        self._producer.resumeProducing()
+
+    def _check_flushed(self):
+        if self._queued_bytes > 0 and self._error is None:
+            return
+
+        flush_deferreds, self._flush_deferreds = self._flush_deferreds, []
+        for deferred in flush_deferreds:
+            if self._error is None:
+                deferred.callback(None)
+            else:
+                deferred.errback(self._error)
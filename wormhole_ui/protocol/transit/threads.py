@@ -0,0 +1,52 @@
+from twisted.internet import threads
+
+
+def run_in_thread(reactor, f, *args):
+    """Calls f on the reactor's thread pool, returning a Deferred of its result"""
+    return threads.deferToThreadPool(reactor, reactor.getThreadPool(), f, *args)
+
+
+class SharedProducer:
+    """
+    Lets several consumers pause the same producer, such as a transit
+    connection that's written to disk and hashed on the thread pool. It stays
+    paused until every consumer that paused it has resumed it, so one can't
+    undo another's back-pressure.
+    """
+
+    def __init__(self, producer):
+        self._producer = producer
+        self._paused_by = set()
+
+    def share(self):
+        """Returns a producer for one consumer to pause and resume"""
+        return _Share(self)
+
+    def _pause(self, share):
+        if not self._paused_by:
+            self._producer.pauseProducing()
+        self._paused_by.add(share)
+
+    def _resume(self, share):
+        if share not in self._paused_by:
+            return
+        self._paused_by.discard(share)
+        if not self._paused_by:
+            self._producer.resumeProducing()
+
+    def _stop(self):
+        self._producer.stopProducing()
+
+
+class _Share:
+    def __init__(self, shared_producer):
+        self._shared_producer = shared_producer
+
+    def pauseProducing(self):
+        self._shared_producer._pause(self)
+
+    def resumeProducing(self):
+        self._shared_producer._resume(self)
+
+    def stopProducing(self):
+        self._shared_producer._stop()
@@ -3,16 +3,63 @@ import logging
 
 from twisted.internet import defer
 
+from ..capabilities import WARM_START, Capabilities
+from ..relays import Relays
+from .relay_selector import RelaySelector
+
 
 class TransitProtocolBase:
-    def __init__(self, wormhole, delegate, transit):
+    # Which way file data goes, from our side. Subclasses override this.
+    DIRECTION = None
+
+    def __init__(
+        self, reactor, wormhole, delegate, capabilities=None, relay_selector=None
+    ):
+        if capabilities is None:
+            capabilities = Capabilities()
+        if relay_selector is None:
+            relay_selector = RelaySelector(reactor, Relays().transit_relays)
+        self._reactor = reactor
         self._wormhole = wormhole
         self._delegate = delegate
-        self._transit = transit
+        self._capabilities = capabilities
+        self._relay_selector = relay_selector
 
         self._send_transit_deferred = None
+        self._is_reconnecting = False
+        self._new_transit()
+
+    def _create_transit(self, transit_relay):
+        """Returns a new wormhole Transit, connecting through transit_relay"""
+        raise NotImplementedError
+
+    def _new_transit(self):
+        self._transit_relay = self._relay_selector.current
+        self._transit = self._create_transit(self._transit_relay)
+        self._is_transit_used = False
+
+    def _use_transit(self):
+        # A Transit can only connect once, so its relay is fixed once it's used
+        if not self._is_transit_used:
+            if self._relay_selector.current != self._transit_relay:
+                self._new_transit()
+            self._is_transit_used = True
+
+    @property
+    def transit_relay(self):
+        return self._transit_relay
+
+    def reconnect(self):
+        """
+        Drops the transit connection, so that the next handshake connects again
+        through the current relay. Only for peers that support RECONNECT.
+        """
+        self.close()
+        self._new_transit()
+        self._is_reconnecting = True
 
     def handle_transit(self, transit_message):
+        self._use_transit()
         self._add_hints(transit_message)
         self._derive_key()
 
@@ -22,12 +69,22 @@ class TransitProtocolBase:
 
     @defer.inlineCallbacks
     def _send_transit(self):
+        if not self._is_transit_used:
+            # Advertise the best relay, if we're still finding out which it is
+            yield self._relay_selector.wait_for_probe()
+        self._use_transit()
+
         our_abilities = self._transit.get_connection_abilities()
         our_hints = yield self._transit.get_connection_hints()
         our_transit_message = {
             "abilities-v1": our_abilities,
             "hints-v1": our_hints,
         }
+        if self._capabilities.supports(WARM_START):
+            our_transit_message["direction"] = self.DIRECTION
+        if self._is_reconnecting:
+            our_transit_message["reconnect"] = True
+            self._is_reconnecting = False
         self._send_data({"transit": our_transit_message})
 
     def _derive_key(self):
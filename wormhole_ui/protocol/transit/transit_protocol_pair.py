@@ -1,16 +1,52 @@
+from collections import deque
 import logging
+import os
+import stat
+import traceback
 
+from twisted.internet.defer import CancelledError
+
+from ..capabilities import BATCH, PACK, RECONNECT, RESUME, WARM_START, Capabilities
+from ..relays import Relays
+from .dest_file import DestFile, DestStream
+from .packed_files import PACKED_FILE_MAX_BYTES
+from .relay_selector import RelaySelector
+from .source_directory import SourceDirectory
 from .source_file import SourceFile
+from .source_stream import SourceStream
+from .threads import run_in_thread
 from .transit_protocol_sender import TransitProtocolSender
 from .transit_protocol_receiver import TransitProtocolReceiver
+from .transit_protocol_shared import TransitProtocolShared
 
 
 class TransitProtocolPair:
-    def __init__(self, reactor, wormhole, delegate):
-        self._receiver = TransitProtocolReceiver(reactor, wormhole, delegate)
-        self._sender = TransitProtocolSender(reactor, wormhole, delegate)
+    def __init__(
+        self, reactor, wormhole, delegate, capabilities=None, relay_selector=None
+    ):
+        if capabilities is None:
+            capabilities = Capabilities()
+        if relay_selector is None:
+            relay_selector = RelaySelector(reactor, Relays().transit_relays)
+        self._reactor = reactor
+        self._wormhole = wormhole
+        self._delegate = delegate
+        self._capabilities = capabilities
+        self._relay_selector = relay_selector
+        self._shared = None
+        self._receiver = TransitProtocolReceiver(
+            reactor, wormhole, delegate, capabilities, relay_selector
+        )
+        self._sender = TransitProtocolSender(
+            reactor, wormhole, delegate, capabilities, relay_selector
+        )
 
         self._source_file = None
+        self._source_batch = None
+        self._queued_files = deque()
+        self._scanning = None
+        self._is_opening = False
+        self._is_offer_waiting = False
         self._dest_file = None
 
         self._send_transit_handshake_complete = False
@@ -20,52 +56,247 @@ class TransitProtocolPair:
         self.is_receiving_file = False
 
     def send_file(self, id, file_path):
-        logging.debug("TransitProtocolPair::send_file")
+        self.send_files([(id, file_path)])
+
+    def send_files(self, files):
+        """
+        Sends a list of (id, file_path) tuples. If the peer supports batches,
+        they're offered together and streamed back to back (with small files
+        packed together, if the peer supports that too). Otherwise they're
+        offered one at a time.
+
+        A SourceStream can be given in place of a file_path. Directories and
+        streams are always offered on their own, after any batch.
+
+        Files can also be given as (id, file_path, size, is_directory) tuples,
+        as scanned off the reactor thread by the FileScanner. The size is None
+        for directories. Any other files are scanned on the thread pool before
+        they're offered.
+        """
+        logging.debug("TransitProtocolPair::send_files")
         assert not self.is_sending_file
         self.is_sending_file = True
 
-        self._source_file = SourceFile(id, file_path)
-        self._source_file.open()
+        if all(len(file) == 4 for file in files):
+            self._send_scanned(files)
+            return
+
+        self._scanning = run_in_thread(self._reactor, _scan_files, files)
+        self._scanning.addCallback(self._on_scanned)
+        self._scanning.addErrback(self._on_scan_error)
+
+    def _on_scanned(self, files):
+        self._scanning = None
+        self._send_scanned(files)
+
+    def _on_scan_error(self, failure):
+        if failure.check(CancelledError):
+            # Closed while the files were being scanned
+            return
+        self._scanning = None
+        self._fail_sending(failure.value, failure.getTraceback())
+
+    def _send_scanned(self, files):
+        singles = []
+        if self._capabilities.supports(BATCH) and len(files) > 1:
+            files, singles = _split_batchable(files)
+
+        if self._capabilities.supports(BATCH) and len(files) > 1:
+            pack = self._capabilities.supports(PACK)
+            self._source_batch = []
+            for id, file_path, size, _ in files:
+                source_file = SourceFile(id, file_path, size)
+                if size is None:
+                    source_file.stat()
+                source_file.packed = (
+                    pack and source_file.final_bytes <= PACKED_FILE_MAX_BYTES
+                )
+                self._source_batch.append(source_file)
+            self._queued_files.extend(singles)
+        else:
+            self._queued_files.extend(files + singles)
+            self._open_next_file()
 
-        if not self._send_transit_handshake_complete:
+        if self._capabilities.supports_shared_transit():
+            # The connection is made in the background, so offer straight away
+            self._start_shared_transit()
+            self._send_offer()
+        elif self._send_transit_handshake_complete:
+            self._send_offer()
+        elif not self._awaiting_transit_response:
             self._awaiting_transit_response = True
             self._sender.send_transit()
+        # Otherwise the offer is sent once the peer responds
+
+    def warm_start(self):
+        """
+        Starts the sender's transit handshake before there's anything to send,
+        so that the first file can be offered straight away. Only for peers that
+        support WARM_START, as the transit messages say which direction
+        they're for.
+        """
+        logging.debug("TransitProtocolPair::warm_start")
+        if self._capabilities.supports_shared_transit():
+            self._start_shared_transit()
+        elif not self._send_transit_handshake_complete:
+            if not self._awaiting_transit_response:
+                self._awaiting_transit_response = True
+                self._sender.send_transit()
+
+    def _start_shared_transit(self):
+        """
+        Switches the sender and receiver over to a single shared connection,
+        and sends our half of its handshake.
+        """
+        if self._shared is None:
+            self._shared = TransitProtocolShared(
+                self._reactor,
+                self._wormhole,
+                self._delegate,
+                self._capabilities,
+                self._relay_selector,
+            )
+            self._sender.share_connection(self._shared.send_channel)
+            self._receiver.share_connection(self._shared.receive_channel)
+
+        if not self._shared.is_transit_sent:
+            self._shared.send_transit()
+
+    def _open_next_file(self):
+        id, file_path, size, is_directory = self._queued_files.popleft()
+        if isinstance(file_path, SourceStream):
+            self._source_file = file_path
+        elif is_directory:
+            # Walking a large tree takes a while, so it's done on the thread
+            # pool, and the offer is sent once it's finished
+            self._source_file = SourceDirectory(id, file_path)
+            self._is_opening = True
+            opened = run_in_thread(self._reactor, self._source_file.open)
+            opened.addCallbacks(
+                self._on_opened,
+                self._on_open_error,
+                callbackArgs=(self._source_file,),
+                errbackArgs=(self._source_file,),
+            )
+            return
+        else:
+            self._source_file = SourceFile(id, file_path, size)
+        self._source_file.open()
+
+    def _on_opened(self, _, source_file):
+        if source_file is not self._source_file:
+            # Closed while it was being opened
+            source_file.close()
+            return
+
+        self._is_opening = False
+        if self._is_offer_waiting:
+            self._is_offer_waiting = False
+            self._send_offer()
+
+    def _on_open_error(self, failure, source_file):
+        if source_file is not self._source_file:
+            return
+
+        self._is_opening = False
+        self._is_offer_waiting = False
+        self._source_file = None
+        self._fail_sending(failure.value, failure.getTraceback())
+
+    def _fail_sending(self, exception, traceback):
+        self._queued_files.clear()
+        self.is_sending_file = False
+        self._delegate.transit_error(exception=exception, traceback=traceback)
+
+    def _send_offer(self):
+        if self._is_opening:
+            self._is_offer_waiting = True
+            return
+
+        if self._source_batch is not None:
+            self._sender.send_batch_offer(self._source_batch)
         else:
             self._sender.send_offer(self._source_file)
 
     def handle_transit(self, transit_message):
         logging.debug("TransitProtocolPair::handle_transit")
 
-        if self._awaiting_transit_response:
-            # We're waiting for a response, so this is for the sender
-            assert self.is_sending_file
+        # Peers that support WARM_START say which direction the message is for.
+        # Otherwise, if we're waiting for a response, it's for the sender.
+        direction = transit_message.get("direction")
+        if direction == "shared":
+            self._start_shared_transit()
+            if not self._shared.is_handshake_complete:
+                self._shared.handle_transit(transit_message)
 
+        elif direction == "receive" or (
+            direction is None and self._awaiting_transit_response
+        ):
             if not self._send_transit_handshake_complete:
                 self._send_transit_handshake_complete = True
                 self._sender.handle_transit(transit_message)
 
             self._awaiting_transit_response = False
-            self._sender.send_offer(self._source_file)
+            if self.is_sending_file:
+                self._send_offer()
 
         else:
-            # We haven't sent a transit message, so this is for the receiver
+            # The peer is sending to us, so this is for the receiver
             assert not self.is_receiving_file
 
+            if transit_message.get("reconnect"):
+                # The sender has switched relays, so connect again
+                self._receive_transit_handshake_complete = False
+                self._receiver.reconnect()
+
             if not self._receive_transit_handshake_complete:
                 self._receive_transit_handshake_complete = True
                 self._receiver.handle_transit(transit_message)
 
             self._receiver.send_transit()
 
-    def handle_file_ack(self):
+    def handle_file_ack(self, resume=None):
         logging.debug("TransitProtocolPair::handle_file_ack")
         assert self.is_sending_file
 
         def on_send_finished():
-            self.is_sending_file = False
+            if self._source_file is not None:
+                self._source_file.close()
             self._source_file = None
+            self._source_batch = None
+
+            if not self._queued_files:
+                self.is_sending_file = False
+                self._reconnect_if_relay_changed()
+                return
+
+            try:
+                self._open_next_file()
+                self._send_offer()
+            except Exception as exception:
+                self._fail_sending(exception, traceback.format_exc())
 
-        self._sender.send_file(self._source_file, on_send_finished)
+        if self._source_batch is not None:
+            self._sender.send_batch(self._source_batch, on_send_finished)
+        else:
+            self._sender.send_file(self._source_file, on_send_finished, resume)
+
+    def _reconnect_if_relay_changed(self):
+        """
+        If the relay we're sending through was too slow, and a better one was
+        chosen, the next transfer connects through that instead.
+        """
+        if (
+            self._shared is None
+            and self._send_transit_handshake_complete
+            and self._sender.transit_relay != self._relay_selector.current
+            and self._capabilities.supports(RECONNECT)
+        ):
+            logging.info(f"Reconnecting through {self._relay_selector.current}")
+            self._send_transit_handshake_complete = False
+            self._sender.reconnect()
+            if self._capabilities.supports(WARM_START):
+                self.warm_start()
 
     def handle_offer(self, offer):
         logging.debug("TransitProtocolPair::handle_offer")
@@ -74,6 +305,10 @@ class TransitProtocolPair:
         self._dest_file = self._receiver.handle_offer(offer)
         return self._dest_file
 
+    def can_receive_into_stream(self):
+        """Only single files can be streamed, not batches or directories"""
+        return isinstance(self._dest_file, DestFile)
+
     def receive_file(self, id, dest_path):
         logging.debug("TransitProtocolPair::receive_file")
         assert not self.is_receiving_file
@@ -85,11 +320,21 @@ class TransitProtocolPair:
                 self._dest_file.cleanup()
                 self._dest_file = None
 
-        self._dest_file.open(id, dest_path)
+        if hasattr(dest_path, "write"):
+            # Received into a stream, rather than saved into a directory
+            self._dest_file = DestStream(self._dest_file, dest_path)
+        self._dest_file.open(id, dest_path, resume=self._capabilities.supports(RESUME))
         self._receiver.receive_file(self._dest_file, on_receive_finished)
 
     def close(self):
+        if self._scanning is not None:
+            self._scanning.cancel()
+            self._scanning = None
         self._source_file = None
+        self._source_batch = None
+        self._queued_files.clear()
+        self._is_opening = False
+        self._is_offer_waiting = False
         self._dest_file = None
         self._send_transit_handshake_complete = False
         self._receive_transit_handshake_complete = False
@@ -99,3 +344,40 @@ class TransitProtocolPair:
 
         self._sender.close()
         self._receiver.close()
+        if self._shared is not None:
+            self._shared.close()
+            self._shared = None
+
+
+def _scan_files(files):
+    """
+    Returns an (id, file_path, size, is_directory) tuple for each file, only
+    stat'ing those that haven't been scanned already. Called on a pool thread.
+    """
+    return [file if len(file) == 4 else _scan_file(*file) for file in files]
+
+
+def _scan_file(id, file_path):
+    if isinstance(file_path, SourceStream):
+        return (id, file_path, file_path.final_bytes, False)
+    try:
+        path_stat = os.stat(file_path)
+    except OSError:
+        # Left for opening the file to report
+        return (id, file_path, None, False)
+    if stat.S_ISDIR(path_stat.st_mode):
+        return (id, file_path, None, True)
+    return (id, file_path, path_stat.st_size, False)
+
+
+def _split_batchable(files):
+    """Splits out the directories and streams, which are sent on their own"""
+    file_paths = []
+    singles = []
+    for file in files:
+        id, file_path, _, is_directory = file
+        if isinstance(file_path, SourceStream) or is_directory:
+            singles.append(file)
+        else:
+            file_paths.append(file)
+    return file_paths, singles
@@ -1,32 +1,56 @@
 import logging
 
 from twisted.internet import defer
-from wormhole.cli import public_relay
 from wormhole.transit import TransitReceiver
 
-from .dest_file import DestFile
+from .dest_file import DestBatch, DestDirectory, DestFile
 from ...errors import (
     OfferError,
+    ReceiveFileError,
     RespondError,
 )
+from ..capabilities import ZLIB
 from .file_receiver import FileReceiver
 from .progress import Progress
+from .threaded_hasher import get_hash_factory, hash_file_prefix
+from .threads import run_in_thread
 from .transit_protocol_base import TransitProtocolBase
 
 
 class TransitProtocolReceiver(TransitProtocolBase):
-    def __init__(self, reactor, wormhole, delegate):
-        transit = TransitReceiver(
-            transit_relay=public_relay.TRANSIT_RELAY,
-            reactor=reactor,
-        )
-        super().__init__(wormhole, delegate, transit)
+    DIRECTION = "receive"
 
-        self._file_receiver = FileReceiver(transit)
-        self._send_transit_deferred = None
+    def __init__(
+        self, reactor, wormhole, delegate, capabilities=None, relay_selector=None
+    ):
+        self._file_receiver = None
         self._receive_file_deferred = None
+        super().__init__(reactor, wormhole, delegate, capabilities, relay_selector)
+
+    def _create_transit(self, transit_relay):
+        transit = TransitReceiver(transit_relay=transit_relay, reactor=self._reactor)
+        self._file_receiver = FileReceiver(self._reactor, transit)
+        return transit
+
+    def share_connection(self, channel):
+        """Receives through a channel of a TransitProtocolShared instead"""
+        self._file_receiver = FileReceiver(self._reactor, channel)
 
     def handle_offer(self, offer):
+        if "batch" in offer:
+            return DestBatch(offer["batch"]["files"])
+
+        if "directory" in offer:
+            directory = offer["directory"]
+            if not directory.get("mode", "").startswith("zipfile"):
+                raise RespondError(OfferError(f"Unknown directory mode: {directory}"))
+            return DestDirectory(
+                directory["dirname"],
+                directory["zipsize"],
+                directory["numbytes"],
+                directory["numfiles"],
+            )
+
         if "file" not in offer:
             raise RespondError(OfferError(f"Unknown offer: {offer}"))
 
@@ -35,25 +59,106 @@ class TransitProtocolReceiver(TransitProtocolBase):
         return DestFile(filename, filesize)
 
     def receive_file(self, dest_file, receive_finished_handler):
-        self._send_data({"answer": {"file_ack": "ok"}})
-
-        self._receive_file_deferred = self._receive_file(dest_file)
+        self._file_receiver.hash_algorithm = self._capabilities.hash_algorithm
+        compress = self._capabilities.supports(ZLIB)
+        if isinstance(dest_file, DestBatch):
+            self._send_data({"answer": {"file_ack": "ok"}})
+            self._receive_file_deferred = self._receive_batch(dest_file, compress)
+        else:
+            # The file_ack is sent once we know whether we can resume
+            self._receive_file_deferred = self._receive_file(dest_file, compress)
         self._receive_file_deferred.addErrback(self._on_deferred_error)
         self._receive_file_deferred.addBoth(lambda _: receive_finished_handler())
 
     @defer.inlineCallbacks
-    def _receive_file(self, dest_file):
-        progress = Progress(self._delegate, dest_file.id, dest_file.transfer_bytes)
+    def _receive_file(self, dest_file, compress=False):
+        prefix_hash = None
+        answer = {"file_ack": "ok"}
+        if dest_file.resume_offset > 0:
+            hash_algorithm = self._file_receiver.hash_algorithm
+            prefix_hash = yield run_in_thread(
+                self._reactor,
+                hash_file_prefix,
+                dest_file.temp_path,
+                dest_file.resume_offset,
+                get_hash_factory(hash_algorithm),
+            )
+            answer["resume"] = {
+                "offset": dest_file.resume_offset,
+                hash_algorithm: prefix_hash.hexdigest(),
+            }
+        self._send_data({"answer": answer})
+
+        progress = Progress(
+            self._reactor, self._delegate, dest_file.id, dest_file.final_bytes
+        )
+
+        try:
+            yield self._file_receiver.open()
+            header = {}
+            # Directories are sent as a plain zip stream, as the CLI expects
+            if prefix_hash is not None or (compress and not dest_file.is_directory):
+                header = yield self._file_receiver.receive_header()
 
-        yield self._file_receiver.open()
-        datahash = yield self._file_receiver.receive(dest_file, progress)
+            if prefix_hash is not None:
+                # The sender either resumes where we asked, or starts again
+                offset = header.get("offset", 0)
+                if offset not in (0, dest_file.resume_offset):
+                    raise ReceiveFileError(f"Can't resume from {offset}B")
+                if offset == 0:
+                    prefix_hash = None
+                dest_file.seek(offset)
+                progress.update(offset)
 
-        dest_file.finalise()
-        yield self._file_receiver.send_ack(datahash)
+            datahash = yield self._file_receiver.receive(
+                dest_file,
+                progress,
+                prefix_hash,
+                compressed=header.get("compression") is not None,
+            )
+
+            dest_file.finalise()
+            yield self._file_receiver.send_ack(datahash)
+        finally:
+            progress.stop()
 
         logging.info("File received, transfer complete")
         self._delegate.transit_complete(dest_file.id, dest_file.name)
 
+    @defer.inlineCallbacks
+    def _receive_batch(self, dest_batch, compress=False):
+        progress = Progress(
+            self._reactor, self._delegate, dest_batch.id, dest_batch.transfer_bytes
+        )
+
+        try:
+            yield self._file_receiver.open()
+            # The files are streamed back to back, each followed by its own ack
+            while dest_batch.has_next():
+                if dest_batch.next_is_packed():
+                    yield self._file_receiver.receive_packed(
+                        dest_batch, progress, compress
+                    )
+                    continue
+
+                dest_file = dest_batch.open_next()
+                header = {}
+                if compress:
+                    header = yield self._file_receiver.receive_header()
+                datahash = yield self._file_receiver.receive(
+                    dest_file,
+                    progress,
+                    compressed=header.get("compression") is not None,
+                )
+
+                dest_file.finalise()
+                yield self._file_receiver.send_ack(datahash)
+        finally:
+            progress.stop()
+
+        logging.info("Batch received, transfer complete")
+        self._delegate.transit_complete(dest_batch.id, dest_batch.name)
+
     def close(self):
         super().close()
 
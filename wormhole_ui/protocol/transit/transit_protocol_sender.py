@@ -1,27 +1,44 @@
 import logging
 
 from twisted.internet import defer
-from wormhole.cli import public_relay
 from wormhole.transit import TransitSender
 
 from ...errors import SendFileError
+from ..capabilities import ZLIB
+from .compression import COMPRESSION, is_compressible
 from .file_sender import FileSender
+from .packed_files import group_packed_files
 from .progress import Progress
+from .source_directory import ZIP_MODE
+from .threaded_hasher import get_hash_factory, hash_file_prefix
+from .threads import run_in_thread
 from .transit_protocol_base import TransitProtocolBase
 
 
 class TransitProtocolSender(TransitProtocolBase):
-    def __init__(self, reactor, wormhole, delegate):
-        transit = TransitSender(
-            transit_relay=public_relay.TRANSIT_RELAY,
-            reactor=reactor,
-        )
-        super().__init__(wormhole, delegate, transit)
+    DIRECTION = "send"
 
-        self._file_sender = FileSender(transit)
+    def __init__(
+        self, reactor, wormhole, delegate, capabilities=None, relay_selector=None
+    ):
+        self._file_sender = None
         self._send_file_deferred = None
+        super().__init__(reactor, wormhole, delegate, capabilities, relay_selector)
+
+    def _create_transit(self, transit_relay):
+        transit = TransitSender(transit_relay=transit_relay, reactor=self._reactor)
+        self._file_sender = FileSender(self._reactor, transit)
+        return transit
+
+    def share_connection(self, channel):
+        """Sends through a channel of a TransitProtocolShared instead"""
+        self._file_sender = FileSender(self._reactor, channel)
 
     def send_offer(self, source_file):
+        if source_file.is_directory:
+            self._send_directory_offer(source_file)
+            return
+
         self._send_data(
             {
                 "offer": {
@@ -33,29 +50,223 @@ class TransitProtocolSender(TransitProtocolBase):
             }
         )
 
-    def send_file(self, source_file, send_finished_handler):
-        self._send_file_deferred = self._send_file(source_file)
+    def _send_directory_offer(self, source_directory):
+        self._send_data(
+            {
+                "offer": {
+                    "directory": {
+                        "mode": ZIP_MODE,
+                        "dirname": source_directory.name,
+                        "zipsize": source_directory.final_bytes,
+                        "numbytes": source_directory.num_bytes,
+                        "numfiles": source_directory.num_files,
+                    },
+                }
+            }
+        )
+
+    def send_batch_offer(self, source_files):
+        self._send_data(
+            {
+                "offer": {
+                    "batch": {
+                        "files": [
+                            _describe_batch_file(source_file)
+                            for source_file in source_files
+                        ],
+                    },
+                }
+            }
+        )
+
+    def send_file(self, source_file, send_finished_handler, resume=None):
+        self._send_file_deferred = self._send_file(source_file, resume)
         self._send_file_deferred.addErrback(self._on_deferred_error)
         self._send_file_deferred.addBoth(lambda _: send_finished_handler())
 
     @defer.inlineCallbacks
-    def _send_file(self, source_file):
-        progress = Progress(self._delegate, source_file.id, source_file.transfer_bytes)
+    def _send_file(self, source_file, resume=None):
+        yield self._open_file_sender()
 
-        yield self._file_sender.open()
-        expected_hash = yield self._file_sender.send(source_file, progress)
+        header = {}
+        prefix_hash = None
+        if resume is not None:
+            # The receiver has part of the file, so only send the rest
+            prefix_hash = yield self._check_resume(source_file, resume)
+            header["offset"] = 0 if prefix_hash is None else resume["offset"]
+            source_file.seek(header["offset"])
+        if self._capabilities.supports(ZLIB) and not source_file.is_directory:
+            # Directories are sent as a plain zip stream, as the CLI expects
+            header["compression"] = yield self._choose_compression(source_file)
+        if header:
+            self._file_sender.send_header(header)
 
-        logging.info("File sent, awaiting confirmation")
-        ack_hash = yield self._file_sender.wait_for_ack()
-        if ack_hash is not None and ack_hash != expected_hash:
-            raise SendFileError("Transfer failed (bad remote hash)")
+        progress = Progress(
+            self._reactor, self._delegate, source_file.id, source_file.final_bytes
+        )
+        try:
+            if source_file.transfer_bytes < source_file.final_bytes:
+                progress.update(source_file.final_bytes - source_file.transfer_bytes)
+
+            start_time = self._reactor.seconds()
+            expected_hash = yield self._file_sender.send(
+                source_file,
+                progress,
+                prefix_hash,
+                compress=header.get("compression") is not None,
+            )
+
+            logging.info("File sent, awaiting confirmation")
+            ack_hash = yield self._file_sender.wait_for_ack()
+            if ack_hash is not None and ack_hash != expected_hash:
+                raise SendFileError("Transfer failed (bad remote hash)")
+        finally:
+            progress.stop()
 
         logging.info("Confirmation received, transfer complete")
+        self._report_transfer(source_file.transfer_bytes, start_time)
         self._delegate.transit_complete(source_file.id, source_file.name)
 
+    @defer.inlineCallbacks
+    def _check_resume(self, source_file, resume):
+        """Returns the hash of the receiver's partial file, if it matches ours"""
+        offset = resume.get("offset", 0)
+        if not 0 < offset <= source_file.final_bytes:
+            return None
+        if source_file.full_path is None:
+            logging.info("Can't resume a stream, sending from the start")
+            return None
+
+        hash_algorithm = self._file_sender.hash_algorithm
+        prefix_hash = yield run_in_thread(
+            self._reactor,
+            hash_file_prefix,
+            source_file.full_path,
+            offset,
+            get_hash_factory(hash_algorithm),
+        )
+        if prefix_hash is None or prefix_hash.hexdigest() != resume.get(hash_algorithm):
+            logging.info("Partial file doesn't match, sending from the start")
+            return None
+
+        logging.info(f"Resuming from {offset}B")
+        return prefix_hash
+
+    @defer.inlineCallbacks
+    def _choose_compression(self, source_file):
+        """Only compresses files that look compressible"""
+        if source_file.full_path is None:
+            # Streams can't be sampled without consuming them
+            return None
+        offset = source_file.final_bytes - source_file.transfer_bytes
+        compressible = yield run_in_thread(
+            self._reactor, is_compressible, source_file.full_path, offset
+        )
+        return COMPRESSION if compressible else None
+
+    def send_batch(self, source_files, send_finished_handler):
+        self._send_file_deferred = self._send_batch(source_files)
+        self._send_file_deferred.addErrback(self._on_deferred_error)
+        self._send_file_deferred.addBoth(lambda _: send_finished_handler())
+
+    @defer.inlineCallbacks
+    def _send_batch(self, source_files):
+        yield self._open_file_sender()
+        compress = self._capabilities.supports(ZLIB)
+        start_time = self._reactor.seconds()
+
+        acks = []
+        for group in group_packed_files(source_files):
+            if group[0].packed:
+                expected_hash = yield self._file_sender.send_packed(group, compress)
+                ack = self._file_sender.wait_for_ack()
+                ack.addCallback(self._on_packed_ack, group, expected_hash)
+            else:
+                source_file = group[0]
+                expected_hash = yield self._send_batch_file(source_file, compress)
+                ack = self._file_sender.wait_for_ack()
+                ack.addCallback(self._on_batch_ack, source_file, expected_hash)
+
+            # Start streaming the next file without waiting for this ack
+            acks.append(ack)
+
+        logging.info("Batch sent, awaiting confirmation")
+        try:
+            yield defer.gatherResults(acks, consumeErrors=True)
+        except defer.FirstError as error:
+            error.subFailure.raiseException()
+        logging.info("Confirmation received, transfer complete")
+        self._report_transfer(
+            sum(source_file.transfer_bytes for source_file in source_files),
+            start_time,
+        )
+
+    @defer.inlineCallbacks
+    def _send_batch_file(self, source_file, compress=False):
+        progress = Progress(
+            self._reactor,
+            self._delegate,
+            source_file.id,
+            source_file.transfer_bytes,
+        )
+        offered_bytes = source_file.transfer_bytes
+
+        source_file.open()
+        try:
+            if source_file.transfer_bytes != offered_bytes:
+                raise SendFileError(f"{source_file.name} changed while queued")
+
+            compression = None
+            if compress:
+                compression = yield self._choose_compression(source_file)
+                self._file_sender.send_header({"compression": compression})
+
+            expected_hash = yield self._file_sender.send(
+                source_file, progress, compress=compression is not None
+            )
+        finally:
+            progress.stop()
+            source_file.close()
+        return expected_hash
+
+    def _on_packed_ack(self, ack_hash, source_files, expected_hash):
+        # Receivers that pack files always send the hash of what they unpacked
+        if ack_hash != expected_hash:
+            raise SendFileError(
+                f"Transfer of {len(source_files)} files failed (bad remote hash)"
+            )
+        for source_file in source_files:
+            self._delegate.transit_complete(source_file.id, source_file.name)
+
+    def _on_batch_ack(self, ack_hash, source_file, expected_hash):
+        if ack_hash is not None and ack_hash != expected_hash:
+            raise SendFileError(
+                f"Transfer of {source_file.name} failed (bad remote hash)"
+            )
+        self._delegate.transit_complete(source_file.id, source_file.name)
+
+    def _report_transfer(self, num_bytes, start_time):
+        self._relay_selector.report_transfer(
+            self._file_sender.describe(),
+            num_bytes,
+            self._reactor.seconds() - start_time,
+        )
+
+    def _open_file_sender(self):
+        self._file_sender.chunk_size = self._capabilities.record_bytes
+        self._file_sender.hash_algorithm = self._capabilities.hash_algorithm
+        return self._file_sender.open()
+
     def close(self):
         super().close()
 
         self._file_sender.close()
         if self._send_file_deferred is not None:
             self._send_file_deferred.cancel()
+
+
+def _describe_batch_file(source_file):
+    description = {"filename": source_file.name, "filesize": source_file.final_bytes}
+    if source_file.packed:
+        description["packed"] = True
+    return description
@@ -0,0 +1,96 @@
+import logging
+
+from twisted.internet import defer
+from wormhole.transit import TransitReceiver, TransitSender
+
+from .multiplexer import Multiplexer
+from .transit_protocol_base import TransitProtocolBase
+
+
+class TransitProtocolShared(TransitProtocolBase):
+    """
+    A single transit connection that carries files in both directions, for
+    peers that support SHARED_TRANSIT. There's only one hint exchange, key
+    derivation and connection (and so only one relay slot), however many
+    files are sent each way.
+
+    The sender and receiver use the send_channel and receive_channel in place
+    of their own transit connections. One of the peers has to take the
+    TransitSender role, so the peer with the greater side leads.
+    """
+
+    DIRECTION = "shared"
+
+    def __init__(
+        self, reactor, wormhole, delegate, capabilities=None, relay_selector=None
+    ):
+        self._multiplexer = Multiplexer()
+        self._connect_deferred = None
+        self.is_transit_sent = False
+        self.is_handshake_complete = False
+        super().__init__(reactor, wormhole, delegate, capabilities, relay_selector)
+
+    def _create_transit(self, transit_relay):
+        if self._capabilities.is_transit_leader:
+            transit_class = TransitSender
+        else:
+            transit_class = TransitReceiver
+        return transit_class(transit_relay=transit_relay, reactor=self._reactor)
+
+    @property
+    def send_channel(self):
+        return self._multiplexer.send_channel
+
+    @property
+    def receive_channel(self):
+        return self._multiplexer.receive_channel
+
+    def send_transit(self):
+        self.is_transit_sent = True
+        super().send_transit()
+
+    def _use_transit(self):
+        # The peer may connect as soon as it has our hints, so the key has to be
+        # set before they're sent, rather than once we have the peer's hints
+        is_new = not self._is_transit_used
+        super()._use_transit()
+        if is_new:
+            self._derive_key()
+
+    def handle_transit(self, transit_message):
+        """
+        Once we have the peer's hints, both peers connect straight away, so the
+        connection is ready by the time the first file is accepted.
+        """
+        self.is_handshake_complete = True
+        self._use_transit()
+        self._add_hints(transit_message)
+
+        self._connect_deferred = self._transit.connect()
+        self._connect_deferred.addCallback(self._on_connected)
+        self._connect_deferred.addErrback(self._on_connect_error)
+
+    def _on_connected(self, pipe):
+        logging.info(f"Shared transit connected ({pipe.describe()})")
+        # Messages and acks are small, and Nagle's algorithm would hold one
+        # back until the previous one is acked (up to 40ms, with delayed acks)
+        pipe.transport.setTcpNoDelay(True)
+        self._multiplexer.attach(pipe)
+        self._delegate.transit_connected(
+            self._multiplexer.message_channel, self._multiplexer.text_channel
+        )
+
+    def _on_connect_error(self, failure):
+        self._multiplexer.close()
+        if failure.check(defer.CancelledError):
+            # We closed the connection ourselves
+            return None
+        return self._on_deferred_error(failure)
+
+    def close(self):
+        super().close()
+
+        if self._connect_deferred is not None:
+            self._connect_deferred.cancel()
+            self._connect_deferred = None
+        self._multiplexer.close()
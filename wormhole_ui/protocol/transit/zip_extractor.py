@@ -0,0 +1,352 @@
+import os
+from pathlib import Path
+import re
+import zlib
+
+from ...errors import ReceiveFileError
+from .zip_stream import (
+    CENTRAL_HEADER,
+    DATA_DESCRIPTOR,
+    LOCAL_HEADER,
+    UNIX_SYSTEM,
+    ZIP64_DATA_DESCRIPTOR,
+    ZIP64_EXTRA_HEADER,
+    ZIP64_FIELD,
+    ZIP64_MARKER,
+)
+
+LOCAL_SIGNATURE = b"PK\x03\x04"
+CENTRAL_SIGNATURE = b"PK\x01\x02"
+DESCRIPTOR_SIGNATURE = b"PK\x07\x08"
+END_SIGNATURES = (b"PK\x05\x06", b"PK\x06\x06", b"PK\x06\x07")
+SIGNATURE_BYTES = 4
+
+ENCRYPTED_FLAG = 0x0001
+DESCRIPTOR_FLAG = 0x0008
+UTF8_FLAG = 0x0800
+STORED = 0
+DEFLATED = 8
+
+ZIP64_EXTRA_ID = 0x0001
+
+
+class ZipEntry:
+    def __init__(self, name, path, method, flags, crc, size, is_zip64):
+        self.name = name
+        self.path = path
+        self.method = method
+        self.has_descriptor = bool(flags & DESCRIPTOR_FLAG)
+        self.expected_crc = crc
+        self.expected_size = size
+        self.is_zip64 = is_zip64
+        self.is_dir = name.endswith("/")
+        self.crc = 0
+        self.size = 0
+        self.file_object = None
+
+    @property
+    def is_size_known(self):
+        # Streamed entries have a zero size, with the real one in the descriptor
+        return not self.has_descriptor or self.expected_size > 0
+
+    @property
+    def descriptor(self):
+        return ZIP64_DATA_DESCRIPTOR if self.is_zip64 else DATA_DESCRIPTOR
+
+
+class ZipExtractor:
+    """
+    Writable object that extracts a zip file as it's written, so that a received
+    directory is never staged on disk as a zip.
+
+    Handles stored and deflated entries, including ones streamed with a data
+    descriptor (as sent by the wormhole CLI). Names are sanitised in the same
+    way as DestFile, and extraction stops with ReceiveFileError if more than
+    max_bytes are extracted.
+    """
+
+    def __init__(self, dest_path, max_bytes):
+        self._dest_path = Path(dest_path).resolve()
+        self._max_bytes = max_bytes
+        self._extracted_bytes = 0
+        self._buffer = bytearray()
+        self._read = self._read_signature
+        self._entry = None
+        self._decompressor = None
+        self._remaining = 0
+        self._extracted_paths = {}
+        self.is_complete = False
+        self.num_files = 0
+
+    def write(self, data):
+        self._buffer += data
+        while self._read():
+            pass
+
+    def close(self):
+        """Closes the current file, returning whether the whole zip was received"""
+        if self._entry is not None and self._entry.file_object is not None:
+            self._entry.file_object.close()
+        self._entry = None
+        return self.is_complete
+
+    def _read_signature(self):
+        if len(self._buffer) < SIGNATURE_BYTES:
+            return False
+
+        signature = bytes(self._buffer[:SIGNATURE_BYTES])
+        if signature == LOCAL_SIGNATURE:
+            self._read = self._read_local_header
+        elif signature == CENTRAL_SIGNATURE:
+            self._read = self._read_central_header
+        elif signature in END_SIGNATURES:
+            # Anything after the central directory isn't needed
+            self.is_complete = True
+            self._read = self._discard
+        else:
+            raise ReceiveFileError("Received directory isn't a valid zip file")
+        return True
+
+    def _read_local_header(self):
+        if len(self._buffer) < LOCAL_HEADER.size:
+            return False
+        (
+            _,
+            _,
+            _,
+            flags,
+            method,
+            _,
+            _,
+            crc,
+            compressed_size,
+            size,
+            name_length,
+            extra_length,
+        ) = LOCAL_HEADER.unpack_from(self._buffer)
+        header_length = LOCAL_HEADER.size + name_length + extra_length
+        if len(self._buffer) < header_length:
+            return False
+
+        start = LOCAL_HEADER.size
+        end = start + name_length
+        name = _decode_name(self._buffer[start:end], flags)
+        zip64_fields = _zip64_fields(self._buffer[end:header_length])
+        del self._buffer[:header_length]
+
+        if flags & ENCRYPTED_FLAG:
+            raise ReceiveFileError(f"Can't extract encrypted file {name}")
+        if method not in (STORED, DEFLATED):
+            raise ReceiveFileError(f"Can't extract {name} (compression {method})")
+
+        is_zip64 = zip64_fields is not None
+        if is_zip64 and size == ZIP64_MARKER:
+            size = zip64_fields.pop(0) if zip64_fields else 0
+        if is_zip64 and compressed_size == ZIP64_MARKER:
+            compressed_size = zip64_fields.pop(0) if zip64_fields else 0
+
+        path = _safe_path(self._dest_path, name)
+        self._entry = ZipEntry(name, path, method, flags, crc, size, is_zip64)
+        self._open_entry(self._entry)
+
+        if method == DEFLATED:
+            self._decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+            self._read = self._read_deflated
+        elif self._entry.is_size_known:
+            self._remaining = compressed_size
+            self._read = self._read_stored
+        else:
+            self._read = self._scan_stored
+        return True
+
+    def _read_stored(self):
+        length = min(len(self._buffer), self._remaining)
+        self._write_data(length)
+        self._remaining -= length
+        if self._remaining > 0:
+            return False
+
+        self._end_data()
+        return True
+
+    def _scan_stored(self):
+        """Finds the end of a stored entry of unknown size, from its descriptor"""
+        descriptor = self._entry.descriptor
+        start = 0
+        while True:
+            index = self._buffer.find(DESCRIPTOR_SIGNATURE, start)
+            if index < 0:
+                # Keep enough to spot a signature that's split across writes
+                self._write_data(max(0, len(self._buffer) - SIGNATURE_BYTES + 1))
+                return False
+            if len(self._buffer) < index + descriptor.size:
+                self._write_data(index)
+                return False
+
+            if self._is_descriptor_at(index, descriptor):
+                self._write_data(index)
+                self._end_data()
+                return True
+            start = index + 1
+
+    def _is_descriptor_at(self, index, descriptor):
+        _, crc, compressed_size, size = descriptor.unpack_from(self._buffer, index)
+        size_so_far = self._entry.size + index
+        return compressed_size == size == size_so_far and crc == zlib.crc32(
+            self._buffer[:index], self._entry.crc
+        )
+
+    def _read_deflated(self):
+        if not self._buffer:
+            return False
+
+        # Limit the output, so that a malicious stream can't expand unchecked
+        allowed_bytes = self._max_bytes - self._extracted_bytes
+        data = self._decompressor.decompress(bytes(self._buffer), allowed_bytes + 1)
+        if self._decompressor.unconsumed_tail or len(data) > allowed_bytes:
+            raise ReceiveFileError("Directory is larger than offered")
+        self._buffer = bytearray(self._decompressor.unused_data)
+        self._write_entry(data)
+
+        if not self._decompressor.eof:
+            return False
+
+        self._decompressor = None
+        self._end_data()
+        return True
+
+    def _read_descriptor(self):
+        if len(self._buffer) < SIGNATURE_BYTES:
+            return False
+
+        # The descriptor signature is optional
+        descriptor = self._entry.descriptor
+        has_signature = self._buffer[:SIGNATURE_BYTES] == DESCRIPTOR_SIGNATURE
+        length = descriptor.size if has_signature else descriptor.size - SIGNATURE_BYTES
+        if len(self._buffer) < length:
+            return False
+
+        data = bytes(self._buffer[:length])
+        del self._buffer[:length]
+        if not has_signature:
+            data = DESCRIPTOR_SIGNATURE + data
+        fields = descriptor.unpack(data)
+
+        _, self._entry.expected_crc, _, self._entry.expected_size = fields
+        self._close_entry()
+        return True
+
+    def _read_central_header(self):
+        if len(self._buffer) < CENTRAL_HEADER.size:
+            return False
+        fields = CENTRAL_HEADER.unpack_from(self._buffer)
+        name_length, extra_length, comment_length = fields[12:15]
+        create_system = fields[2]
+        flags = fields[5]
+        external_attributes = fields[17]
+        header_length = (
+            CENTRAL_HEADER.size + name_length + extra_length + comment_length
+        )
+        if len(self._buffer) < header_length:
+            return False
+
+        start = CENTRAL_HEADER.size
+        end = start + name_length
+        name = _decode_name(self._buffer[start:end], flags)
+        del self._buffer[:header_length]
+
+        # Only the permission bits are restored, and files stay writable by us
+        path = self._extracted_paths.get(name)
+        mode = (external_attributes >> 16) & 0o777
+        if path is not None and create_system == UNIX_SYSTEM and mode:
+            os.chmod(path, (mode & 0o755) | 0o600)
+
+        self._read = self._read_signature
+        return True
+
+    def _discard(self):
+        self._buffer.clear()
+        return False
+
+    def _open_entry(self, entry):
+        if entry.is_dir:
+            entry.path.mkdir(parents=True, exist_ok=True)
+        else:
+            entry.path.parent.mkdir(parents=True, exist_ok=True)
+            entry.file_object = open(entry.path, "wb")
+            self.num_files += 1
+        self._extracted_paths[entry.name] = entry.path
+
+    def _write_data(self, length):
+        if length > 0:
+            data = bytes(self._buffer[:length])
+            del self._buffer[:length]
+            self._write_entry(data)
+
+    def _write_entry(self, data):
+        entry = self._entry
+        if not data:
+            return
+
+        self._extracted_bytes += len(data)
+        if self._extracted_bytes > self._max_bytes:
+            raise ReceiveFileError("Directory is larger than offered")
+        if entry.is_dir:
+            raise ReceiveFileError(f"Directory {entry.name} has contents")
+
+        entry.crc = zlib.crc32(data, entry.crc)
+        entry.size += len(data)
+        entry.file_object.write(data)
+
+    def _end_data(self):
+        if self._entry.has_descriptor:
+            self._read = self._read_descriptor
+        else:
+            self._close_entry()
+
+    def _close_entry(self):
+        entry, self._entry = self._entry, None
+        if entry.file_object is not None:
+            entry.file_object.close()
+
+        if entry.crc != entry.expected_crc or entry.size != entry.expected_size:
+            raise ReceiveFileError(f"{entry.name} is corrupt")
+        self._read = self._read_signature
+
+
+def _decode_name(name_bytes, flags):
+    encoding = "utf-8" if flags & UTF8_FLAG else "cp437"
+    return bytes(name_bytes).decode(encoding)
+
+
+def _zip64_fields(extra):
+    """Returns the values in the zip64 extra field, or None if there isn't one"""
+    offset = 0
+    while offset + ZIP64_EXTRA_HEADER.size <= len(extra):
+        header_id, length = ZIP64_EXTRA_HEADER.unpack_from(extra, offset)
+        offset += ZIP64_EXTRA_HEADER.size
+        if header_id == ZIP64_EXTRA_ID:
+            count = length // ZIP64_FIELD.size
+            return [
+                ZIP64_FIELD.unpack_from(extra, offset + i * ZIP64_FIELD.size)[0]
+                for i in range(count)
+            ]
+        offset += length
+    return None
+
+
+def _safe_path(dest_path, name):
+    parts = [part for part in re.split(r"[/\\]", name) if part not in ("", ".")]
+    if not parts or ".." in parts:
+        raise ReceiveFileError(f"Unsafe path in received directory: {name}")
+
+    # Path().name is intended to protect us against drive letters and the like,
+    # as it does for DestFile
+    parts = [Path(part).name for part in parts]
+    if not all(parts):
+        raise ReceiveFileError(f"Unsafe path in received directory: {name}")
+
+    path = dest_path.joinpath(*parts)
+    if dest_path not in path.resolve().parents:
+        raise ReceiveFileError(f"Unsafe path in received directory: {name}")
+    return path
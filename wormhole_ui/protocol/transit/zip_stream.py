@@ -0,0 +1,346 @@
+import logging
+import os
+from pathlib import Path
+import stat
+import struct
+import time
+import zlib
+
+from ...errors import SendFileError
+
+# A directory is sent as an uncompressed zip file, generated as it's read. The
+# size of every part of the zip is known up front from the directory walk, so the
+# only thing that depends on the file contents is the CRC, which follows the data
+# in a data descriptor.
+#
+#   For each entry:  local header, file data, data descriptor
+#   Then:            central directory, (zip64 end record, zip64 locator), end record
+#
+# See https://pkware.cachefly.net/webdocs/casestudies/APPNOTE.TXT
+READ_BYTES = 256 * 1024
+
+# Larger values are stored in zip64 fields, with a marker in the original field
+ZIP64_LIMIT = 0xFFFFFFFF
+ZIP64_COUNT_LIMIT = 0xFFFF
+ZIP64_MARKER = 0xFFFFFFFF
+ZIP64_COUNT_MARKER = 0xFFFF
+
+ZIP_VERSION = 20
+ZIP64_VERSION = 45
+UNIX_SYSTEM = 3
+# Sizes and CRC follow the data, and names are UTF-8
+FLAGS = 0x0008 | 0x0800
+STORED = 0
+DIRECTORY_ATTRIBUTE = 0x10
+
+LOCAL_HEADER = struct.Struct("<4s2B4HL2L2H")
+CENTRAL_HEADER = struct.Struct("<4s4B4HL2L5H2L")
+DATA_DESCRIPTOR = struct.Struct("<4s3L")
+ZIP64_DATA_DESCRIPTOR = struct.Struct("<4sL2Q")
+ZIP64_EXTRA_HEADER = struct.Struct("<2H")
+ZIP64_FIELD = struct.Struct("<Q")
+ZIP64_END_RECORD = struct.Struct("<4sQ2H2L4Q")
+ZIP64_END_LOCATOR = struct.Struct("<4sLQL")
+END_RECORD = struct.Struct("<4s4H2LH")
+
+
+class ZipEntry:
+    def __init__(self, path, arcname, is_dir, size, mode, mtime):
+        self.path = path
+        self.arcname = arcname + "/" if is_dir else arcname
+        self.name_bytes = self.arcname.encode("utf-8")
+        self.is_dir = is_dir
+        self.size = size
+        self.mode = mode
+        self.dos_time, self.dos_date = _dos_time(mtime)
+        self.is_zip64 = size >= ZIP64_LIMIT
+        self.offset = None
+        self.crc = None
+
+    @classmethod
+    def from_path(cls, path, arcname):
+        """
+        Returns None for anything that isn't a regular file or directory, such as
+        a FIFO or a broken symlink, as those can't be sent
+        """
+        try:
+            path_stat = path.stat()
+        except OSError as exception:
+            logging.warning(f"Skipping {path}: {exception}")
+            return None
+
+        is_dir = stat.S_ISDIR(path_stat.st_mode)
+        if not is_dir and not stat.S_ISREG(path_stat.st_mode):
+            logging.warning(f"Skipping {path}: not a regular file")
+            return None
+        return cls(
+            path,
+            arcname,
+            is_dir,
+            0 if is_dir else path_stat.st_size,
+            path_stat.st_mode,
+            path_stat.st_mtime,
+        )
+
+    @property
+    def local_bytes(self):
+        """Size of the local header, data and data descriptor"""
+        if self.is_zip64:
+            extra_bytes = ZIP64_EXTRA_HEADER.size + 2 * ZIP64_FIELD.size
+            descriptor_bytes = ZIP64_DATA_DESCRIPTOR.size
+        else:
+            extra_bytes = 0
+            descriptor_bytes = DATA_DESCRIPTOR.size
+        return (
+            LOCAL_HEADER.size
+            + len(self.name_bytes)
+            + extra_bytes
+            + self.size
+            + descriptor_bytes
+        )
+
+    @property
+    def central_bytes(self):
+        return CENTRAL_HEADER.size + len(self.name_bytes) + len(self._central_extra())
+
+    def local_header(self):
+        extra = b""
+        size_field = 0
+        if self.is_zip64:
+            # The real sizes follow in the zip64 data descriptor
+            extra = _zip64_extra([0, 0])
+            size_field = ZIP64_MARKER
+        header = LOCAL_HEADER.pack(
+            b"PK\x03\x04",
+            self._version,
+            0,
+            FLAGS,
+            STORED,
+            self.dos_time,
+            self.dos_date,
+            0,
+            size_field,
+            size_field,
+            len(self.name_bytes),
+            len(extra),
+        )
+        return header + self.name_bytes + extra
+
+    def data_descriptor(self):
+        if self.is_zip64:
+            return ZIP64_DATA_DESCRIPTOR.pack(
+                b"PK\x07\x08", self.crc, self.size, self.size
+            )
+        return DATA_DESCRIPTOR.pack(b"PK\x07\x08", self.crc, self.size, self.size)
+
+    def central_header(self):
+        extra = self._central_extra()
+        size = ZIP64_MARKER if self.is_zip64 else self.size
+        offset = ZIP64_MARKER if self.offset >= ZIP64_LIMIT else self.offset
+        external_attributes = (self.mode & 0xFFFF) << 16
+        if self.is_dir:
+            external_attributes |= DIRECTORY_ATTRIBUTE
+
+        header = CENTRAL_HEADER.pack(
+            b"PK\x01\x02",
+            self._version,
+            UNIX_SYSTEM,
+            self._version,
+            0,
+            FLAGS,
+            STORED,
+            self.dos_time,
+            self.dos_date,
+            self.crc,
+            size,
+            size,
+            len(self.name_bytes),
+            len(extra),
+            0,
+            0,
+            0,
+            external_attributes,
+            offset,
+        )
+        return header + self.name_bytes + extra
+
+    @property
+    def _version(self):
+        return ZIP64_VERSION if self._central_extra() else ZIP_VERSION
+
+    def _central_extra(self):
+        fields = []
+        if self.is_zip64:
+            fields += [self.size, self.size]
+        if self.offset is not None and self.offset >= ZIP64_LIMIT:
+            fields.append(self.offset)
+        return _zip64_extra(fields) if fields else b""
+
+
+class ZipStream:
+    """
+    File-like object that reads as a zip of the directory. Files are read from
+    disk as the stream is read, so nothing is staged on disk.
+
+    The directory is walked when the stream is created. If a file changes size
+    after that, reading raises SendFileError.
+    """
+
+    def __init__(self, dir_path):
+        self._entries = list(_walk(Path(dir_path)))
+
+        offset = 0
+        for entry in self._entries:
+            entry.offset = offset
+            offset += entry.local_bytes
+        self._central_offset = offset
+        self._central_bytes = sum(entry.central_bytes for entry in self._entries)
+
+        self.size = self._central_offset + self._central_bytes + self._end_bytes
+        self.num_files = sum(1 for entry in self._entries if not entry.is_dir)
+        self.num_bytes = sum(entry.size for entry in self._entries)
+
+        self._chunks = self._generate()
+        self._pending = None
+
+    def read(self, size=-1):
+        data = []
+        while size != 0:
+            if not self._pending:
+                try:
+                    self._pending = memoryview(next(self._chunks))
+                except StopIteration:
+                    break
+
+            if 0 <= size < len(self._pending):
+                chunk = self._pending[:size]
+                self._pending = self._pending[size:]
+            else:
+                chunk, self._pending = self._pending, None
+
+            data.append(chunk)
+            if size > 0:
+                size -= len(chunk)
+        return b"".join(data)
+
+    def close(self):
+        self._chunks.close()
+        self._pending = None
+
+    @property
+    def _is_zip64(self):
+        return (
+            len(self._entries) >= ZIP64_COUNT_LIMIT
+            or self._central_offset >= ZIP64_LIMIT
+            or self._central_bytes >= ZIP64_LIMIT
+        )
+
+    @property
+    def _end_bytes(self):
+        end_bytes = END_RECORD.size
+        if self._is_zip64:
+            end_bytes += ZIP64_END_RECORD.size + ZIP64_END_LOCATOR.size
+        return end_bytes
+
+    def _generate(self):
+        for entry in self._entries:
+            yield entry.local_header()
+            entry.crc = 0
+            if not entry.is_dir:
+                for data in _read_file(entry):
+                    entry.crc = zlib.crc32(data, entry.crc)
+                    yield data
+            yield entry.data_descriptor()
+
+        for entry in self._entries:
+            yield entry.central_header()
+        yield self._end_records()
+
+    def _end_records(self):
+        records = []
+        count = len(self._entries)
+        central_offset = self._central_offset
+        central_bytes = self._central_bytes
+
+        if self._is_zip64:
+            zip64_end_offset = central_offset + central_bytes
+            records.append(
+                ZIP64_END_RECORD.pack(
+                    b"PK\x06\x06",
+                    ZIP64_END_RECORD.size - 12,
+                    ZIP64_VERSION,
+                    ZIP64_VERSION,
+                    0,
+                    0,
+                    count,
+                    count,
+                    central_bytes,
+                    central_offset,
+                )
+            )
+            records.append(
+                ZIP64_END_LOCATOR.pack(b"PK\x06\x07", 0, zip64_end_offset, 1)
+            )
+            count = ZIP64_COUNT_MARKER
+            central_offset = ZIP64_MARKER
+            central_bytes = ZIP64_MARKER
+
+        records.append(
+            END_RECORD.pack(
+                b"PK\x05\x06", 0, 0, count, count, central_bytes, central_offset, 0
+            )
+        )
+        return b"".join(records)
+
+
+def _walk(dir_path):
+    """Yields an entry for every regular file, and every empty directory"""
+    for root, dirs, files in os.walk(str(dir_path)):
+        dirs.sort()
+        root = Path(root)
+        arcdir = root.relative_to(dir_path)
+        entries = [
+            ZipEntry.from_path(root / name, (arcdir / name).as_posix())
+            for name in sorted(files)
+        ]
+        entries = [entry for entry in entries if entry is not None]
+        if root != dir_path and not dirs and not entries:
+            entry = ZipEntry.from_path(root, arcdir.as_posix())
+            if entry is not None:
+                yield entry
+        yield from entries
+
+
+def _read_file(entry):
+    remaining = entry.size
+    with open(entry.path, "rb") as file_object:
+        while remaining > 0:
+            data = file_object.read(min(remaining, READ_BYTES))
+            if not data:
+                break
+            remaining -= len(data)
+            yield data
+
+        if remaining > 0 or file_object.read(1):
+            raise SendFileError(f"{entry.arcname} changed while sending")
+
+
+def _zip64_extra(fields):
+    header = ZIP64_EXTRA_HEADER.pack(0x0001, len(fields) * ZIP64_FIELD.size)
+    return header + b"".join(ZIP64_FIELD.pack(field) for field in fields)
+
+
+def _dos_time(mtime):
+    local_time = time.localtime(mtime)
+    if local_time.tm_year < 1980:
+        return 0, (1 << 5) | 1
+
+    dos_time = (
+        (local_time.tm_hour << 11) | (local_time.tm_min << 5) | (local_time.tm_sec // 2)
+    )
+    dos_date = (
+        ((local_time.tm_year - 1980) << 9)
+        | (local_time.tm_mon << 5)
+        | local_time.tm_mday
+    )
+    return dos_time, dos_date
@@ -14,20 +14,22 @@ class WormholeSignals(QObject):
     wormhole_closed = Signal()
     wormhole_shutdown = Signal()
     wormhole_shutdown_received = Signal()
-    message_sent = Signal(bool)
+    message_sent = Signal(int, bool)
     message_received = Signal(str)
-    file_receive_pending = Signal(str, int)
-    file_transfer_progress = Signal(int, int, int)
+    # Byte counts are 64-bit, since Qt's int overflows for files over 2GiB
+    file_receive_pending = Signal(str, "qint64")
+    file_transfer_progress = Signal(int, "qint64", "qint64")
     file_transfer_complete = Signal(int, str)
     error = Signal(Exception, str)
     respond_error = Signal(Exception, str)
 
 
 class WormholeProtocol:
-    def __init__(self, reactor):
+    def __init__(self, reactor, relays=None):
         super().__init__()
         self.signals = WormholeSignals()
-        self._protocol = FileTransferProtocol(reactor, self.signals)
+        self.reactor = reactor
+        self._protocol = FileTransferProtocol(reactor, self.signals, relays)
 
     @Slot(str)
     def open(self, code=None):
@@ -51,14 +53,18 @@ class WormholeProtocol:
     def shutdown(self):
         self._capture_errors(self._protocol.shutdown)
 
-    @Slot()
-    def send_message(self, message):
-        self._capture_errors(self._protocol.send_message, message)
+    @Slot(int, str)
+    def send_message(self, id, message):
+        self._capture_errors(self._protocol.send_message, id, message)
 
     @Slot(str, str)
     def send_file(self, id, file_path):
         self._capture_errors(self._protocol.send_file, id, file_path)
 
+    @Slot(list)
+    def send_files(self, files):
+        self._capture_errors(self._protocol.send_files, files)
+
     @Slot(str, str)
     def receive_file(self, id, dest_path):
         self._capture_errors(self._protocol.receive_file, id, dest_path)
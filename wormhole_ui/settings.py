@@ -0,0 +1,47 @@
+"""
+Persistent settings, stored wherever Qt keeps them for this platform (eg.
+~/.config/wormhole-ui/wormhole-ui.conf on Linux).
+
+    [relays]
+    mailbox_url=ws://relay.example.com:4000/v1
+    transit_relay=tcp:relay.example.com:4001, tcp:relay2.example.com:4001
+    local=false
+"""
+
+from PySide2.QtCore import QSettings
+
+from .protocol.relays import LocalRelay, Relays
+
+ORGANIZATION = "wormhole-ui"
+APPLICATION = "wormhole-ui"
+
+
+def get_settings():
+    return QSettings(
+        QSettings.IniFormat, QSettings.UserScope, ORGANIZATION, APPLICATION
+    )
+
+
+def get_relays(reactor, settings):
+    """
+    Returns the relays to connect through, and the LocalRelay if one was started
+    (otherwise None). An empty transit_relay means peers only connect directly,
+    and a list of them means whichever responds fastest is used.
+    """
+    if settings.value("relays/local", False, type=bool):
+        local_relay = LocalRelay(reactor)
+        return local_relay.start(), local_relay
+
+    defaults = Relays()
+    transit_relays = settings.value("relays/transit_relay", defaults.transit_relay)
+    # Comma-separated values are read as a list
+    if not isinstance(transit_relays, list):
+        transit_relays = [transit_relays]
+    transit_relays = [relay.strip() for relay in transit_relays if relay] or [None]
+
+    relays = Relays(
+        mailbox_url=settings.value("relays/mailbox_url", defaults.mailbox_url),
+        transit_relay=transit_relays[0],
+        alternative_transit_relays=transit_relays[1:],
+    )
+    return relays, None
@@ -0,0 +1,53 @@
+import logging
+from pathlib import Path
+import stat
+
+from PySide2.QtCore import QObject, Signal
+
+from ..protocol.transit.threads import run_in_thread
+
+BATCH_SIZE = 256
+
+
+class FileScanner(QObject):
+    """
+    Resolves and checks files on the reactor's thread pool, so that dropping
+    thousands of files (or files on a slow network share) doesn't block the GUI
+    thread.
+
+    Results are emitted on the GUI thread in batches, as a list of
+    (id, path, size, is_directory) tuples, so that the files needn't be stat'ed
+    again before they're sent. The size is None for directories, and the path is
+    None if the file (or directory) can't be sent.
+    """
+
+    scanned = Signal(list)
+
+    def __init__(self, reactor, parent=None):
+        super().__init__(parent)
+        self._reactor = reactor
+
+    def scan(self, files):
+        files = list(files)
+        for start in range(0, len(files), BATCH_SIZE):
+            end = start + BATCH_SIZE
+            scanning = run_in_thread(self._reactor, _scan, files[start:end])
+            scanning.addCallback(self.scanned.emit)
+
+
+def _scan(files):
+    results = []
+    for id, filepath in files:
+        try:
+            path = Path(filepath).resolve()
+            path_stat = path.stat()
+            if stat.S_ISDIR(path_stat.st_mode):
+                results.append((id, str(path), None, True))
+            elif stat.S_ISREG(path_stat.st_mode):
+                results.append((id, str(path), path_stat.st_size, False))
+            else:
+                raise FileNotFoundError(f"Not a file or directory: {filepath}")
+        except Exception as exception:
+            logging.warning(f"Can't send {filepath}: {exception}")
+            results.append((id, None, None, False))
+    return results
@@ -54,7 +54,7 @@ class MainWindow(QMainWindow):
         self.message_edit.returnPressed.connect(self.send_message_button.clicked)
         self.send_message_button.clicked.connect(self._on_send_message_button)
         self.send_files_button.clicked.connect(self._on_send_files_button)
-        self.message_table.send_file.connect(self._on_send_file)
+        self.message_table.send_files.connect(self._on_send_files)
 
         self.connect_dialog.rejected.connect(self.close)
 
@@ -79,8 +79,11 @@ class MainWindow(QMainWindow):
 
     @Slot()
     def _on_send_message_button(self):
-        self._disable_message_entry()
-        self.wormhole.send_message(self.message_edit.text())
+        # Messages are sent straight away, without waiting for earlier ones
+        message = self.message_edit.text()
+        self.message_edit.clear()
+        id = self.message_table.send_message_pending(message)
+        self.wormhole.send_message(id, message)
 
     @Slot()
     def _on_send_files_button(self):
@@ -91,26 +94,21 @@ class MainWindow(QMainWindow):
 
     @Slot(str)
     def _on_send_files_selected(self, filepaths):
-        for filepath in filepaths:
-            self.message_table.send_file_pending(filepath)
+        self.message_table.send_files_pending(filepaths)
 
-    @Slot(int, str)
-    def _on_send_file(self, id, filepath):
-        self.wormhole.send_file(id, filepath)
+    @Slot(list)
+    def _on_send_files(self, files):
+        self.wormhole.send_files(files)
 
-    @Slot()
-    def _on_message_sent(self, success):
-        self._enable_message_entry()
-        if success:
-            message = self.message_edit.text()
-            self.message_table.add_sent_message(message)
-            self.message_edit.clear()
+    @Slot(int, bool)
+    def _on_message_sent(self, id, success):
+        self.message_table.message_sent(id, success)
 
     @Slot(str)
     def _on_message_received(self, message):
         self.message_table.add_received_message(message)
 
-    @Slot(str, int)
+    @Slot(str, "qint64")
     def _on_file_receive_pending(self, filename, size):
         self.save_file_dialog.open(filename, size)
 
@@ -124,7 +122,7 @@ class MainWindow(QMainWindow):
         else:
             self.wormhole.reject_file()
 
-    @Slot(int, int, int)
+    @Slot(int, "qint64", "qint64")
     def _on_file_transfer_progress(self, id, transferred_bytes, total_bytes):
         self.message_table.transfer_progress(id, transferred_bytes, total_bytes)
 
@@ -152,11 +150,3 @@ class MainWindow(QMainWindow):
     @Slot()
     def _on_wormhole_shutdown_received(self):
         ShutdownMessage(parent=self).exec_()
-
-    def _disable_message_entry(self):
-        self.message_edit.setDisabled(True)
-        self.send_message_button.setDisabled(True)
-
-    def _enable_message_entry(self):
-        self.message_edit.setEnabled(True)
-        self.send_message_button.setEnabled(True)
@@ -0,0 +1,209 @@
+from PySide2.QtCore import QAbstractTableModel, QModelIndex, Qt
+from PySide2.QtGui import QFont
+
+ICON_COLUMN = 0
+TEXT_COLUMN = 1
+COLUMN_COUNT = 2
+
+PROGRESS_ROLE = Qt.UserRole
+ICON_ROLE = Qt.UserRole + 1
+
+
+class MessageModel(QAbstractTableModel):
+    """
+    Holds the rows shown in the MessageTable. Rows are only ever appended, so
+    row numbers are used as ids for the messages and file transfers.
+    """
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._items = []
+        self._in_progress = set()
+        self._sent_font = None
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self._items)
+
+    def columnCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return COLUMN_COUNT
+
+    def flags(self, index):
+        return Qt.ItemIsEnabled
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        item = self._items[index.row()]
+
+        if index.column() == TEXT_COLUMN:
+            if role == Qt.DisplayRole:
+                return item.text
+            if role == Qt.FontRole and item.is_sent:
+                return self._get_sent_font()
+
+        elif index.column() == ICON_COLUMN:
+            if role == PROGRESS_ROLE:
+                return item.progress
+            if role == ICON_ROLE:
+                return item.icon
+
+        return None
+
+    def item(self, id):
+        return self._items[id]
+
+    def append(self, item):
+        id = len(self._items)
+        self.beginInsertRows(QModelIndex(), id, id)
+        self._items.append(item)
+        self.endInsertRows()
+        return id
+
+    def append_many(self, items):
+        """Appends all the items in a single model update, returning their ids"""
+        first_id = len(self._items)
+        if not items:
+            return range(first_id, first_id)
+
+        self.beginInsertRows(QModelIndex(), first_id, first_id + len(items) - 1)
+        self._items.extend(items)
+        self.endInsertRows()
+        return range(first_id, len(self._items))
+
+    def transfer_started(self, id):
+        self._items[id].transfer_started()
+        self._in_progress.add(id)
+        self._row_changed(id)
+
+    def transfer_progress(self, id, percent):
+        item = self._items[id]
+        if item.progress != percent and item.icon is None:
+            item.progress = percent
+            self._cell_changed(id, ICON_COLUMN)
+
+    def transfer_complete(self, id, filename):
+        self._items[id].transfer_complete(filename)
+        self._in_progress.discard(id)
+        self._row_changed(id)
+
+    def message_sent(self, id):
+        self._items[id].message_sent()
+        self._in_progress.discard(id)
+        self._row_changed(id)
+
+    def transfer_failed(self, id):
+        self._items[id].transfer_failed()
+        self._in_progress.discard(id)
+        self._row_changed(id)
+
+    def transfers_failed(self):
+        for id in sorted(self._in_progress):
+            self._items[id].transfer_failed()
+            self._row_changed(id)
+        self._in_progress.clear()
+
+    def _cell_changed(self, id, column):
+        index = self.index(id, column)
+        self.dataChanged.emit(index, index)
+
+    def _row_changed(self, id):
+        self.dataChanged.emit(self.index(id, 0), self.index(id, COLUMN_COUNT - 1))
+
+    def _get_sent_font(self):
+        if self._sent_font is None:
+            self._sent_font = QFont()
+            self._sent_font.setItalic(True)
+        return self._sent_font
+
+
+class MessageItem:
+    # Slots keep the per-row memory small for long sessions
+    __slots__ = ["text", "in_progress", "progress", "icon"]
+    is_sent = False
+
+    def __init__(self, message):
+        self.text = message
+        self.in_progress = False
+        self.progress = None
+        self.icon = None
+
+
+class ReceiveItem(MessageItem):
+    __slots__ = []
+
+
+class SendItem(MessageItem):
+    __slots__ = []
+    is_sent = True
+
+
+class SendMessage(SendItem):
+    __slots__ = ["_message"]
+
+    def __init__(self, message):
+        self._message = message
+        super().__init__(f"Sending: {message}")
+
+    def transfer_started(self):
+        self.in_progress = True
+
+    def message_sent(self):
+        self.in_progress = False
+        self.text = f"Sent: {self._message}"
+
+    def transfer_failed(self):
+        self.in_progress = False
+        self.text = f"Failed to send: {self._message}"
+        self.icon = "times.svg"
+
+
+class ReceiveFile(ReceiveItem):
+    __slots__ = ["_filename"]
+
+    def __init__(self, filename):
+        self._filename = filename
+        super().__init__(f"Queued: {self._filename}...")
+        self.progress = 0
+
+    def transfer_started(self):
+        self.in_progress = True
+        self.text = f"Receiving: {self._filename}..."
+
+    def transfer_complete(self, filename):
+        self.in_progress = False
+        self._filename = filename
+        self.text = f"Received: {filename}"
+        self.icon = "check.svg"
+
+    def transfer_failed(self):
+        self.in_progress = False
+        self.text = f"Failed to receive {self._filename}"
+        self.icon = "times.svg"
+
+
+class SendFile(SendItem):
+    __slots__ = ["_filename"]
+
+    def __init__(self, filename):
+        self._filename = filename
+        super().__init__(f"Queued: {self._filename}...")
+        self.progress = 0
+
+    def transfer_started(self):
+        self.in_progress = True
+        self.text = f"Sending: {self._filename}..."
+
+    def transfer_complete(self, filename):
+        self.in_progress = False
+        self._filename = filename
+        self.text = f"Sent: {filename}"
+        self.icon = "check.svg"
+
+    def transfer_failed(self):
+        self.in_progress = False
+        self.text = f"Failed to send {self._filename}"
+        self.icon = "times.svg"
@@ -1,67 +1,109 @@
 from collections import OrderedDict
 from pathlib import Path
 
-from PySide2.QtCore import Qt, Signal
+from PySide2.QtCore import QRect, Qt, QTimer, Signal, Slot
+from PySide2.QtGui import QPainter, QPixmap
+from PySide2.QtSvg import QSvgRenderer
 from PySide2.QtWidgets import (
+    QApplication,
     QHeaderView,
-    QHBoxLayout,
-    QProgressBar,
-    QTableWidget,
-    QTableWidgetItem,
-    QWidget,
+    QStyle,
+    QStyledItemDelegate,
+    QStyleOptionProgressBar,
+    QTableView,
 )
-from PySide2.QtSvg import QSvgWidget
 
 from ..util import RESOURCES_PATH
+from .file_scanner import FileScanner
+from .message_model import (
+    ICON_COLUMN,
+    ICON_ROLE,
+    PROGRESS_ROLE,
+    TEXT_COLUMN,
+    MessageModel,
+    ReceiveFile,
+    ReceiveItem,
+    SendFile,
+    SendMessage,
+)
 
-ICON_COLUMN = 0
-TEXT_COLUMN = 1
 ICON_COLUMN_WIDTH = 32
+ROW_PADDING = 8
+# Limits the size of the batch offer sent through the mailbox server
+MAX_BATCH_FILES = 1000
 
 
-class MessageTable(QTableWidget):
-    send_file = Signal(int, str)
+class MessageTable(QTableView):
+    send_files = Signal(list)
 
     def __init__(self, parent, wormhole):
         super().__init__(parent=parent)
         self.setAcceptDrops(True)
         self.setFocusPolicy(Qt.NoFocus)
 
+        # Pending files map to None until they've been scanned, then to
+        # (filepath, size, is_directory)
         self._send_files_pending = OrderedDict()
         self._wormhole = wormhole
 
+        self._file_scanner = FileScanner(wormhole.reactor, self)
+        self._file_scanner.scanned.connect(self._on_files_scanned)
+
+        self._model = MessageModel(self)
+        self.setModel(self._model)
+        self.setItemDelegateForColumn(ICON_COLUMN, StatusDelegate(self))
+
         self._setup_columns()
+        self._setup_rows()
 
     def _setup_columns(self):
-        self.setColumnCount(2)
         header = self.horizontalHeader()
         header.setSectionResizeMode(ICON_COLUMN, QHeaderView.Fixed)
         header.setSectionResizeMode(TEXT_COLUMN, QHeaderView.Stretch)
         header.resizeSection(ICON_COLUMN, ICON_COLUMN_WIDTH)
 
-    def add_sent_message(self, message):
-        self._append_item(SendItem(f"Sent: {message}"))
+    def _setup_rows(self):
+        # Fixed height rows avoid resizing every row each time one is added
+        header = self.verticalHeader()
+        header.setSectionResizeMode(QHeaderView.Fixed)
+        header.setDefaultSectionSize(self.fontMetrics().height() + ROW_PADDING)
 
-    def add_received_message(self, message):
-        self._append_item(ReceiveItem(message))
+    def send_message_pending(self, message):
+        """Adds a message that's waiting to be acked, returning its id"""
+        id = self._append_message(SendMessage(message))
+        self._model.transfer_started(id)
+        return id
 
-    def send_file_pending(self, filepath):
-        id = self.rowCount()
-        self._send_files_pending[id] = filepath
-        self._append_item(SendFile(Path(filepath).name))
-        self._draw_progress(id, 0)
+    def message_sent(self, id, success):
+        if success:
+            self._model.message_sent(id)
+        else:
+            self._model.transfer_failed(id)
 
-        if not self._wormhole.is_sending_file():
-            self._send_next_file()
+    def add_received_message(self, message):
+        self._append_message(ReceiveItem(message))
 
-        return id
+    def send_file_pending(self, filepath):
+        return self.send_files_pending([filepath])[0]
+
+    def send_files_pending(self, filepaths):
+        """
+        Queues files to be sent, adding their rows in a single update.
+        Files are sent once they've been scanned on the thread pool.
+        """
+        filepaths = list(filepaths)
+        ids = self._model.append_many(
+            [SendFile(Path(filepath).name) for filepath in filepaths]
+        )
+        for id in ids:
+            self._send_files_pending[id] = None
+
+        self._file_scanner.scan(zip(ids, filepaths))
+        return ids
 
     def receiving_file(self, filepath):
-        id = self.rowCount()
-        item = ReceiveFile(Path(filepath).name)
-        item.transfer_started()
-        self._append_item(item)
-        self._draw_progress(id, 0)
+        id = self._model.append(ReceiveFile(Path(filepath).name))
+        self._model.transfer_started(id)
 
         return id
 
@@ -70,59 +112,57 @@ class MessageTable(QTableWidget):
             percent = 100
         else:
             percent = (100 * transferred_bytes) // total_bytes
-        self._draw_progress(id, percent)
+        self._model.transfer_progress(id, percent)
 
     def transfer_complete(self, id, filename):
-        self.item(id, TEXT_COLUMN).transfer_complete(filename)
-        self._draw_icon(id, "check.svg")
+        self._model.transfer_complete(id, filename)
 
-        if not self._wormhole.is_sending_file():
-            self._send_next_file()
+        # The transfer isn't finished until this signal has been handled,
+        # so check for the next files afterwards.
+        QTimer.singleShot(0, self._send_next_files_if_idle)
 
     def transfers_failed(self):
-        for id in range(self.rowCount()):
-            item = self.item(id, TEXT_COLUMN)
-            if item.in_progress:
-                item.transfer_failed()
-                self._draw_icon(id, "times.svg")
-
-    def _send_next_file(self):
-        if self._send_files_pending:
-            id, filepath = self._send_files_pending.popitem(last=False)
-            self.item(id, TEXT_COLUMN).transfer_started()
-            self.send_file.emit(id, filepath)
-
-    def _append_item(self, item):
-        item.setFlags(Qt.ItemIsEnabled)
-        id = self.rowCount()
-        self.insertRow(id)
-        self.setItem(id, TEXT_COLUMN, item)
-        self.resizeRowsToContents()
-
-    def _draw_progress(self, id, percent):
-        if self.cellWidget(id, ICON_COLUMN) is None:
-            bar = QProgressBar()
-            bar.setTextVisible(False)
-            bar.setFixedSize(ICON_COLUMN_WIDTH, self.rowHeight(id))
-
-            self.setCellWidget(id, ICON_COLUMN, bar)
-
-        if isinstance(self.cellWidget(id, ICON_COLUMN), QProgressBar):
-            self.cellWidget(id, ICON_COLUMN).setValue(percent)
-
-    def _draw_icon(self, id, svg_filename):
-        svg = QSvgWidget(str(RESOURCES_PATH / svg_filename))
-        height = self.cellWidget(id, ICON_COLUMN).size().height()
-        svg.setFixedSize(height, height)
-
-        container = QWidget()
-        layout = QHBoxLayout(container)
-        layout.addWidget(svg)
-        layout.setAlignment(Qt.AlignCenter)
-        layout.setContentsMargins(0, 0, 0, 0)
-        container.setLayout(layout)
-
-        self.setCellWidget(id, ICON_COLUMN, container)
+        self._model.transfers_failed()
+
+    @Slot(list)
+    def _on_files_scanned(self, results):
+        for id, filepath, size, is_directory in results:
+            if filepath is None:
+                self._send_files_pending.pop(id, None)
+                self._model.transfer_failed(id)
+            elif id in self._send_files_pending:
+                self._send_files_pending[id] = (filepath, size, is_directory)
+
+        self._send_next_files_if_idle()
+
+    @Slot()
+    def _send_next_files_if_idle(self):
+        if not self._wormhole.is_sending_file():
+            self._send_next_files()
+
+    def _send_next_files(self):
+        """Sends the scanned files at the front of the queue together"""
+        files = []
+        for id, scanned in self._send_files_pending.items():
+            if len(files) == MAX_BATCH_FILES:
+                break
+            if scanned is None:
+                # Wait for the file to be scanned
+                break
+            files.append((id, *scanned))
+
+        for id, *_ in files:
+            del self._send_files_pending[id]
+            self._model.transfer_started(id)
+
+        if files:
+            self.send_files.emit(files)
+
+    def _append_message(self, item):
+        id = self._model.append(item)
+        # Messages can wrap onto multiple lines. Only the new row is resized.
+        self.resizeRowToContents(id)
+        return id
 
     def dragEnterEvent(self, event):
         if event.mimeData().hasUrls():
@@ -144,61 +184,62 @@ class MessageTable(QTableWidget):
             event.setDropAction(Qt.CopyAction)
             event.accept()
 
-            for url in event.mimeData().urls():
-                self.send_file_pending(url.toLocalFile())
-
+            self.send_files_pending(
+                url.toLocalFile() for url in event.mimeData().urls()
+            )
 
-class ReceiveItem(QTableWidgetItem):
-    def __init__(self, message):
-        super().__init__(message)
-        self.in_progress = False
 
+class StatusDelegate(QStyledItemDelegate):
+    """
+    Paints the transfer progress bar or status icon, rather than creating
+    a widget for every row. Rendered icons are cached.
+    """
 
-class SendItem(QTableWidgetItem):
-    def __init__(self, message):
-        super().__init__(message)
-        self.in_progress = False
+    def __init__(self, parent):
+        super().__init__(parent)
+        self._pixmaps = {}
 
-        font = self.font()
-        font.setItalic(True)
-        self.setFont(font)
+    def paint(self, painter, option, index):
+        icon = index.data(ICON_ROLE)
+        progress = index.data(PROGRESS_ROLE)
 
+        if icon is not None:
+            self._draw_icon(painter, option.rect, icon)
+        elif progress is not None:
+            self._draw_progress(painter, option.rect, progress)
+        else:
+            super().paint(painter, option, index)
 
-class ReceiveFile(ReceiveItem):
-    def __init__(self, filename):
-        self.in_progress = False
-        self._filename = filename
-        super().__init__(f"Queued: {self._filename}...")
-
-    def transfer_started(self):
-        self.in_progress = True
-        self.setText(f"Receiving: {self._filename}...")
+    def _draw_progress(self, painter, rect, percent):
+        bar = QStyleOptionProgressBar()
+        bar.rect = rect
+        bar.minimum = 0
+        bar.maximum = 100
+        bar.progress = percent
+        bar.textVisible = False
 
-    def transfer_complete(self, filename):
-        self.in_progress = False
-        self._filename = filename
-        self.setText(f"Received: {filename}")
+        QApplication.style().drawControl(QStyle.CE_ProgressBar, bar, painter)
 
-    def transfer_failed(self):
-        self.in_progress = False
-        self.setText(f"Failed to receive {self._filename}")
+    def _draw_icon(self, painter, rect, svg_filename):
+        size = min(rect.width(), rect.height())
+        ratio = painter.device().devicePixelRatioF()
+        pixmap = self._get_pixmap(svg_filename, size, ratio)
 
+        target = QRect(0, 0, size, size)
+        target.moveCenter(rect.center())
+        painter.drawPixmap(target, pixmap)
 
-class SendFile(SendItem):
-    def __init__(self, filename):
-        self.in_progress = False
-        self._filename = filename
-        super().__init__(f"Queued: {self._filename}...")
+    def _get_pixmap(self, svg_filename, size, ratio):
+        key = (svg_filename, size, ratio)
+        if key not in self._pixmaps:
+            pixmap = QPixmap(int(size * ratio), int(size * ratio))
+            pixmap.fill(Qt.transparent)
 
-    def transfer_started(self):
-        self.in_progress = True
-        self.setText(f"Sending: {self._filename}...")
+            painter = QPainter(pixmap)
+            QSvgRenderer(str(RESOURCES_PATH / svg_filename)).render(painter)
+            painter.end()
 
-    def transfer_complete(self, filename):
-        self.in_progress = False
-        self._filename = filename
-        self.setText(f"Sent: {filename}")
+            pixmap.setDevicePixelRatio(ratio)
+            self._pixmaps[key] = pixmap
 
-    def transfer_failed(self):
-        self.in_progress = False
-        self.setText(f"Failed to send {self._filename}")
+        return self._pixmaps[key]